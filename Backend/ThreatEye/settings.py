@@ -234,6 +234,91 @@ FRONTEND_URL = os.environ.get('FRONTEND_URL', 'http://localhost:5173')
 # Directory for Snort logs, polling interval
 SNORT_LOG_DIR = os.environ.get('SNORT_LOG_DIR', str(BASE_DIR.parent / 'real_logs'))
 SNORT_POLL_INTERVAL_SECONDS = int(os.environ.get('SNORT_POLL_INTERVAL_SECONDS', '3'))
+# Event-driven ingestion: wake on log writes (inotify, stat fallback) instead of fixed sleeps.
+# SNORT_WATCH_RESCAN_SECONDS is the safety-net full rescan when no events arrive.
+SNORT_WATCH_ENABLED = os.environ.get('SNORT_WATCH_ENABLED', 'True') == 'True'
+SNORT_WATCH_RESCAN_SECONDS = int(os.environ.get('SNORT_WATCH_RESCAN_SECONDS', '60'))
+SNORT_WATCH_STAT_INTERVAL_SECONDS = float(os.environ.get('SNORT_WATCH_STAT_INTERVAL_SECONDS', '0.5'))
+# Transition from the SHA-256 event_hash to the 16-byte event_digest (see alerts migrations 0007 / 0015).
+# On: event_hash is still written, and rows stored before the upgrade are matched by their legacy key,
+# so pre-upgrade log lines read again are not stored twice. Turn off once those log files have
+# rotated away: event_hash is then left empty and SHA-256 is not computed.
+ALERT_EVENT_HASH_DUAL_WRITE = os.environ.get('ALERT_EVENT_HASH_DUAL_WRITE', 'True') == 'True'
+# Recent-event dedup cache checked before the DB during ingestion (alerts/dedup.py).
+# Exact LRU of INGEST_DEDUP_CACHE_SIZE digests (0 disables) plus an optional Bloom filter
+# for a longer history (INGEST_DEDUP_BLOOM_CAPACITY, 0 disables). Seeded from the newest rows at startup.
+INGEST_DEDUP_CACHE_SIZE = int(os.environ.get('INGEST_DEDUP_CACHE_SIZE', '100000'))
+INGEST_DEDUP_BLOOM_CAPACITY = int(os.environ.get('INGEST_DEDUP_BLOOM_CAPACITY', '1000000'))
+INGEST_DEDUP_BLOOM_FP_RATE = float(os.environ.get('INGEST_DEDUP_BLOOM_FP_RATE', '0.001'))
+INGEST_DEDUP_SEED_ROWS = int(os.environ.get('INGEST_DEDUP_SEED_ROWS', '100000'))
+# Staged ingestion pipeline (alerts/pipeline.py): persist / enrich (ML) / notify run on worker
+# threads behind bounded queues of INGEST_PIPELINE_QUEUE_SIZE batches, so slow email or WebSocket
+# delivery no longer stalls log parsing.
+INGEST_PIPELINE_ENABLED = os.environ.get('INGEST_PIPELINE_ENABLED', 'True') == 'True'
+INGEST_PIPELINE_QUEUE_SIZE = int(os.environ.get('INGEST_PIPELINE_QUEUE_SIZE', '4'))
+INGEST_PIPELINE_PERSIST_WORKERS = int(os.environ.get('INGEST_PIPELINE_PERSIST_WORKERS', '1'))
+INGEST_PIPELINE_ENRICH_WORKERS = int(os.environ.get('INGEST_PIPELINE_ENRICH_WORKERS', '2'))
+INGEST_PIPELINE_NOTIFY_WORKERS = int(os.environ.get('INGEST_PIPELINE_NOTIFY_WORKERS', '1'))
+# Durable notification outbox (alerts/outbox.py): WebSocket/email side effects are stored with the
+# alerts and delivered by a dispatcher with coalescing and retries. False = notify inline (legacy).
+ALERT_OUTBOX_ENABLED = os.environ.get('ALERT_OUTBOX_ENABLED', 'True') == 'True'
+ALERT_OUTBOX_BATCH_SIZE = int(os.environ.get('ALERT_OUTBOX_BATCH_SIZE', '200'))
+ALERT_OUTBOX_MAX_ATTEMPTS = int(os.environ.get('ALERT_OUTBOX_MAX_ATTEMPTS', '8'))
+ALERT_OUTBOX_POLL_SECONDS = float(os.environ.get('ALERT_OUTBOX_POLL_SECONDS', '0.5'))
+# A dispatcher owns the entries it claimed for this long; they are due again if it dies mid-batch.
+# Keep it above the time one batch of emails can take, or a slow pass is overtaken and resends.
+ALERT_OUTBOX_CLAIM_SECONDS = int(os.environ.get('ALERT_OUTBOX_CLAIM_SECONDS', '300'))
+# Adaptive alert batching: flush at the size target or when the oldest queued alert is
+# INGEST_BATCH_MAX_DELAY_MS old. The size target moves within [MIN, MAX] to keep one insert
+# near INGEST_BATCH_TARGET_INSERT_MS.
+INGEST_BATCH_MIN_SIZE = int(os.environ.get('INGEST_BATCH_MIN_SIZE', '50'))
+INGEST_BATCH_MAX_SIZE = int(os.environ.get('INGEST_BATCH_MAX_SIZE', '5000'))
+INGEST_BATCH_MAX_DELAY_MS = int(os.environ.get('INGEST_BATCH_MAX_DELAY_MS', '200'))
+INGEST_BATCH_TARGET_INSERT_MS = int(os.environ.get('INGEST_BATCH_TARGET_INSERT_MS', '250'))
+# unified2 binary alerts (alerts/unified2.py) carry numeric ids only. Point these at the sensor's
+# sid-msg.map / classification.config to store rule messages and class names (empty = placeholders).
+SNORT_SID_MSG_MAP = os.environ.get('SNORT_SID_MSG_MAP', '')
+SNORT_CLASSIFICATION_CONFIG = os.environ.get('SNORT_CLASSIFICATION_CONFIG', '')
+# Syslog receiver (`python manage.py receive_snort_syslog`): sensors push FAST / alert_syslog /
+# alert_json messages over UDP and TCP. Above SYSLOG_RECEIVER_MAX_PENDING unstored records TCP
+# sensors are paused and UDP messages dropped.
+SYSLOG_RECEIVER_HOST = os.environ.get('SYSLOG_RECEIVER_HOST', '0.0.0.0')
+SYSLOG_RECEIVER_UDP_PORT = int(os.environ.get('SYSLOG_RECEIVER_UDP_PORT', '5514'))
+SYSLOG_RECEIVER_TCP_PORT = int(os.environ.get('SYSLOG_RECEIVER_TCP_PORT', '5514'))
+SYSLOG_RECEIVER_MAX_PENDING = int(os.environ.get('SYSLOG_RECEIVER_MAX_PENDING', '20000'))
+# Packet captures (snort.log*) are stored as 5-tuple flows (alerts/flows.py), not one alert per packet.
+# A flow ends after PACKET_FLOW_IDLE_TIMEOUT seconds without packets or PACKET_FLOW_ACTIVE_TIMEOUT
+# seconds after its first one; at most PACKET_FLOW_MAX_ACTIVE flows are kept open. Open flows and
+# offsets are written every PACKET_FLOW_WRITE_PACKETS packets and at the end of every capture file.
+PACKET_FLOW_IDLE_TIMEOUT = float(os.environ.get('PACKET_FLOW_IDLE_TIMEOUT', '60'))
+PACKET_FLOW_ACTIVE_TIMEOUT = float(os.environ.get('PACKET_FLOW_ACTIVE_TIMEOUT', '300'))
+PACKET_FLOW_MAX_ACTIVE = int(os.environ.get('PACKET_FLOW_MAX_ACTIVE', '100000'))
+PACKET_FLOW_WRITE_PACKETS = int(os.environ.get('PACKET_FLOW_WRITE_PACKETS', '200000'))
+# Load shedding (alerts/shedding.py, opt-in): once a reader is INGEST_SHED_LAG_BYTES behind its log files,
+# each (src_ip, sid) keeps INGEST_SHED_RATE alerts per second of alert time (bursts up to INGEST_SHED_BURST);
+# the rest are counted per INGEST_SHED_WINDOW_SECONDS window in ShedAlertCount instead of stored.
+INGEST_SHED_ENABLED = os.environ.get('INGEST_SHED_ENABLED', 'False') == 'True'
+INGEST_SHED_LAG_BYTES = int(os.environ.get('INGEST_SHED_LAG_BYTES', '67108864'))  # 64 MiB
+INGEST_SHED_RATE = float(os.environ.get('INGEST_SHED_RATE', '10'))
+INGEST_SHED_BURST = float(os.environ.get('INGEST_SHED_BURST', '100'))
+INGEST_SHED_WINDOW_SECONDS = int(os.environ.get('INGEST_SHED_WINDOW_SECONDS', '60'))
+INGEST_SHED_MAX_KEYS = int(os.environ.get('INGEST_SHED_MAX_KEYS', '100000'))
+# Ingestion telemetry (alerts/telemetry.py): the polling process publishes lag, lines/s, rows/s, dedup counts
+# and batch latency per sensor every INGEST_TELEMETRY_PUBLISH_SECONDS (0 disables) for
+# /api/alerts/ingestion-telemetry/ and dashboard_summary.
+INGEST_TELEMETRY_PUBLISH_SECONDS = float(os.environ.get('INGEST_TELEMETRY_PUBLISH_SECONDS', '10'))
+# Additional sensors: poll_snort_logs runs one ingest worker thread per enabled alerts.Sensor row
+# (name + log_dir) next to SNORT_LOG_DIR, all sharing the ingestion pipeline. The Sensor table is
+# re-read every SNORT_SENSOR_RELOAD_SECONDS, so sensors are added/removed without a restart.
+SNORT_SENSOR_RELOAD_SECONDS = int(os.environ.get('SNORT_SENSOR_RELOAD_SECONDS', '10'))
+# Horizontal scaling: with INGEST_LEASES_ENABLED several poll_snort_logs processes (hosts sharing
+# the log roots) split the log files through per-file leases in the database. A node that stops
+# renewing loses its files to the others after INGEST_LEASE_SECONDS.
+INGEST_LEASES_ENABLED = os.environ.get('INGEST_LEASES_ENABLED', 'False') == 'True'
+INGEST_LEASE_SECONDS = float(os.environ.get('INGEST_LEASE_SECONDS', '30'))
+# Signature rows (gid:sid:rev -> message/classification/priority) cached by ingesting processes
+# (alerts/signatures.py); a ruleset has tens of thousands of rules at most.
+INGEST_SIGNATURE_CACHE_SIZE = int(os.environ.get('INGEST_SIGNATURE_CACHE_SIZE', '50000'))
 
 # ===== LOGGING CONFIGURATION =====
 # Log all debug and error messages to console and file
@@ -1,6 +1,17 @@
 from django.contrib import admin
 
-from .models import Alert, LogIngestionState
+from .models import (
+    Alert,
+    AlertOutbox,
+    IngestionNode,
+    IngestionTelemetrySnapshot,
+    LogFileLease,
+    LogIngestionState,
+    PacketFlow,
+    Sensor,
+    ShedAlertCount,
+    Signature,
+)
 
 
 @admin.register(Alert)
@@ -13,15 +24,77 @@ class AlertAdmin(admin.ModelAdmin):
         'dest_port',
         'protocol',
         'sid',
+        'sensor',
         'threat_level',
     ]
-    list_filter = ['protocol', 'threat_level', 'sid']
-    search_fields = ['src_ip', 'dest_ip', 'sid', 'message', 'classification']
+    list_filter = ['protocol', 'threat_level', 'sensor', 'sid']
+    search_fields = ['src_ip', 'dest_ip', 'sid', 'signature__message', 'signature__classification']
+    raw_id_fields = ['signature']
     readonly_fields = ['ingested_at', 'event_hash']
     ordering = ['-timestamp']
 
 
+@admin.register(Signature)
+class SignatureAdmin(admin.ModelAdmin):
+    list_display = ['gid', 'sid', 'rev', 'message', 'classification', 'priority']
+    list_filter = ['priority', 'classification']
+    search_fields = ['sid', 'message', 'classification']
+    ordering = ['gid', 'sid', 'rev']
+
+
+@admin.register(PacketFlow)
+class PacketFlowAdmin(admin.ModelAdmin):
+    list_display = ['first_seen', 'last_seen', 'src_ip', 'src_port', 'dest_ip', 'dest_port', 'protocol', 'packet_count', 'byte_count']
+    list_filter = ['protocol']
+    search_fields = ['src_ip', 'dest_ip', 'source_file']
+    ordering = ['-last_seen']
+
+
+@admin.register(ShedAlertCount)
+class ShedAlertCountAdmin(admin.ModelAdmin):
+    list_display = ['window_start', 'sensor', 'src_ip', 'sid', 'shed_count', 'updated_at']
+    search_fields = ['src_ip', 'sid']
+    readonly_fields = ['updated_at']
+    ordering = ['-window_start']
+
+
+@admin.register(Sensor)
+class SensorAdmin(admin.ModelAdmin):
+    list_display = ['name', 'log_dir', 'enabled', 'updated_at']
+    list_filter = ['enabled']
+    search_fields = ['name', 'log_dir']
+    readonly_fields = ['created_at', 'updated_at']
+
+
 @admin.register(LogIngestionState)
 class LogIngestionStateAdmin(admin.ModelAdmin):
-    list_display = ['file_path', 'inode', 'offset', 'updated_at']
+    list_display = ['sensor', 'file_path', 'inode', 'offset', 'file_size', 'updated_at']
+    list_filter = ['sensor']
     readonly_fields = ['updated_at']
+
+
+@admin.register(IngestionNode)
+class IngestionNodeAdmin(admin.ModelAdmin):
+    list_display = ['owner', 'hostname', 'pid', 'started_at', 'expires_at']
+    readonly_fields = ['started_at']
+
+
+@admin.register(LogFileLease)
+class LogFileLeaseAdmin(admin.ModelAdmin):
+    list_display = ['sensor', 'file_path', 'owner', 'expires_at']
+    list_filter = ['sensor']
+    search_fields = ['file_path', 'owner']
+
+
+@admin.register(IngestionTelemetrySnapshot)
+class IngestionTelemetrySnapshotAdmin(admin.ModelAdmin):
+    list_display = ['kind', 'sensor', 'node', 'updated_at']
+    list_filter = ['kind']
+    readonly_fields = ['updated_at']
+
+
+@admin.register(AlertOutbox)
+class AlertOutboxAdmin(admin.ModelAdmin):
+    list_display = ['id', 'kind', 'alert', 'attempts', 'failed', 'next_attempt_at', 'created_at']
+    list_filter = ['kind', 'failed']
+    readonly_fields = ['created_at']
@@ -0,0 +1,202 @@
+"""
+Snort 3 alert_json ingestion.
+
+Snort 3 sensors configured with `alert_json` write one JSON object per line
+(alert_json.txt), which FAST_ALERT_PATTERN cannot read. This source plugs
+into the same reader as ingest_snort_logs (batching, dedup cache, batch
+checkpoints, .gz archives) and only picks the fields we store out of each
+object.
+
+Both the default field set
+    timestamp pkt_num proto pkt_gen pkt_len dir src_ap dst_ap rule action
+and explicit ones (seconds, msg, class, priority, src_addr/src_port,
+dst_addr/dst_port, gid/sid/rev) are understood. Without a `msg` field the
+message comes from SNORT_SID_MSG_MAP, like unified2.
+
+Decoding uses orjson or ujson when installed, otherwise the stdlib json.
+"""
+import json
+import logging
+from datetime import datetime
+from functools import lru_cache
+
+from .records import AlertRecord
+from .services import (
+    SnortTimestampCache,
+    _is_json_alert_log_name,
+    _parse_fast_endpoint,
+    compute_event_hashes,
+    ingest_line_logs,
+    is_valid_ipv4,
+    map_priority_to_threat_level,
+)
+from .unified2 import get_signature_lookups
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+
+    json_loads = orjson.loads
+    JSON_DECODER = 'orjson'
+except ImportError:
+    try:
+        import ujson
+
+        json_loads = ujson.loads
+        JSON_DECODER = 'ujson'
+    except ImportError:
+        json_loads = json.JSONDecoder().decode
+        JSON_DECODER = 'json'
+
+
+@lru_cache(maxsize=8)
+def _timestamp_cache_for_year(year):
+    # "YY/MM/DD-..." timestamps (snort -y) carry their own year
+    return SnortTimestampCache(year=year)
+
+
+def _parse_json_timestamp(event, timestamp_cache):
+    text = event.get('timestamp')
+    seconds = event.get('seconds')
+    if seconds is not None:
+        # Exact epoch seconds (+ the fraction of the text timestamp, if any)
+        try:
+            moment = datetime.fromtimestamp(int(seconds), timestamp_cache.tz)
+        except (TypeError, ValueError, OverflowError, OSError):
+            return None
+        if isinstance(text, str) and '.' in text:
+            fraction = text.rpartition('.')[2]
+            if fraction.isdigit() and len(fraction) <= 6:
+                moment = moment.replace(microsecond=int(fraction.ljust(6, '0')))
+        return moment
+
+    if not isinstance(text, str):
+        return None
+    if text.count('/') == 2:
+        year, _slash, text = text.partition('/')
+        if not year.isdigit():
+            return None
+        return _timestamp_cache_for_year(2000 + int(year)).parse(text)
+    return timestamp_cache.parse(text)
+
+
+def _json_endpoint(event, addr_key, port_key, ap_key):
+    # (ip, port) from src_addr/src_port, else from the "ip:port" src_ap field; IP validated once
+    addr = event.get(addr_key)
+    if addr is not None:
+        if not is_valid_ipv4(addr):
+            return None, None
+        port = event.get(port_key)
+        return addr, port if isinstance(port, int) and 0 <= port <= 65535 else None
+    endpoint = event.get(ap_key)
+    if not isinstance(endpoint, str) or not endpoint.strip():
+        return None, None
+    return _parse_fast_endpoint(endpoint.strip())
+
+
+def _rule_number(value, default):
+    # gid / rev of the rule as int (strings when split from "rule"); default when malformed
+    try:
+        return max(0, int(value))
+    except (TypeError, ValueError):
+        return default
+
+
+class SnortJsonParser:
+    """
+    parse_record callable for ingest_line_logs: one alert_json line -> record.
+
+    Args:
+        messages: {(gid, sid): message} used when the line has no `msg`
+        loads: JSON decoder (default: orjson / ujson / json, whichever is installed)
+    """
+
+    def __init__(self, messages=None, loads=None):
+        self.messages = messages or {}
+        self.loads = loads or json_loads
+
+    def parse(self, event, timestamp_cache):
+        # Decoded alert_json object -> AlertRecord without raw_line / hashes, or None.
+        # Like parse_fast_alert, each field is checked and length-limited once here,
+        # so the record needs no validate_alert_data() pass.
+        timestamp = _parse_json_timestamp(event, timestamp_cache)
+        if timestamp is None:
+            return None
+
+        src_ip, src_port = _json_endpoint(event, 'src_addr', 'src_port', 'src_ap')
+        dest_ip, dest_port = _json_endpoint(event, 'dst_addr', 'dst_port', 'dst_ap')
+        if not src_ip or not dest_ip:
+            return None
+
+        rule = event.get('rule')
+        if isinstance(rule, str) and rule.count(':') == 2:
+            gid, sid, rev = rule.split(':')
+        else:
+            gid, sid, rev = event.get('gid', 1), event.get('sid'), event.get('rev', 1)
+        sid = str(sid).strip()[:64] if sid is not None else ''
+        if not sid:
+            return None
+
+        priority = event.get('priority', 3)
+        if not isinstance(priority, int) or priority < 1 or priority > 3:
+            priority = 3
+
+        message = event.get('msg')
+        if not message:
+            try:
+                message = self.messages.get((int(gid), int(sid)))
+            except (TypeError, ValueError):
+                message = None
+            message = message or f'Snort Alert [{gid}:{sid}:{rev}]'
+
+        return AlertRecord(
+            timestamp,
+            src_ip,
+            src_port,
+            dest_ip,
+            dest_port,
+            str(event.get('proto') or 'IP').strip()[:20] or 'IP',
+            sid,
+            str(message).strip()[:512] or 'Unknown alert',
+            str(event.get('class') or '').strip()[:255],
+            priority,
+            map_priority_to_threat_level(priority),
+            # Signature key with the sid
+            gid=_rule_number(gid, 1),
+            rev=_rule_number(rev, 0),
+        )
+
+    def __call__(self, file_path, line_start, raw_line, timestamp_cache):
+        """Same contract as _parse_fast_record: (record, error_msg)."""
+        line = str(raw_line, 'utf-8', 'ignore').strip()
+        if not line.startswith('{'):
+            return None, None
+        try:
+            event = self.loads(line)
+        except ValueError:
+            return None, None
+        if not isinstance(event, dict):
+            return None, None
+
+        record = self.parse(event, timestamp_cache)
+        if record is None:
+            return None, None
+
+        record.raw_line = line
+        record.event_hash, record.event_digest = compute_event_hashes(f'{file_path}:{line_start}:{line}')
+        return record, None
+
+
+def ingest_snort_json_logs(log_dir, max_lines=None, enable_ml=True, enable_email=True, enable_websocket=True, registry=None, dedup_cache=None, pipeline=None, batch_policy=None, shedder=None):
+    """
+    Ingest Snort 3 alert_json files (alert_json.txt*, *alert*.json[l]).
+
+    Args: as ingest_snort_logs
+    """
+    messages, _classifications = get_signature_lookups()
+    return ingest_line_logs(
+        log_dir, _is_json_alert_log_name, SnortJsonParser(messages),
+        max_lines=max_lines, enable_ml=enable_ml, enable_email=enable_email, enable_websocket=enable_websocket,
+        registry=registry, dedup_cache=dedup_cache, pipeline=pipeline, batch_policy=batch_policy, shedder=shedder,
+    )
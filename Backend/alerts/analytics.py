@@ -3,15 +3,17 @@ Analytics endpoints for ThreatEye alerts dashboard.
 Handles all analytics and statistics queries without mixing with core alert operations.
 """
 import logging
+from django.conf import settings
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from django.db.models import Count, Max
+from django.db.models import Count, F, Max, Sum
 from django.db.models.functions import TruncMinute
 from django.utils import timezone as dj_timezone
 from datetime import timedelta
 
-from .models import Alert, LogIngestionState
+from .models import Alert, IngestionTelemetrySnapshot, LogIngestionState, PacketFlow
+from .signatures import latest_signatures
 
 logger = logging.getLogger(__name__)
 
@@ -61,17 +63,19 @@ def top_attacks(request):
     Shows which attacks are happening most frequently
     Used for Top Attacks bar chart on dashboard
     
-    OPTIMIZATION: Cache commonly used SIDs to avoid extra queries
+    OPTIMIZATION: Groups by the indexed sid column (no message text); every
+    revision of a rule counts for its SID, labelled with the newest revision
     """
-    # Find top 5 attacks by occurrence count with message in one query
-    top_sids = Alert.objects.values('sid', 'message').annotate(
+    # Find top 5 attacks (SIDs) by occurrence count
+    top_sids = Alert.objects.values('sid').annotate(
         count=Count('id')
     ).order_by('-count')[:5]
+    signatures = latest_signatures(row['sid'] for row in top_sids)
 
     results = []
     for row in top_sids:
         sid = row['sid']
-        message = row['message']
+        message = signatures[sid].message if sid in signatures else ''
         attack_name = SID_ATTACK_MAP.get(sid) or message[:80] or f'Attack SID {sid}'
         results.append({
             'sid': sid,
@@ -171,6 +175,147 @@ def top_suspicious_ips(request):
     })
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def traffic_statistics(request):
+    """
+    Get captured traffic of the last 24 hours from packet flows (not alerts)
+    Shows totals, the protocol breakdown and the top 5 source IPs by bytes
+    Used for traffic volume charts on dashboard
+    """
+    cutoff = dj_timezone.now() - timedelta(hours=24)
+    recent_flows = PacketFlow.objects.filter(last_seen__gte=cutoff)
+
+    totals = recent_flows.aggregate(flows=Count('id'), packets=Sum('packet_count'), bytes=Sum('byte_count'))
+
+    by_protocol = (
+        recent_flows.values('protocol')
+        .annotate(flows=Count('id'), packets=Sum('packet_count'), bytes=Sum('byte_count'))
+        .order_by('-bytes')
+    )
+    top_talkers = (
+        recent_flows.values('src_ip')
+        .annotate(flows=Count('id'), packets=Sum('packet_count'), bytes=Sum('byte_count'))
+        .order_by('-bytes')[:5]
+    )
+
+    return Response({
+        'flows': totals['flows'],
+        'packets': totals['packets'] or 0,
+        'bytes': totals['bytes'] or 0,
+        'protocols': [
+            {
+                'protocol': row['protocol'] or 'Unknown',
+                'flows': row['flows'],
+                'packets': row['packets'],
+                'bytes': row['bytes'],
+            }
+            for row in by_protocol
+        ],
+        'top_talkers': [
+            {
+                'src_ip': row['src_ip'],
+                'flows': row['flows'],
+                'packets': row['packets'],
+                'bytes': row['bytes'],
+            }
+            for row in top_talkers
+        ],
+    })
+
+
+def _fresh_telemetry_cutoff(now):
+    # Snapshots older than this come from an ingester that stopped publishing (idle watch waits included)
+    publish_seconds = getattr(settings, 'INGEST_TELEMETRY_PUBLISH_SECONDS', 10)
+    rescan_seconds = getattr(settings, 'SNORT_WATCH_RESCAN_SECONDS', 60)
+    return now - timedelta(seconds=max(3 * publish_seconds, 2 * rescan_seconds))
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def ingestion_telemetry(request):
+    """
+    Get ingestion lag and throughput per sensor (log root), per log file and per ingesting node
+    Sensors: snapshots of every node reading the sensor added up - bytes/lines behind,
+    lines/s parsed, rows/s inserted, dedup/shed/failed counts (only the newest
+    snapshot, marked stale, when no node published recently)
+    Files: bytes behind from LogIngestionState (file size - offset), largest first,
+    with the sensor ('' for SNORT_LOG_DIR) whose log root they belong to
+    Nodes: batch insert latency histogram of each ingesting process
+    Used for the ingestion health panel
+    """
+    now = dj_timezone.now()
+    fresh_after = _fresh_telemetry_cutoff(now)
+
+    by_sensor = {}  # (kind, sensor) -> snapshots, newest first
+    nodes = []
+    for snapshot in IngestionTelemetrySnapshot.objects.order_by('-updated_at'):
+        if snapshot.kind == IngestionTelemetrySnapshot.KIND_NODE:
+            nodes.append({
+                'node': snapshot.node,
+                'hostname': snapshot.hostname,
+                'pid': snapshot.pid,
+                'updated_at': snapshot.updated_at.isoformat(),
+                'stale': snapshot.updated_at < fresh_after,
+                **(snapshot.data or {}),
+            })
+        else:
+            by_sensor.setdefault((snapshot.kind, snapshot.sensor), []).append(snapshot)
+
+    sensors = []
+    file_telemetry = {}  # (LogIngestionState.sensor, file path) -> file entry
+    for (kind, sensor), snapshots in sorted(by_sensor.items()):
+        current = [snapshot for snapshot in snapshots if snapshot.updated_at >= fresh_after] or snapshots[:1]
+        # Oldest first: a file two nodes reported (lease handover) keeps the newest entry
+        files = {}
+        for snapshot in reversed(current):
+            files.update((snapshot.data or {}).get('files', {}))
+        state_sensor = '' if kind == IngestionTelemetrySnapshot.KIND_LOG_DIR else sensor
+        for file_path, entry in files.items():
+            file_telemetry[(state_sensor, file_path)] = entry
+
+        totals = {
+            field: sum((snapshot.data or {}).get(field, 0) for snapshot in current)
+            for field in ('lines_per_second', 'rows_per_second', 'lines', 'rows', 'duplicates', 'shed', 'failed')
+        }
+        totals['lines_per_second'] = round(totals['lines_per_second'], 1)
+        totals['rows_per_second'] = round(totals['rows_per_second'], 1)
+        sensors.append({
+            'sensor': sensor,
+            'kind': kind,
+            'nodes': [snapshot.node for snapshot in current],
+            'updated_at': current[0].updated_at.isoformat(),
+            'stale': current[0].updated_at < fresh_after,
+            'bytes_behind': sum(entry['bytes_behind'] for entry in files.values()),
+            'lines_behind': sum(entry['lines_behind'] or 0 for entry in files.values()),
+            **totals,
+            'files': files,
+        })
+
+    # Offsets and sizes are written by the ingester itself: available even without telemetry
+    behind = (
+        LogIngestionState.objects.annotate(bytes_behind=F('file_size') - F('offset'))
+        .filter(bytes_behind__gt=0)
+        .order_by('-bytes_behind')[:100]
+    )
+
+    files = []
+    for state in behind:
+        telemetry = file_telemetry.get((state.sensor, state.file_path), {})
+        files.append({
+            'sensor': state.sensor,
+            'file_path': state.file_path,
+            'file_size': state.file_size,
+            'offset': state.offset,
+            'bytes_behind': state.bytes_behind,
+            'lines_behind': telemetry.get('lines_behind'),
+            'lines_per_second': telemetry.get('lines_per_second'),
+            'updated_at': state.updated_at.isoformat(),
+        })
+
+    return Response({'sensors': sensors, 'files': files, 'nodes': nodes})
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def dashboard_summary(request):
@@ -187,6 +332,8 @@ def dashboard_summary(request):
     - mostFrequentSourceIp: IP address most frequently attacking (last 24h)
     - ingestionRunning: Whether log ingestion is currently active
     - lastLogReceived: Timestamp of most recent alert
+    - traffic24h: Flows, packets and bytes captured in the last 24 hours (packet flows)
+    - ingestion: Bytes/lines behind, lines/s parsed, rows/s inserted and dedup rejects (ingestion telemetry)
     
     OPTIMIZATION: All queries limited to 24h window except active threats (7d) and false positives (all-time)
     """
@@ -231,15 +378,20 @@ def dashboard_summary(request):
         ml_processed=True
     ).count()
     
-    # Top attack type (most common classification in last 24h)
-    top_attack = (
+    # Top attack type (most common classification in last 24h): counts per SID, summed per
+    # classification of the SID's newest revision
+    sid_counts = dict(
         recent_alerts_24h
-        .values('classification')
+        .values('sid')
         .annotate(count=Count('id'))
-        .order_by('-count')
-        .first()
+        .values_list('sid', 'count')
     )
-    top_attack_type = top_attack['classification'] if top_attack and top_attack['classification'] else 'N/A'
+    classification_counts = {}
+    for sid, signature in latest_signatures(sid_counts).items():
+        classification = signature.classification
+        classification_counts[classification] = classification_counts.get(classification, 0) + sid_counts[sid]
+    top_attack = max(classification_counts.items(), key=lambda item: item[1], default=None)
+    top_attack_type = top_attack[0] if top_attack and top_attack[0] else 'N/A'
     
     # Most targeted IP (most common dest_ip in last 24h)
     most_targeted = (
@@ -261,11 +413,28 @@ def dashboard_summary(request):
     )
     most_frequent_source_ip = most_frequent_source['src_ip'] if most_frequent_source else 'N/A'
     
+    # Captured traffic (last 24h) comes from packet flows, not per-packet alerts
+    traffic_24h = PacketFlow.objects.filter(last_seen__gte=time_24h_ago).aggregate(
+        flows=Count('id'), packets=Sum('packet_count'), bytes=Sum('byte_count')
+    )
+
     # Check if ingestion is running (use database query instead of Python loop)
     ingestion_running = LogIngestionState.objects.filter(
         updated_at__gte=now - timedelta(minutes=5)
     ).exists()
     
+    # Ingestion lag (LogIngestionState) and throughput (snapshots of running ingesters)
+    bytes_behind = LogIngestionState.objects.filter(file_size__gt=F('offset')).aggregate(
+        total=Sum(F('file_size') - F('offset'))
+    )['total'] or 0
+    # One row per (sensor, node): nodes sharing a sensor's files each report their share
+    fresh_snapshots = [
+        snapshot.data or {}
+        for snapshot in IngestionTelemetrySnapshot.objects.filter(updated_at__gte=_fresh_telemetry_cutoff(now))
+        .exclude(kind=IngestionTelemetrySnapshot.KIND_NODE)
+    ]
+    last_telemetry = IngestionTelemetrySnapshot.objects.aggregate(last=Max('updated_at'))['last']
+
     # Last log received (most recent alert timestamp)
     last_alert = Alert.objects.order_by('-timestamp').values_list('timestamp', flat=True).first()
     last_log_received = (
@@ -284,4 +453,17 @@ def dashboard_summary(request):
         'mostFrequentSourceIp': most_frequent_source_ip,
         'ingestionRunning': ingestion_running,
         'lastLogReceived': last_log_received,
+        'traffic24h': {
+            'flows': traffic_24h['flows'],
+            'packets': traffic_24h['packets'] or 0,
+            'bytes': traffic_24h['bytes'] or 0,
+        },
+        'ingestion': {
+            'bytesBehind': bytes_behind,
+            'linesBehind': sum(data.get('lines_behind', 0) for data in fresh_snapshots),
+            'linesPerSecond': round(sum(data.get('lines_per_second', 0) for data in fresh_snapshots), 1),
+            'rowsPerSecond': round(sum(data.get('rows_per_second', 0) for data in fresh_snapshots), 1),
+            'dedupRejected': sum(data.get('duplicates', 0) for data in fresh_snapshots),
+            'telemetryUpdated': last_telemetry.isoformat() if last_telemetry else None,
+        },
     })
@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+
+@register()
+def event_hash_dual_write_check(app_configs, **kwargs):
+    # ALERT_EVENT_HASH_DUAL_WRITE is a transition setting: remind deployments to finish it
+    if not getattr(settings, 'ALERT_EVENT_HASH_DUAL_WRITE', False):
+        return []
+    return [
+        Warning(
+            'ALERT_EVENT_HASH_DUAL_WRITE is on: every alert still gets a SHA-256 event_hash and each '
+            'insert batch looks up pre-upgrade rows by their legacy key.',
+            hint='Set ALERT_EVENT_HASH_DUAL_WRITE=False once the log files written before the '
+                 'event_digest upgrade have rotated away.',
+            id='alerts.W001',
+        )
+    ]
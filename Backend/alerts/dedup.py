@@ -0,0 +1,180 @@
+"""
+In-memory deduplication of recently ingested alerts.
+
+After an offset reset, an inode change or `poll_snort_logs --reset-state`,
+every line that is already stored used to go through bulk_create and be
+rejected by the database's unique index. RecentEventCache answers "has this
+event_digest been stored?" in memory first:
+
+- an exact LRU set of the most recent digests (definite hits, skipped)
+- an optional Bloom filter covering a much longer history; its positives are
+  only "maybe" and are confirmed with one batched query per batch
+
+The cache is seeded from the newest Alert.event_digest values at startup.
+"""
+import logging
+import math
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over 16-byte digests (bit positions come from the digest itself)."""
+
+    def __init__(self, capacity, fp_rate=0.001):
+        capacity = max(1, int(capacity))
+        fp_rate = min(max(float(fp_rate), 1e-9), 0.5)
+        # Standard sizing: m = -n ln p / (ln 2)^2, k = m/n ln 2
+        self.num_bits = max(8, int(math.ceil(-capacity * math.log(fp_rate) / (math.log(2) ** 2))))
+        self.num_hashes = max(1, int(round(self.num_bits / capacity * math.log(2))))
+        self._bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, digest):
+        # Kirsch-Mitzenmacher double hashing from the two halves of the digest
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:16], 'little') | 1
+        num_bits = self.num_bits
+        return [(h1 + i * h2) % num_bits for i in range(self.num_hashes)]
+
+    def add(self, digest):
+        bits = self._bits
+        for position in self._positions(digest):
+            bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, digest):
+        bits = self._bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(digest))
+
+
+class RecentEventCache:
+    """
+    LRU set (+ optional Bloom filter) of event digests known to be stored.
+
+    check() returns SEEN (skip it), MAYBE (Bloom positive, confirm with
+    confirm_new()) or NEW.
+    """
+
+    NEW = 'new'
+    SEEN = 'seen'
+    MAYBE = 'maybe'
+
+    def __init__(self, max_entries=100000, bloom_capacity=0, bloom_fp_rate=0.001):
+        self.max_entries = max(0, int(max_entries))
+        self.bloom = BloomFilter(bloom_capacity, bloom_fp_rate) if bloom_capacity else None
+        self._recent = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0                   # skipped: exact LRU hit
+        self.misses = 0                 # not in cache: went to the database
+        self.bloom_hits = 0             # Bloom positive confirmed as stored
+        self.bloom_false_positives = 0  # Bloom positive that was actually new
+
+    def check(self, digest):
+        if not digest:
+            return self.NEW
+        with self._lock:
+            if digest in self._recent:
+                self._recent.move_to_end(digest)
+                self.hits += 1
+                return self.SEEN
+            if self.bloom is not None and digest in self.bloom:
+                return self.MAYBE
+            self.misses += 1
+            return self.NEW
+
+    def add_many(self, digests):
+        with self._lock:
+            recent = self._recent
+            for digest in digests:
+                if not digest:
+                    continue
+                digest = bytes(digest)
+                recent[digest] = None
+                recent.move_to_end(digest)
+                if self.bloom is not None:
+                    self.bloom.add(digest)
+            while len(recent) > self.max_entries:
+                recent.popitem(last=False)
+
+    def confirm_new(self, candidates, digest_of=lambda item: item):
+        """
+        Resolve Bloom "maybe" candidates with one query.
+
+        Returns the candidates whose digest is NOT stored yet; updates the
+        hit / false-positive counters.
+        """
+        from .models import Alert
+
+        if not candidates:
+            return []
+        digests = [digest_of(item) for item in candidates]
+        stored = {bytes(d) for d in Alert.objects.filter(event_digest__in=digests).values_list('event_digest', flat=True)}
+        fresh = [item for item, digest in zip(candidates, digests) if digest not in stored]
+
+        with self._lock:
+            self.bloom_hits += len(candidates) - len(fresh)
+            self.bloom_false_positives += len(fresh)
+        self.add_many(stored)
+        return fresh
+
+    def seed_from_database(self, limit):
+        # Warm the cache with the newest stored digests (one query)
+        from .models import Alert
+
+        if limit <= 0:
+            return 0
+        digests = list(
+            Alert.objects.exclude(event_digest=None)
+            .order_by('-id')
+            .values_list('event_digest', flat=True)[:limit]
+        )
+        # Oldest first so the newest end up most-recently-used
+        self.add_many(reversed(digests))
+        return len(digests)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._recent),
+                'hits': self.hits,
+                'misses': self.misses,
+                'bloom_hits': self.bloom_hits,
+                'bloom_false_positives': self.bloom_false_positives,
+            }
+
+
+_event_cache = None
+_event_cache_lock = threading.Lock()
+
+
+def get_event_cache():
+    """Process-wide cache configured from settings; None when disabled."""
+    global _event_cache
+    with _event_cache_lock:
+        if _event_cache is None:
+            max_entries = getattr(settings, 'INGEST_DEDUP_CACHE_SIZE', 100000)
+            if max_entries <= 0:
+                _event_cache = False
+            else:
+                _event_cache = RecentEventCache(
+                    max_entries=max_entries,
+                    bloom_capacity=getattr(settings, 'INGEST_DEDUP_BLOOM_CAPACITY', 0),
+                    bloom_fp_rate=getattr(settings, 'INGEST_DEDUP_BLOOM_FP_RATE', 0.001),
+                )
+                try:
+                    seeded = _event_cache.seed_from_database(
+                        getattr(settings, 'INGEST_DEDUP_SEED_ROWS', max_entries)
+                    )
+                    logger.info(f'[Dedup] Seeded recent-event cache with {seeded} digests')
+                except Exception as e:
+                    logger.warning(f'[Dedup] Could not seed recent-event cache: {e}')
+        return _event_cache or None
+
+
+def reset_event_cache():
+    global _event_cache
+    with _event_cache_lock:
+        _event_cache = None
@@ -0,0 +1,373 @@
+"""
+Flow aggregation for snort.log packet captures.
+
+Storing every captured IPv4 packet as an Alert row (sid 'packet_capture')
+filled the alerts table, its indexes and the analytics with millions of
+near-identical rows. Packets are now folded into unidirectional 5-tuple
+flows (src ip/port, dest ip/port, protocol), NetFlow style, and stored as
+PacketFlow rows:
+
+- a flow ends after PACKET_FLOW_IDLE_TIMEOUT seconds without packets, or
+  PACKET_FLOW_ACTIVE_TIMEOUT seconds after its first packet (long
+  connections are reported in slices)
+- open flows are written as well and updated later, so live traffic shows
+  long-running connections before they end
+- flows are written in the same transaction as the capture offsets they
+  cover, at the end of every file and every PACKET_FLOW_WRITE_PACKETS packets
+
+A flow is identified by the capture file and the offset of its first
+packet, so re-reading a capture after an offset reset rewrites the same
+rows instead of adding new ones.
+
+Timeouts run on capture time (packet timestamps), plus a wall-clock sweep at
+the end of every cycle so flows of a capture that went quiet are closed.
+"""
+import hashlib
+import logging
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import PacketFlow
+from .pcap import CaptureFormatError, PacketCapture, decode_ipv4
+from .services import _get_protocol_name, _is_packet_log_name, _write_checkpoints, get_file_registry
+from .telemetry import get_ingestion_telemetry, telemetry_sensor
+
+logger = logging.getLogger(__name__)
+
+MAX_FLOW_TIMESTAMP = 253402300799  # 9999-12-31: later seconds come from corrupt pcapng timestamps
+FLOW_WRITE_BATCH_SIZE = 500
+
+
+class _Flow:
+    # One open or ended flow; times are epoch seconds (datetimes are built when written)
+    __slots__ = ('key', 'first_seen', 'last_seen', 'packets', 'bytes', 'source_file', 'first_offset', 'pk', 'dirty')
+
+    def __init__(self, key, timestamp, source_file, first_offset):
+        self.key = key
+        self.first_seen = timestamp
+        self.last_seen = timestamp
+        self.packets = 0
+        self.bytes = 0
+        self.source_file = source_file
+        self.first_offset = first_offset
+        self.pk = None  # PacketFlow row, once written
+        self.dirty = True
+
+    @property
+    def flow_hash(self):
+        return hashlib.blake2b(f'{self.source_file}:{self.first_offset}'.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class FlowAggregator:
+    """
+    In-memory flow table keyed by 5-tuple.
+
+    Args:
+        idle_timeout: Seconds without packets that end a flow (default PACKET_FLOW_IDLE_TIMEOUT)
+        active_timeout: Seconds after the first packet that end a flow (default PACKET_FLOW_ACTIVE_TIMEOUT)
+        max_flows: Open flows kept before the least recently seen are ended early (default PACKET_FLOW_MAX_ACTIVE)
+    """
+
+    def __init__(self, idle_timeout=None, active_timeout=None, max_flows=None):
+        if idle_timeout is None:
+            idle_timeout = getattr(settings, 'PACKET_FLOW_IDLE_TIMEOUT', 60)
+        if active_timeout is None:
+            active_timeout = getattr(settings, 'PACKET_FLOW_ACTIVE_TIMEOUT', 300)
+        if max_flows is None:
+            max_flows = getattr(settings, 'PACKET_FLOW_MAX_ACTIVE', 100000)
+        self.idle_timeout = max(0.001, float(idle_timeout))
+        self.active_timeout = max(self.idle_timeout, float(active_timeout))
+        self.max_flows = max(1, int(max_flows))
+
+        self.active = {}  # 5-tuple -> _Flow
+        self.closed = []  # Ended flows not written yet
+        self.clock = 0.0  # Newest packet time seen
+        self._sweep_interval = max(1.0, self.idle_timeout / 4)
+        self._next_sweep = 0.0
+
+    def add(self, key, timestamp, size, source_file, offset):
+        """
+        Count one packet.
+
+        Args:
+            key: (src_ip, src_port, dest_ip, dest_port, protocol_number)
+            timestamp: Capture time in epoch seconds
+            size: Frame length on the wire
+            source_file / offset: Capture file and record offset (identify a new flow)
+        """
+        flow = self.active.get(key)
+        if flow is not None and (
+            timestamp - flow.last_seen > self.idle_timeout or timestamp - flow.first_seen >= self.active_timeout
+        ):
+            self._close(flow)
+            flow = None
+        if flow is None:
+            if len(self.active) >= self.max_flows:
+                self._evict()
+            flow = self.active[key] = _Flow(key, timestamp, source_file, offset)
+        elif timestamp > flow.last_seen:
+            flow.last_seen = timestamp
+        flow.packets += 1
+        flow.bytes += size
+        flow.dirty = True
+
+        if timestamp > self.clock:
+            self.clock = timestamp
+            if timestamp >= self._next_sweep:
+                self.expire(timestamp)
+
+    def expire(self, now):
+        """End the flows that timed out at `now` (epoch seconds)."""
+        idle_before = now - self.idle_timeout
+        active_before = now - self.active_timeout
+        for flow in [f for f in self.active.values() if f.last_seen < idle_before or f.first_seen <= active_before]:
+            self._close(flow)
+        self._next_sweep = now + self._sweep_interval
+
+    def _close(self, flow):
+        del self.active[flow.key]
+        self.closed.append(flow)
+
+    def _evict(self):
+        # Table full (scans, floods): end the least recently seen tenth
+        oldest = sorted(self.active.values(), key=lambda flow: flow.last_seen)
+        for flow in oldest[:max(1, len(oldest) // 10)]:
+            self._close(flow)
+
+    def pending(self):
+        """Ended flows plus open flows changed since they were last written."""
+        return [flow for flow in self.closed if flow.dirty] + [flow for flow in self.active.values() if flow.dirty]
+
+    def written(self, flows):
+        # Called after pending() flows were stored
+        for flow in flows:
+            flow.dirty = False
+        self.closed = []
+
+
+def _flow_row(flow, tz):
+    src_ip, src_port, dest_ip, dest_port, protocol_number = flow.key
+    return PacketFlow(
+        pk=flow.pk,
+        src_ip=src_ip,
+        src_port=src_port,
+        dest_ip=dest_ip,
+        dest_port=dest_port,
+        protocol=_get_protocol_name(protocol_number),
+        first_seen=datetime.fromtimestamp(flow.first_seen, tz),
+        last_seen=datetime.fromtimestamp(flow.last_seen, tz),
+        packet_count=flow.packets,
+        byte_count=flow.bytes,
+        source_file=flow.source_file[:512],
+        flow_hash=flow.flow_hash,
+    )
+
+
+def write_flows(flows, checkpoint=None):
+    """
+    Insert new flows, update known ones and advance the capture offsets in one transaction.
+
+    Args:
+        flows: _Flow objects (FlowAggregator.pending())
+        checkpoint: [(LogIngestionState pk, inode, offset)] covered by these flows (optional)
+
+    Returns (inserted, updated).
+    """
+    tz = timezone.get_current_timezone()
+    inserted = updated = 0
+    with transaction.atomic():
+        new_flows = {flow.flow_hash: flow for flow in flows if flow.pk is None}
+        hashes = list(new_flows)
+        for start in range(0, len(hashes), FLOW_WRITE_BATCH_SIZE):
+            # Rows of a capture that is read again (offset reset) are updated, not duplicated
+            chunk = hashes[start:start + FLOW_WRITE_BATCH_SIZE]
+            for flow_hash, pk in PacketFlow.objects.filter(flow_hash__in=chunk).values_list('flow_hash', 'pk'):
+                new_flows.pop(flow_hash).pk = pk
+
+        if new_flows:
+            PacketFlow.objects.bulk_create(
+                [_flow_row(flow, tz) for flow in new_flows.values()],
+                batch_size=FLOW_WRITE_BATCH_SIZE, ignore_conflicts=True,
+            )
+            inserted = len(new_flows)
+            # bulk_create does not return ids on MySQL
+            hashes = list(new_flows)
+            for start in range(0, len(hashes), FLOW_WRITE_BATCH_SIZE):
+                chunk = hashes[start:start + FLOW_WRITE_BATCH_SIZE]
+                for flow_hash, pk in PacketFlow.objects.filter(flow_hash__in=chunk).values_list('flow_hash', 'pk'):
+                    new_flows[flow_hash].pk = pk
+
+        known = [flow for flow in flows if flow.pk is not None and flow.flow_hash not in new_flows]
+        if known:
+            PacketFlow.objects.bulk_update(
+                [_flow_row(flow, tz) for flow in known],
+                ['last_seen', 'packet_count', 'byte_count'], batch_size=FLOW_WRITE_BATCH_SIZE,
+            )
+            updated = len(known)
+
+        if checkpoint:
+            _write_checkpoints(checkpoint)
+    return inserted, updated
+
+
+_flow_aggregators = {}
+_flow_aggregators_lock = threading.Lock()
+
+
+def get_flow_aggregator(log_dir):
+    """Process-wide FlowAggregator for a log directory (open flows span polling cycles)."""
+    key = str(Path(log_dir).resolve())
+    with _flow_aggregators_lock:
+        aggregator = _flow_aggregators.get(key)
+        if aggregator is None:
+            aggregator = _flow_aggregators[key] = FlowAggregator()
+        return aggregator
+
+
+def reset_flow_aggregators():
+    with _flow_aggregators_lock:
+        _flow_aggregators.clear()
+
+
+def ingest_snort_packet_logs(log_dir, max_packets=None, registry=None, aggregator=None):
+    """
+    Aggregate the IPv4 packets of snort.log* captures into PacketFlow rows.
+
+    Args:
+        log_dir: Path to Snort log directory
+        max_packets: Max packets to process (None = all)
+        registry: LogFileRegistry to use (default: process-wide registry for log_dir)
+        aggregator: FlowAggregator holding the open flows (default: process-wide one for log_dir)
+    """
+    log_dir_path = Path(log_dir)
+    if not log_dir_path.exists() or not log_dir_path.is_dir():
+        return {'inserted': 0, 'updated': 0, 'processed_packets': 0, 'failed_packets': 0, 'active_flows': 0}
+
+    if registry is None:
+        registry = get_file_registry(log_dir_path)
+    if aggregator is None:
+        aggregator = get_flow_aggregator(log_dir_path)
+    log_files = registry.iter_log_files(_is_packet_log_name)
+    write_every = max(1, int(getattr(settings, 'PACKET_FLOW_WRITE_PACKETS', 200000)))
+
+    inserted = 0
+    updated = 0
+    processed_packets = 0
+    failed_packets = 0
+    checkpoints = {}  # file_path -> (state pk, inode, offset) covered by the flows not written yet
+    telemetry = get_ingestion_telemetry()
+    sensor = telemetry_sensor(log_dir_path, registry.sensor)
+
+    def write_pending():
+        nonlocal inserted, updated, checkpoints
+        flows = aggregator.pending()
+        added, changed = write_flows(flows, checkpoint=list(checkpoints.values()))
+        aggregator.written(flows)
+        inserted += added
+        updated += changed
+        checkpoints = {}
+
+    add = aggregator.add
+    for log_file, file_path, stat_result in log_files:
+        if max_packets is not None and processed_packets >= max_packets:
+            break
+
+        # Nothing new since the last cycle - no open(), no DB query
+        if registry.is_unchanged(file_path, stat_result):
+            continue
+
+        try:
+            inode = str(stat_result.st_ino)
+            # Track ingestion state per file to resume on restart
+            state = registry.get_state(file_path)
+
+            # File was rotated/replaced - reset offset and inode
+            if state.inode != inode:
+                state.inode = inode
+                state.offset = 0
+
+            try:
+                capture = PacketCapture(log_file)
+            except CaptureFormatError:
+                registry.skip_until_changed(file_path, stat_result)
+                continue
+
+            with capture:
+                data_offset = capture.first_record_offset
+                if state.offset == 0:
+                    state.offset = data_offset
+                if state.offset < data_offset or state.offset > capture.size:
+                    state.offset = data_offset
+                registry.ensure_row(state)
+                start_offset = state.offset
+                counts_before = (processed_packets, failed_packets)
+                source_file = registry.event_source(file_path)
+
+                view = capture.view
+                since_write = 0
+                packets = capture.packets(state.offset)
+                for record_end, ts_sec, ts_usec, _ts_frac, linktype, data_start, caplen, orig_len in packets:
+                    if max_packets is not None and processed_packets >= max_packets:
+                        break
+                    processed_packets += 1
+                    state.offset = record_end
+
+                    if ts_sec > MAX_FLOW_TIMESTAMP:
+                        failed_packets += 1
+                        continue
+                    decoded = decode_ipv4(view, linktype, data_start, caplen)
+                    if decoded is not None:
+                        add(decoded, ts_sec + ts_usec / 1000000, orig_len, source_file, record_end)
+
+                    since_write += 1
+                    if since_write >= write_every:
+                        checkpoints[file_path] = (state.pk, state.inode, state.offset)
+                        write_pending()
+                        since_write = 0
+                # Stop the walk before the map is released
+                packets.close()
+
+                if capture.error:
+                    failed_packets += 1
+                    logger.warning(f'Corrupt packet capture {file_path}: {capture.error}')
+
+            checkpoints[file_path] = (state.pk, state.inode, state.offset)
+            write_pending()
+            registry.mark_ingested(file_path, state, stat_result)
+            # Packets count as the "lines" of a capture
+            telemetry.record_file(
+                sensor, file_path, state.file_size, state.offset,
+                lines=processed_packets - counts_before[0], bytes_read=state.offset - start_offset,
+                failed=failed_packets - counts_before[1],
+            )
+        except Exception:
+            logger.exception('Error while ingesting packet log file %s', log_file)
+            continue
+
+    # Flows of captures that went quiet end on wall-clock time
+    aggregator.expire(time.time())
+    try:
+        if aggregator.closed or checkpoints:
+            write_pending()
+    except Exception:
+        logger.exception('Failed to store packet flows')
+
+    # Persist all changed offsets in one batched write
+    try:
+        registry.flush()
+    except Exception:
+        logger.exception('Failed to save packet log ingestion state')
+
+    return {
+        'inserted': inserted,
+        'updated': updated,
+        'processed_packets': processed_packets,
+        'failed_packets': failed_packets,
+        'active_flows': len(aggregator.active),
+    }
@@ -0,0 +1,236 @@
+"""
+Per-file leases so several poll_snort_logs processes can share the log files.
+
+Without coordination two ingesters read every file twice and race on the
+same LogIngestionState rows. With INGEST_LEASES_ENABLED each process:
+
+- registers an IngestionNode row and renews it, plus every LogFileLease it
+  holds, from a heartbeat thread every INGEST_LEASE_SECONDS / 3
+- reads only the files it holds a lease on (LogFileRegistry.iter_log_files
+  asks claim())
+- prefers the files that rendezvous hashing assigns to it among the live
+  nodes, so N nodes split the files evenly and a node joining or leaving
+  moves only its share
+
+A lease row is the lock: it is taken with a conditional UPDATE (free or
+expired rows only), so a file has at most one owner. A node that stops
+renewing - crashed or hung - loses its leases after INGEST_LEASE_SECONDS
+and the next preferred node takes over from the committed offsets. Files
+nobody claims (their preferred node cannot see them) can be taken by any
+node after one lease period. A clean shutdown releases everything at once.
+
+Every node must see the same log roots (shared storage) under the same
+relative paths; Sensor names must match across nodes.
+"""
+import hashlib
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import IngestionNode, LogFileLease
+
+logger = logging.getLogger(__name__)
+
+
+def _rendezvous_score(owner, sensor, file_path):
+    digest = hashlib.blake2b(f'{owner}\0{sensor}\0{file_path}'.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+
+class FileLeaseManager:
+    """
+    Leases of one ingesting process (shared by its sensor worker threads).
+
+    Args:
+        owner: Node id (default: hostname:pid:random)
+        lease_seconds: Lease lifetime; failover takes at most this long (default from settings)
+        refresh_seconds: How long claim() trusts its previous answer for a file and
+                         the live node list (default lease_seconds / 3)
+    """
+
+    def __init__(self, owner=None, lease_seconds=None, refresh_seconds=None):
+        if lease_seconds is None:
+            lease_seconds = getattr(settings, 'INGEST_LEASE_SECONDS', 30)
+        self.lease_seconds = max(1.0, float(lease_seconds))
+        self.refresh_seconds = self.lease_seconds / 3 if refresh_seconds is None else max(0.0, float(refresh_seconds))
+        self.hostname = socket.gethostname()
+        self.owner = owner or f'{self.hostname}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self._lock = threading.Lock()
+        self._held = {}       # sensor -> file paths leased by this node
+        self._known = {}      # sensor -> file paths claim() answered for since _checked_at
+        self._checked_at = {}  # sensor -> monotonic time the answers were started
+        self._members = None
+        self._members_at = 0.0
+        self._stopping = threading.Event()
+        self._thread = None
+
+    # ---- Heartbeat ----
+
+    def start(self):
+        """Register the node and keep it and its leases alive from a background thread."""
+        self.heartbeat()
+        self._thread = threading.Thread(target=self._run, name='ingest-leases', daemon=True)
+        self._thread.start()
+        return self
+
+    def heartbeat(self):
+        # Renew the node row and every lease held (one upsert + one UPDATE)
+        expires_at = timezone.now() + timedelta(seconds=self.lease_seconds)
+        IngestionNode.objects.update_or_create(
+            owner=self.owner,
+            defaults={'hostname': self.hostname, 'pid': os.getpid(), 'expires_at': expires_at},
+        )
+        LogFileLease.objects.filter(owner=self.owner).update(expires_at=expires_at)
+
+    def _run(self):
+        try:
+            while not self._stopping.wait(self.lease_seconds / 3):
+                try:
+                    self.heartbeat()
+                except Exception as e:
+                    logger.warning(f'[Leases] Heartbeat failed: {e}')
+                finally:
+                    close_old_connections()
+        finally:
+            connection.close()
+
+    def close(self):
+        """Stop the heartbeat and release every lease so other nodes take over right away."""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        now = timezone.now()
+        LogFileLease.objects.filter(owner=self.owner).update(owner='', expires_at=now)
+        IngestionNode.objects.filter(owner=self.owner).delete()
+        with self._lock:
+            self._held = {}
+            self._known = {}
+            self._checked_at = {}
+
+    # ---- Claiming ----
+
+    def _live_members(self):
+        now = time.monotonic()
+        if self._members is None or now - self._members_at >= self.refresh_seconds:
+            members = set(IngestionNode.objects.filter(expires_at__gt=timezone.now()).values_list('owner', flat=True))
+            members.add(self.owner)
+            self._members = sorted(members)
+            self._members_at = now
+        return self._members
+
+    def preferred_owner(self, sensor, file_path, members=None):
+        """Live node that should read file_path (highest rendezvous hash)."""
+        members = members or self._live_members()
+        return max(members, key=lambda owner: _rendezvous_score(owner, sensor, file_path))
+
+    def claim(self, sensor, file_paths):
+        """
+        Lease what this node should read among file_paths.
+
+        Files already answered within refresh_seconds are served from memory,
+        so an idle cycle costs no query.
+
+        Returns: (file paths leased by this node, file paths newly acquired -
+                  their cached offsets may be stale)
+        """
+        paths = set(file_paths)
+        with self._lock:
+            now = time.monotonic()
+            if now - self._checked_at.get(sensor, float('-inf')) >= self.refresh_seconds:
+                self._checked_at[sensor] = now
+                self._known[sensor] = set()
+            held = self._held.setdefault(sensor, set())
+            unknown = paths - self._known[sensor]
+            acquired = set()
+            if unknown:
+                owned = self._claim(sensor, unknown)
+                acquired = owned - held
+                held -= unknown
+                held |= owned
+                self._known[sensor] |= unknown
+            return paths & held, acquired
+
+    def _claim(self, sensor, paths):
+        now = timezone.now()
+        expires_at = now + timedelta(seconds=self.lease_seconds)
+        members = self._live_members()
+        preferred = {path for path in paths if self.preferred_owner(sensor, path, members) == self.owner}
+        leases = LogFileLease.objects.filter(sensor=sensor)
+        rows = {row.file_path: row for row in leases.filter(file_path__in=paths)}
+
+        # Hand files over to the live node they now belong to (a node joined)
+        handover = [path for path, row in rows.items() if row.owner == self.owner and path not in preferred]
+        if handover:
+            leases.filter(file_path__in=handover, owner=self.owner).update(owner='', expires_at=expires_at)
+            logger.info(f'[Leases] Handed over {len(handover)} file(s) to other ingesters')
+
+        # New files: ours are taken now, the rest reserved for their preferred node for one lease period
+        missing = paths - rows.keys()
+        if missing:
+            LogFileLease.objects.bulk_create(
+                [
+                    LogFileLease(
+                        sensor=sensor,
+                        file_path=path,
+                        owner=self.owner if path in preferred else '',
+                        expires_at=expires_at,
+                    )
+                    for path in missing
+                ],
+                ignore_conflicts=True,
+            )
+
+        # Our files once free or expired (owner died); anyone's once expired (nobody claimed them)
+        takeable_preferred = [
+            path for path in preferred
+            if path in rows and rows[path].owner != self.owner and (not rows[path].owner or rows[path].expires_at < now)
+        ]
+        if takeable_preferred:
+            leases.filter(file_path__in=takeable_preferred).filter(Q(owner='') | Q(expires_at__lt=now)).update(
+                owner=self.owner, expires_at=expires_at,
+            )
+        takeable_orphans = [
+            path for path, row in rows.items()
+            if path not in preferred and row.owner != self.owner and row.expires_at < now
+        ]
+        if takeable_orphans:
+            leases.filter(file_path__in=takeable_orphans, expires_at__lt=now).update(
+                owner=self.owner, expires_at=expires_at,
+            )
+
+        return set(leases.filter(file_path__in=paths, owner=self.owner).values_list('file_path', flat=True))
+
+
+_lease_manager = None
+_lease_manager_lock = threading.Lock()
+
+
+def get_lease_manager():
+    """Process-wide FileLeaseManager (heartbeat running); None when INGEST_LEASES_ENABLED is off."""
+    global _lease_manager
+    if not getattr(settings, 'INGEST_LEASES_ENABLED', False):
+        return None
+    with _lease_manager_lock:
+        if _lease_manager is None:
+            _lease_manager = FileLeaseManager().start()
+            logger.info(f'[Leases] Ingesting as {_lease_manager.owner}')
+        return _lease_manager
+
+
+def reset_lease_manager():
+    # Release every lease of this process (shutdown, tests)
+    global _lease_manager
+    with _lease_manager_lock:
+        manager, _lease_manager = _lease_manager, None
+    if manager is not None:
+        manager.close()
@@ -0,0 +1,388 @@
+"""
+Micro-benchmarks for the Snort ingestion hot paths.
+
+Runs entirely in memory on synthetic data (no sensor or database needed):
+
+    python manage.py benchmark_ingestion fast-parser --lines 200000
+    python manage.py benchmark_ingestion fast-record --lines 200000
+    python manage.py benchmark_ingestion unified2 --lines 200000
+    python manage.py benchmark_ingestion alert-json --lines 200000
+    python manage.py benchmark_ingestion pcap --lines 2000000
+    python manage.py benchmark_ingestion pcap --capture /var/log/snort/snort.log.1713657600
+
+The pcap target writes its synthetic capture to a temporary file (about 90
+bytes per packet, so --lines 30000000 gives a multi-GB file) unless
+--capture points at a real one.
+"""
+import json
+import random
+import socket
+import struct
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from alerts.alert_json import JSON_DECODER, SnortJsonParser
+from alerts.models import Alert, Signature
+from alerts.pcap import PacketCapture, PacketTimestampCache, decode_ipv4
+from alerts.services import (
+    FAST_ALERT_PATTERN,
+    SnortTimestampCache,
+    _get_protocol_name,
+    _parse_fast_record,
+    compute_event_hashes,
+    map_priority_to_threat_level,
+    parse_endpoint,
+    parse_snort_fast_line,
+    validate_alert_data,
+)
+from alerts.unified2 import _synthetic_frame, build_unified2_bytes, parse_unified2_records, synthetic_unified2_events
+
+
+def build_fast_lines(count, alerts_per_second=500, seed=42):
+    # Synthetic FAST alert lines: many alerts share the same second, like a real flood
+    rng = random.Random(seed)
+    lines = []
+    for i in range(count):
+        second = i // alerts_per_second
+        lines.append(
+            f'04/21-{(second // 3600) % 24:02d}:{(second // 60) % 60:02d}:{second % 60:02d}.{rng.randrange(1000000):06d}  '
+            f'[**] [1:{1000001 + i % 20}:1] TCP SYN Flood Detected [**] '
+            f'[Classification: Attempted Denial of Service] [Priority: {1 + i % 3}] {{TCP}} '
+            f'192.168.{i % 256}.{(i // 256) % 256}:{1024 + i % 60000} -> 10.0.0.{i % 250 + 1}:80'
+        )
+    return lines
+
+
+def build_json_lines(count, alerts_per_second=500, seed=42):
+    # The same alerts as build_fast_lines, in Snort 3 alert_json form (default fields + msg/class/priority)
+    rng = random.Random(seed)
+    lines = []
+    for i in range(count):
+        second = i // alerts_per_second
+        lines.append(json.dumps({
+            'timestamp': f'04/21-{(second // 3600) % 24:02d}:{(second // 60) % 60:02d}:{second % 60:02d}.{rng.randrange(1000000):06d}',
+            'pkt_num': i + 1,
+            'proto': 'TCP',
+            'pkt_gen': 'raw',
+            'pkt_len': 60,
+            'dir': 'C2S',
+            'src_ap': f'192.168.{i % 256}.{(i // 256) % 256}:{1024 + i % 60000}',
+            'dst_ap': f'10.0.0.{i % 250 + 1}:80',
+            'rule': f'1:{1000001 + i % 20}:1',
+            'action': 'allow',
+            'msg': 'TCP SYN Flood Detected',
+            'class': 'Attempted Denial of Service',
+            'priority': 1 + i % 3,
+        }))
+    return lines
+
+
+def _legacy_parse_fast_record(file_path, line_start, raw_line, timestamp_cache):
+    # The previous FAST path: groupdict -> dict, then a validate_alert_data() pass, then a tuple
+    line = str(raw_line, 'utf-8', 'ignore').strip()
+    match = FAST_ALERT_PATTERN.match(line)
+    if not match:
+        return None
+    parts = match.groupdict()
+    timestamp_obj = timestamp_cache.parse(parts['timestamp'])
+    src_ip, src_port = parse_endpoint(parts['src'])
+    dest_ip, dest_port = parse_endpoint(parts['dest'])
+    if timestamp_obj is None or not src_ip or not dest_ip:
+        return None
+    priority = int(parts['priority'])
+    if priority < 1 or priority > 3:
+        priority = 3
+    parsed = {
+        'timestamp': timestamp_obj,
+        'src_ip': src_ip,
+        'src_port': src_port,
+        'dest_ip': dest_ip,
+        'dest_port': dest_port,
+        'protocol': str(parts.get('protocol', 'TCP')).strip()[:20] or 'TCP',
+        'sid': str(parts.get('sid', 'unknown')).strip()[:64] or 'unknown',
+        'message': str(parts.get('message', 'Unknown alert')).strip()[:512] or 'Unknown alert',
+        'classification': str(parts.get('classification', '')).strip()[:255],
+        'priority': priority,
+        'threat_level': map_priority_to_threat_level(priority),
+    }
+    is_valid, _error_msg, cleaned_data = validate_alert_data(parsed)
+    if not is_valid:
+        return None
+    event_hash, event_digest = compute_event_hashes(f'{file_path}:{line_start}:{line}')
+    return cleaned_data, line, event_hash, event_digest
+
+
+def _legacy_alert(record, signature):
+    # Keyword construction (message / classification / priority now live on the Signature)
+    cleaned_data, line, event_hash, event_digest = record
+    fields = {name: value for name, value in cleaned_data.items() if name not in ('message', 'classification', 'priority')}
+    return Alert(**fields, sensor='', signature=signature, raw_line=line, event_hash=event_hash, event_digest=event_digest)
+
+
+def _bytes_per_record(build):
+    # Memory held by the records build() returns (a batch waiting to be flushed), per record
+    tracemalloc.start()
+    try:
+        records = build()
+        held, _peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return held / max(1, len(records))
+
+
+def write_synthetic_pcap(path, count, chunk=100000):
+    # Little-endian microsecond pcap of Ethernet/IPv4 frames, written in chunks so huge captures fit in memory
+    with open(path, 'wb') as handle:
+        handle.write(struct.pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1))
+        for start in range(0, count, chunk):
+            events = synthetic_unified2_events(min(chunk, count - start), start_seconds=1713657600 + start // 500, seed=start)
+            parts = []
+            for event in events:
+                frame = _synthetic_frame(event)
+                parts.append(struct.pack('<IIII', event['seconds'], event['microseconds'], len(frame), len(frame)))
+                parts.append(frame)
+            handle.write(b''.join(parts))
+
+
+def _legacy_parse_ipv4_packet(packet_data):
+    # The previous per-packet decoder (copies of the frame and its header slices)
+    if len(packet_data) < 34:
+        return None
+    if struct.unpack('!H', packet_data[12:14])[0] != 0x0800:
+        return None
+    version_ihl = packet_data[14]
+    if version_ihl >> 4 != 4:
+        return None
+    ihl = (version_ihl & 0x0F) * 4
+    if len(packet_data) < 14 + ihl:
+        return None
+    protocol_number = packet_data[23]
+    src_ip = socket.inet_ntoa(packet_data[26:30])
+    dest_ip = socket.inet_ntoa(packet_data[30:34])
+    src_port = dest_port = None
+    if protocol_number in (6, 17) and len(packet_data) >= 14 + ihl + 4:
+        src_port, dest_port = struct.unpack('!HH', packet_data[14 + ihl:14 + ihl + 4])
+    return src_ip, src_port, dest_ip, dest_port, _get_protocol_name(protocol_number)
+
+
+def read_packets_legacy(path):
+    """Previous reader: two read() calls per packet, sliced frames, fromtimestamp per packet."""
+    tz = timezone.get_current_timezone()
+    count, last = 0, None
+    with open(path, 'rb') as handle:
+        header = handle.read(24)
+        endian = '<' if header[:4] in (b'\xd4\xc3\xb2\xa1', b'\x4d\x3c\xb2\xa1') else '>'
+        while True:
+            packet_header = handle.read(16)
+            if len(packet_header) < 16:
+                break
+            ts_sec, ts_usec, incl_len, _orig_len = struct.unpack(f'{endian}IIII', packet_header)
+            packet_data = handle.read(incl_len)
+            if len(packet_data) < incl_len:
+                break
+            parsed = _legacy_parse_ipv4_packet(packet_data)
+            if parsed is None:
+                continue
+            last = (datetime.fromtimestamp(ts_sec, tz).replace(microsecond=min(ts_usec, 999999)),) + parsed
+            count += 1
+    return count, last
+
+
+def read_packets_mmap(path):
+    """alerts.pcap reader: mmap + precompiled unpack_from, per-second timestamp cache."""
+    timestamps = PacketTimestampCache()
+    count, last = 0, None
+    with PacketCapture(path) as capture:
+        view = capture.view
+        for _record_end, ts_sec, ts_usec, _ts_frac, linktype, data_start, caplen, _orig_len in capture.packets():
+            decoded = decode_ipv4(view, linktype, data_start, caplen)
+            if decoded is None:
+                continue
+            src_ip, src_port, dest_ip, dest_port, protocol_number = decoded
+            last = (timestamps.get(ts_sec, ts_usec), src_ip, src_port, dest_ip, dest_port, _get_protocol_name(protocol_number))
+            count += 1
+    return count, last
+
+
+class Command(BaseCommand):
+    help = 'Benchmark Snort ingestion hot paths (lines/second before and after optimisations).'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'target',
+            choices=['fast-parser', 'fast-record', 'unified2', 'alert-json', 'pcap'],
+            help='Which code path to benchmark.',
+        )
+        parser.add_argument(
+            '--lines',
+            type=int,
+            default=100000,
+            help='Number of synthetic records (default: 100000)',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=3,
+            help='Runs per variant; the best run is reported (default: 3)',
+        )
+        parser.add_argument(
+            '--capture',
+            help='pcap target: benchmark this capture file instead of a synthetic one',
+        )
+
+    def handle(self, *args, **options):
+        count = max(1, options['lines'])
+        repeat = max(1, options['repeat'])
+
+        self.capture = options.get('capture')
+
+        handler = getattr(self, f"bench_{options['target'].replace('-', '_')}")
+        self.stdout.write(self.style.SUCCESS(f"=== benchmark: {options['target']} ({count} records) ==="))
+        handler(count, repeat)
+
+    # ---- helpers ----
+
+    def _best_of(self, repeat, func):
+        best = None
+        result = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = func()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best, result
+
+    def _report(self, label, count, seconds, baseline=None):
+        rate = count / seconds if seconds else float('inf')
+        line = f'  {label:<28} {rate:>12,.0f} records/s  ({seconds:.3f}s)'
+        if baseline:
+            line += f'  x{baseline / seconds:.2f}'
+        self.stdout.write(line)
+
+    # ---- targets ----
+
+    def bench_fast_parser(self, count, repeat):
+        lines = build_fast_lines(count)
+
+        baseline, reference = self._best_of(
+            repeat, lambda: [parse_snort_fast_line(line) for line in lines]
+        )
+
+        def cached_run():
+            cache = SnortTimestampCache()
+            return [parse_snort_fast_line(line, timestamp_cache=cache) for line in lines]
+
+        cached, results = self._best_of(repeat, cached_run)
+
+        if results != reference:
+            raise CommandError('Timestamp cache output differs from the reference parser')
+
+        self._report('strptime (reference)', count, baseline)
+        self._report('timestamp cache', count, cached, baseline)
+
+    def bench_fast_record(self, count, repeat):
+        lines = [line.encode() for line in build_fast_lines(count)]
+
+        def legacy_parse():
+            cache = SnortTimestampCache()
+            return [_legacy_parse_fast_record('alert', index, line, cache) for index, line in enumerate(lines)]
+
+        def record_parse():
+            cache = SnortTimestampCache()
+            return [_parse_fast_record('alert', index, line, cache)[0] for index, line in enumerate(lines)]
+
+        # Reader-side cost: what the reader thread spends per line before handing a batch on
+        legacy, legacy_records = self._best_of(repeat, legacy_parse)
+        fused, records = self._best_of(repeat, record_parse)
+        if [record.cleaned_data() for record in records] != [record[0] for record in legacy_records]:
+            raise CommandError('AlertRecord parser output differs from the previous parser')
+
+        # Insert-boundary cost: building the unsaved Alert objects for bulk_create
+        # (one unsaved signature stands in for the resolved ones - no database here)
+        signature = Signature(gid=1, sid='1000001', rev=1, message='TCP SYN Flood Detected')
+        legacy_build, _alerts = self._best_of(
+            repeat, lambda: [_legacy_alert(record, signature) for record in legacy_records]
+        )
+        record_build, _alerts = self._best_of(repeat, lambda: [record.to_alert('', signature) for record in records])
+
+        self._report('dict + validate (previous)', count, legacy)
+        self._report('fused AlertRecord', count, fused, legacy)
+        self._report('Alert(**kwargs)', count, legacy_build)
+        self._report('AlertRecord.to_alert', count, record_build, legacy_build)
+        self._report('parse + build (previous)', count, legacy + legacy_build)
+        self._report('parse + build', count, fused + record_build, legacy + legacy_build)
+
+        legacy_bytes = _bytes_per_record(legacy_parse)
+        record_bytes = _bytes_per_record(record_parse)
+        self.stdout.write(
+            f'  batched record size: {legacy_bytes:,.0f} -> {record_bytes:,.0f} bytes/record '
+            f'({record_bytes / legacy_bytes:.0%})'
+        )
+
+    def bench_unified2(self, count, repeat):
+        data = build_unified2_bytes(synthetic_unified2_events(count))
+        records, _errors = parse_unified2_records(data)
+        # The same events as FAST text (raw_line), through the full text path: parse + validate + hash
+        lines = [record.raw_line.encode() for record in records]
+
+        def text_run():
+            cache = SnortTimestampCache()
+            return [_parse_fast_record('alert', index, line, cache)[0] for index, line in enumerate(lines)]
+
+        baseline, text_records = self._best_of(repeat, text_run)
+        binary, binary_records = self._best_of(repeat, lambda: parse_unified2_records(data)[0])
+
+        if len(binary_records) != count or sum(record is not None for record in text_records) != count:
+            raise CommandError('unified2 and FAST paths produced a different number of alerts')
+
+        self._report('FAST text (parse+validate)', count, baseline)
+        self._report('unified2 (struct)', count, binary, baseline)
+
+    def bench_alert_json(self, count, repeat):
+        fast_lines = [line.encode() for line in build_fast_lines(count)]
+        json_lines = [line.encode() for line in build_json_lines(count)]
+
+        def run(parse_record, lines):
+            cache = SnortTimestampCache()
+            return [parse_record('alert', index, line, cache)[0] for index, line in enumerate(lines)]
+
+        # Full per-line path of each source: decode + parse + validate + hash
+        baseline, fast_records = self._best_of(repeat, lambda: run(_parse_fast_record, fast_lines))
+        stdlib, json_records = self._best_of(repeat, lambda: run(SnortJsonParser(loads=json.loads), json_lines))
+
+        if [record.cleaned_data() for record in fast_records] != [record.cleaned_data() for record in json_records]:
+            raise CommandError('alert_json and FAST paths produced different alerts')
+
+        self._report('FAST text (regex)', count, baseline)
+        self._report('alert_json (json)', count, stdlib, baseline)
+        if JSON_DECODER != 'json':
+            fast_json, _records = self._best_of(repeat, lambda: run(SnortJsonParser(), json_lines))
+            self._report(f'alert_json ({JSON_DECODER})', count, fast_json, baseline)
+        else:
+            self.stdout.write('  (install orjson or ujson for the faster decoder)')
+
+    def bench_pcap(self, count, repeat):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = self.capture
+            if not path:
+                path = Path(tmp) / 'snort.log.bench'
+                write_synthetic_pcap(path, count)
+            size = Path(path).stat().st_size
+            self.stdout.write(f'  capture: {path} ({size / 1024 ** 2:,.1f} MiB)')
+
+            baseline, reference = self._best_of(repeat, lambda: read_packets_legacy(path))
+            mapped, result = self._best_of(repeat, lambda: read_packets_mmap(path))
+
+        if result != reference:
+            raise CommandError('mmap reader output differs from the read() reader')
+
+        packets = reference[0]
+        self._report('read() + slices (previous)', packets, baseline)
+        self._report('mmap + unpack_from', packets, mapped, baseline)
+        self.stdout.write(f'  {size / 1024 ** 2 / mapped:,.0f} MiB/s with the mmap reader')
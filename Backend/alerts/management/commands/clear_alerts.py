@@ -27,6 +27,7 @@ class Command(BaseCommand):
         state_count = LogIngestionState.objects.count()
 
         with connection.cursor() as cursor:
+            cursor.execute('TRUNCATE TABLE alerts_alertoutbox')
             cursor.execute('TRUNCATE TABLE alerts_alert')
             cursor.execute('TRUNCATE TABLE alerts_logingestionstate')
 
@@ -0,0 +1,68 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from alerts.models import AlertOutbox
+from alerts.outbox import dispatch_outbox
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued WebSocket/email notifications from the alert outbox (safe to run alongside other dispatchers).'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Drain the currently due entries once and exit.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.ALERT_OUTBOX_BATCH_SIZE,
+            help='Entries per dispatch pass (default from settings).',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=settings.ALERT_OUTBOX_POLL_SECONDS,
+            help='Seconds to sleep when the outbox is empty (default from settings).',
+        )
+        parser.add_argument(
+            '--retry-failed',
+            action='store_true',
+            help='Re-queue entries that exhausted their attempts before starting.',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options['batch_size'])
+        interval = max(0.05, options['interval'])
+
+        if options.get('retry_failed'):
+            requeued = AlertOutbox.objects.filter(failed=True).update(failed=False, attempts=0)
+            self.stdout.write(self.style.WARNING(f'[RETRY] Re-queued {requeued} failed outbox entries'))
+
+        self.stdout.write(self.style.SUCCESS('[OK] Alert outbox dispatcher started'))
+        totals = {'dispatched': 0, 'retried': 0, 'failed': 0, 'websocket_posts': 0}
+
+        try:
+            while True:
+                result = dispatch_outbox(batch_size=batch_size)
+                for key, value in result.items():
+                    totals[key] += value
+                if result['dispatched'] or result['retried'] or result['failed']:
+                    self.stdout.write(
+                        f"Dispatched: {result['dispatched']} | Retrying: {result['retried']} | "
+                        f"Failed: {result['failed']} | WS posts: {result['websocket_posts']}"
+                    )
+                    self.stdout.flush()
+                    continue  # Keep draining a backlog without sleeping
+                if options.get('once'):
+                    break
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('\n[STOP] Outbox dispatcher stopped'))
+
+        self.stdout.write(
+            f"Total dispatched: {totals['dispatched']} | WS posts: {totals['websocket_posts']} | Failed: {totals['failed']}"
+        )
@@ -2,19 +2,35 @@ from django.conf import settings
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 
+from alerts.alert_json import JSON_DECODER, ingest_snort_json_logs
+from alerts.dedup import get_event_cache
+from alerts.flows import ingest_snort_packet_logs
+from alerts.leases import get_lease_manager, reset_lease_manager
 from alerts.models import LogIngestionState
-from alerts.services import ingest_snort_logs, ingest_snort_packet_logs
+from alerts.outbox import OutboxDispatcher
+from alerts.pipeline import IngestionPipeline
+from alerts.sensors import SensorSupervisor, ingest_log_root
+from alerts.services import AdaptiveBatchPolicy, backfill_snort_logs_parallel, ingest_snort_logs
+from alerts.telemetry import publish_ingestion_telemetry
+from alerts.unified2 import ingest_snort_unified2_logs
+from alerts.watcher import create_log_watcher, inotify_available
 
 
 class Command(BaseCommand):
-    help = 'Continuously polls Snort logs and ingests new alerts/packets into the database.'
+    help = 'Continuously polls Snort logs and ingests new alerts and packet flows into the database.'
 
     def add_arguments(self, parser):
         parser.add_argument(
             '--interval',
             type=int,
             default=settings.SNORT_POLL_INTERVAL_SECONDS,
-            help='Polling interval in seconds (default from settings)',
+            help='Polling interval in seconds (default from settings). Only used with --no-watch.',
+        )
+
+        parser.add_argument(
+            '--no-watch',
+            action='store_true',
+            help='Disable event-driven ingestion (inotify/stat watcher) and sleep --interval between cycles.',
         )
 
         parser.add_argument(
@@ -29,12 +45,31 @@ class Command(BaseCommand):
             help='On startup, ingest existing logs once WITHOUT email/websocket (faster, avoids spam), then start polling.',
         )
 
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Parser processes for --backfill (default 1 = single process). Large files are split into byte ranges.',
+        )
+
         parser.add_argument(
             '--once',
             action='store_true',
             help='Ingest/backfill once and exit (no continuous polling).',
         )
 
+        parser.add_argument(
+            '--no-pipeline',
+            action='store_true',
+            help='Persist, enrich and notify inline on the reader thread instead of the staged worker pipeline.',
+        )
+
+        parser.add_argument(
+            '--no-dispatcher',
+            action='store_true',
+            help='Do not deliver outbox notifications from this process (run dispatch_alert_outbox separately).',
+        )
+
         parser.add_argument(
             '--no-ml',
             action='store_true',
@@ -60,6 +95,13 @@ class Command(BaseCommand):
         enable_ml = not bool(options.get('no_ml'))
         enable_email = not bool(options.get('no_email'))
         enable_websocket = not bool(options.get('no_websocket'))
+        watch = settings.SNORT_WATCH_ENABLED and not bool(options.get('no_watch'))
+        rescan_seconds = max(1, settings.SNORT_WATCH_RESCAN_SECONDS)
+        sensor_reload_seconds = max(1, settings.SNORT_SENSOR_RELOAD_SECONDS)
+        # Several ingesters split the files through leases; rescan often enough to take over a dead node's files
+        leases = get_lease_manager()
+        if leases is not None:
+            rescan_seconds = max(1, min(rescan_seconds, int(leases.lease_seconds)))
 
         if options.get('reset_state'):
             updated = LogIngestionState.objects.update(offset=0)
@@ -71,7 +113,18 @@ class Command(BaseCommand):
             )
         )
         self.stdout.write(f'  Location: {settings.SNORT_LOG_DIR}')
-        self.stdout.write(f'  Interval: {interval}s')
+        if watch:
+            mode = 'inotify' if inotify_available() else 'stat polling'
+            self.stdout.write(f'  Mode:     event-driven ({mode}, rescan every {rescan_seconds}s)')
+        else:
+            self.stdout.write(f'  Interval: {interval}s')
+        self.stdout.write(f'  JSON:     alert_json decoded with {JSON_DECODER}')
+        if leases is not None:
+            self.stdout.write(f'  Leases:   node {leases.owner} (lease {leases.lease_seconds:g}s)')
+        # Seed the recent-event dedup cache from the newest stored alerts
+        dedup_cache = get_event_cache()
+        if dedup_cache is not None:
+            self.stdout.write(f"  Dedup:    {dedup_cache.stats()['entries']} recent events cached")
         self.stdout.write(f'  Press Ctrl+C to stop\n')
         self.stdout.write('Loading ML analyzer...(running in silent mode)\n')
         
@@ -82,68 +135,159 @@ class Command(BaseCommand):
         if options.get('backfill'):
             self.stdout.write(self.style.WARNING('[BACKFILL] Ingesting existing logs (email/websocket disabled)...'))
             try:
-                backfill_text = ingest_snort_logs(
+                workers = max(1, options.get('workers') or 1)
+                if workers > 1:
+                    self.stdout.write(f'[BACKFILL] Parsing with {workers} worker processes')
+                    backfill_text = backfill_snort_logs_parallel(
+                        settings.SNORT_LOG_DIR,
+                        workers=workers,
+                        enable_ml=enable_ml,
+                    )
+                else:
+                    backfill_text = ingest_snort_logs(
+                        settings.SNORT_LOG_DIR,
+                        enable_ml=enable_ml,
+                        enable_email=False,
+                        enable_websocket=False,
+                    )
+                backfill_json = ingest_snort_json_logs(
                     settings.SNORT_LOG_DIR,
                     enable_ml=enable_ml,
                     enable_email=False,
                     enable_websocket=False,
                 )
-                backfill_packets = ingest_snort_packet_logs(
+                backfill_unified2 = ingest_snort_unified2_logs(
                     settings.SNORT_LOG_DIR,
                     enable_ml=enable_ml,
                     enable_email=False,
                     enable_websocket=False,
                 )
+                backfill_packets = ingest_snort_packet_logs(settings.SNORT_LOG_DIR)
                 self.stdout.write(
                     self.style.SUCCESS(
-                        f"[BACKFILL] Alerts inserted={backfill_text.get('inserted', 0)} processed={backfill_text.get('processed_lines', 0)} failed={backfill_text.get('failed_lines', 0)}"
+                        f"[BACKFILL] Alerts inserted={backfill_text.get('inserted', 0)} processed={backfill_text.get('processed_lines', 0)} failed={backfill_text.get('failed_lines', 0)} duplicates={backfill_text.get('skipped_duplicates', 0)}"
                     )
                 )
+                if backfill_json.get('processed_lines', 0):
+                    self.stdout.write(
+                        self.style.SUCCESS(
+                            f"[BACKFILL] alert_json inserted={backfill_json.get('inserted', 0)} processed={backfill_json.get('processed_lines', 0)} failed={backfill_json.get('failed_lines', 0)} duplicates={backfill_json.get('skipped_duplicates', 0)}"
+                        )
+                    )
+                if backfill_unified2.get('processed_records', 0):
+                    self.stdout.write(
+                        self.style.SUCCESS(
+                            f"[BACKFILL] unified2 inserted={backfill_unified2.get('inserted', 0)} processed={backfill_unified2.get('processed_records', 0)} failed={backfill_unified2.get('failed_records', 0)} duplicates={backfill_unified2.get('skipped_duplicates', 0)}"
+                        )
+                    )
                 if backfill_packets.get('processed_packets', 0) or backfill_packets.get('inserted', 0):
                     self.stdout.write(
                         self.style.SUCCESS(
-                            f"[BACKFILL] Packets inserted={backfill_packets.get('inserted', 0)} processed={backfill_packets.get('processed_packets', 0)} failed={backfill_packets.get('failed_packets', 0)}"
+                            f"[BACKFILL] Packets processed={backfill_packets.get('processed_packets', 0)} failed={backfill_packets.get('failed_packets', 0)} flows inserted={backfill_packets.get('inserted', 0)} updated={backfill_packets.get('updated', 0)}"
                         )
                     )
             except Exception as exc:
                 self.stderr.write(self.style.ERROR(f'[BACKFILL] Error: {exc}'))
+            publish_ingestion_telemetry(force=True)
 
             if options.get('once'):
+                reset_lease_manager()
                 return
 
+        # Watch for log changes (created after backfill so startup scan is not duplicated)
+        watcher = None
+        if watch:
+            watcher = create_log_watcher(
+                settings.SNORT_LOG_DIR,
+                stat_interval=settings.SNORT_WATCH_STAT_INTERVAL_SECONDS,
+            )
+
+        # Persist / ML / notifications on worker threads so slow side effects don't stall parsing
+        # Batch size adapts to insert latency; shared with the pipeline's persist stage
+        batch_policy = AdaptiveBatchPolicy()
+        pipeline = None
+        if settings.INGEST_PIPELINE_ENABLED and not options.get('no_pipeline'):
+            pipeline = IngestionPipeline(
+                enable_ml=enable_ml,
+                enable_email=enable_email,
+                enable_websocket=enable_websocket,
+                dedup_cache=dedup_cache,  # Same cache the readers check: stored digests land in it
+                batch_policy=batch_policy,
+            )
+            workers = ', '.join(f"{name}={stats['workers']}" for name, stats in pipeline.stats().items())
+            self.stdout.write(f'  Pipeline: {workers}')
+
+        # Deliver queued notifications in the background (independent of ingestion latency)
+        dispatcher = None
+        if settings.ALERT_OUTBOX_ENABLED and not options.get('no_dispatcher') and (enable_email or enable_websocket):
+            dispatcher = OutboxDispatcher()
+            dispatcher.start()
+            self.stdout.write('  Outbox:   dispatcher running')
+
+        # One worker thread per enabled Sensor row, sharing the pipeline (re-read every SNORT_SENSOR_RELOAD_SECONDS)
+        ingest_options = {
+            'pipeline': pipeline,
+            'batch_policy': batch_policy,
+            'enable_ml': enable_ml,
+            'enable_email': enable_email,
+            'enable_websocket': enable_websocket,
+        }
+        supervisor = SensorSupervisor(watch=watch, interval=interval, rescan_seconds=rescan_seconds, **ingest_options)
+        sensors_reloaded_at = None
+
         try:
             while True:
                 try:
-                    text_result = ingest_snort_logs(
-                        settings.SNORT_LOG_DIR,
-                        enable_ml=enable_ml,
-                        enable_email=enable_email,
-                        enable_websocket=enable_websocket,
-                    )
-                    packet_result = ingest_snort_packet_logs(
-                        settings.SNORT_LOG_DIR,
-                        enable_ml=enable_ml,
-                        enable_email=enable_email,
-                        enable_websocket=enable_websocket,
-                    )
+                    if sensors_reloaded_at is None or time.monotonic() - sensors_reloaded_at >= sensor_reload_seconds:
+                        sensors_reloaded_at = time.monotonic()
+                        started, stopped = supervisor.reconcile()
+                        if started or stopped:
+                            self.stdout.write(
+                                f"[SENSORS] Running: {', '.join(supervisor.workers) or 'none'}"
+                                f" (started {len(started)}, stopped {len(stopped)})"
+                            )
+
+                    root_results = ingest_log_root(settings.SNORT_LOG_DIR, **ingest_options)
+                    packet_result = root_results['packets']
                     
                     # Track cumulative stats
-                    inserted = text_result.get('inserted', 0)
-                    processed = text_result.get('processed_lines', 0)
-                    failed = text_result.get('failed_lines', 0)
+                    results = (root_results['text'], root_results['json'], root_results['unified2'])
+                    inserted = sum(result.get('inserted', 0) for result in results)
+                    processed = sum(result.get('processed_lines', result.get('processed_records', 0)) for result in results)
+                    failed = sum(result.get('failed_lines', result.get('failed_records', 0)) for result in results)
+                    shed = sum(result.get('shed_events', 0) for result in results)
+                    batches = batch_policy.take_cycle_stats()
                     
-                    if processed > 0 or inserted > 0 or failed > 0:
+                    packets = packet_result.get('processed_packets', 0)
+                    if processed > 0 or inserted > 0 or failed > 0 or packets > 0:
                         # Show real-time activity
                         timestamp = timezone.now().strftime('%H:%M:%S')
-                        self.stdout.write(f'[{timestamp}] Detected: {processed} | Inserted: {inserted} | Failed: {failed}')
+                        activity = f'[{timestamp}] Detected: {processed} | Inserted: {inserted} | Failed: {failed}'
+                        if shed:
+                            activity += f' | Shed (behind): {shed}'
+                        if packets:
+                            activity += f" | Packets: {packets} (flows +{packet_result.get('inserted', 0)}, open {packet_result.get('active_flows', 0)})"
+                        if batches['batches']:
+                            activity += (
+                                f" | Batches: {batches['batches']} avg {batches['avg_batch']} (target {batches['target']}; "
+                                f"size={batches['size']} deadline={batches['deadline']} end={batches['end']})"
+                            )
+                        if pipeline is not None:
+                            depths = '/'.join(str(stats['depth']) for stats in pipeline.stats().values())
+                            activity += f' | Queues ({"/".join(pipeline.stats())}): {depths}'
+                        self.stdout.write(activity)
                         total_alerts += processed
                         total_ingested += inserted
                         total_failed += failed
+
+                    # Lag / throughput snapshot for the API (every INGEST_TELEMETRY_PUBLISH_SECONDS)
+                    publish_ingestion_telemetry()
                     
                     self.stdout.flush()
                     self.stderr.flush()
                     
-                    time.sleep(max(1, interval))
+                    # Wake up in time for the next Sensor table reload
+                    self._wait_for_changes(watcher, interval, min(rescan_seconds, sensor_reload_seconds))
                             
                 except Exception as exc:
                     self.stderr.write(self.style.ERROR(f'Error: {exc}'))
@@ -161,4 +305,41 @@ class Command(BaseCommand):
             self.stdout.write(f"  Email Enabled:       {enable_email}")
             self.stdout.write(f"  WebSocket Enabled:   {enable_websocket}")
             self.stdout.write(f'  Failures:            {total_failed}')
+            for worker in supervisor.workers.values():
+                self.stdout.write(
+                    f"  Sensor {worker.sensor + ':':<13}{worker.totals['processed']} found, {worker.totals['inserted']} ingested, "
+                    f"{worker.totals['failed']} failures"
+                )
+            if dedup_cache is not None:
+                stats = dedup_cache.stats()
+                self.stdout.write(f"  Dedup Cache Hits:    {stats['hits'] + stats['bloom_hits']}")
+                self.stdout.write(f"  Bloom False Pos.:    {stats['bloom_false_positives']}")
+            if pipeline is not None:
+                for name, stats in pipeline.stats().items():
+                    self.stdout.write(
+                        f"  Stage {name + ':':<14}{stats['batches']} batches, max depth {stats['max_depth']}/{stats['capacity']}, "
+                        f"busy {stats['busy_seconds']}s, blocked {stats['blocked_seconds']}s, errors {stats['errors']}"
+                    )
+            if dispatcher is not None:
+                self.stdout.write(f"  Outbox Dispatched:   {dispatcher.totals['dispatched']} ({dispatcher.totals['websocket_posts']} WS posts)")
             self.stdout.write(self.style.SUCCESS('===============================\n'))
+        finally:
+            # Workers first: they submit to the pipeline
+            supervisor.stop_all()
+            if watcher is not None:
+                watcher.close()
+            if pipeline is not None:
+                pipeline.close()
+            if dispatcher is not None:
+                dispatcher.stop()
+            # Hand this node's files to the other ingesters right away (offsets are all stored now)
+            reset_lease_manager()
+
+    def _wait_for_changes(self, watcher, interval, rescan_seconds):
+        # Block until Snort writes (watch mode) or sleep the fixed interval (--no-watch)
+        import time
+
+        if watcher is None:
+            time.sleep(max(1, interval))
+            return
+        watcher.wait(timeout=rescan_seconds)
@@ -0,0 +1,151 @@
+import asyncio
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from alerts.dedup import get_event_cache
+from alerts.outbox import OutboxDispatcher
+from alerts.pipeline import IngestionPipeline
+from alerts.services import AdaptiveBatchPolicy
+from alerts.syslog_receiver import SyslogAlertReceiver
+
+
+class Command(BaseCommand):
+    help = 'Receive Snort alerts pushed by sensors over syslog (UDP/TCP) and ingest them in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--host',
+            default=settings.SYSLOG_RECEIVER_HOST,
+            help='Address to listen on (default from settings).',
+        )
+        parser.add_argument(
+            '--udp-port',
+            type=int,
+            default=settings.SYSLOG_RECEIVER_UDP_PORT,
+            help='UDP port (default from settings, -1 disables UDP).',
+        )
+        parser.add_argument(
+            '--tcp-port',
+            type=int,
+            default=settings.SYSLOG_RECEIVER_TCP_PORT,
+            help='TCP port, newline framed (default from settings, -1 disables TCP).',
+        )
+        parser.add_argument(
+            '--stats-interval',
+            type=int,
+            default=10,
+            help='Seconds between activity lines (default: 10).',
+        )
+        parser.add_argument(
+            '--no-pipeline',
+            action='store_true',
+            help='Persist, enrich and notify on the writer thread instead of the staged worker pipeline.',
+        )
+        parser.add_argument(
+            '--no-dispatcher',
+            action='store_true',
+            help='Do not deliver outbox notifications from this process (run dispatch_alert_outbox separately).',
+        )
+        parser.add_argument(
+            '--no-ml',
+            action='store_true',
+            help='Disable ML enrichment during ingestion.',
+        )
+        parser.add_argument(
+            '--no-email',
+            action='store_true',
+            help='Disable alert email notifications during ingestion.',
+        )
+        parser.add_argument(
+            '--no-websocket',
+            action='store_true',
+            help='Disable WebSocket broadcasts during ingestion.',
+        )
+
+    def handle(self, *args, **options):
+        enable_ml = not bool(options.get('no_ml'))
+        enable_email = not bool(options.get('no_email'))
+        enable_websocket = not bool(options.get('no_websocket'))
+        udp_port = options['udp_port'] if options['udp_port'] >= 0 else None
+        tcp_port = options['tcp_port'] if options['tcp_port'] >= 0 else None
+
+        # Seed the recent-event dedup cache from the newest stored alerts
+        dedup_cache = get_event_cache()
+
+        batch_policy = AdaptiveBatchPolicy()
+        pipeline = None
+        if settings.INGEST_PIPELINE_ENABLED and not options.get('no_pipeline'):
+            pipeline = IngestionPipeline(
+                enable_ml=enable_ml,
+                enable_email=enable_email,
+                enable_websocket=enable_websocket,
+                dedup_cache=dedup_cache,  # Same cache the readers check: stored digests land in it
+                batch_policy=batch_policy,
+            )
+
+        dispatcher = None
+        if settings.ALERT_OUTBOX_ENABLED and not options.get('no_dispatcher') and (enable_email or enable_websocket):
+            dispatcher = OutboxDispatcher()
+            dispatcher.start()
+
+        receiver = SyslogAlertReceiver(
+            host=options['host'],
+            udp_port=udp_port,
+            tcp_port=tcp_port,
+            enable_ml=enable_ml,
+            enable_email=enable_email,
+            enable_websocket=enable_websocket,
+            pipeline=pipeline,
+            batch_policy=batch_policy,
+            dedup_cache=dedup_cache,
+        )
+
+        try:
+            asyncio.run(self._serve(receiver, max(1, options['stats_interval'])))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if pipeline is not None:
+                pipeline.close()
+            if dispatcher is not None:
+                dispatcher.stop()
+
+        stats = receiver.stats
+        self.stdout.write(self.style.WARNING('\n[STOP] Syslog receiver stopped\n'))
+        self.stdout.write(self.style.SUCCESS('======= Session Summary ======='))
+        self.stdout.write(f"  Messages Received:   {stats['received']}")
+        self.stdout.write(f"  Alerts Parsed:       {stats['parsed']}")
+        self.stdout.write(f"  Alerts Ingested:     {stats['inserted']}")
+        self.stdout.write(f"  Duplicates Skipped:  {stats['skipped_duplicates']}")
+        self.stdout.write(f"  Failures:            {stats['failed']}")
+        self.stdout.write(f"  UDP Dropped:         {stats['dropped']}")
+        self.stdout.write(self.style.SUCCESS('===============================\n'))
+
+    async def _serve(self, receiver, stats_interval):
+        await receiver.start()
+        self.stdout.write(self.style.SUCCESS('[OK] Snort syslog receiver started'))
+        if receiver.udp_port is not None:
+            self.stdout.write(f'  UDP:      {receiver.host}:{receiver.udp_port}')
+        if receiver.tcp_port is not None:
+            self.stdout.write(f'  TCP:      {receiver.host}:{receiver.tcp_port}')
+        self.stdout.write('  Press Ctrl+C to stop\n')
+        self.stdout.flush()
+
+        try:
+            last = dict(receiver.stats)
+            while True:
+                await asyncio.sleep(stats_interval)
+                stats = dict(receiver.stats)
+                if stats != last:
+                    timestamp = timezone.now().strftime('%H:%M:%S')
+                    self.stdout.write(
+                        f"[{timestamp}] Received: {stats['received'] - last['received']} | "
+                        f"Parsed: {stats['parsed'] - last['parsed']} | Failed: {stats['failed'] - last['failed']} | "
+                        f"Dropped: {stats['dropped'] - last['dropped']}"
+                    )
+                    self.stdout.flush()
+                    last = stats
+        finally:
+            await receiver.close()
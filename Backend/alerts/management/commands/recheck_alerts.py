@@ -66,7 +66,7 @@ class Command(BaseCommand):
 
         # Get all alerts
         try:
-            query = Alert.objects.all()
+            query = Alert.objects.select_related('signature')
             if limit:
                 query = query[:limit]
             
@@ -32,7 +32,7 @@ class Command(BaseCommand):
         limit = int(options['limit'])
         threat_level = options['threat_level']
 
-        qs = Alert.objects.all()
+        qs = Alert.objects.select_related('signature')
 
         if threat_level != 'all':
             qs = qs.filter(threat_level=threat_level)
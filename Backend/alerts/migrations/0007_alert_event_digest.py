@@ -0,0 +1,33 @@
+"""
+Add Alert.event_digest: a 16-byte BLAKE2b digest (VARBINARY(16) on MySQL)
+replacing the 64-char hex SHA-256 event_hash as the ingestion dedup key.
+
+Transition:
+  1. This migration adds the nullable column. Ingestion dual-writes both
+     event_hash (SHA-256 hex) and event_digest while
+     ALERT_EVENT_HASH_DUAL_WRITE=True (default), so re-reading lines stored
+     before the upgrade still hits the old unique index.
+  2. Once every pre-upgrade log file has rotated away, set
+     ALERT_EVENT_HASH_DUAL_WRITE=False: event_hash then stores the digest in
+     hex and SHA-256 is no longer computed.
+
+Existing rows keep event_digest NULL - the original hash input (file path +
+byte offset) is not stored, so it cannot be recomputed.
+"""
+import alerts.models
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('alerts', '0006_add_performance_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='alert',
+            name='event_digest',
+            field=alerts.models.EventDigestField(blank=True, max_length=16, null=True, unique=True),
+        ),
+    ]
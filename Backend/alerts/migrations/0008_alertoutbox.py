@@ -0,0 +1,33 @@
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('alerts', '0007_alert_event_digest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlertOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('websocket', 'WebSocket broadcast'), ('email', 'Email notification')], max_length=16)),
+                ('payload', models.JSONField(blank=True, default=dict)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('failed', models.BooleanField(default=False)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('alert', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='outbox_entries', to='alerts.alert')),
+            ],
+            options={
+                'verbose_name': 'Alert outbox entry',
+                'verbose_name_plural': 'Alert outbox entries',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['failed', 'next_attempt_at'], name='outbox_due_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('alerts', '0008_alertoutbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PacketFlow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('src_ip', models.GenericIPAddressField(unpack_ipv4=True)),
+                ('src_port', models.PositiveIntegerField(blank=True, null=True)),
+                ('dest_ip', models.GenericIPAddressField(unpack_ipv4=True)),
+                ('dest_port', models.PositiveIntegerField(blank=True, null=True)),
+                ('protocol', models.CharField(max_length=20)),
+                ('first_seen', models.DateTimeField(db_index=True)),
+                ('last_seen', models.DateTimeField()),
+                ('packet_count', models.PositiveBigIntegerField(default=0)),
+                ('byte_count', models.PositiveBigIntegerField(default=0)),
+                ('source_file', models.CharField(blank=True, default='', max_length=512)),
+                ('flow_hash', models.CharField(max_length=64, unique=True)),
+            ],
+            options={
+                'ordering': ['-last_seen', '-id'],
+                'indexes': [
+                    models.Index(fields=['-last_seen'], name='flow_last_seen_idx'),
+                    models.Index(fields=['protocol', '-last_seen'], name='flow_protocol_idx'),
+                ],
+            },
+        ),
+    ]
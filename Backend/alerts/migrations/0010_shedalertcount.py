@@ -0,0 +1,28 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('alerts', '0009_packetflow'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShedAlertCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('window_start', models.DateTimeField(db_index=True)),
+                ('src_ip', models.GenericIPAddressField(unpack_ipv4=True)),
+                ('sid', models.CharField(max_length=64)),
+                ('shed_count', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-window_start', '-shed_count'],
+                'constraints': [
+                    models.UniqueConstraint(fields=('window_start', 'src_ip', 'sid'), name='shed_window_key_uniq'),
+                ],
+            },
+        ),
+    ]
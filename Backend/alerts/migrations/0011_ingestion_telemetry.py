@@ -0,0 +1,31 @@
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('alerts', '0010_shedalertcount'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='logingestionstate',
+            name='file_size',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='IngestionTelemetrySnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sensor', models.CharField(max_length=512, unique=True)),
+                ('hostname', models.CharField(blank=True, default='', max_length=255)),
+                ('pid', models.PositiveIntegerField(blank=True, null=True)),
+                ('data', models.JSONField(blank=True, default=dict)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'ordering': ['sensor'],
+            },
+        ),
+    ]
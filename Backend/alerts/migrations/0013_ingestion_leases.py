@@ -0,0 +1,40 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('alerts', '0012_sensor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestionNode',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('owner', models.CharField(max_length=255, unique=True)),
+                ('hostname', models.CharField(blank=True, default='', max_length=255)),
+                ('pid', models.PositiveIntegerField(blank=True, null=True)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'ordering': ['owner'],
+            },
+        ),
+        migrations.CreateModel(
+            name='LogFileLease',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sensor', models.CharField(blank=True, default='', max_length=64)),
+                ('file_path', models.CharField(max_length=512)),
+                ('owner', models.CharField(blank=True, db_index=True, default='', max_length=255)),
+                ('expires_at', models.DateTimeField()),
+            ],
+            options={
+                'constraints': [
+                    models.UniqueConstraint(fields=('sensor', 'file_path'), name='file_lease_sensor_file_uniq'),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,122 @@
+"""
+Move message, classification and priority from every Alert row to a
+Signature row per rule revision (gid:sid:rev), referenced by Alert.signature.
+
+Existing alerts take gid/rev from their raw_line ("[1:1000008:2]" in FAST
+and unified2 text, "rule": "1:1000008:2" in alert_json). Rows whose line
+does not carry them get gid 1 / rev 0. When one revision was stored with
+different texts, the newest alert's text wins.
+"""
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+RULE_PATTERN = re.compile(r'(?:\[|"rule"\s*:\s*")(\d+):(\d+):(\d+)[\]"]')
+
+UPDATE_CHUNK = 1000
+
+
+def link_signatures(apps, schema_editor):
+    """Create a Signature per rule revision found in the alerts and point the alerts at it."""
+    Alert = apps.get_model('alerts', 'Alert')
+    Signature = apps.get_model('alerts', 'Signature')
+
+    signatures = {}  # (gid, sid, rev) -> Signature
+    alert_ids = {}   # (gid, sid, rev) -> [alert id]
+    rows = Alert.objects.order_by('-id').values_list('id', 'sid', 'message', 'classification', 'priority', 'raw_line')
+    for alert_id, sid, message, classification, priority, raw_line in rows.iterator(chunk_size=5000):
+        match = RULE_PATTERN.search(raw_line or '')
+        if match and match.group(2) == sid:
+            key = (int(match.group(1)), sid, int(match.group(3)))
+        else:
+            key = (1, sid, 0)
+        if key not in signatures:
+            signatures[key] = Signature.objects.create(
+                gid=key[0], sid=key[1], rev=key[2],
+                message=message, classification=classification, priority=priority,
+            )
+            alert_ids[key] = []
+        alert_ids[key].append(alert_id)
+
+    for key, ids in alert_ids.items():
+        for start in range(0, len(ids), UPDATE_CHUNK):
+            Alert.objects.filter(id__in=ids[start:start + UPDATE_CHUNK]).update(signature=signatures[key])
+
+    print(f'Linked {sum(len(ids) for ids in alert_ids.values())} alerts to {len(signatures)} signatures')
+
+
+def unlink_signatures(apps, schema_editor):
+    """Reverse: copy the signature text back onto the alerts (for rollback)"""
+    Alert = apps.get_model('alerts', 'Alert')
+    Signature = apps.get_model('alerts', 'Signature')
+
+    for signature in Signature.objects.all():
+        Alert.objects.filter(signature=signature).update(
+            message=signature.message, classification=signature.classification, priority=signature.priority,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('alerts', '0013_ingestion_leases'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Signature',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('gid', models.PositiveIntegerField(default=1)),
+                ('sid', models.CharField(db_index=True, max_length=64)),
+                ('rev', models.PositiveIntegerField(default=0)),
+                ('message', models.CharField(max_length=512)),
+                ('classification', models.CharField(blank=True, default='', max_length=255)),
+                ('priority', models.PositiveIntegerField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['gid', 'sid', 'rev'],
+                'constraints': [
+                    models.UniqueConstraint(fields=('gid', 'sid', 'rev'), name='signature_gid_sid_rev_uniq'),
+                ],
+            },
+        ),
+        migrations.AddField(
+            model_name='alert',
+            name='signature',
+            field=models.ForeignKey(
+                null=True, on_delete=django.db.models.deletion.PROTECT, related_name='alerts', to='alerts.signature',
+            ),
+        ),
+        migrations.RunPython(link_signatures, unlink_signatures),
+        migrations.AlterField(
+            model_name='alert',
+            name='signature',
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.PROTECT, related_name='alerts', to='alerts.signature',
+            ),
+        ),
+        migrations.RemoveIndex(
+            model_name='alert',
+            name='classification_idx',
+        ),
+        # A default lets the rollback re-add the column before unlink_signatures fills it
+        migrations.AlterField(
+            model_name='alert',
+            name='message',
+            field=models.CharField(default='', max_length=512),
+        ),
+        migrations.RemoveField(
+            model_name='alert',
+            name='message',
+        ),
+        migrations.RemoveField(
+            model_name='alert',
+            name='classification',
+        ),
+        migrations.RemoveField(
+            model_name='alert',
+            name='priority',
+        ),
+    ]
@@ -0,0 +1,56 @@
+"""
+Make event_digest the only dedup key: backfill it for rows stored before
+migration 0007 and drop the unique index on the 64-char event_hash.
+
+The BLAKE2b digest of a pre-upgrade row cannot be computed (its hash input
+includes the line's byte offset, which was never stored), so the backfill
+gives it a legacy key instead: the first 16 bytes of its SHA-256
+event_hash. While ALERT_EVENT_HASH_DUAL_WRITE is on, ingestion looks that
+key up too, so a pre-upgrade line read again is still recognised.
+"""
+from django.db import migrations, models
+
+BACKFILL_CHUNK = 1000
+
+
+def backfill_event_digests(apps, schema_editor):
+    """Give every row without an event_digest the legacy key derived from its event_hash."""
+    Alert = apps.get_model('alerts', 'Alert')
+
+    last_id = 0
+    filled = 0
+    while True:
+        rows = list(
+            Alert.objects.filter(event_digest=None, id__gt=last_id).order_by('id').values_list('id', 'event_hash')[:BACKFILL_CHUNK]
+        )
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        updates = []
+        for alert_id, event_hash in rows:
+            try:
+                digest = bytes.fromhex(event_hash)[:16]
+            except ValueError:
+                continue  # Not a hex hash: stays NULL
+            if len(digest) == 16:
+                updates.append(Alert(id=alert_id, event_digest=digest))
+        Alert.objects.bulk_update(updates, ['event_digest'])
+        filled += len(updates)
+
+    print(f'Backfilled event_digest on {filled} alerts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('alerts', '0014_signature'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_event_digests, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='alert',
+            name='event_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
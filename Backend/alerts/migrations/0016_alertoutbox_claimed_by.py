@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('alerts', '0015_event_digest_only'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='alertoutbox',
+            name='claimed_by',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+    ]
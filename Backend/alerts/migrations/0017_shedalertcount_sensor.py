@@ -0,0 +1,24 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('alerts', '0016_alertoutbox_claimed_by'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='shedalertcount',
+            name='shed_window_key_uniq',
+        ),
+        migrations.AddField(
+            model_name='shedalertcount',
+            name='sensor',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddConstraint(
+            model_name='shedalertcount',
+            constraint=models.UniqueConstraint(fields=('window_start', 'sensor', 'src_ip', 'sid'), name='shed_window_key_uniq'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+"""
+Key ingestion telemetry snapshots by (kind, sensor, node) instead of sensor.
+
+The old rows cannot be told apart by node; they are dropped and the running
+ingesters publish new ones within INGEST_TELEMETRY_PUBLISH_SECONDS.
+"""
+from django.db import migrations, models
+
+
+def delete_snapshots(apps, schema_editor):
+    apps.get_model('alerts', 'IngestionTelemetrySnapshot').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('alerts', '0017_shedalertcount_sensor'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_snapshots, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='ingestiontelemetrysnapshot',
+            name='sensor',
+            field=models.CharField(blank=True, default='', max_length=512),
+        ),
+        migrations.AddField(
+            model_name='ingestiontelemetrysnapshot',
+            name='kind',
+            field=models.CharField(
+                choices=[('log_dir', 'SNORT_LOG_DIR'), ('sensor', 'Sensor'), ('node', 'Ingesting node')],
+                default='log_dir', max_length=16,
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='ingestiontelemetrysnapshot',
+            name='node',
+            field=models.CharField(default='', max_length=255),
+            preserve_default=False,
+        ),
+        migrations.AlterModelOptions(
+            name='ingestiontelemetrysnapshot',
+            options={'ordering': ['kind', 'sensor', 'node']},
+        ),
+        migrations.AddConstraint(
+            model_name='ingestiontelemetrysnapshot',
+            constraint=models.UniqueConstraint(fields=('kind', 'sensor', 'node'), name='telemetry_snapshot_uniq'),
+        ),
+        # Rollback: several nodes' rows of one sensor would break the unique sensor column
+        migrations.RunPython(migrations.RunPython.noop, delete_snapshots),
+    ]
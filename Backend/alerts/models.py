@@ -1,4 +1,49 @@
 from django.db import models
+from django.utils import timezone
+
+
+class EventDigestField(models.BinaryField):
+    """
+    Fixed-size binary digest column.
+
+    Django maps BinaryField to LONGBLOB on MySQL, which cannot carry a plain
+    unique index - use VARBINARY(max_length) there instead.
+    """
+
+    def db_type(self, connection):
+        if connection.vendor == 'mysql':
+            return f'varbinary({self.max_length})'
+        return super().db_type(connection)
+
+
+class Signature(models.Model):
+    """
+    One Snort rule revision (gid:sid:rev) with its message, classification
+    and priority. Alerts reference it instead of repeating the text on every
+    row; ingestion resolves it through an in-process cache (alerts/signatures.py).
+    """
+
+    gid = models.PositiveIntegerField(default=1)
+    sid = models.CharField(max_length=64, db_index=True)  # Same text as Alert.sid
+    rev = models.PositiveIntegerField(default=0)  # 0 = unknown (alerts stored before signatures existed)
+
+    # Rule message/description
+    message = models.CharField(max_length=512)
+
+    # Snort classification category
+    classification = models.CharField(max_length=255, blank=True, default='')
+
+    # Snort priority level (1=high, 2=medium, 3=low)
+    priority = models.PositiveIntegerField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['gid', 'sid', 'rev']
+        constraints = [
+            models.UniqueConstraint(fields=['gid', 'sid', 'rev'], name='signature_gid_sid_rev_uniq'),
+        ]
+
+    def __str__(self):
+        return f"[{self.gid}:{self.sid}:{self.rev}] {self.message}"
 
 
 class Alert(models.Model):
@@ -34,15 +79,12 @@ class Alert(models.Model):
     
     # Snort Signature ID - identifies the rule that triggered
     sid = models.CharField(max_length=64, db_index=True)
-    
-    # Alert message/description
-    message = models.CharField(max_length=512)
-    
-    # Snort classification category
-    classification = models.CharField(max_length=255, blank=True, default='')
-    
-    # Snort priority level (1=high, 2=medium, 3=low)
-    priority = models.PositiveIntegerField(null=True, blank=True)
+
+    # Sensor (Sensor.name) whose logs reported the alert; '' = SNORT_LOG_DIR
+    sensor = models.CharField(max_length=64, blank=True, default='', db_index=True)
+
+    # Rule revision that fired: message, classification and priority live there
+    signature = models.ForeignKey(Signature, on_delete=models.PROTECT, related_name='alerts')
     
     # Threat level computed from priority or ML model
     threat_level = models.CharField(max_length=16, choices=THREAT_LEVEL_CHOICES, db_index=True)
@@ -50,8 +92,12 @@ class Alert(models.Model):
     # Raw Snort log line for reference
     raw_line = models.TextField()
     
-    # Hash of alert for deduplication (prevents duplicate alerts in DB)
-    event_hash = models.CharField(max_length=64, unique=True, db_index=True)
+    # Legacy SHA-256 hex of the dedup source, only written with ALERT_EVENT_HASH_DUAL_WRITE; not indexed
+    event_hash = models.CharField(max_length=64, blank=True, default='')
+
+    # Compact 16-byte BLAKE2b of the dedup source - the unique key that prevents duplicate alerts.
+    # Rows stored before it existed carry the legacy key: a prefix of their event_hash (migration 0015).
+    event_digest = EventDigestField(max_length=16, unique=True, null=True, blank=True)
     
     # When this alert was stored in database
     ingested_at = models.DateTimeField(auto_now_add=True)
@@ -73,16 +119,238 @@ class Alert(models.Model):
     def __str__(self):
         return f"{self.timestamp.isoformat()} {self.src_ip}->{self.dest_ip} {self.message}"
 
+    # Signature fields, read through the foreign key (query with select_related('signature'))
+
+    @property
+    def message(self):
+        return self.signature.message
+
+    @property
+    def classification(self):
+        return self.signature.classification
+
+    @property
+    def priority(self):
+        return self.signature.priority
+
+
+class PacketFlow(models.Model):
+    """
+    Packets of one unidirectional 5-tuple captured in snort.log, aggregated
+    NetFlow style (see alerts/flows.py) instead of one Alert row per packet.
+    """
+
+    # 5-tuple; ports are NULL for protocols without ports and for non-first fragments
+    src_ip = models.GenericIPAddressField(protocol='both', unpack_ipv4=True)
+    src_port = models.PositiveIntegerField(null=True, blank=True)
+    dest_ip = models.GenericIPAddressField(protocol='both', unpack_ipv4=True)
+    dest_port = models.PositiveIntegerField(null=True, blank=True)
+    protocol = models.CharField(max_length=20)
+
+    # Capture time of the first and latest packet
+    first_seen = models.DateTimeField(db_index=True)
+    last_seen = models.DateTimeField()
+
+    packet_count = models.PositiveBigIntegerField(default=0)
+    byte_count = models.PositiveBigIntegerField(default=0)  # Original (on the wire) frame lengths
+
+    # Capture file of the first packet, relative to SNORT_LOG_DIR ('<sensor>:<path>' for Sensor log roots)
+    source_file = models.CharField(max_length=512, blank=True, default='')
+
+    # Hash of capture file + first packet offset: re-reading a capture updates the same row
+    flow_hash = models.CharField(max_length=64, unique=True)
+
+    class Meta:
+        ordering = ['-last_seen', '-id']
+        indexes = [
+            models.Index(fields=['-last_seen'], name='flow_last_seen_idx'),
+            models.Index(fields=['protocol', '-last_seen'], name='flow_protocol_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.src_ip}:{self.src_port}->{self.dest_ip}:{self.dest_port}/{self.protocol} ({self.packet_count} packets)"
+
+
+class ShedAlertCount(models.Model):
+    """
+    Alerts dropped by load shedding (alerts/shedding.py) while ingestion was
+    behind, counted per sensor, source IP, SID and window of alert time.
+    """
+
+    # Start of the INGEST_SHED_WINDOW_SECONDS window of the shed alerts' timestamps
+    window_start = models.DateTimeField(db_index=True)
+    # Sensor (Sensor.name) whose logs the alerts were shed from; '' = SNORT_LOG_DIR
+    sensor = models.CharField(max_length=64, blank=True, default='')
+    src_ip = models.GenericIPAddressField(protocol='both', unpack_ipv4=True)
+    sid = models.CharField(max_length=64)
+    shed_count = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-window_start', '-shed_count']
+        constraints = [
+            models.UniqueConstraint(fields=['window_start', 'sensor', 'src_ip', 'sid'], name='shed_window_key_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.window_start.isoformat()} {self.src_ip} sid={self.sid}: {self.shed_count} shed"
+
+
+class Sensor(models.Model):
+    """
+    Additional Snort sensor log root, ingested concurrently by poll_snort_logs
+    (one worker thread per enabled sensor, see alerts/sensors.py). Rows are
+    re-read every SNORT_SENSOR_RELOAD_SECONDS: adding, disabling or removing a
+    sensor needs no restart.
+    """
+
+    name = models.SlugField(max_length=64, unique=True)
+    log_dir = models.CharField(max_length=512)
+    enabled = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['name']
+
+    def __str__(self):
+        return f"{self.name} ({self.log_dir})"
+
 
 class LogIngestionState(models.Model):
-    file_path = models.CharField(max_length=512, unique=True)
+    # Sensor.name of the log root the path is relative to; '' = SNORT_LOG_DIR
+    sensor = models.CharField(max_length=64, blank=True, default='')
+    file_path = models.CharField(max_length=512)
     inode = models.CharField(max_length=128, blank=True, default='')
     offset = models.BigIntegerField(default=0)
+    # Readable size (uncompressed for .gz archives) when last read: file_size - offset = bytes behind
+    file_size = models.BigIntegerField(default=0)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         verbose_name = 'Log ingestion state'
         verbose_name_plural = 'Log ingestion states'
+        constraints = [
+            models.UniqueConstraint(fields=['sensor', 'file_path'], name='ingest_state_sensor_file_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.sensor + ':' if self.sensor else ''}{self.file_path} @ {self.offset}"
+
+
+class IngestionNode(models.Model):
+    """
+    A running ingester (poll_snort_logs process) taking part in file leasing;
+    alive while expires_at is in the future (see alerts/leases.py).
+    """
+
+    owner = models.CharField(max_length=255, unique=True)  # hostname:pid:random
+    hostname = models.CharField(max_length=255, blank=True, default='')
+    pid = models.PositiveIntegerField(null=True, blank=True)
+    started_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        ordering = ['owner']
+
+    def __str__(self):
+        return f"{self.owner} (until {self.expires_at.isoformat()})"
+
+
+class LogFileLease(models.Model):
+    """
+    Exclusive right of one IngestionNode to read a log file, so several
+    ingesters split the files instead of racing on LogIngestionState.
+    owner '' = free (released, or reserved for the preferred node).
+    """
+
+    sensor = models.CharField(max_length=64, blank=True, default='')
+    file_path = models.CharField(max_length=512)
+    owner = models.CharField(max_length=255, blank=True, default='', db_index=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['sensor', 'file_path'], name='file_lease_sensor_file_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.sensor + ':' if self.sensor else ''}{self.file_path} -> {self.owner or '(free)'}"
+
+
+class IngestionTelemetrySnapshot(models.Model):
+    """
+    Latest lag / throughput telemetry of one sensor (log root) as seen by one
+    ingesting node, or that node's own batch latency (KIND_NODE), published
+    every INGEST_TELEMETRY_PUBLISH_SECONDS (see alerts/telemetry.py).
+    """
+
+    KIND_LOG_DIR = 'log_dir'  # SNORT_LOG_DIR; sensor is its resolved path
+    KIND_SENSOR = 'sensor'    # A Sensor row; sensor is Sensor.name
+    KIND_NODE = 'node'        # Per-node data (batch latency); sensor is ''
+
+    KIND_CHOICES = [
+        (KIND_LOG_DIR, 'SNORT_LOG_DIR'),
+        (KIND_SENSOR, 'Sensor'),
+        (KIND_NODE, 'Ingesting node'),
+    ]
+
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    sensor = models.CharField(max_length=512, blank=True, default='')
+    # Publishing process (hostname:pid); lease-sharing nodes publish the same sensor side by side
+    node = models.CharField(max_length=255)
+    hostname = models.CharField(max_length=255, blank=True, default='')
+    pid = models.PositiveIntegerField(null=True, blank=True)
+    data = models.JSONField(default=dict, blank=True)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['kind', 'sensor', 'node']
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'sensor', 'node'], name='telemetry_snapshot_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.sensor or self.kind} ({self.node}) @ {self.updated_at.isoformat()}"
+
+
+class AlertOutbox(models.Model):
+    """
+    Pending WebSocket/email side effect of stored alerts.
+
+    Written in the same transaction as the alert insert and drained by the
+    outbox dispatcher (alerts/outbox.py), so notifications survive process
+    restarts and Daphne outages.
+    """
+
+    KIND_WEBSOCKET = 'websocket'
+    KIND_EMAIL = 'email'
+
+    KIND_CHOICES = [
+        (KIND_WEBSOCKET, 'WebSocket broadcast'),
+        (KIND_EMAIL, 'Email notification'),
+    ]
+
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    # No DB-level constraint: clear_alerts TRUNCATEs alerts_alert, which MySQL refuses for FK-referenced tables
+    alert = models.ForeignKey(
+        Alert, on_delete=models.CASCADE, null=True, blank=True, related_name='outbox_entries', db_constraint=False,
+    )
+    payload = models.JSONField(default=dict, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    failed = models.BooleanField(default=False)  # Gave up after ALERT_OUTBOX_MAX_ATTEMPTS
+    claimed_by = models.CharField(max_length=32, blank=True, default='')  # Dispatch pass delivering the entry
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['failed', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+        verbose_name = 'Alert outbox entry'
+        verbose_name_plural = 'Alert outbox entries'
 
     def __str__(self):
-        return f"{self.file_path} @ {self.offset}"
+        return f"{self.kind} #{self.pk} (attempts={self.attempts})"
@@ -0,0 +1,210 @@
+"""
+Durable outbox for alert side effects (WebSocket broadcasts and emails).
+
+Inline notifications were lost when the ingester died or Daphne was down,
+and broadcast failures were never retried. With ALERT_OUTBOX_ENABLED the
+persist step writes AlertOutbox rows in the same transaction as the alert
+insert, and a dispatcher drains them:
+
+- due entries are claimed in batches of ALERT_OUTBOX_BATCH_SIZE
+- all pending WebSocket entries are coalesced into ONE 'alert.batch' POST
+- failures are retried with exponential backoff, up to ALERT_OUTBOX_MAX_ATTEMPTS
+- delivered entries are deleted, and so are email entries whose alert is gone
+
+Every poll_snort_logs node starts a dispatcher unless --no-dispatcher
+(`python manage.py dispatch_alert_outbox` runs one standalone), so several
+may drain the same table. An entry is claimed before delivery with a
+conditional UPDATE that stamps claimed_by and pushes next_attempt_at out by
+ALERT_OUTBOX_CLAIM_SECONDS: only one dispatcher wins a row. If that
+dispatcher dies the claim expires and the entry is due again.
+"""
+import logging
+import threading
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.utils import timezone
+
+from .models import Alert, AlertOutbox
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_MAX_BACKOFF_SECONDS = 300
+
+
+def outbox_enabled():
+    return getattr(settings, 'ALERT_OUTBOX_ENABLED', True)
+
+
+def enqueue_alert_notifications(saved_alerts, enable_email=True, enable_websocket=True):
+    """
+    Create outbox entries for newly stored alerts (call inside the insert transaction).
+
+    Args:
+        saved_alerts: Alerts returned by the insert, with primary keys
+        enable_email: Queue email notifications for MEDIUM/HIGH alerts
+        enable_websocket: Queue one WebSocket batch signal
+    """
+    from .services import build_alert_batch_payload
+
+    if not saved_alerts:
+        return []
+
+    entries = []
+    if enable_websocket:
+        entries.append(AlertOutbox(kind=AlertOutbox.KIND_WEBSOCKET, payload=build_alert_batch_payload(saved_alerts)))
+    if enable_email:
+        entries.extend(
+            AlertOutbox(kind=AlertOutbox.KIND_EMAIL, alert=alert)
+            for alert in saved_alerts
+            if alert.threat_level in (Alert.THREAT_MEDIUM, Alert.THREAT_HIGH)
+        )
+    if entries:
+        AlertOutbox.objects.bulk_create(entries)
+    return entries
+
+
+def _coalesce_websocket_payloads(entries):
+    # Many batches -> one 'alert.batch' signal: total count, newest alert as preview
+    count = 0
+    latest = None
+    for entry in entries:
+        count += entry.payload.get('count', 0)
+        preview = entry.payload.get('latest')
+        if preview and (latest is None or preview.get('id', 0) > latest.get('id', 0)):
+            latest = preview
+    return {'type': 'alert.batch', 'count': count, 'latest': latest}
+
+
+def dispatch_outbox(batch_size=None):
+    """
+    Claim and deliver one batch of due outbox entries.
+
+    Returns: {'dispatched', 'retried', 'failed', 'websocket_posts'}
+    """
+    from .services import post_websocket_payload, send_alert_notification
+
+    if batch_size is None:
+        batch_size = getattr(settings, 'ALERT_OUTBOX_BATCH_SIZE', 200)
+    max_attempts = getattr(settings, 'ALERT_OUTBOX_MAX_ATTEMPTS', 8)
+    claim_seconds = getattr(settings, 'ALERT_OUTBOX_CLAIM_SECONDS', 300)
+
+    now = timezone.now()
+    result = {'dispatched': 0, 'retried': 0, 'failed': 0, 'websocket_posts': 0}
+    due = AlertOutbox.objects.filter(failed=False, next_attempt_at__lte=now)
+    candidate_ids = list(due.order_by('id').values_list('id', flat=True)[:max(1, batch_size)])
+    if not candidate_ids:
+        return result
+
+    # Rows another dispatcher claimed since the SELECT are no longer due and are skipped
+    claim = uuid.uuid4().hex
+    claimed = due.filter(pk__in=candidate_ids).update(
+        claimed_by=claim, next_attempt_at=now + timedelta(seconds=claim_seconds),
+    )
+    if not claimed:
+        return result
+    entries = list(
+        AlertOutbox.objects.filter(pk__in=candidate_ids, claimed_by=claim)
+        .select_related('alert__signature')
+        .order_by('id')
+    )
+
+    delivered = []
+    orphaned = []  # Email entries whose alert was deleted (clear_alerts, retention)
+    errors = []  # (entry, error message)
+
+    websocket_entries = [entry for entry in entries if entry.kind == AlertOutbox.KIND_WEBSOCKET]
+    if websocket_entries:
+        try:
+            post_websocket_payload(_coalesce_websocket_payloads(websocket_entries))
+            result['websocket_posts'] = 1
+            delivered.extend(websocket_entries)
+        except Exception as e:
+            errors.extend((entry, str(e)) for entry in websocket_entries)
+
+    for entry in entries:
+        if entry.kind != AlertOutbox.KIND_EMAIL:
+            continue
+        if entry.alert is None:
+            # The FK has no DB constraint, so the alert row can be gone: nothing left to notify about
+            orphaned.append(entry)
+            continue
+        try:
+            # Raises when no recipient got the email: the entry stays for a retry
+            send_alert_notification(entry.alert, raise_errors=True)
+            delivered.append(entry)
+        except Exception as e:
+            errors.append((entry, str(e)))
+
+    if delivered or orphaned:
+        AlertOutbox.objects.filter(pk__in=[entry.pk for entry in delivered + orphaned]).delete()
+        result['dispatched'] = len(delivered)
+    if orphaned:
+        logger.info(f'[Outbox] Dropped {len(orphaned)} email entries of deleted alerts')
+
+    if errors:
+        for entry, message in errors:
+            entry.attempts += 1
+            entry.last_error = message[:1000]
+            entry.claimed_by = ''
+            if entry.attempts >= max_attempts:
+                entry.failed = True
+                result['failed'] += 1
+            else:
+                backoff = min(OUTBOX_MAX_BACKOFF_SECONDS, 2 ** (entry.attempts - 1))
+                entry.next_attempt_at = now + timedelta(seconds=backoff)
+                result['retried'] += 1
+        AlertOutbox.objects.bulk_update(
+            [entry for entry, _message in errors],
+            ['attempts', 'last_error', 'failed', 'next_attempt_at', 'claimed_by'],
+        )
+        logger.warning(f'[Outbox] {len(errors)} deliveries failed: {errors[0][1]}')
+
+    return result
+
+
+class OutboxDispatcher:
+    """Background thread that keeps draining the outbox until stop() is called."""
+
+    def __init__(self, poll_seconds=None, batch_size=None):
+        if poll_seconds is None:
+            poll_seconds = getattr(settings, 'ALERT_OUTBOX_POLL_SECONDS', 0.5)
+        self.poll_seconds = max(0.05, float(poll_seconds))
+        self.batch_size = batch_size
+        self.totals = {'dispatched': 0, 'retried': 0, 'failed': 0, 'websocket_posts': 0}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run_once(self):
+        result = dispatch_outbox(batch_size=self.batch_size)
+        for key, value in result.items():
+            self.totals[key] += value
+        return result
+
+    def _run(self):
+        try:
+            while not self._stop.is_set():
+                try:
+                    result = self.run_once()
+                except Exception:
+                    logger.exception('[Outbox] Dispatch pass failed')
+                    result = None
+                finally:
+                    close_old_connections()
+                # Keep draining while there is a backlog, otherwise sleep
+                if not result or not (result['dispatched'] or result['retried']):
+                    self._stop.wait(self.poll_seconds)
+        finally:
+            connection.close()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='alert-outbox-dispatcher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,319 @@
+"""
+Staged ingestion pipeline: parse -> persist -> enrich -> notify.
+
+_process_alert_batch runs every step on the reader thread, so one slow SMTP
+server or a restarting Daphne stops ingestion. IngestionPipeline runs the
+same stage functions on worker threads connected by bounded queues:
+
+    reader (parse) --submit()--> persist --> enrich (ML) --> notify (WS + email)
+
+Each queue holds at most INGEST_PIPELINE_QUEUE_SIZE batches. When a stage
+falls behind, its queue fills up and put() blocks the stage before it, all
+the way back to the reader (backpressure instead of unbounded memory).
+"""
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class PersistError(Exception):
+    """
+    A batch carrying file checkpoints was not stored: its reader must resume from the last committed offsets.
+
+    Args:
+        inserted: Alerts stored by the reader's other batches before the failure was reported
+    """
+
+    def __init__(self, message, inserted=0):
+        super().__init__(message)
+        self.inserted = inserted
+
+
+class PipelineStage:
+    """One stage: a bounded queue of batches drained by `workers` threads."""
+
+    def __init__(self, name, handler, workers=1, queue_size=4, downstream=None, size_of=len):
+        self.name = name
+        self.handler = handler
+        self.size_of = size_of  # Items in one queued batch (for metrics)
+        self.workers = max(1, int(workers))
+        self.downstream = downstream
+        self.queue = queue.Queue(maxsize=max(1, int(queue_size)))
+        self._threads = []
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self.blocked_seconds = 0.0  # Time producers spent waiting on this (full) queue
+        self.max_depth = 0
+
+    def start(self):
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f'ingest-{self.name}-{index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def put(self, batch):
+        # Blocks while the queue is full: backpressure toward the producer
+        started = time.monotonic()
+        self.queue.put(batch)
+        waited = time.monotonic() - started
+        depth = self.queue.qsize()
+        with self._lock:
+            self.blocked_seconds += waited
+            self.max_depth = max(self.max_depth, depth)
+
+    def _run(self):
+        try:
+            while True:
+                batch = self.queue.get()
+                if batch is _STOP:
+                    self.queue.task_done()
+                    return
+                started = time.monotonic()
+                try:
+                    result = self.handler(batch)
+                    if result and self.downstream is not None:
+                        self.downstream.put(result)
+                except Exception:
+                    with self._lock:
+                        self.errors += 1
+                    logger.exception(f'[Pipeline] {self.name} stage failed on a batch of {self.size_of(batch)}')
+                finally:
+                    with self._lock:
+                        self.batches += 1
+                        self.items += self.size_of(batch)
+                        self.busy_seconds += time.monotonic() - started
+                    self.queue.task_done()
+                    # Worker threads own their DB connection: drop it if broken/expired
+                    close_old_connections()
+        finally:
+            connection.close()
+
+    def join(self):
+        # Wait until every batch queued so far has been handled
+        self.queue.join()
+
+    def stop(self):
+        for _ in self._threads:
+            self.queue.put(_STOP)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'depth': self.queue.qsize(),
+                'max_depth': self.max_depth,
+                'capacity': self.queue.maxsize,
+                'batches': self.batches,
+                'items': self.items,
+                'errors': self.errors,
+                'busy_seconds': round(self.busy_seconds, 3),
+                'blocked_seconds': round(self.blocked_seconds, 3),
+            }
+
+
+class IngestionPipeline:
+    """
+    Persist, enrich and notify alert batches on worker threads.
+
+    With ALERT_OUTBOX_ENABLED there is no notify stage: persist writes outbox
+    entries and OutboxDispatcher delivers them.
+
+    The reader calls submit() for each batch of parsed records (with the
+    file offsets it covers, committed in the insert transaction) and
+    wait_persisted() before its end-of-cycle state flush, so offsets never get
+    ahead of the stored alerts. Enrichment and notifications keep running in
+    the background.
+
+    When a checkpointed batch fails, the sensor's later checkpointed batches
+    are dropped (their offsets would skip the failed one) until
+    wait_persisted() raises PersistError; the reader then falls back to its
+    committed offsets. With several persist workers a later batch already in
+    flight may still commit past the failed one.
+
+    Args:
+        enable_ml: Run ML enrichment on alerts (default True)
+        enable_email: Send email notifications (default True)
+        enable_websocket: Broadcast WebSocket updates (default True)
+        dedup_cache: RecentEventCache to record stored digests in (default: process-wide cache
+                     from settings, the one the readers check)
+        persist_workers / enrich_workers / notify_workers: Threads per stage (default from settings)
+        queue_size: Max batches waiting in front of each stage (default from settings)
+        batch_policy: AdaptiveBatchPolicy fed with persist latency (default: a new one, used by ingest_snort_logs)
+    """
+
+    def __init__(self, enable_ml=True, enable_email=True, enable_websocket=True, dedup_cache=None,
+                 persist_workers=None, enrich_workers=None, notify_workers=None, queue_size=None, batch_policy=None):
+        from .dedup import get_event_cache
+        from .outbox import outbox_enabled
+        from .records import build_alerts
+        from .services import (
+            AdaptiveBatchPolicy,
+            _enrich_alert_batch,
+            _notify_alert_batch,
+            _persist_alert_batch,
+            get_threat_analyzer,
+        )
+
+        if dedup_cache is None:
+            dedup_cache = get_event_cache()
+        if queue_size is None:
+            queue_size = getattr(settings, 'INGEST_PIPELINE_QUEUE_SIZE', 4)
+        if persist_workers is None:
+            persist_workers = getattr(settings, 'INGEST_PIPELINE_PERSIST_WORKERS', 1)
+        if enrich_workers is None:
+            enrich_workers = getattr(settings, 'INGEST_PIPELINE_ENRICH_WORKERS', 2)
+        if notify_workers is None:
+            notify_workers = getattr(settings, 'INGEST_PIPELINE_NOTIFY_WORKERS', 1)
+
+        self._inserted = {}  # sensor -> alerts stored since its last wait_persisted()
+        self._pending = {}   # sensor -> submitted batches not persisted yet
+        self._failures = {}  # sensor -> exception of its first failed checkpointed batch
+        self._persisted = threading.Condition()
+        self.batch_policy = batch_policy or AdaptiveBatchPolicy()
+
+        # With the outbox, persist queues notifications in its transaction and the dispatcher sends them
+        use_outbox = outbox_enabled()
+        outbox_email = enable_email and use_outbox
+        outbox_websocket = enable_websocket and use_outbox
+
+        self.notify = None
+        if not use_outbox and (enable_email or enable_websocket):
+            self.notify = PipelineStage(
+                'notify',
+                lambda saved: _notify_alert_batch(saved, enable_email=enable_email, enable_websocket=enable_websocket),
+                workers=notify_workers,
+                queue_size=queue_size,
+            )
+
+        self.enrich = None
+        if enable_ml:
+            # Load the model once here instead of racing in the enrich workers
+            get_threat_analyzer()
+
+            def enrich(saved):
+                _enrich_alert_batch(saved)
+                return saved
+
+            self.enrich = PipelineStage('enrich', enrich, workers=enrich_workers, queue_size=queue_size, downstream=self.notify)
+
+        def persist(item):
+            records, checkpoint, shed_counts, sensor = item
+            saved = []
+            try:
+                if checkpoint:
+                    with self._persisted:
+                        if sensor in self._failures:
+                            return []  # Re-read from the committed offsets after wait_persisted()
+                # Alert instances (and new signatures) are built here, off the reader thread
+                saved = _persist_alert_batch(
+                    build_alerts(records, sensor),
+                    dedup_cache=dedup_cache,
+                    enable_email=outbox_email,
+                    enable_websocket=outbox_websocket,
+                    batch_policy=self.batch_policy,
+                    checkpoint=checkpoint,
+                    shed_counts=shed_counts,
+                )
+            except Exception as e:
+                if checkpoint:
+                    with self._persisted:
+                        self._failures.setdefault(sensor, e)
+                raise
+            finally:
+                with self._persisted:
+                    self._inserted[sensor] = self._inserted.get(sensor, 0) + len(saved)
+                    self._pending[sensor] -= 1
+                    self._persisted.notify_all()
+            return saved
+
+        self.persist = PipelineStage(
+            'persist',
+            persist,
+            workers=persist_workers,
+            queue_size=queue_size,
+            downstream=self.enrich or self.notify,
+            size_of=lambda item: len(item[0]),
+        )
+        self.stages = [stage for stage in (self.persist, self.enrich, self.notify) if stage is not None]
+        for stage in self.stages:
+            stage.start()
+
+    def submit(self, records, checkpoint=None, shed_counts=None, sensor=''):
+        """
+        Queue a batch for the persist stage; blocks when the queue is full (backpressure on the reader).
+
+        Args:
+            records: AlertRecords to store (may be empty when only a checkpoint is due)
+            checkpoint: [(LogIngestionState pk, inode, offset)] committed with the insert
+            shed_counts: Load-shedding counts committed with the insert
+            sensor: Sensor.name of the reader, for wait_persisted(sensor)
+
+        Raises PersistError (without queueing) when an earlier checkpointed batch of the sensor failed.
+        """
+        if records or checkpoint or shed_counts:
+            with self._persisted:
+                if checkpoint and sensor in self._failures:
+                    raise PersistError(f'Persisting a batch of sensor {sensor!r} failed: {self._failures[sensor]}')
+                self._pending[sensor] = self._pending.get(sensor, 0) + 1
+            self.persist.put((records, checkpoint, shed_counts, sensor))
+
+    def wait_persisted(self, sensor=None):
+        """
+        Block until the submitted batches are stored; returns alerts inserted since the last call.
+
+        Args:
+            sensor: Only wait for (and count) this sensor's batches, so concurrent
+                    sensor workers sharing the pipeline do not wait on each other
+                    (default: every batch)
+
+        Raises PersistError when a checkpointed batch failed since the last call
+        (the failure is cleared: the next cycle submits again).
+        """
+        if sensor is None:
+            self.persist.join()
+        with self._persisted:
+            if sensor is None:
+                inserted = sum(self._inserted.values())
+                self._inserted = {}
+                failures, self._failures = self._failures, {}
+                failure = next(iter(failures.values()), None)
+            else:
+                self._persisted.wait_for(lambda: not self._pending.get(sensor))
+                inserted = self._inserted.pop(sensor, 0)
+                failure = self._failures.pop(sensor, None)
+        if failure is not None:
+            raise PersistError(f'Persisting a batch failed: {failure}', inserted=inserted) from failure
+        return inserted
+
+    def drain(self):
+        # Wait for all stages, upstream first (downstream queues only grow from upstream)
+        for stage in self.stages:
+            stage.join()
+
+    def close(self):
+        self.drain()
+        for stage in self.stages:
+            stage.stop()
+
+    def stats(self):
+        return {stage.name: stage.stats() for stage in self.stages}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
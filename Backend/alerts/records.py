@@ -0,0 +1,133 @@
+"""
+Parsed alert records.
+
+Every reader (FAST, alert_json, unified2, syslog) turns an event into an
+AlertRecord: one __slots__ object with the validated alert fields, the
+rule's gid/rev, the raw line and the dedup hashes. Dedup, load shedding and
+batching work on these records; Alert model instances are only built at the
+insert (build_alerts, called by the persist step), so Django's per-instance
+initialisation stays off the reader thread.
+"""
+from operator import attrgetter
+
+from .models import Alert
+from .signatures import get_signature_cache
+
+# Fields of the parsed-alert dict (parse_snort_fast_line / validate_alert_data)
+PARSED_FIELDS = (
+    'timestamp',
+    'src_ip',
+    'src_port',
+    'dest_ip',
+    'dest_port',
+    'protocol',
+    'sid',
+    'message',
+    'classification',
+    'priority',
+    'threat_level',
+)
+
+
+class AlertRecord:
+    """
+    One validated alert event: the parsed fields plus raw_line, event_hash,
+    event_digest and the gid / rev completing the Signature key.
+    """
+
+    __slots__ = PARSED_FIELDS + ('raw_line', 'event_hash', 'event_digest', 'gid', 'rev')
+
+    def __init__(self, timestamp, src_ip, src_port, dest_ip, dest_port, protocol, sid, message, classification,
+                 priority, threat_level, raw_line='', event_hash='', event_digest=None, gid=1, rev=0):
+        self.timestamp = timestamp
+        self.src_ip = src_ip
+        self.src_port = src_port
+        self.dest_ip = dest_ip
+        self.dest_port = dest_port
+        self.protocol = protocol
+        self.sid = sid
+        self.message = message
+        self.classification = classification
+        self.priority = priority
+        self.threat_level = threat_level
+        self.raw_line = raw_line
+        self.event_hash = event_hash
+        self.event_digest = event_digest
+        self.gid = gid
+        self.rev = rev
+
+    @classmethod
+    def from_cleaned(cls, cleaned_data, raw_line='', event_hash='', event_digest=None):
+        # From a validate_alert_data() dict (alert_json / unified2 decoders add 'gid' / 'rev')
+        return cls(
+            *(cleaned_data.get(name) for name in PARSED_FIELDS),
+            raw_line=raw_line, event_hash=event_hash, event_digest=event_digest,
+            gid=cleaned_data.get('gid', 1), rev=cleaned_data.get('rev', 0),
+        )
+
+    def cleaned_data(self):
+        """The parsed fields as a dict (the parse_snort_fast_line result)."""
+        return {name: getattr(self, name) for name in PARSED_FIELDS}
+
+    def to_alert(self, sensor='', signature=None):
+        """
+        Unsaved Alert for this record.
+
+        Args:
+            sensor: Sensor.name stored on the alert
+            signature: The record's Signature (default: resolved through the signature cache;
+                       batches use build_alerts to resolve them together)
+        """
+        if signature is None:
+            signature = get_signature_cache().resolve([self])[0]
+        template, positions, sensor_index, signature_index, values_of = _alert_layout()
+        args = template.copy()
+        for index, value in zip(positions, values_of(self)):
+            args[index] = value
+        args[sensor_index] = sensor
+        args[signature_index] = signature.pk
+        # Positional Model.__init__ skips the kwargs matching: about twice as fast
+        alert = Alert(*args)
+        _cache_signature(alert, signature)  # alert.message & co. without a query
+        return alert
+
+    def __eq__(self, other):
+        if not isinstance(other, AlertRecord):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f'AlertRecord({self.timestamp.isoformat()} {self.src_ip}->{self.dest_ip} [{self.gid}:{self.sid}:{self.rev}])'
+
+
+def build_alerts(records, sensor=''):
+    """Unsaved Alerts for a batch of records, with their signatures resolved in one go."""
+    signatures = get_signature_cache().resolve(records)
+    return [record.to_alert(sensor, signature) for record, signature in zip(records, signatures)]
+
+
+_cache_signature = Alert.signature.field.set_cached_value
+
+_layout = None
+
+
+def _alert_layout():
+    # (args template in concrete field order, record slot positions, sensor position, signature position, slot getter)
+    global _layout
+    if _layout is None:
+        fields = Alert._meta.concrete_fields
+        slot_names = [field.attname for field in fields if field.attname in AlertRecord.__slots__]
+        for field in fields:
+            templated = field.attname not in AlertRecord.__slots__ and field.attname not in ('sensor', 'signature_id')
+            if templated and field.has_default() and callable(field.default):
+                raise TypeError(f'Alert.{field.attname} has a callable default; AlertRecord.to_alert cannot template it')
+        _layout = (
+            [field.get_default() for field in fields],
+            [index for index, field in enumerate(fields) if field.attname in AlertRecord.__slots__],
+            next(index for index, field in enumerate(fields) if field.attname == 'sensor'),
+            next(index for index, field in enumerate(fields) if field.attname == 'signature_id'),
+            attrgetter(*slot_names),
+        )
+    return _layout
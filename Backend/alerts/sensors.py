@@ -0,0 +1,210 @@
+"""
+Concurrent ingestion of several Snort sensors.
+
+poll_snort_logs reads SNORT_LOG_DIR itself. Every enabled Sensor row gets a
+SensorWorker thread with its own watcher and LogFileRegistry that ingests
+the FAST, alert_json, unified2 and packet logs below Sensor.log_dir. All
+workers share the command's IngestionPipeline - one batched DB writer
+instead of one per sensor - and its AdaptiveBatchPolicy. Alerts carry
+Sensor.name; offsets are LogIngestionState rows scoped by sensor.
+
+SensorSupervisor.reconcile() compares the running workers with the Sensor
+table: new or re-enabled sensors start, disabled or deleted ones stop and a
+changed log_dir restarts the worker. poll_snort_logs calls it every
+SNORT_SENSOR_RELOAD_SECONDS, so sensors are added and removed without a
+restart. A sensor whose log_dir is, contains or lies inside SNORT_LOG_DIR is
+ignored: the command's recursive scan already reads those files.
+"""
+import logging
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+from .alert_json import ingest_snort_json_logs
+from .flows import ingest_snort_packet_logs
+from .models import Sensor
+from .services import get_file_registry, ingest_snort_logs
+from .unified2 import ingest_snort_unified2_logs
+from .watcher import create_log_watcher
+
+logger = logging.getLogger(__name__)
+
+# Longest a worker blocks on its watcher before checking for stop()
+STOP_CHECK_SECONDS = 1.0
+
+
+def ingest_log_root(log_dir, sensor='', pipeline=None, batch_policy=None, enable_ml=True, enable_email=True, enable_websocket=True):
+    """
+    One ingestion cycle over every log type of a log root.
+
+    Args:
+        log_dir: Path to the sensor's Snort log directory
+        sensor: Sensor.name ('' for SNORT_LOG_DIR)
+        pipeline: IngestionPipeline shared by all sensors (default: process batches inline)
+        batch_policy: AdaptiveBatchPolicy deciding batch flushes (default: the pipeline's, else a new one)
+        enable_ml / enable_email / enable_websocket: as ingest_snort_logs
+
+    Returns: {'text', 'json', 'unified2', 'packets'} results of the ingest functions
+    """
+    registry = get_file_registry(log_dir, sensor)
+    options = {
+        'enable_ml': enable_ml,
+        'enable_email': enable_email,
+        'enable_websocket': enable_websocket,
+        'registry': registry,
+        'pipeline': pipeline,
+        'batch_policy': batch_policy,
+    }
+    return {
+        'text': ingest_snort_logs(log_dir, **options),
+        'json': ingest_snort_json_logs(log_dir, **options),
+        'unified2': ingest_snort_unified2_logs(log_dir, **options),
+        'packets': ingest_snort_packet_logs(log_dir, registry=registry),
+    }
+
+
+class SensorWorker(threading.Thread):
+    """
+    Ingests one sensor's log root until stop(): a cycle per change (watch
+    mode) or every `interval` seconds, with a full rescan at least every
+    rescan_seconds.
+
+    Args:
+        sensor: Sensor.name
+        log_dir: The sensor's Snort log directory
+        watch: Block on a create_log_watcher() watcher between cycles (default True)
+        interval: Seconds between cycles without watch (default 3)
+        rescan_seconds: Longest wait between cycles in watch mode (default from settings)
+        **ingest_options: pipeline / batch_policy / enable_* for ingest_log_root
+    """
+
+    def __init__(self, sensor, log_dir, watch=True, interval=3, rescan_seconds=None, **ingest_options):
+        super().__init__(name=f'sensor-{sensor}', daemon=True)
+        self.sensor = sensor
+        self.log_dir = log_dir
+        self.watch = watch
+        self.interval = max(1, interval)
+        if rescan_seconds is None:
+            rescan_seconds = getattr(settings, 'SNORT_WATCH_RESCAN_SECONDS', 60)
+        self.rescan_seconds = max(1, rescan_seconds)
+        self.ingest_options = ingest_options
+        self.totals = {'cycles': 0, 'processed': 0, 'inserted': 0, 'failed': 0, 'packets': 0}
+        self._stopping = threading.Event()
+
+    def run(self):
+        watcher = None
+        try:
+            if self.watch:
+                watcher = create_log_watcher(
+                    self.log_dir,
+                    stat_interval=getattr(settings, 'SNORT_WATCH_STAT_INTERVAL_SECONDS', 0.5),
+                )
+            while not self._stopping.is_set():
+                try:
+                    self._record(ingest_log_root(self.log_dir, sensor=self.sensor, **self.ingest_options))
+                except Exception:
+                    logger.exception(f'[Sensor {self.sensor}] Ingestion cycle failed')
+                finally:
+                    # Long-lived thread: drop a broken/expired DB connection between cycles
+                    close_old_connections()
+                self._wait(watcher)
+        finally:
+            if watcher is not None:
+                watcher.close()
+            connection.close()
+
+    def _record(self, results):
+        line_results = (results['text'], results['json'], results['unified2'])
+        processed = sum(result.get('processed_lines', result.get('processed_records', 0)) for result in line_results)
+        inserted = sum(result.get('inserted', 0) for result in line_results)
+        failed = sum(result.get('failed_lines', result.get('failed_records', 0)) for result in line_results)
+        packets = results['packets'].get('processed_packets', 0)
+        self.totals['cycles'] += 1
+        self.totals['processed'] += processed
+        self.totals['inserted'] += inserted
+        self.totals['failed'] += failed
+        self.totals['packets'] += packets
+        if processed or failed or packets:
+            logger.info(
+                f'[Sensor {self.sensor}] Detected: {processed} | Inserted: {inserted} | Failed: {failed} | Packets: {packets}'
+            )
+
+    def _wait(self, watcher):
+        # Like poll_snort_logs' wait, in short slices so stop() takes effect within STOP_CHECK_SECONDS
+        if watcher is None:
+            self._stopping.wait(self.interval)
+            return
+        deadline = time.monotonic() + self.rescan_seconds
+        while not self._stopping.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or watcher.wait(timeout=min(STOP_CHECK_SECONDS, remaining)):
+                return
+
+    def stop(self, timeout=None):
+        """Ask the worker to finish its current cycle and exit; waits up to timeout seconds."""
+        self._stopping.set()
+        if self.is_alive():
+            self.join(timeout)
+
+
+class SensorSupervisor:
+    """
+    Keeps one SensorWorker running per enabled Sensor row.
+
+    Args:
+        **worker_options: SensorWorker arguments shared by every worker
+                          (watch / interval / rescan_seconds / pipeline / batch_policy / enable_*)
+    """
+
+    def __init__(self, **worker_options):
+        self.worker_options = worker_options
+        self.workers = {}  # Sensor.name -> SensorWorker
+        self._ignored = set()  # Sensor names already warned about
+
+    def reconcile(self):
+        """Start, stop and restart workers to match the enabled Sensor rows; returns (started, stopped) names."""
+        main_log_dir = Path(settings.SNORT_LOG_DIR).resolve()
+        wanted = {}
+        for sensor in Sensor.objects.filter(enabled=True):
+            sensor_dir = Path(sensor.log_dir).resolve()
+            if sensor_dir.is_relative_to(main_log_dir) or main_log_dir.is_relative_to(sensor_dir):
+                # poll_snort_logs already scans SNORT_LOG_DIR recursively; a second reader of the
+                # same files (nested either way) would store every alert twice
+                if sensor.name not in self._ignored:
+                    self._ignored.add(sensor.name)
+                    logger.warning(f'[Sensor {sensor.name}] Ignored: {sensor.log_dir} overlaps SNORT_LOG_DIR')
+                continue
+            wanted[sensor.name] = sensor.log_dir
+
+        stopped = []
+        for name, worker in list(self.workers.items()):
+            # Disabled / deleted / moved, or died: stop (and restart below when still wanted)
+            if wanted.get(name) != worker.log_dir or not worker.is_alive():
+                worker.stop()
+                del self.workers[name]
+                stopped.append(name)
+
+        started = []
+        for name, log_dir in wanted.items():
+            if name not in self.workers:
+                worker = self.workers[name] = SensorWorker(name, log_dir, **self.worker_options)
+                worker.start()
+                started.append(name)
+
+        for name in stopped:
+            if name not in started:
+                logger.info(f'[Sensor {name}] Worker stopped')
+        for name in started:
+            logger.info(f'[Sensor {name}] Worker started for {self.workers[name].log_dir}')
+        return started, stopped
+
+    def stop_all(self):
+        # Signal every worker first so their current cycles finish in parallel
+        for worker in self.workers.values():
+            worker.stop(timeout=0)
+        for worker in self.workers.values():
+            worker.stop()
+        self.workers = {}
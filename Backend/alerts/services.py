@@ -1,20 +1,29 @@
+import gzip
 import hashlib
 import logging
 import os
 import re
-import socket
 import struct
 import threading
 import time
 from datetime import datetime
+from functools import lru_cache
+from operator import attrgetter
 from pathlib import Path
 
 from django.core.mail import EmailMultiAlternatives
 from django.conf import settings
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
 from django.utils import timezone
 
+from .dedup import get_event_cache
+from .leases import get_lease_manager
 from .models import Alert, LogIngestionState
+from .outbox import enqueue_alert_notifications, outbox_enabled
+from .pipeline import PersistError
+from .records import AlertRecord, build_alerts
+from .shedding import get_load_shedder, write_shed_counts
+from .telemetry import get_ingestion_telemetry, telemetry_sensor
 from ml_features.threat_analyzer import ThreatAnalyzer
 from authentication.models import Organization, User
 from subscription.models import SubscriptionPlan
@@ -30,18 +39,29 @@ _last_email_time_high = {}  # org_id -> timestamp
 _last_email_time_medium = {}  # org_id -> timestamp
 EMAIL_RATE_LIMIT_SECONDS = 10  # Wait at least 10 seconds between emails per severity
 
-def send_alert_notification(alert):
+
+class AlertEmailError(Exception):
+    """No recipient received an alert email (send_alert_notification with raise_errors)."""
+
+
+def send_alert_notification(alert, raise_errors=False):
     """
     Send email notification for MEDIUM and HIGH severity alerts.
     Rate limited to avoid spam: max 1 email per severity per 10 seconds per org.
     
     Args:
         alert: Alert object to send notification for
+        raise_errors: Raise AlertEmailError when there were recipients but none got the
+                      email, and let other errors through (the outbox retries the entry);
+                      by default every error is only logged
     """
     # Only send for MEDIUM and HIGH severity alerts
     if alert.threat_level not in [Alert.THREAT_MEDIUM, Alert.THREAT_HIGH]:
         return
     
+    attempted = 0
+    delivered = 0
+    last_error = None
     try:
         # Get all organizations with email alerts enabled
         organizations = Organization.objects.filter(is_active=True)
@@ -69,17 +89,11 @@ def send_alert_notification(alert):
                 continue
             
             # Check rate limit - only send 1 email per severity type per org every N seconds
+            # (the slot is taken once an email went out, so a failed attempt can be retried)
             now = timezone.now().timestamp()
-            if alert.threat_level == Alert.THREAT_HIGH:
-                last_time = _last_email_time_high.get(org.id, 0)
-                if now - last_time < EMAIL_RATE_LIMIT_SECONDS:
-                    continue  # Skip this email - rate limited
-                _last_email_time_high[org.id] = now
-            else:
-                last_time = _last_email_time_medium.get(org.id, 0)
-                if now - last_time < EMAIL_RATE_LIMIT_SECONDS:
-                    continue  # Skip this email - rate limited
-                _last_email_time_medium[org.id] = now
+            last_email_times = _last_email_time_high if alert.threat_level == Alert.THREAT_HIGH else _last_email_time_medium
+            if now - last_email_times.get(org.id, 0) < EMAIL_RATE_LIMIT_SECONDS:
+                continue  # Skip this email - rate limited
             
             # Prepare email content - simple and focused
             subject = f'🛡 ThreatEye Alert: {alert.threat_level.upper()} - {alert.message[:50]}'
@@ -181,7 +195,9 @@ Destination IP: {alert.dest_ip}
 </html>"""
             
             # Send email synchronously with proper error handling
+            org_delivered = 0
             for recipient_email in recipient_emails:
+                attempted += 1
                 try:
                     msg = EmailMultiAlternatives(
                         subject=subject,
@@ -192,15 +208,26 @@ Destination IP: {alert.dest_ip}
                     msg.attach_alternative(html_content, "text/html")
                     result = msg.send()
                     if result:
+                        org_delivered += 1
                         logger.info(f"[Alert Email] Sent to {recipient_email} for alert {alert.id} ({alert.threat_level})")
                     else:
+                        last_error = f'backend sent nothing to {recipient_email}'
                         logger.warning(f"[Alert Email] Failed to send to {recipient_email}")
                 except Exception as e:
+                    last_error = f'{recipient_email}: {e}'
                     logger.error(f"[Alert Email] Error sending to {recipient_email}: {str(e)}")
+            if org_delivered:
+                last_email_times[org.id] = now
+                delivered += org_delivered
         
     except Exception as e:
+        if raise_errors:
+            raise
         logger.error(f"Error in send_alert_notification for alert {alert.id}: {str(e)}")
 
+    if raise_errors and attempted and not delivered:
+        raise AlertEmailError(f'No email delivered for alert {alert.id} ({attempted} recipients): {last_error}')
+
 
 
 
@@ -237,6 +264,7 @@ def broadcast_alert_via_websocket(alert):
             'dest_port': alert.dest_port,
             'protocol': alert.protocol,
             'sid': alert.sid,
+            'sensor': alert.sensor,
             'message': alert.message,
             'classification': alert.classification,
             'priority': alert.priority,
@@ -264,6 +292,40 @@ def broadcast_alert_via_websocket(alert):
         logger.warning(f'[WebSocket] Failed to broadcast alert {alert.id}: {e}')
 
 
+def build_alert_batch_payload(saved_alerts):
+    # 'alert.batch' signal: tells the frontend to re-fetch, plus a preview of the newest alert
+    latest = saved_alerts[-1]
+    return {
+        'type': 'alert.batch',
+        'count': len(saved_alerts),
+        'latest': {
+            'id': latest.id,
+            'src_ip': latest.src_ip,
+            'dest_ip': latest.dest_ip,
+            'message': latest.message[:200],
+            'threat_level': latest.threat_level,
+        },
+    }
+
+
+def post_websocket_payload(payload):
+    """
+    POST a payload to the Daphne server's internal broadcast endpoint.
+
+    Raises on connection errors and non-200 responses so callers can retry.
+    """
+    import requests
+
+    response = requests.post(
+        'http://127.0.0.1:8000/api/alerts/ws-broadcast/',
+        json=payload,
+        headers={'X-Internal-Key': settings.SECRET_KEY[:16]},
+        timeout=3,
+    )
+    if response.status_code != 200:
+        raise RuntimeError(f'HTTP broadcast returned {response.status_code}: {response.text[:200]}')
+
+
 
 # ===== ML MODEL INITIALIZATION =====
 # Lazy-load ML threat analyzer on first use
@@ -471,19 +533,51 @@ def map_priority_to_threat_level(priority):
     return Alert.THREAT_SAFE
 
 
-# ===== SNORT FAST LOG PARSING =====
-# Parse individual Snort FAST format alert lines
+# ===== SNORT TIMESTAMP CACHE =====
+# Snort writes thousands of alerts per second with the same MM/DD-HH:MM:SS
+# prefix. Resolve year + timezone once per batch, parse each distinct second
+# once (LRU) and only attach the microseconds per line.
 
-def parse_snort_fast_line(line):
-    # Parse FAST format Snort log line, validate IPs/ports/priority, return dict or None
-    match = FAST_ALERT_PATTERN.match(line.strip())
-    if not match:
-        return None
+_FRACTION_SCALE = {1: 100000, 2: 10000, 3: 1000, 4: 100, 5: 10, 6: 1}  # ".5" == 500000us
 
-    parts = match.groupdict()
+class SnortTimestampCache:
+    """
+    Fast replacement for the strptime/make_aware path in parse_snort_fast_line.
 
-    # Parse timestamp - need to prepend current year (Snort logs don't include year)
-    timestamp_text = parts['timestamp']
+    Produces exactly the same aware datetimes, but the year and timezone are
+    fixed when the cache is created (create one per ingestion batch/cycle).
+    """
+
+    def __init__(self, year=None, tz=None, maxsize=1024):
+        self.year = year if year is not None else timezone.now().year
+        self.tz = tz or timezone.get_current_timezone()
+        self._parse_second = lru_cache(maxsize=maxsize)(self._parse_second_uncached)
+
+    def _parse_second_uncached(self, prefix):
+        try:
+            naive = datetime.strptime(f'{self.year}/{prefix}', '%Y/%m/%d-%H:%M:%S')
+        except ValueError:
+            return None
+        return timezone.make_aware(naive, self.tz)
+
+    def parse(self, timestamp_text):
+        # "MM/DD-HH:MM:SS[.ffffff]" -> aware datetime, or None if invalid
+        prefix, dot, fraction = timestamp_text.partition('.')
+        microsecond = 0
+        if dot:
+            # strptime's %f accepts 1-6 digits, right-padded with zeros
+            if not 0 < len(fraction) <= 6 or not fraction.isdigit():
+                return None
+            microsecond = int(fraction) * _FRACTION_SCALE[len(fraction)]
+
+        base = self._parse_second(prefix)
+        if base is None:
+            return None
+        return base.replace(microsecond=microsecond) if microsecond else base
+
+
+def _parse_snort_timestamp(timestamp_text):
+    # Reference path: prepend current year (Snort logs don't include year)
     current_year = timezone.now().year
     timestamp_obj = None
     for fmt in ('%Y/%m/%d-%H:%M:%S.%f', '%Y/%m/%d-%H:%M:%S'):
@@ -493,54 +587,123 @@ def parse_snort_fast_line(line):
         except ValueError:
             continue
 
+    if timestamp_obj is None:
+        return None
+
+    return timezone.make_aware(timestamp_obj, timezone.get_current_timezone())
+
+
+# ===== SNORT FAST LOG PARSING =====
+# Parse individual Snort FAST format alert lines
+
+def _parse_fast_endpoint(endpoint):
+    # parse_endpoint() for the regex-matched (non-blank) FAST endpoints: IP validated once
+    ip_part, colon, port_part = endpoint.rpartition(':')
+    if not colon:
+        ip_part, port_part = endpoint, ''
+    if not is_valid_ipv4(ip_part):
+        if colon:
+            logger.warning(f"Invalid IP in endpoint: {ip_part}")
+        return None, None
+    if port_part.isdigit():
+        port = int(port_part)
+        if port <= 65535:
+            return ip_part, port
+        logger.warning(f"Invalid port in endpoint: {port}")
+    return ip_part, None
+
+
+def parse_fast_alert(line, timestamp_cache=None):
+    """
+    Parse and validate one stripped FAST line in a single pass.
+
+    Each field is converted, range-checked and length-limited once while
+    building the record, so the result needs no validate_alert_data() pass.
+
+    Args:
+        line: Decoded FAST line without surrounding whitespace
+        timestamp_cache: SnortTimestampCache (default: reference strptime path)
+
+    Returns: AlertRecord without raw_line / hashes, or None for non-alert lines
+    """
+    match = FAST_ALERT_PATTERN.match(line)
+    if match is None:
+        return None
+    timestamp_text, gid, sid, rev, message, classification, priority_text, protocol, src, dest = match.groups()
+
+    # Parse timestamp - need to prepend current year (Snort logs don't include year)
+    if timestamp_cache is not None:
+        timestamp_obj = timestamp_cache.parse(timestamp_text)
+    else:
+        timestamp_obj = _parse_snort_timestamp(timestamp_text)
     if timestamp_obj is None:
         logger.debug(f"Failed to parse timestamp: {timestamp_text}")
         return None
 
-    timestamp_obj = timezone.make_aware(timestamp_obj, timezone.get_current_timezone())
-    
-    # Parse endpoints with validation
-    src_ip, src_port = parse_endpoint(parts['src'])
-    dest_ip, dest_port = parse_endpoint(parts['dest'])
-    
     # Reject if critical IPs are missing/invalid
+    src_ip, src_port = _parse_fast_endpoint(src)
+    dest_ip, dest_port = _parse_fast_endpoint(dest)
     if not src_ip or not dest_ip:
-        logger.warning(f"Invalid IP addresses: src={parts['src']} -> dest={parts['dest']}")
+        logger.warning(f"Invalid IP addresses: src={src} -> dest={dest}")
         return None
-    
-    # Parse and validate priority
-    try:
-        priority = int(parts['priority'])
-        if priority < 1 or priority > 3:
-            logger.warning(f"Invalid priority {priority} (expected 1-3), defaulting to 3")
-            priority = 3
-    except (ValueError, TypeError):
-        logger.warning(f"Failed to parse priority: {parts['priority']}")
+
+    # Priority is digits by the regex; clamp to Snort's 1-3
+    priority = int(priority_text)
+    if priority < 1 or priority > 3:
+        logger.warning(f"Invalid priority {priority} (expected 1-3), defaulting to 3")
         priority = 3
-    
-    # Sanitize strings and apply field length limits
-    protocol = str(parts.get('protocol', 'TCP')).strip()[:20]
-    sid = str(parts.get('sid', 'unknown')).strip()[:64]
-    message = str(parts.get('message', 'Unknown alert')).strip()[:512]
-    classification = str(parts.get('classification', '')).strip()[:255]
 
-    return {
-        'timestamp': timestamp_obj,
-        'src_ip': src_ip,
-        'src_port': src_port,
-        'dest_ip': dest_ip,
-        'dest_port': dest_port,
-        'protocol': protocol or 'TCP',
-        'sid': sid or 'unknown',
-        'message': message or 'Unknown alert',
-        'classification': classification,
-        'priority': priority,
-        'threat_level': map_priority_to_threat_level(priority),
-    }
+    # Field length limits of the Alert columns (sid is digits by the regex)
+    return AlertRecord(
+        timestamp_obj,
+        src_ip,
+        src_port,
+        dest_ip,
+        dest_port,
+        protocol.strip()[:20] or 'TCP',
+        sid[:64],
+        message.strip()[:512] or 'Unknown alert',
+        classification.strip()[:255],
+        priority,
+        map_priority_to_threat_level(priority),
+        gid=int(gid),
+        rev=int(rev),
+    )
+
+
+def parse_snort_fast_line(line, timestamp_cache=None):
+    # Parse FAST format Snort log line, validate IPs/ports/priority, return dict or None
+    # timestamp_cache: optional SnortTimestampCache (fast path used by batch ingestion)
+    record = parse_fast_alert(line.strip(), timestamp_cache)
+    return record.cleaned_data() if record is not None else None
+
+
+# ===== EVENT HASHING (DEDUPLICATION KEYS) =====
+# event_digest: 16-byte BLAKE2b, stored in a VARBINARY(16) unique column -
+# the only dedup key.
+# event_hash: unindexed legacy 64-char SHA-256 hex, written only during the
+# ALERT_EVENT_HASH_DUAL_WRITE transition. Its first 16 bytes are the key
+# migration 0015 gave pre-upgrade rows, and keeping it filled lets 0015 be
+# reversed (its unique index needs a value on every row).
+
+def compute_event_hashes(hash_source):
+    # Returns (event_hash, event_digest) for a hash source string
+    data = hash_source.encode('utf-8')
+    event_digest = hashlib.blake2b(data, digest_size=16).digest()
+    if getattr(settings, 'ALERT_EVENT_HASH_DUAL_WRITE', False):
+        return hashlib.sha256(data).hexdigest(), event_digest
+    return '', event_digest
+
+
+def legacy_event_digest(event_hash):
+    # Key of the pre-upgrade row for the same event (migration 0015), or None without a SHA-256 event_hash
+    if len(event_hash) != 64:
+        return None
+    return bytes.fromhex(event_hash)[:16]
 
 
 # ===== PCAP PACKET PARSING FUNCTIONS =====
-# Parse binary packet data from snort.log PCAP files
+# Helpers for snort.log packet captures (reader in pcap.py, flow aggregation in flows.py)
 
 def _get_file_inode(log_file):
     # Get file inode for change detection
@@ -559,268 +722,638 @@ def _get_protocol_name(protocol_number):
     return f'IP-{protocol_number}'
 
 
-def _parse_ipv4_packet(packet_data):
-    # Extract IPv4 packet from Ethernet frame, parse IPs/ports/protocol
-    # Ethernet header is 14 bytes. Parse only IPv4 frames (ethertype 0x0800).
-    if len(packet_data) < 34:
-        return None
-
-    eth_type = struct.unpack('!H', packet_data[12:14])[0]
-    if eth_type != 0x0800:
-        return None
+# ===== IN-MEMORY LOG FILE REGISTRY =====
+# Process-local cache of the log tree and LogIngestionState rows, so an idle
+# polling cycle needs neither an rglob() nor a DB query per file.
 
-    ip_start = 14
-    version_ihl = packet_data[ip_start]
-    version = version_ihl >> 4
-    if version != 4:
-        return None
-
-    ihl = (version_ihl & 0x0F) * 4
-    if len(packet_data) < ip_start + ihl:
-        return None
+STATE_HEARTBEAT_SECONDS = 60  # Touch updated_at so dashboard_summary sees ingestion as running
+PARTIAL_LINE_QUIET_SECONDS = 5  # Unchanged this long after a cycle: an unterminated last line is complete
 
-    protocol_number = packet_data[ip_start + 9]
-    src_ip = socket.inet_ntoa(packet_data[ip_start + 12:ip_start + 16])
-    dest_ip = socket.inet_ntoa(packet_data[ip_start + 16:ip_start + 20])
 
-    src_port = None
-    dest_port = None
-    transport_offset = ip_start + ihl
+def _is_alert_log_name(name):
+    # FAST alert files: filename contains "alert" (including logrotate .gz archives);
+    # Snort 3 alert_json output is read by alerts/alert_json.py instead
+    return 'alert' in name and not name.startswith('.') and not _is_json_alert_log_name(name)
 
-    if protocol_number in (6, 17) and len(packet_data) >= transport_offset + 4:
-        src_port, dest_port = struct.unpack('!HH', packet_data[transport_offset:transport_offset + 4])
 
-    return {
-        'src_ip': src_ip,
-        'src_port': src_port,
-        'dest_ip': dest_ip,
-        'dest_port': dest_port,
-        'protocol': _get_protocol_name(protocol_number),
-    }
+def _is_json_alert_log_name(name):
+    # Snort 3 alert_json: alert_json.txt[.<epoch>], or any *.json / *.jsonl alert file
+    if name.startswith('.') or 'alert' not in name:
+        return False
+    base = name[:-3] if name.endswith('.gz') else name
+    return 'alert_json' in base or base.endswith(('.json', '.jsonl'))
 
 
-def _get_pcap_endian_and_data_offset(header_bytes):
-    # Detect byte order from PCAP magic number
-    if len(header_bytes) < 24:
-        return None, None
+def _is_gzip_log(path):
+    return str(path).endswith('.gz')
 
-    magic = header_bytes[:4]
-    if magic == b'\xd4\xc3\xb2\xa1' or magic == b'\x4d\x3c\xb2\xa1':
-        return '<', 24
-    if magic == b'\xa1\xb2\xc3\xd4' or magic == b'\xa1\xb2\x3c\x4d':
-        return '>', 24
-    return None, None
 
+def _open_alert_log(log_file):
+    # Binary handle over the FAST text; .gz archives are decompressed on the fly and
+    # all offsets (LogIngestionState, event hashes) are positions in the uncompressed stream
+    if _is_gzip_log(log_file):
+        return gzip.open(log_file, 'rb')
+    return open(log_file, 'rb')
 
-def _parse_ipv4_packet(packet_data):
-    # Ethernet header is 14 bytes. Parse only IPv4 frames (ethertype 0x0800).
-    if len(packet_data) < 34:
-        return None
 
-    eth_type = struct.unpack('!H', packet_data[12:14])[0]
-    if eth_type != 0x0800:
+def _gzip_isize(log_file):
+    # Uncompressed size (mod 2**32) from the gzip trailer - 4 bytes, no decompression
+    try:
+        with open(log_file, 'rb') as handle:
+            handle.seek(-4, os.SEEK_END)
+            return struct.unpack('<I', handle.read(4))[0]
+    except (OSError, struct.error):
         return None
 
-    ip_start = 14
-    version_ihl = packet_data[ip_start]
-    version = version_ihl >> 4
-    if version != 4:
-        return None
 
-    ihl = (version_ihl & 0x0F) * 4
-    if len(packet_data) < ip_start + ihl:
-        return None
+def _readable_size(log_file, stat_result):
+    # Bytes the reader walks through: uncompressed size for .gz archives (same unit as the offsets)
+    if _is_gzip_log(log_file):
+        return _gzip_isize(log_file) or 0
+    return stat_result.st_size
 
-    protocol_number = packet_data[ip_start + 9]
-    src_ip = socket.inet_ntoa(packet_data[ip_start + 12:ip_start + 16])
-    dest_ip = socket.inet_ntoa(packet_data[ip_start + 16:ip_start + 20])
 
-    src_port = None
-    dest_port = None
-    transport_offset = ip_start + ihl
+def _is_packet_log_name(name):
+    # PCAP packet logs written by Snort: snort.log, snort.log.<epoch>
+    return name.startswith('snort.log')
 
-    if protocol_number in (6, 17) and len(packet_data) >= transport_offset + 4:
-        src_port, dest_port = struct.unpack('!HH', packet_data[transport_offset:transport_offset + 4])
 
-    return {
-        'src_ip': src_ip,
-        'src_port': src_port,
-        'dest_ip': dest_ip,
-        'dest_port': dest_port,
-        'protocol': _get_protocol_name(protocol_number),
-    }
+class LogFileRegistry:
+    """
+    Remembers, per Snort log directory:
+      - directory listings, re-read only when a directory's mtime changes
+      - the (inode, size, mtime) signature of each file at its last ingestion
+      - LogIngestionState rows (loaded with one query, written back in bulk)
+
+    A file whose signature is unchanged since it was last read to EOF is
+    skipped without opening it or touching the database.
+
+    sensor: Sensor.name of the log root ('' for SNORT_LOG_DIR); scopes the
+    LogIngestionState rows and tags the alerts read through this registry.
+    leases: FileLeaseManager - only files leased by this process are listed
+    (several ingesters sharing the log roots, see alerts/leases.py).
+    """
 
+    def __init__(self, log_dir, sensor='', leases=None):
+        self.log_dir = Path(log_dir)
+        self.sensor = sensor
+        self.leases = leases
+        self._listings = {}    # dir path -> (mtime_ns, [file names], [sub dirs])
+        self._signatures = {}  # relative path -> (inode, size, mtime_ns) when fully ingested
+        self._states = None    # relative path -> LogIngestionState
+        self._dirty = {}       # relative path -> LogIngestionState pending write
+        self._partial = {}     # relative path -> signature when a cycle stopped before an unterminated last line
+        self._last_write = 0.0
 
-def _get_pcap_endian_and_data_offset(header_bytes):
-    if len(header_bytes) < 24:
-        return None, None
+    # ---- Directory walk (replaces rglob) ----
 
-    magic = header_bytes[:4]
-    if magic == b'\xd4\xc3\xb2\xa1' or magic == b'\x4d\x3c\xb2\xa1':
-        return '<', 24
-    if magic == b'\xa1\xb2\xc3\xd4' or magic == b'\xa1\xb2\x3c\x4d':
-        return '>', 24
-    return None, None
+    def _list_dir(self, directory):
+        try:
+            mtime_ns = os.stat(directory).st_mtime_ns
+        except OSError:
+            self._listings.pop(directory, None)
+            return [], []
 
+        cached = self._listings.get(directory)
+        if cached is not None and cached[0] == mtime_ns:
+            return cached[1], cached[2]
 
-def ingest_snort_packet_logs(log_dir, max_packets=None, enable_ml=True, enable_email=True, enable_websocket=True):
-    # Parse PCAP files, extract IPv4 packets, validate and store as alerts
-    log_dir_path = Path(log_dir)
-    if not log_dir_path.exists() or not log_dir_path.is_dir():
-        return {'inserted': 0, 'processed_packets': 0, 'failed_packets': 0}
+        files, subdirs = [], []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.name.startswith('.'):
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    elif entry.is_file():
+                        files.append(entry.name)
+        except OSError:
+            return [], []
+
+        self._listings[directory] = (mtime_ns, files, subdirs)
+        return files, subdirs
+
+    def iter_log_files(self, name_filter):
+        """Return (Path, relative path, stat) for every log file accepted by name_filter."""
+        found = []
+        pending = [str(self.log_dir)]
+        while pending:
+            directory = pending.pop()
+            files, subdirs = self._list_dir(directory)
+            pending.extend(subdirs)
+            for name in files:
+                if not name_filter(name):
+                    continue
+                full_path = os.path.join(directory, name)
+                try:
+                    stat_result = os.stat(full_path)
+                except OSError:
+                    continue
+                log_file = Path(full_path)
+                found.append((log_file, str(log_file.relative_to(self.log_dir)), stat_result))
+
+        if self.leases is not None and found:
+            owned, acquired = self.leases.claim(self.sensor, [item[1] for item in found])
+            if acquired:
+                # Another ingester may have advanced them since we last read them
+                self.forget(acquired)
+            found = [item for item in found if item[1] in owned]
+
+        found.sort(key=lambda item: item[0].name)
+        return found
+
+    # ---- Change detection ----
+
+    @staticmethod
+    def signature(stat_result):
+        return (str(stat_result.st_ino), stat_result.st_size, stat_result.st_mtime_ns)
+
+    def is_unchanged(self, file_path, stat_result):
+        # True when the file was read to EOF and has not been touched since
+        signature = self.signature(stat_result)
+        if self._signatures.get(file_path) == signature:
+            return True
+
+        # First sight in this process: trust a stored state that already reached EOF
+        state = self._load_states().get(file_path)
+        if state is None or state.inode != signature[0] or file_path in self._signatures:
+            return False
+        if _is_gzip_log(file_path):
+            # Offsets of archives are uncompressed positions: compare with the gzip trailer
+            reached_eof = state.offset > 0 and state.offset % (1 << 32) == _gzip_isize(self.log_dir / file_path)
+        else:
+            reached_eof = state.offset == signature[1]
+        if reached_eof:
+            self._signatures[file_path] = signature
+        return reached_eof
+
+    def mark_ingested(self, file_path, state, stat_result, complete=None):
+        """
+        Queue the new offset for the next flush(); remember the signature if EOF was reached.
+
+        complete: whether the reader reached EOF (default: offset >= file size,
+        which does not hold for .gz archives)
+        """
+        self._load_states()[file_path] = state
+        self._dirty[file_path] = state
+        state.file_size = _readable_size(self.log_dir / file_path, stat_result)
+        if complete is None:
+            complete = state.offset >= stat_result.st_size
+        if complete:
+            self._signatures[file_path] = self.signature(stat_result)
+            self._partial.pop(file_path, None)
+        else:
+            self._signatures.pop(file_path, None)
+            self._partial[file_path] = self.signature(stat_result)
+
+    def is_quiet(self, file_path, stat_result):
+        """
+        True when the last cycle stopped before an unterminated last line and the
+        file has not changed since (for PARTIAL_LINE_QUIET_SECONDS): nobody will
+        finish that line - rotated away, or Snort stopped - so it is read as is.
+        """
+        if self._partial.get(file_path) != self.signature(stat_result):
+            return False
+        return time.time() - stat_result.st_mtime >= PARTIAL_LINE_QUIET_SECONDS
+
+    def lag_bytes(self, log_files):
+        """Bytes of log_files not read yet: size minus stored offset (.gz archives: uncompressed size)."""
+        states = self._load_states()
+        lag = 0
+        for log_file, file_path, stat_result in log_files:
+            if self._signatures.get(file_path) == self.signature(stat_result):
+                continue
+            state = states.get(file_path)
+            offset = state.offset if state is not None and state.inode == str(stat_result.st_ino) else 0
+            if _is_gzip_log(file_path):
+                lag += (_readable_size(log_file, stat_result) - offset) % (1 << 32)
+            else:
+                lag += max(0, stat_result.st_size - offset)
+        return lag
+
+    def skip_until_changed(self, file_path, stat_result):
+        # Ignore an unreadable file (e.g. bad PCAP header) until it is modified
+        self._signatures[file_path] = self.signature(stat_result)
+
+    def event_source(self, file_path):
+        # Path hashed into event hashes: sensors can share file names ('alert'), so prefix theirs
+        return f'{self.sensor}:{file_path}' if self.sensor else file_path
+
+    # ---- LogIngestionState cache ----
+
+    def _load_states(self):
+        if self._states is None:
+            self._states = {
+                state.file_path: state for state in LogIngestionState.objects.filter(sensor=self.sensor)
+            }
+        return self._states
+
+    def get_state(self, file_path):
+        # Cached state for file_path, or a new unsaved one
+        states = self._load_states()
+        state = states.get(file_path)
+        if state is None:
+            state = LogIngestionState(sensor=self.sensor, file_path=file_path)
+            states[file_path] = state
+        return state
+
+    def ensure_row(self, state):
+        """Give a new file's state a database row (offset 0) so batches can checkpoint it by pk."""
+        if state.pk is None:
+            row, _created = LogIngestionState.objects.get_or_create(
+                sensor=self.sensor,
+                file_path=state.file_path,
+                defaults={'inode': state.inode, 'offset': 0},
+            )
+            state.pk = row.pk
+        return state
+
+    def flush(self):
+        """Write every pending offset back in one bulk UPDATE (+ one INSERT for new files)."""
+        now = timezone.now()
+        dirty = list(self._dirty.values())
+        self._dirty = {}
+
+        if dirty:
+            for state in dirty:
+                state.updated_at = now
+            existing = [state for state in dirty if state.pk is not None]
+            new_states = [state for state in dirty if state.pk is None]
+
+            if existing:
+                LogIngestionState.objects.bulk_update(existing, ['inode', 'offset', 'file_size', 'updated_at'])
+            if new_states:
+                LogIngestionState.objects.bulk_create(new_states, ignore_conflicts=True)
+                # MySQL bulk_create does not set primary keys - reload the new rows
+                states = self._load_states()
+                for state in LogIngestionState.objects.filter(
+                    sensor=self.sensor,
+                    file_path__in=[state.file_path for state in new_states],
+                ):
+                    states[state.file_path] = state
+            self._last_write = time.monotonic()
+
+        elif self._states and time.monotonic() - self._last_write >= STATE_HEARTBEAT_SECONDS:
+            # Idle: a single cheap UPDATE keeps "ingestionRunning" true on the dashboard
+            LogIngestionState.objects.filter(
+                pk__in=[state.pk for state in self._states.values() if state.pk is not None]
+            ).update(updated_at=now)
+            self._last_write = time.monotonic()
+
+    def forget(self, file_paths):
+        """Drop the cached signature and state of file_paths and reload their states (one query)."""
+        for file_path in file_paths:
+            self._signatures.pop(file_path, None)
+            self._dirty.pop(file_path, None)
+            self._partial.pop(file_path, None)
+        if self._states is None:
+            return
+        for file_path in file_paths:
+            self._states.pop(file_path, None)
+        for state in LogIngestionState.objects.filter(sensor=self.sensor, file_path__in=list(file_paths)):
+            self._states[state.file_path] = state
+
+    def reset(self):
+        """Forget all cached state (after --reset-state or clear_alerts)."""
+        self._listings.clear()
+        self._signatures.clear()
+        self._partial.clear()
+        self._states = None
+        self._dirty = {}
+
+
+_file_registries = {}
+_file_registries_lock = threading.Lock()
+
+
+def get_file_registry(log_dir, sensor=''):
+    # One registry per log directory and sensor per process
+    key = (str(Path(log_dir).resolve()), sensor)
+    with _file_registries_lock:
+        registry = _file_registries.get(key)
+        if registry is None:
+            registry = LogFileRegistry(log_dir, sensor=sensor, leases=get_lease_manager())
+            _file_registries[key] = registry
+        return registry
+
+
+def reset_file_registries():
+    with _file_registries_lock:
+        _file_registries.clear()
+
+
+
+# ===== BINARY LINE READER =====
+# Text-mode readline() + tell() rebuilds the UTF-8 decoder state on every
+# call, which dominated backfill time. Read raw blocks instead and track
+# byte offsets arithmetically (same values tell() returned, so offsets in
+# LogIngestionState stay compatible).
+
+LOG_READ_CHUNK_SIZE = 1024 * 1024  # 1 MiB per read()
+
+
+def _iter_log_lines(handle, offset, chunk_size=LOG_READ_CHUNK_SIZE, final=False):
+    """
+    Yield (line_start, line_end, line) for every complete line of a binary
+    file handle, starting at byte offset.
+
+    line is a memoryview over the read block (including the trailing newline)
+    so nothing is copied or decoded until the caller needs it. A final line
+    without a newline is usually still being written by Snort: it is not
+    yielded and the caller's offset stays in front of it, so it is read in
+    full next cycle. With final=True (archive, or a file nobody writes to any
+    more) it is yielded too, once the stream ends cleanly.
+    """
+    handle.seek(offset)
+    pending = b''
+    base = offset  # file offset of data[0]
 
-    # Recursively find all packet log files (snort.log*)
-    log_files = sorted(
-        [p for p in log_dir_path.rglob('snort.log*') if p.is_file() and not p.name.startswith('.')],
-        key=lambda p: p.name,
-    )
+    while True:
+        try:
+            chunk = handle.read(chunk_size)
+        except EOFError:
+            # Truncated .gz (logrotate still compressing it): stop after the last complete line
+            return
+        if not chunk:
+            if final and pending:
+                yield base, base + len(pending), memoryview(pending)
+            return
+
+        data = pending + chunk if pending else chunk
+        view = memoryview(data)
+        find = data.find
+        pos = 0
+        while True:
+            newline = find(b'\n', pos)
+            if newline < 0:
+                break
+            yield base + pos, base + newline + 1, view[pos:newline + 1]
+            pos = newline + 1
+
+        # Carry the partial trailing line into the next block
+        pending = data[pos:]
+        base += pos
+
+
+def _reached_clean_eof(handle):
+    # After _iter_log_lines: True when the stream really ended (not truncated, not stopped early)
+    try:
+        return handle.read(1) == b''
+    except EOFError:
+        return False
 
-    inserted = 0
-    processed_packets = 0
-    failed_packets = 0
 
-    for log_file in log_files:
-        if max_packets is not None and processed_packets >= max_packets:
-            break
+# ===== BATCH PROCESSING HELPERS =====
 
-        try:
-            file_path = str(log_file.relative_to(log_dir_path))
-            inode = _get_file_inode(log_file)
-            # Track ingestion state per file to resume on restart
-            state, _ = LogIngestionState.objects.get_or_create(file_path=file_path)
-
-            # File was rotated/replaced - reset offset and inode
-            if state.inode != inode:
-                state.inode = inode
-                state.offset = 0
-
-            with log_file.open('rb') as handle:
-                global_header = handle.read(24)
-                endian, data_offset = _get_pcap_endian_and_data_offset(global_header)
-                if endian is None:
-                    continue
+BATCH_SIZE = 500  # Number of alerts to process per batch (initial adaptive target)
 
-                file_size = log_file.stat().st_size
-                if state.offset == 0:
-                    state.offset = data_offset
-                if state.offset < data_offset or state.offset > file_size:
-                    state.offset = data_offset
 
-                handle.seek(state.offset)
+class AdaptiveBatchPolicy:
+    """
+    Decide when to flush the current batch: size target OR latency deadline.
 
-                while True:
-                    if max_packets is not None and processed_packets >= max_packets:
-                        break
+    - A batch flushes when it reaches `size` rows ('size'), when its oldest
+      record has waited max_delay seconds ('deadline'), or when the reader
+      runs out of input ('end').
+    - `size` adapts to the measured insert latency: full batches that insert
+      well under target_seconds grow the target (x1.25), slow inserts shrink
+      it proportionally. Bounded by [min_size, max_size].
 
-                    packet_header = handle.read(16)
-                    if len(packet_header) < 16:
-                        break
+    Thread-safe: the persist stage reports insert latency from worker threads,
+    and sensor workers sharing one policy each time their own batch deadline.
+    """
 
-                    try:
-                        ts_sec, ts_usec, incl_len, _orig_len = struct.unpack(f'{endian}IIII', packet_header)
-                    except struct.error:
-                        break
+    def __init__(self, initial_size=None, min_size=None, max_size=None, max_delay=None, target_seconds=None):
+        if initial_size is None:
+            initial_size = BATCH_SIZE
+        if min_size is None:
+            min_size = getattr(settings, 'INGEST_BATCH_MIN_SIZE', 50)
+        if max_size is None:
+            max_size = getattr(settings, 'INGEST_BATCH_MAX_SIZE', 5000)
+        if max_delay is None:
+            max_delay = getattr(settings, 'INGEST_BATCH_MAX_DELAY_MS', 200) / 1000.0
+        if target_seconds is None:
+            target_seconds = getattr(settings, 'INGEST_BATCH_TARGET_INSERT_MS', 250) / 1000.0
+
+        self.min_size = max(1, min(int(min_size), int(initial_size)))
+        self.max_size = max(self.min_size, int(max_size), int(initial_size))
+        self.size = int(initial_size)
+        self.max_delay = max(0.0, float(max_delay))
+        self.target_seconds = max(0.001, float(target_seconds))
+        self._lock = threading.Lock()
+        self._reader = threading.local()  # Per reader thread: batch_started
+        self._reset_cycle()
+
+    def _reset_cycle(self):
+        self.cycle = {'batches': 0, 'rows': 0, 'size': 0, 'deadline': 0, 'end': 0, 'insert_seconds': 0.0}
+
+    def record_added(self):
+        # Call after appending a record; starts the deadline clock for a new batch
+        if getattr(self._reader, 'batch_started', None) is None:
+            self._reader.batch_started = time.monotonic()
+
+    def flush_reason(self, batch_len):
+        """Return 'size' / 'deadline' when the batch should be flushed now, else None."""
+        if batch_len >= self.size:
+            return 'size'
+        batch_started = getattr(self._reader, 'batch_started', None)
+        if batch_started is not None and time.monotonic() - batch_started >= self.max_delay:
+            return 'deadline'
+        return None
 
-                    packet_data = handle.read(incl_len)
-                    if len(packet_data) < incl_len:
-                        break
+    def record_flush(self, reason, batch_len):
+        self._reader.batch_started = None
+        with self._lock:
+            self.cycle['batches'] += 1
+            self.cycle['rows'] += batch_len
+            self.cycle[reason] += 1
+
+    def record_insert(self, rows, seconds):
+        # Insert latency feedback from the persist step
+        with self._lock:
+            self.cycle['insert_seconds'] += seconds
+            if seconds > self.target_seconds:
+                scale = max(0.5, self.target_seconds / seconds)
+                self.size = max(self.min_size, int(self.size * scale))
+            elif rows >= self.size and seconds < self.target_seconds / 2:
+                self.size = min(self.max_size, int(self.size * 1.25) + 1)
+
+    def take_cycle_stats(self):
+        """Counters since the last call (batches, rows, flush reasons) plus the current size target."""
+        with self._lock:
+            stats = dict(self.cycle, target=self.size)
+            self._reset_cycle()
+        stats['avg_batch'] = round(stats['rows'] / stats['batches']) if stats['batches'] else 0
+        return stats
+
+
+# ===== INSERT-AND-IDENTIFY =====
+# bulk_create(ignore_conflicts=True) followed by a SELECT ... event_hash IN (...)
+# doubled the work per batch and also returned rows that already existed.
+# Instead: one plain multi-row INSERT whose new primary keys are known from
+# the INSERT itself, with a duplicate-aware slow path only on IntegrityError.
+
+_mysql_autoinc_step = {}  # connection alias -> @@auto_increment_increment
+
+
+def _bulk_insert_returning_ids(alerts):
+    """
+    INSERT all alerts in a single statement and set their primary keys.
 
-                    processed_packets += 1
-                    parsed_packet = _parse_ipv4_packet(packet_data)
-                    if not parsed_packet:
-                        continue
+    - RETURNING-capable backends (SQLite >= 3.35, PostgreSQL): bulk_create sets pks.
+    - MySQL/MariaDB: a multi-row "simple insert" gets a consecutive
+      auto-increment range starting at LAST_INSERT_ID() (cursor.lastrowid),
+      spaced by @@auto_increment_increment.
+    - Anything else: bulk_create + one lookup by event_digest.
 
-                    timestamp = timezone.make_aware(
-                        datetime.fromtimestamp(ts_sec + (ts_usec / 1_000_000.0)),
-                        timezone.get_current_timezone(),
-                    )
+    Raises IntegrityError (nothing inserted) if any row is a duplicate.
+    """
+    from django.db import connections
+    from django.db.models.sql import InsertQuery
 
-                    # Build alert dict from parsed packet data
-                    packet_alert = {
-                        'timestamp': timestamp,
-                        'src_ip': parsed_packet['src_ip'],
-                        'src_port': parsed_packet['src_port'],
-                        'dest_ip': parsed_packet['dest_ip'],
-                        'dest_port': parsed_packet['dest_port'],
-                        'protocol': parsed_packet['protocol'],
-                        'sid': 'packet_capture',
-                        'message': 'Real-time packet captured from snort.log',
-                        'classification': 'Packet Log',
-                        'priority': 3,
-                        'threat_level': Alert.THREAT_SAFE,
-                    }
-                    
-                    # Validate packet alert data before storing
-                    is_valid, error_msg, cleaned_packet = validate_alert_data(packet_alert)
-                    if not is_valid:
-                        failed_packets += 1
-                        logger.warning(f'Invalid packet data: {error_msg}')
-                        continue
+    db = Alert.objects.db
+    connection = connections[db]
 
-                    hash_source = f"{file_path}:{ts_sec}:{ts_usec}:{parsed_packet['src_ip']}:{parsed_packet['dest_ip']}:{incl_len}"
-                    event_hash = hashlib.sha256(hash_source.encode('utf-8')).hexdigest()
+    if connection.features.can_return_rows_from_bulk_insert:
+        Alert.objects.bulk_create(alerts)
+        return alerts
 
-                    try:
-                        alert = Alert.objects.create(
-                            **cleaned_packet,
-                            raw_line=f"pcap:{file_path}:{ts_sec}.{ts_usec}:{parsed_packet['src_ip']}->{parsed_packet['dest_ip']}",
-                            event_hash=event_hash,
-                        )
-                        inserted += 1
-                        # Enrich alert with ML analysis (if enabled)
-                        if enable_ml:
-                            enrich_alert_with_ml(alert)
-                        # Send email notification for MEDIUM and HIGH alerts (if enabled)
-                        if enable_email:
-                            send_alert_notification(alert)
-                        # Broadcast to all connected WebSocket clients (if enabled)
-                        if enable_websocket:
-                            broadcast_alert_via_websocket(alert)
-                    except IntegrityError:
-                        continue
-                    except Exception:
-                        failed_packets += 1
-                        logger.exception('Failed to store parsed packet from %s', file_path)
-                        continue
+    if connection.vendor != 'mysql':
+        Alert.objects.bulk_create(alerts)
+        ids = {
+            bytes(digest): pk
+            for digest, pk in Alert.objects.filter(event_digest__in=[a.event_digest for a in alerts]).values_list('event_digest', 'id')
+        }
+        for alert in alerts:
+            alert.pk = ids.get(alert.event_digest)
+        return alerts
+
+    step = _mysql_autoinc_step.get(db)
+    if step is None:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT @@auto_increment_increment')
+            step = int(cursor.fetchone()[0] or 1)
+        _mysql_autoinc_step[db] = step
+
+    fields = [f for f in Alert._meta.concrete_fields if not f.primary_key]
+    query = InsertQuery(Alert)
+    query.insert_values(fields, alerts, raw=False)
+    (sql, params), = query.get_compiler(using=db).as_sql()
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        first_id = cursor.lastrowid
+
+    for index, alert in enumerate(alerts):
+        alert.pk = first_id + index * step
+        alert._state.adding = False
+        alert._state.db = db
+    return alerts
+
+
+def _find_stored_event_digests(alerts):
+    # event_digest of every alert in `alerts` that is already in the table
+    digests = [a.event_digest for a in alerts if a.event_digest]
+    return {bytes(d) for d in Alert.objects.filter(event_digest__in=digests).values_list('event_digest', flat=True)}
+
+
+def _drop_legacy_duplicates(alerts):
+    # A pre-upgrade line read again has a new digest, but its stored row carries the legacy key
+    keys = [key for key in (legacy_event_digest(a.event_hash) for a in alerts) if key]
+    if not keys:
+        return alerts
+    stored = {bytes(d) for d in Alert.objects.filter(event_digest__in=keys).values_list('event_digest', flat=True)}
+    if not stored:
+        return alerts
+    return [alert for alert in alerts if legacy_event_digest(alert.event_hash) not in stored]
+
+
+def _insert_new_alerts(alert_objects):
+    """
+    Insert alert_objects, skipping rows that are already stored.
 
-                state.offset = handle.tell()
+    Returns exactly the newly inserted Alert objects with their primary keys
+    set. The common case (all rows new) is a single INSERT round trip, plus
+    one legacy key lookup while ALERT_EVENT_HASH_DUAL_WRITE is on.
+    """
+    # Same event twice in one batch: keep the first
+    seen = set()
+    alerts = []
+    for alert in alert_objects:
+        if alert.event_digest is None or alert.event_digest not in seen:
+            seen.add(alert.event_digest)
+            alerts.append(alert)
 
-            state.save(update_fields=['inode', 'offset', 'updated_at'])
-        except Exception:
-            logger.exception('Error while ingesting packet log file %s', log_file)
-            continue
+    if alerts and getattr(settings, 'ALERT_EVENT_HASH_DUAL_WRITE', False):
+        alerts = _drop_legacy_duplicates(alerts)
 
-    return {
-        'inserted': inserted,
-        'processed_packets': processed_packets,
-        'failed_packets': failed_packets,
-    }
+    if not alerts:
+        return []
 
+    try:
+        with transaction.atomic():
+            return _bulk_insert_returning_ids(alerts)
+    except IntegrityError:
+        pass
+
+    # Some rows were stored before (offset reset / re-read): drop them and retry
+    stored = _find_stored_event_digests(alerts)
+    fresh = [alert for alert in alerts if alert.event_digest not in stored]
+    for alert in fresh:
+        alert.pk = None
+    if not fresh:
+        return []
 
+    try:
+        with transaction.atomic():
+            return _bulk_insert_returning_ids(fresh)
+    except IntegrityError:
+        pass
+
+    # Lost a race with a concurrent writer: fall back to row-by-row
+    inserted = []
+    for alert in fresh:
+        alert.pk = None
+        try:
+            with transaction.atomic():
+                alert.save(force_insert=True)
+            inserted.append(alert)
+        except IntegrityError:
+            continue
+    return inserted
 
-# ===== BATCH PROCESSING HELPERS =====
 
-BATCH_SIZE = 500  # Number of alerts to process per batch
+def _write_checkpoints(checkpoints):
+    # Advance LogIngestionState to the offsets covered by a stored batch. Never
+    # moves an offset backwards for the same inode (batches may commit out of order).
+    now = timezone.now()
+    for pk, inode, offset in checkpoints:
+        LogIngestionState.objects.filter(pk=pk).exclude(inode=inode, offset__gt=offset).update(
+            inode=inode, offset=offset, updated_at=now,
+        )
 
 
-def _process_alert_batch(alert_objects, enable_ml=True, enable_email=True, enable_websocket=True):
+def _persist_alert_batch(alert_objects, dedup_cache=None, enable_email=False, enable_websocket=False, batch_policy=None, checkpoint=None, shed_counts=None):
     """
-    Process a batch of Alert objects efficiently:
-      0. DROP alerts from permanently blocked IPs (they can't attack anymore)
-      1. Bulk insert into DB (skip duplicates)
-      2. Batch ML enrichment
-      3. WebSocket batch_complete signal
-      4. Batch prevention (medium/high only)
-      5. Single email digest per batch
-    
+    Persist stage: drop blocked sources, insert the batch and return the newly stored alerts.
+
+    With enable_email / enable_websocket the matching AlertOutbox entries are
+    written in the same transaction as the insert (see alerts/outbox.py), and
+    so is the checkpoint: a crash can never store alerts without their
+    offsets or advance offsets past alerts that were not stored.
+
     Args:
-        alert_objects: List of Alert objects to process
-        enable_ml: Run ML enrichment on alerts (default True)
-        enable_email: Send email notifications (default True)
-        enable_websocket: Broadcast WebSocket updates (default True)
+        alert_objects: List of unsaved Alert objects
+        dedup_cache: RecentEventCache to record the stored digests in (optional)
+        enable_email: Queue email notifications in the outbox (default False)
+        enable_websocket: Queue a WebSocket batch signal in the outbox (default False)
+        batch_policy: AdaptiveBatchPolicy to report the insert latency to (optional)
+        checkpoint: [(LogIngestionState pk, inode, offset)] covered by this batch (optional)
+        shed_counts: LoadShedder.take_counts() of the events the checkpoint skips (optional)
     """
-    if not alert_objects:
-        return 0
+    if not alert_objects and not checkpoint and not shed_counts:
+        return []
 
     # ---- STEP 0: Drop alerts from permanently blocked IPs ----
     # (BlockedIP model not yet implemented - skip this step for now)
@@ -840,81 +1373,87 @@ def _process_alert_batch(alert_objects, enable_ml=True, enable_email=True, enabl
     #         logger.info(f'[Prevention] Dropped {dropped} alerts from {len(blocked_ips)} permanently blocked IP(s)')
     # 
     # if not alert_objects:
-    #     return 0
+    #     return []
+
+    # ---- STEP 1: Insert, skip duplicates, get IDs of the new rows only ----
+    started = time.monotonic()
+    if enable_email or enable_websocket or checkpoint or shed_counts:
+        # Alerts, their pending notifications, shed counts and the file offsets commit (or roll back) together
+        with transaction.atomic():
+            saved_alerts = _insert_new_alerts(alert_objects)
+            if enable_email or enable_websocket:
+                enqueue_alert_notifications(saved_alerts, enable_email=enable_email, enable_websocket=enable_websocket)
+            if shed_counts:
+                write_shed_counts(shed_counts)
+            if checkpoint:
+                _write_checkpoints(checkpoint)
+    else:
+        saved_alerts = _insert_new_alerts(alert_objects)
+    elapsed = time.monotonic() - started
+    get_ingestion_telemetry().record_insert(elapsed)
+    if batch_policy is not None:
+        batch_policy.record_insert(len(alert_objects), elapsed)
+
+    # Every digest of the batch is stored now (new or pre-existing)
+    if dedup_cache is not None:
+        dedup_cache.add_many(alert.event_digest for alert in alert_objects)
+
+    return saved_alerts
+
+
+def _enrich_alert_batch(saved_alerts):
+    """
+    Enrich stage: batch ML analysis of stored alerts, saved with one bulk_update.
 
-    # ---- STEP 1: Bulk insert, skip duplicates ----
-    Alert.objects.bulk_create(
-        alert_objects,
-        ignore_conflicts=True,
-        batch_size=500,
-    )
+    Args:
+        saved_alerts: Alerts returned by _persist_alert_batch
+    """
+    if not saved_alerts:
+        return
 
-    # Re-fetch inserted alerts (MySQL ignore_conflicts doesn't set IDs)
-    hashes = [a.event_hash for a in alert_objects]
-    saved_alerts = list(
-        Alert.objects.filter(event_hash__in=hashes, ml_processed=False)
-        .only('id', 'src_ip', 'dest_ip', 'src_port', 'dest_port',
-              'protocol', 'sid', 'message', 'threat_level', 'priority',
-              'event_hash', 'ml_processed')
-    )
+    # ---- STEP 2: Batch ML enrichment ----
+    # One feature matrix + one predict_proba for the whole batch (not two model calls per alert)
+    try:
+        analyzer = get_threat_analyzer()
+        if analyzer:
+            ml_updates = []
+            for alert, result in zip(saved_alerts, analyzer.analyze_alerts(saved_alerts)):
+                if result['error'] is None:
+                    alert.ml_processed = True
+                    alert.ml_threat_score = result['confidence']
+                    alert.ml_classification = 'attack' if result['threat_class'] == 1 else 'benign'
+                    alert.ml_features = result.get('features_extracted', 0)
+                    ml_updates.append(alert)
+
+            if ml_updates:
+                Alert.objects.bulk_update(
+                    ml_updates,
+                    ['ml_processed', 'ml_threat_score', 'ml_classification', 'ml_features'],
+                    batch_size=500,
+                )
+    except Exception as e:
+        logger.warning(f'[Batch ML] Error: {e}')
 
-    if not saved_alerts:
-        return 0
 
-    count = len(saved_alerts)
+def _notify_alert_batch(saved_alerts, enable_email=True, enable_websocket=True):
+    """
+    Notify stage: WebSocket batch signal and email notifications for stored alerts.
 
-    # ---- STEP 2: Batch ML enrichment ----
-    if enable_ml:
-        try:
-            analyzer = get_threat_analyzer()
-            if analyzer:
-                ml_updates = []
-                for alert in saved_alerts:
-                    try:
-                        result = analyzer.analyze_alert(alert)
-                        if result['error'] is None:
-                            alert.ml_processed = True
-                            alert.ml_threat_score = result['confidence']
-                            alert.ml_classification = 'attack' if result['threat_class'] == 1 else 'benign'
-                            alert.ml_features = result.get('features_extracted', 0)
-                            ml_updates.append(alert)
-                    except Exception:
-                        pass
-
-                if ml_updates:
-                    Alert.objects.bulk_update(
-                        ml_updates,
-                        ['ml_processed', 'ml_threat_score', 'ml_classification', 'ml_features'],
-                        batch_size=500,
-                    )
-        except Exception as e:
-            logger.warning(f'[Batch ML] Error: {e}')
+    Args:
+        saved_alerts: Alerts returned by _persist_alert_batch
+        enable_email: Send email notifications (default True)
+        enable_websocket: Broadcast WebSocket updates (default True)
+    """
+    if not saved_alerts:
+        return
+    count = len(saved_alerts)
 
     # ---- STEP 3: Broadcast batch_complete signal to frontend ----
     # Tells the frontend to re-fetch from the API (not individual alerts)
     if enable_websocket:
         try:
-            import requests
-            from django.conf import settings as django_settings
-            webhook_url = 'http://127.0.0.1:8000/api/alerts/ws-broadcast/'
-            latest = saved_alerts[-1]
-
-            response = requests.post(webhook_url, json={
-                'type': 'alert.batch',
-                'count': count,
-                'latest': {
-                    'id': latest.id,
-                    'src_ip': latest.src_ip,
-                    'dest_ip': latest.dest_ip,
-                    'message': latest.message[:200],
-                    'threat_level': latest.threat_level,
-                },
-            }, headers={'X-Internal-Key': django_settings.SECRET_KEY[:16]}, timeout=3)
-
-            if response.status_code == 200:
-                logger.debug(f'[WebSocket] Broadcast batch {count} via HTTP webhook')
-            else:
-                logger.warning(f'[WebSocket] HTTP batch broadcast returned {response.status_code}: {response.text}')
+            post_websocket_payload(build_alert_batch_payload(saved_alerts))
+            logger.debug(f'[WebSocket] Broadcast batch {count} via HTTP webhook')
         except Exception as e:
             logger.warning(f'[Batch WS] Broadcast failed: {e}')
 
@@ -937,15 +1476,146 @@ def _process_alert_batch(alert_objects, enable_ml=True, enable_email=True, enabl
             except Exception as e:
                 logger.error(f'[Batch Email] Error sending notification for alert {alert.id}: {e}')
 
-    return count
+
+def _process_alert_batch(alert_objects, enable_ml=True, enable_email=True, enable_websocket=True, dedup_cache=None, batch_policy=None, checkpoint=None, shed_counts=None):
+    """
+    Process a batch of Alert objects efficiently:
+      0. DROP alerts from permanently blocked IPs (they can't attack anymore)
+      1. Bulk insert into DB (skip duplicates)
+      2. Batch ML enrichment
+      3. WebSocket batch_complete signal
+      4. Batch prevention (medium/high only)
+      5. Single email digest per batch
+
+    Runs all stages inline; IngestionPipeline (alerts/pipeline.py) runs the
+    same stage functions on worker threads instead. With ALERT_OUTBOX_ENABLED
+    steps 3-5 are queued in the outbox and delivered by the dispatcher.
+
+    Args:
+        alert_objects: List of Alert objects to process
+        enable_ml: Run ML enrichment on alerts (default True)
+        enable_email: Send email notifications (default True)
+        enable_websocket: Broadcast WebSocket updates (default True)
+        dedup_cache: RecentEventCache to record the stored digests in (optional)
+        batch_policy: AdaptiveBatchPolicy to report the insert latency to (optional)
+        checkpoint: [(LogIngestionState pk, inode, offset)] committed with the insert (optional)
+        shed_counts: Load-shedding counts committed with the insert (optional)
+    """
+    use_outbox = outbox_enabled()
+    saved_alerts = _persist_alert_batch(
+        alert_objects,
+        dedup_cache=dedup_cache,
+        batch_policy=batch_policy,
+        checkpoint=checkpoint,
+        shed_counts=shed_counts,
+        enable_email=enable_email and use_outbox,
+        enable_websocket=enable_websocket and use_outbox,
+    )
+    if not saved_alerts:
+        return 0
+
+    if enable_ml:
+        _enrich_alert_batch(saved_alerts)
+    if not use_outbox and (enable_email or enable_websocket):
+        _notify_alert_batch(saved_alerts, enable_email=enable_email, enable_websocket=enable_websocket)
+    return len(saved_alerts)
 
 
 # ===== OPTIMIZED BATCH INGESTION =====
 
-def ingest_snort_logs(log_dir, max_lines=None, enable_ml=True, enable_email=True, enable_websocket=True):
+def _get_alert_log_state(registry, file_path, stat_result):
+    # Cached LogIngestionState for file_path, reset when the file was rotated/truncated
+    state = registry.get_state(file_path)
+    inode = str(stat_result.st_ino)
+
+    # File was rotated/replaced - reset offset and inode
+    if state.inode != inode:
+        state.inode = inode
+        state.offset = 0
+
+    # Truncated in place (archives are never rewritten; their offsets exceed the compressed size)
+    if state.offset > stat_result.st_size and not _is_gzip_log(file_path):
+        state.offset = 0
+    return state
+
+
+def _parse_fast_record(file_path, line_start, raw_line, timestamp_cache):
+    """
+    Decode, parse, validate and hash one FAST line.
+
+    Returns (record, error_msg):
+      - (AlertRecord, None) for a valid alert
+      - (None, error_msg) when the alert failed validation (other formats;
+        parse_fast_alert validates while parsing, so FAST lines never do)
+      - (None, None) for blank/non-alert lines
+    """
+    # Decode once: the same text is parsed, hashed and stored as raw_line
+    line = str(raw_line, 'utf-8', 'ignore').strip()
+    if not line:
+        return None, None
+
+    # Parse FAST format line (validated field by field)
+    record = parse_fast_alert(line, timestamp_cache)
+    if record is None:
+        return None, None
+
+    # Create unique hash for deduplication (same line = same event)
+    record.raw_line = line
+    record.event_hash, record.event_digest = compute_event_hashes(f'{file_path}:{line_start}:{line}')
+    return record, None
+
+
+def _store_record_batch(records, maybe_records, dedup_cache, pipeline=None, checkpoint=None, shed_counts=None, sensor='', **options):
     """
-    Parse FAST format alert logs, validate, deduplicate via event_hash,
+    Process a batch of parsed records (AlertRecord); Alert objects are
+    built here only for the inline path - the pipeline builds them in its
+    persist stage.
+
+    Records the dedup cache could only answer "maybe" for (Bloom positives)
+    are confirmed with one query first; those already stored are dropped.
+
+    Args:
+        records: Parsed records in file order
+        maybe_records: Subset of records that hit the Bloom filter
+        dedup_cache: RecentEventCache or None
+        pipeline: IngestionPipeline to hand the batch to (returns 0, counted by wait_persisted)
+        checkpoint: [(LogIngestionState pk, inode, offset)] to commit with the batch
+        shed_counts: LoadShedder.take_counts() to commit with the batch
+        sensor: Sensor.name stored on the alerts ('' for SNORT_LOG_DIR)
+        **options: enable_ml / enable_email / enable_websocket / batch_policy for _process_alert_batch
+
+    Raises PersistError when a batch carrying a checkpoint is not stored.
+    """
+    if maybe_records:
+        fresh = {record.event_digest for record in dedup_cache.confirm_new(maybe_records, digest_of=attrgetter('event_digest'))}
+        stored = {record.event_digest for record in maybe_records} - fresh
+        if stored:
+            records = [record for record in records if record.event_digest not in stored]
+    if pipeline is not None:
+        pipeline.submit(records, checkpoint=checkpoint, shed_counts=shed_counts, sensor=sensor)
+        return 0
+    try:
+        alerts = build_alerts(records, sensor)
+        if not alerts:
+            # Everything was a duplicate or shed: still record how far the files were read
+            if checkpoint or shed_counts:
+                _persist_alert_batch([], checkpoint=checkpoint, shed_counts=shed_counts)
+            return 0
+        return _process_alert_batch(alerts, dedup_cache=dedup_cache, checkpoint=checkpoint, shed_counts=shed_counts, **options)
+    except Exception as e:
+        if not checkpoint:
+            raise
+        # The reader's cached offsets are ahead of this batch: it must fall back to the committed ones
+        raise PersistError(f'Storing a batch of {len(records)} alerts failed: {e}') from e
+
+
+def ingest_snort_logs(log_dir, max_lines=None, enable_ml=True, enable_email=True, enable_websocket=True, registry=None, dedup_cache=None, pipeline=None, batch_policy=None, shedder=None):
+    """
+    Parse FAST format alert logs, validate, deduplicate via event_digest,
     and store alerts using efficient batch processing.
+
+    Rotated .gz archives are decompressed as a stream (no temporary files);
+    their offsets are positions in the uncompressed text.
     
     Args:
         log_dir: Path to Snort log directory
@@ -953,116 +1623,447 @@ def ingest_snort_logs(log_dir, max_lines=None, enable_ml=True, enable_email=True
         enable_ml: Run ML enrichment on alerts (default True)
         enable_email: Send email notifications (default True)
         enable_websocket: Broadcast WebSocket updates (default True)
+        registry: LogFileRegistry to use (default: process-wide registry for log_dir)
+        dedup_cache: RecentEventCache to use (default: process-wide cache from settings)
+        pipeline: IngestionPipeline to persist/enrich/notify on worker threads
+                  (default: process batches inline; the pipeline's own enable_* flags apply)
+        batch_policy: AdaptiveBatchPolicy deciding batch flushes (default: the pipeline's, else a new one)
+        shedder: LoadShedder used while ingestion is behind (default: per log type from settings,
+                 None when INGEST_SHED_ENABLED is off)
+    """
+    # Find all alert log files (filename contains "alert"), cached between cycles
+    return ingest_line_logs(
+        log_dir, _is_alert_log_name, _parse_fast_record,
+        max_lines=max_lines, enable_ml=enable_ml, enable_email=enable_email, enable_websocket=enable_websocket,
+        registry=registry, dedup_cache=dedup_cache, pipeline=pipeline, batch_policy=batch_policy, shedder=shedder,
+    )
+
+
+def ingest_line_logs(log_dir, name_filter, parse_record, max_lines=None, enable_ml=True, enable_email=True, enable_websocket=True, registry=None, dedup_cache=None, pipeline=None, batch_policy=None, shedder=None):
+    """
+    Shared reader for line-oriented alert logs (FAST text, Snort 3 alert_json).
+
+    Args:
+        name_filter: Accepts the file names to ingest
+        parse_record: (file_path, line_start, raw_line, timestamp_cache) -> (record, error_msg),
+                      see _parse_fast_record
+        other args: as ingest_snort_logs
     """
     log_dir_path = Path(log_dir)
     if not log_dir_path.exists() or not log_dir_path.is_dir():
         logger.warning(f'Log directory does not exist: {log_dir}')
-        return {'inserted': 0, 'processed_lines': 0, 'failed_lines': 0}
-
-    # Find all alert log files (filename contains "alert")
-    log_files = sorted(
-        [p for p in log_dir_path.rglob('*alert*') if p.is_file() and p.suffix != '.gz' and not p.name.startswith('.')],
-        key=lambda p: p.name,
-    )
+        return {'inserted': 0, 'processed_lines': 0, 'failed_lines': 0, 'skipped_duplicates': 0, 'shed_events': 0}
+
+    if registry is None:
+        registry = get_file_registry(log_dir_path)
+    log_files = registry.iter_log_files(name_filter)
+    if dedup_cache is None:
+        dedup_cache = get_event_cache()
+    if batch_policy is None:
+        batch_policy = getattr(pipeline, 'batch_policy', None) or AdaptiveBatchPolicy()
+    if shedder is None:
+        shedder = get_load_shedder(log_dir_path, name_filter, registry.sensor)
+    # Bytes behind at the start of the cycle; reduced by what each file has been read since
+    lag_bytes = registry.lag_bytes(log_files) if shedder is not None else 0
+    telemetry = get_ingestion_telemetry()
+    sensor = telemetry_sensor(log_dir_path, registry.sensor)
 
     inserted = 0
     processed_lines = 0
     failed_lines = 0
-    batch = []  # Accumulate Alert objects for batch processing
+    skipped_duplicates = 0
+    shed_events = 0
+    batch = []  # Accumulate parsed records for batch processing
+    maybe_records = []  # Records of the batch the Bloom filter could not rule out
+    checkpoints = {}  # file_path -> (state pk, inode, offset) reached by the records in `batch`
+    read_files = []  # Files read this cycle (their cached offsets run ahead of the stored alerts)
+    timestamp_cache = SnortTimestampCache()  # Year/timezone resolved once per cycle
+    options = {
+        'enable_ml': enable_ml,
+        'enable_email': enable_email,
+        'enable_websocket': enable_websocket,
+        'pipeline': pipeline,
+        'batch_policy': batch_policy,
+        'sensor': registry.sensor,
+    }
 
-    for log_file in log_files:
-        if max_lines is not None and processed_lines >= max_lines:
-            break
+    failure = None
+    try:
+        for log_file, file_path, stat_result in log_files:
+            if max_lines is not None and processed_lines >= max_lines:
+                break
+
+            # Nothing new since the last cycle - no open(), no DB query
+            if registry.is_unchanged(file_path, stat_result):
+                continue
+
+            try:
+                read_files.append(file_path)
+                # Track ingestion state per file to resume on restart
+                state = registry.ensure_row(_get_alert_log_state(registry, file_path, stat_result))
+                complete = None
+                start_offset = state.offset
+                counts_before = (processed_lines, skipped_duplicates, shed_events, failed_lines)
+                event_source = registry.event_source(file_path)
+                if shedder is not None:
+                    shedder.set_lag(lag_bytes)
+
+                # Archives and files that stopped changing end with their last line, newline or not
+                final = _is_gzip_log(file_path) or registry.is_quiet(file_path, stat_result)
+                with _open_alert_log(log_file) as handle:
+                    for line_start, line_end, raw_line in _iter_log_lines(handle, state.offset, final=final):
+                        if max_lines is not None and processed_lines >= max_lines:
+                            break
+
+                        processed_lines += 1
+                        state.offset = line_end
+
+                        record, error_msg = parse_record(event_source, line_start, raw_line, timestamp_cache)
+                        if error_msg:
+                            failed_lines += 1
+                            logger.warning(f'Invalid alert data from {file_path}: {error_msg}')
+                            continue
+                        if record is None:
+                            continue
+
+                        # Recently stored event (re-read after a reset/rotation): skip without touching the DB
+                        if dedup_cache is not None:
+                            verdict = dedup_cache.check(record.event_digest)
+                            if verdict == dedup_cache.SEEN:
+                                skipped_duplicates += 1
+                                continue
+                            if verdict == dedup_cache.MAYBE:
+                                maybe_records.append(record)
+
+                        # Behind: over-rate (src_ip, sid) events are counted instead of stored
+                        if shedder is not None and not shedder.admit(record):
+                            shed_events += 1
+                            continue
+
+                        # Append to batch instead of inserting one-by-one
+                        batch.append(record)
+                        batch_policy.record_added()
+
+                        # Flush on the adaptive size target or when the oldest record hits the deadline
+                        reason = batch_policy.flush_reason(len(batch))
+                        if reason:
+                            batch_policy.record_flush(reason, len(batch))
+                            # Checkpoint: this file up to the current line, earlier files to their end
+                            checkpoints[file_path] = (state.pk, state.inode, state.offset)
+                            inserted += _store_record_batch(
+                                batch, maybe_records, dedup_cache, checkpoint=list(checkpoints.values()),
+                                shed_counts=shedder and shedder.take_counts(), **options
+                            )
+                            batch = []
+                            maybe_records = []
+                            checkpoints = {}
+                            if shedder is not None:
+                                shedder.set_lag(lag_bytes - (state.offset - start_offset))
+
+                    if _is_gzip_log(file_path):
+                        complete = _reached_clean_eof(handle)
+
+                # Remember progress (file offset + inode) for resume on restart
+                registry.mark_ingested(file_path, state, stat_result, complete=complete)
+                checkpoints[file_path] = (state.pk, state.inode, state.offset)
+                lag_bytes -= state.offset - start_offset
+                telemetry.record_file(
+                    sensor, file_path, state.file_size, state.offset,
+                    processed_lines - counts_before[0], state.offset - start_offset,
+                    skipped_duplicates - counts_before[1], shed_events - counts_before[2], failed_lines - counts_before[3],
+                )
+            except PersistError:
+                raise
+            except Exception:
+                logger.exception('Error while ingesting alert log file %s', log_file)
+                continue
+
+        # Process any remaining alerts in the final partial batch (and shed counts not written yet)
+        shed_counts = shedder and shedder.take_counts()
+        if batch or shed_counts:
+            if batch:
+                batch_policy.record_flush('end', len(batch))
+            inserted += _store_record_batch(
+                batch, maybe_records, dedup_cache, checkpoint=list(checkpoints.values()), shed_counts=shed_counts, **options
+            )
+    except PersistError as e:
+        failure = e
 
+    # Offsets must never get ahead of the stored alerts
+    if pipeline is not None:
         try:
-            file_path = str(log_file.relative_to(log_dir_path))
-            inode = _get_file_inode(log_file)
-            # Track ingestion state per file to resume on restart
-            state, _ = LogIngestionState.objects.get_or_create(file_path=file_path)
-
-            # File was rotated/replaced - reset offset and inode
-            if state.inode != inode:
-                state.inode = inode
-                state.offset = 0
-
-            file_size = log_file.stat().st_size
-            if state.offset > file_size:
-                state.offset = 0
-
-            with log_file.open('r', encoding='utf-8', errors='ignore') as handle:
-                handle.seek(state.offset)
-                while True:
-                    if max_lines is not None and processed_lines >= max_lines:
-                        break
-
-                    line_start = handle.tell()
-                    line = handle.readline()
-                    if not line:
-                        break
-
-                    processed_lines += 1
-                    # Parse FAST format line
-                    parsed = parse_snort_fast_line(line)
-                    if not parsed:
-                        continue
+            inserted += pipeline.wait_persisted(registry.sensor)
+        except PersistError as e:
+            inserted += e.inserted
+            failure = failure or e
+    if failure is not None:
+        # The cached offsets are ahead of the stored alerts: go back to the committed checkpoints
+        logger.error(f'Storing alerts failed, {len(read_files)} file(s) are re-read from their last checkpoint: {failure}')
+        registry.forget(read_files)
+    telemetry.record_rows(sensor, inserted)
+
+    # Persist all changed offsets in one batched write (after the alerts are stored)
+    try:
+        registry.flush()
+    except Exception:
+        logger.exception('Failed to save alert log ingestion state')
 
-                    # Validate parsed fields
-                    is_valid, error_msg, cleaned_data = validate_alert_data(parsed)
-                    if not is_valid:
-                        failed_lines += 1
-                        logger.warning(f'Invalid alert data from {file_path}: {error_msg}')
-                        continue
+    return {
+        'inserted': inserted,
+        'processed_lines': processed_lines,
+        'failed_lines': failed_lines,
+        'skipped_duplicates': skipped_duplicates,
+        'shed_events': shed_events,
+    }
 
-                    # Create unique hash for deduplication (same line = same event)
-                    hash_source = f'{file_path}:{line_start}:{line.strip()}'
-                    event_hash = hashlib.sha256(hash_source.encode('utf-8')).hexdigest()
 
-                    # Append to batch instead of inserting one-by-one
-                    batch.append(Alert(
-                        **cleaned_data,
-                        raw_line=line.strip(),
-                        event_hash=event_hash,
-                    ))
+# ===== PARALLEL BACKFILL =====
+# Replaying months of history on one core is slow. Split alert files into
+# byte ranges, parse + validate + hash them in a process pool, and stream the
+# records back (in file order) to a single writer that bulk-inserts them.
+# Each .gz archive is one work unit, so several archives decompress in parallel.
 
-                    # Process batch when it reaches BATCH_SIZE
-                    if len(batch) >= BATCH_SIZE:
-                        inserted += _process_alert_batch(batch, enable_ml=enable_ml, enable_email=enable_email, enable_websocket=enable_websocket)
-                        batch = []
+BACKFILL_RANGE_BYTES = 8 * 1024 * 1024  # Work unit size; large files are split on line boundaries
 
-                state.offset = handle.tell()
 
-            # Save progress (file offset + inode) for resume on restart
-            LogIngestionState.objects.update_or_create(
-                file_path=file_path,
-                defaults={'inode': state.inode, 'offset': state.offset}
-            )
-        except Exception:
-            logger.exception('Error while ingesting alert log file %s', log_file)
+def _backfill_worker_init():
+    # Workers only parse - never let them use DB connections inherited via fork()
+    import django
+    from django.apps import apps
+    from django.db import connections
+
+    if not apps.ready:
+        django.setup()
+    for conn in connections.all():
+        conn.connection = None
+
+
+def _backfill_parse_range(log_file, file_path, start, end, year):
+    """
+    Worker: parse every complete line whose first byte lies in [start, end).
+
+    end=None reads to EOF: .gz archives are one unit each (decompressed in
+    the worker, in memory - no temporary files) and start is always a line
+    boundary there.
+
+    Returns a dict with the validated records (AlertRecord),
+    line counters, resume_offset (where the first unconsumed line starts,
+    None when the range holds nothing but the tail of an unfinished line) and
+    complete (EOF was reached cleanly; only meaningful for end=None).
+    """
+    timestamp_cache = SnortTimestampCache(year=year)
+    records = []
+    processed = 0
+    failed = 0
+    resume_offset = start
+    complete = None
+
+    with _open_alert_log(log_file) as handle:
+        if start > 0 and end is not None:
+            # Mid-file range: a line starting exactly at `start` belongs to us,
+            # otherwise the previous range owns it and we begin at the next one
+            handle.seek(start - 1)
+            if handle.read(1) != b'\n' and not handle.readline().endswith(b'\n'):
+                # Only the unfinished last line is left - the previous range keeps the offset
+                return {'file_path': file_path, 'records': [], 'processed': 0, 'failed': 0, 'resume_offset': None}
+            resume_offset = handle.tell()
+
+        # An archive is read to its end: its last line is complete even without a newline
+        for line_start, line_end, raw_line in _iter_log_lines(handle, resume_offset, final=end is None and _is_gzip_log(log_file)):
+            if end is not None and line_start >= end:
+                break
+            processed += 1
+            resume_offset = line_end
+
+            record, error_msg = _parse_fast_record(file_path, line_start, raw_line, timestamp_cache)
+            if error_msg:
+                failed += 1
+                logger.warning(f'Invalid alert data from {file_path}: {error_msg}')
+            elif record is not None:
+                records.append(record)
+
+        if end is None:
+            complete = _reached_clean_eof(handle)
+
+    return {
+        'file_path': file_path,
+        'records': records,
+        'processed': processed,
+        'failed': failed,
+        'resume_offset': resume_offset,
+        'complete': complete,
+    }
+
+
+def _plan_backfill_ranges(log_file, file_path, start, size, range_bytes):
+    # Split [start, size) into byte ranges; workers realign them to line starts
+    if _is_gzip_log(file_path):
+        # Uncompressed size is unknown up front and gzip cannot seek cheaply: one unit per archive
+        return [(str(log_file), file_path, start, None)]
+    units = []
+    position = start
+    while position < size:
+        end = min(size, position + range_bytes)
+        units.append((str(log_file), file_path, position, end))
+        position = end
+    return units
+
+
+def backfill_snort_logs_parallel(log_dir, workers=2, enable_ml=True, range_bytes=BACKFILL_RANGE_BYTES, registry=None, dedup_cache=None, batch_policy=None):
+    """
+    Backfill FAST alert logs using a process pool (parse) and a single writer (DB).
+
+    Produces exactly the same alerts, event_hash values and final
+    LogIngestionState offsets as ingest_snort_logs(), just faster on big
+    histories. Email and WebSocket side effects are always disabled.
+
+    Args:
+        log_dir: Path to Snort log directory
+        workers: Number of parser processes
+        enable_ml: Run ML enrichment on inserted alerts (default True)
+        range_bytes: Target size of each work unit in bytes
+        registry: LogFileRegistry to use (default: process-wide registry for log_dir)
+        dedup_cache: RecentEventCache to use (default: process-wide cache from settings)
+        batch_policy: AdaptiveBatchPolicy deciding batch flushes (default: a new one)
+    """
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor
+
+    log_dir_path = Path(log_dir)
+    if not log_dir_path.exists() or not log_dir_path.is_dir():
+        logger.warning(f'Log directory does not exist: {log_dir}')
+        return {'inserted': 0, 'processed_lines': 0, 'failed_lines': 0, 'skipped_duplicates': 0}
+
+    if registry is None:
+        registry = get_file_registry(log_dir_path)
+    if dedup_cache is None:
+        dedup_cache = get_event_cache()
+    if batch_policy is None:
+        batch_policy = AdaptiveBatchPolicy()
+
+    # Plan work units per file from the stored offsets (file order is kept)
+    files = []
+    for log_file, file_path, stat_result in registry.iter_log_files(_is_alert_log_name):
+        if registry.is_unchanged(file_path, stat_result):
             continue
+        state = registry.ensure_row(_get_alert_log_state(registry, file_path, stat_result))
+        units = _plan_backfill_ranges(
+            log_file, registry.event_source(file_path), state.offset, stat_result.st_size, max(1, range_bytes)
+        )
+        if units:
+            files.append((file_path, state, stat_result, units))
+
+    inserted = 0
+    processed_lines = 0
+    failed_lines = 0
+    skipped_duplicates = 0
+    batch = []
+    maybe_records = []
+    checkpoints = {}  # file_path -> (state pk, inode, offset) of work units fully in `batch`
+    year = timezone.now().year
+    options = {
+        'enable_ml': enable_ml,
+        'enable_email': False,
+        'enable_websocket': False,
+        'batch_policy': batch_policy,
+        'sensor': registry.sensor,
+    }
+
+    all_units = [(file_index, unit) for file_index, (_, _, _, units) in enumerate(files) for unit in units]
+    remaining_units = [len(units) for _, _, _, units in files]
+
+    try:
+        with ProcessPoolExecutor(max_workers=max(1, workers), initializer=_backfill_worker_init) as pool:
+            # Bounded window of in-flight units keeps memory flat and results ordered
+            pending = deque()
+            unit_iter = iter(all_units)
+            window = max(1, workers) * 2
+
+            def submit_next():
+                try:
+                    file_index, unit = next(unit_iter)
+                except StopIteration:
+                    return
+                pending.append((file_index, pool.submit(_backfill_parse_range, *unit, year)))
+
+            for _ in range(window):
+                submit_next()
+
+            while pending:
+                file_index, future = pending.popleft()
+                result = future.result()
+                submit_next()
+
+                processed_lines += result['processed']
+                failed_lines += result['failed']
+                for record in result['records']:
+                    if dedup_cache is not None:
+                        verdict = dedup_cache.check(record.event_digest)
+                        if verdict == dedup_cache.SEEN:
+                            skipped_duplicates += 1
+                            continue
+                        if verdict == dedup_cache.MAYBE:
+                            maybe_records.append(record)
+                    batch.append(record)
+                    batch_policy.record_added()
+                    reason = batch_policy.flush_reason(len(batch))
+                    if reason:
+                        batch_policy.record_flush(reason, len(batch))
+                        inserted += _store_record_batch(
+                            batch, maybe_records, dedup_cache, checkpoint=list(checkpoints.values()), **options
+                        )
+                        batch = []
+                        maybe_records = []
+                        checkpoints = {}
+
+                # Unit fully consumed: the next batch may checkpoint its resume offset
+                file_path, state, stat_result, _units = files[file_index]
+                if result['resume_offset'] is not None:
+                    state.offset = result['resume_offset']
+                    checkpoints[file_path] = (state.pk, state.inode, state.offset)
+                remaining_units[file_index] -= 1
+                if remaining_units[file_index] == 0:
+                    registry.mark_ingested(file_path, state, stat_result, complete=result['complete'])
+
+        if batch:
+            batch_policy.record_flush('end', len(batch))
+            inserted += _store_record_batch(
+                batch, maybe_records, dedup_cache, checkpoint=list(checkpoints.values()), **options
+            )
+    except PersistError:
+        # Back to the committed checkpoints so a later cycle reads the unstored ranges again
+        registry.forget([file_path for file_path, _state, _stat, _units in files])
+        raise
 
-    # Process any remaining alerts in the final partial batch
-    if batch:
-        inserted += _process_alert_batch(batch, enable_ml=enable_ml, enable_email=enable_email, enable_websocket=enable_websocket)
+    registry.flush()
 
     return {
         'inserted': inserted,
         'processed_lines': processed_lines,
         'failed_lines': failed_lines,
+        'skipped_duplicates': skipped_duplicates,
     }
 
 
 # ===== CONTINUOUS LOG INGESTION POLLING =====
 # Continuously monitor and ingest Snort logs
 
-def run_polling_loop(log_dir, interval_seconds=3):
+def run_polling_loop(log_dir, interval_seconds=3, watch=None):
     """
     Continuously monitor Snort log directory and ingest new alerts.
 
     Polling cycle:
     1. Call ingest_snort_logs() - parse text-based FAST format alerts
-    2. Call ingest_snort_packet_logs() - parse binary PCAP packets
-    3. Sleep for interval_seconds
-    4. Repeat forever
+    2. Call ingest_snort_json_logs() - parse Snort 3 alert_json lines
+    3. Call ingest_snort_unified2_logs() - parse binary unified2 alerts
+    4. Call ingest_snort_packet_logs() - aggregate PCAP packets into flows
+    5. Wait for the next change (watch mode) or sleep for interval_seconds
+    6. Repeat forever
+
+    In watch mode the loop blocks on the watcher from create_log_watcher()
+    (InotifyLogWatcher on Linux, StatLogWatcher elsewhere) so new alerts are ingested milliseconds after
+    Snort writes them and an idle sensor costs no CPU. A full rescan still
+    runs every SNORT_WATCH_RESCAN_SECONDS as a safety net.
 
     Designed to run as background process or management command.
     Logs results of each ingestion cycle.
@@ -1070,32 +2071,87 @@ def run_polling_loop(log_dir, interval_seconds=3):
     Args:
         log_dir: Path to Snort log directory
         interval_seconds: Delay between polling cycles (default 3 seconds)
+        watch: Wake on file changes instead of sleeping (default settings.SNORT_WATCH_ENABLED)
     """
-    while True:
-        try:
-            # Ingest text-based FAST format logs
-            text_result = ingest_snort_logs(log_dir)
-            # Ingest binary PCAP packet logs
-            packet_result = ingest_snort_packet_logs(log_dir)
-
-            total_inserted = text_result.get('inserted', 0) + packet_result.get('inserted', 0)
-            total_processed = text_result.get('processed_lines', 0) + packet_result.get('processed_packets', 0)
-            total_failed = text_result.get('failed_lines', 0) + packet_result.get('failed_packets', 0)
-
-            if total_inserted > 0 or total_failed > 0:
-                logger.info(
-                    f'[{datetime.now().strftime("%H:%M:%S")}] '
-                    f'Detected: {total_processed} | Inserted: {total_inserted} | Failed: {total_failed}'
-                )
+    from .alert_json import ingest_snort_json_logs
+    from .flows import ingest_snort_packet_logs
+    from .telemetry import publish_ingestion_telemetry
+    from .unified2 import ingest_snort_unified2_logs
+    from .watcher import create_log_watcher
+
+    if watch is None:
+        watch = getattr(settings, 'SNORT_WATCH_ENABLED', True)
+
+    watcher = None
+    if watch:
+        watcher = create_log_watcher(
+            log_dir,
+            stat_interval=getattr(settings, 'SNORT_WATCH_STAT_INTERVAL_SECONDS', 0.5),
+        )
+    rescan_seconds = getattr(settings, 'SNORT_WATCH_RESCAN_SECONDS', 60)
 
-            # Cleanup expired temporary blocks
+    try:
+        while True:
             try:
-                from .prevention import cleanup_expired_blocks
-                cleanup_expired_blocks()
-            except Exception:
-                pass
+                # Ingest text-based FAST format logs
+                text_result = ingest_snort_logs(log_dir)
+                # Ingest Snort 3 alert_json lines
+                json_result = ingest_snort_json_logs(log_dir)
+                # Ingest binary unified2 alerts
+                unified2_result = ingest_snort_unified2_logs(log_dir)
+                # Aggregate binary PCAP packet logs into flows
+                packet_result = ingest_snort_packet_logs(log_dir)
+
+                total_inserted = (
+                    text_result.get('inserted', 0)
+                    + json_result.get('inserted', 0)
+                    + unified2_result.get('inserted', 0)
+                )
+                total_processed = (
+                    text_result.get('processed_lines', 0)
+                    + json_result.get('processed_lines', 0)
+                    + unified2_result.get('processed_records', 0)
+                )
+                total_failed = (
+                    text_result.get('failed_lines', 0)
+                    + json_result.get('failed_lines', 0)
+                    + unified2_result.get('failed_records', 0)
+                    + packet_result.get('failed_packets', 0)
+                )
+                total_shed = (
+                    text_result.get('shed_events', 0)
+                    + json_result.get('shed_events', 0)
+                    + unified2_result.get('shed_events', 0)
+                )
 
-        except Exception:
-            logger.exception('Error in polling loop iteration')
+                if total_inserted > 0 or total_failed > 0 or total_shed > 0:
+                    logger.info(
+                        f'[{datetime.now().strftime("%H:%M:%S")}] '
+                        f'Detected: {total_processed} | Inserted: {total_inserted} | Failed: {total_failed} | Shed: {total_shed}'
+                    )
+                if packet_result.get('processed_packets', 0):
+                    logger.info(
+                        f"Packets: {packet_result['processed_packets']} | Flows inserted: {packet_result.get('inserted', 0)} "
+                        f"| updated: {packet_result.get('updated', 0)} | open: {packet_result.get('active_flows', 0)}"
+                    )
 
-        time.sleep(interval_seconds)
+                # Lag / throughput snapshot for the API (every INGEST_TELEMETRY_PUBLISH_SECONDS)
+                publish_ingestion_telemetry()
+
+                # Cleanup expired temporary blocks
+                try:
+                    from .prevention import cleanup_expired_blocks
+                    cleanup_expired_blocks()
+                except Exception:
+                    pass
+
+            except Exception:
+                logger.exception('Error in polling loop iteration')
+
+            if watcher is not None:
+                watcher.wait(timeout=rescan_seconds)
+            else:
+                time.sleep(interval_seconds)
+    finally:
+        if watcher is not None:
+            watcher.close()
@@ -0,0 +1,169 @@
+"""
+Opt-in load shedding for alert floods.
+
+A SYN flood makes Snort write tens of thousands of identical alerts per
+second; storing every one of them puts ingestion minutes behind real time.
+When a reader falls more than INGEST_SHED_LAG_BYTES behind the end of its
+log files, LoadShedder rate-limits events per (src_ip, sid) with token
+buckets (INGEST_SHED_RATE events per second of alert time, bursts up to
+INGEST_SHED_BURST). It switches off again once the lag is below half the
+threshold.
+
+Shed events are not silently lost: they are counted per sensor, key and
+INGEST_SHED_WINDOW_SECONDS window of alert time and stored as ShedAlertCount
+rows in the same transaction as the offsets that skipped them. Re-reading a
+file after an offset reset counts its shed events again.
+"""
+import logging
+import threading
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .models import ShedAlertCount
+
+logger = logging.getLogger(__name__)
+
+
+class LoadShedder:
+    """
+    Lag-triggered token buckets per (src_ip, sid).
+
+    set_lag() switches shedding on/off; admit() returns False for events to
+    drop and counts them; take_counts() hands the counts to the batch that
+    checkpoints past them.
+
+    Args:
+        sensor: Sensor.name of the log root the counts belong to ('' for SNORT_LOG_DIR)
+    """
+
+    def __init__(self, lag_threshold, rate, burst, window_seconds=60, max_keys=100000, sensor=''):
+        self.sensor = sensor
+        self.lag_threshold = max(1, int(lag_threshold))
+        self.rate = max(0.0, float(rate))
+        self.burst = max(1.0, float(burst))
+        self.window_seconds = max(1, int(window_seconds))
+        self.max_keys = max(1, int(max_keys))
+        self.active = False
+        self.lag = 0
+        self.shed_total = 0
+        self._buckets = {}  # (src_ip, sid) -> [tokens, alert time of the last refill]
+        self._counts = {}   # (window start epoch, src_ip, sid) -> shed events not written yet
+
+    def set_lag(self, lag_bytes):
+        """Switch on at lag_threshold bytes behind, off below half of it (hysteresis)."""
+        self.lag = lag_bytes
+        if not self.active and lag_bytes >= self.lag_threshold:
+            self.active = True
+            logger.warning(f'[Shedding] Ingestion is {lag_bytes} bytes behind: rate-limiting alerts per source and SID')
+        elif self.active and lag_bytes < self.lag_threshold // 2:
+            self.active = False
+            self._buckets.clear()
+            logger.info(f'[Shedding] Caught up ({lag_bytes} bytes behind): storing every alert again ({self.shed_total} shed so far)')
+        return self.active
+
+    def admit(self, record):
+        """True to store the event (AlertRecord), False to shed it (always True while inactive)."""
+        if not self.active:
+            return True
+
+        key = (record.src_ip, record.sid)
+        now = record.timestamp.timestamp()
+        buckets = self._buckets
+        bucket = buckets.pop(key, None)  # Re-inserted below: dict order is least recently seen first
+        if bucket is None:
+            if len(buckets) >= self.max_keys:
+                # Forget the least recently seen tenth; they start again with a full bucket
+                for stale in list(buckets)[:max(1, self.max_keys // 10)]:
+                    del buckets[stale]
+            bucket = [self.burst, now]
+        elif now > bucket[1]:
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        buckets[key] = bucket
+
+        if bucket[0] >= 1.0:
+            bucket[0] -= 1.0
+            return True
+
+        window = int(now // self.window_seconds) * self.window_seconds
+        count_key = (window, key[0], key[1])
+        self._counts[count_key] = self._counts.get(count_key, 0) + 1
+        self.shed_total += 1
+        return False
+
+    def take_counts(self):
+        """Shed counts since the last call as {(window_start, sensor, src_ip, sid): count}; None when there are none."""
+        if not self._counts:
+            return None
+        counts, self._counts = self._counts, {}
+        return {
+            (datetime.fromtimestamp(window, tz=dt_timezone.utc), self.sensor, src_ip, sid): count
+            for (window, src_ip, sid), count in counts.items()
+        }
+
+
+def write_shed_counts(counts):
+    """
+    Add shed counts to their ShedAlertCount rows.
+
+    Called inside the transaction of the batch whose checkpoint skipped the
+    events, and possibly by several sensor workers or nodes at once for the
+    same window. So nothing is read and written back: missing rows are
+    created empty with one INSERT that ignores rows another writer created
+    first, then every count is added in the database (UPDATE ... SET
+    shed_count = shed_count + n), in key order so concurrent writers lock
+    rows in the same order.
+
+    Args:
+        counts: {(window_start, sensor, src_ip, sid): count} from LoadShedder.take_counts()
+    """
+    if not counts:
+        return
+    # Same IP normalisation as the column, so keys match the stored rows
+    normalize_ip = ShedAlertCount._meta.get_field('src_ip').to_python
+    merged = {}
+    for (window_start, sensor, src_ip, sid), count in counts.items():
+        key = (window_start, sensor, normalize_ip(src_ip), sid)
+        merged[key] = merged.get(key, 0) + count
+
+    keys = sorted(merged)
+    ShedAlertCount.objects.bulk_create(
+        [ShedAlertCount(window_start=key[0], sensor=key[1], src_ip=key[2], sid=key[3]) for key in keys],
+        ignore_conflicts=True,
+    )
+    now = timezone.now()
+    for window_start, sensor, src_ip, sid in keys:
+        ShedAlertCount.objects.filter(window_start=window_start, sensor=sensor, src_ip=src_ip, sid=sid).update(
+            shed_count=F('shed_count') + merged[(window_start, sensor, src_ip, sid)], updated_at=now,
+        )
+
+
+_shedders = {}
+_shedders_lock = threading.Lock()
+
+
+def get_load_shedder(log_dir, name_filter, sensor=''):
+    """Process-wide shedder for one log type of log_dir configured from settings; None when disabled."""
+    if not getattr(settings, 'INGEST_SHED_ENABLED', False):
+        return None
+    key = (str(log_dir), name_filter, sensor)
+    with _shedders_lock:
+        shedder = _shedders.get(key)
+        if shedder is None:
+            shedder = _shedders[key] = LoadShedder(
+                lag_threshold=getattr(settings, 'INGEST_SHED_LAG_BYTES', 64 * 1024 * 1024),
+                rate=getattr(settings, 'INGEST_SHED_RATE', 10),
+                burst=getattr(settings, 'INGEST_SHED_BURST', 100),
+                window_seconds=getattr(settings, 'INGEST_SHED_WINDOW_SECONDS', 60),
+                max_keys=getattr(settings, 'INGEST_SHED_MAX_KEYS', 100000),
+                sensor=sensor,
+            )
+        return shedder
+
+
+def reset_load_shedders():
+    with _shedders_lock:
+        _shedders.clear()
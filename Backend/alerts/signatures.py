@@ -0,0 +1,137 @@
+"""
+In-process Signature cache used while ingesting.
+
+Alerts reference one Signature row per rule revision (gid:sid:rev) instead
+of repeating message, classification and priority on every row. A ruleset
+has at most tens of thousands of rules and a flood repeats a handful, so
+each ingesting process keeps the rows it has used: a batch whose
+signatures are known costs no query, new ones one SELECT and one INSERT.
+
+Rows are created in autocommit before the alert insert transaction, so a
+batch that rolls back never leaves the cache pointing at a missing row.
+A new signature takes the text of the first alert seen. A placeholder
+message (alert_json / unified2 event read without sid-msg.map) or an empty
+classification is filled in once an event carries the real one.
+"""
+import logging
+import threading
+
+from django.conf import settings
+
+from .models import Signature
+
+logger = logging.getLogger(__name__)
+
+# Message of alert_json / unified2 events whose rule text is unknown: 'Snort Alert [gid:sid:rev]'
+PLACEHOLDER_PREFIX = 'Snort Alert ['
+
+
+class SignatureCache:
+    """
+    (gid, sid, rev) -> Signature for the records of ingestion batches.
+
+    Args:
+        max_entries: Signatures kept; the oldest tenth is dropped when full
+    """
+
+    def __init__(self, max_entries=50000):
+        self.max_entries = max(1, int(max_entries))
+        self._signatures = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, records):
+        """Signature of each record (AlertRecord), in order; unknown ones are loaded or created."""
+        batch = {}  # (gid, sid, rev) -> a record with it, whose text creates / fills in the row
+        for record in records:
+            batch[(record.gid, record.sid, record.rev)] = record
+        with self._lock:
+            resolved = {key: self._signatures[key] for key in batch if key in self._signatures}
+            if len(resolved) < len(batch):
+                self._load([key for key in batch if key not in resolved], batch, resolved)
+            for key, signature in resolved.items():
+                self._fill_in(signature, batch[key])
+        return [resolved[(record.gid, record.sid, record.rev)] for record in records]
+
+    def _load(self, keys, batch, resolved):
+        sids = {sid for _gid, sid, _rev in keys}
+        found = _fetch(sids, keys)
+        new = [key for key in keys if key not in found]
+        if new:
+            Signature.objects.bulk_create(
+                [
+                    Signature(
+                        gid=gid, sid=sid, rev=rev,
+                        message=batch[(gid, sid, rev)].message,
+                        classification=batch[(gid, sid, rev)].classification,
+                        priority=batch[(gid, sid, rev)].priority,
+                    )
+                    for gid, sid, rev in new
+                ],
+                ignore_conflicts=True,  # Another ingester may add the same revision concurrently
+            )
+            # No primary keys with ignore_conflicts: read the rows back
+            found.update(_fetch(sids, new))
+            logger.info(f'[Signatures] Added {len(new)} signature(s)')
+
+        overflow = len(self._signatures) + len(found) - self.max_entries
+        if overflow > 0:
+            for stale in list(self._signatures)[:overflow + self.max_entries // 10]:
+                del self._signatures[stale]
+        self._signatures.update(found)
+        resolved.update(found)
+
+    def _fill_in(self, signature, record):
+        # Replace a placeholder message / empty classification with the text the record carries
+        updates = {}
+        if signature.message.startswith(PLACEHOLDER_PREFIX) and not record.message.startswith(PLACEHOLDER_PREFIX):
+            updates['message'] = record.message
+        if not signature.classification and record.classification:
+            updates['classification'] = record.classification
+        if updates:
+            Signature.objects.filter(pk=signature.pk).update(**updates)
+            for name, value in updates.items():
+                setattr(signature, name, value)
+
+
+def _fetch(sids, keys):
+    # Signature rows among keys, one query by sid
+    keys = set(keys)
+    found = {}
+    for signature in Signature.objects.filter(sid__in=sids):
+        key = (signature.gid, signature.sid, signature.rev)
+        if key in keys:
+            found[key] = signature
+    return found
+
+
+def latest_signatures(sids):
+    """
+    Newest revision of each SID as {sid: Signature}, for labelling per-SID counts.
+
+    One SID has several Signature rows once its rule is revised (and rev 0
+    for alerts stored before migration 0014): statistics group alerts by
+    sid and take the text of the highest revision.
+    """
+    latest = {}
+    for signature in Signature.objects.filter(sid__in=set(sids)).order_by('sid', 'rev', 'id'):
+        latest[signature.sid] = signature
+    return latest
+
+
+_signature_cache = None
+_signature_cache_lock = threading.Lock()
+
+
+def get_signature_cache():
+    """Process-wide SignatureCache sized from settings."""
+    global _signature_cache
+    with _signature_cache_lock:
+        if _signature_cache is None:
+            _signature_cache = SignatureCache(getattr(settings, 'INGEST_SIGNATURE_CACHE_SIZE', 50000))
+        return _signature_cache
+
+
+def reset_signature_cache():
+    global _signature_cache
+    with _signature_cache_lock:
+        _signature_cache = None
@@ -0,0 +1,293 @@
+"""
+Asyncio syslog receiver: sensors push alerts instead of writing into a
+shared SNORT_LOG_DIR that poll_snort_logs scans.
+
+    sensor --UDP datagram / TCP line--> SyslogAlertReceiver --batches--> _store_record_batch
+
+Accepted payloads (after an optional RFC 3164 / RFC 5424 header):
+- FAST lines, e.g. forwarded by rsyslog imfile from the alert file
+- Snort alert_syslog messages ("[1:1000001:1] msg [Classification: ...]
+  [Priority: 1]: {TCP} a:1 -> b:2"), stamped with the receive time
+- Snort 3 alert_json objects
+
+Everything goes through the existing FAST / alert_json parsers, the dedup
+cache and AdaptiveBatchPolicy. Database writes run on one executor thread
+(or are handed to an IngestionPipeline), so the event loop never blocks on
+MySQL. When more than SYSLOG_RECEIVER_MAX_PENDING records are waiting, TCP
+connections stop being read and UDP datagrams are dropped (and counted).
+
+TCP uses newline framing (rsyslog's default "traditional" framing).
+"""
+import asyncio
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.utils import timezone
+
+from .alert_json import SnortJsonParser
+from .dedup import get_event_cache
+from .services import AdaptiveBatchPolicy, SnortTimestampCache, _parse_fast_record, _store_record_batch
+from .unified2 import get_signature_lookups
+
+logger = logging.getLogger(__name__)
+
+MAX_SYSLOG_LINE_BYTES = 64 * 1024
+
+# First byte of the alert inside a syslog message: FAST timestamp, alert_syslog rule id or JSON object
+_PAYLOAD_START = re.compile(rb'\d{2}/\d{2}-\d{2}:\d{2}:\d{2}|\[\d+:\d+:\d+\]|\{"')
+
+SYSLOG_ALERT_PATTERN = re.compile(
+    r'^\[(?P<gid>\d+):(?P<sid>\d+):(?P<rev>\d+)\]\s+'
+    r'(?P<message>.+?)\s+'
+    r'(?:\[Classification:\s*(?P<classification>.*?)\]\s+)?'
+    r'\[Priority:\s*(?P<priority>\d+)\]:?\s+'
+    r'\{(?P<protocol>[^}]+)\}\s+'
+    r'(?P<src>\S+)\s+->\s+(?P<dest>\S+)\s*$'
+)
+
+
+def extract_alert_payload(message):
+    """Strip the syslog header (if any); returns the alert bytes or None."""
+    match = _PAYLOAD_START.search(message)
+    if match is None:
+        return None
+    return message[match.start():].rstrip(b'\r\n\x00 ')
+
+
+def syslog_alert_to_fast_line(text, received_at):
+    # alert_syslog has no timestamp and no [**] markers: rebuild the FAST line around it
+    match = SYSLOG_ALERT_PATTERN.match(text)
+    if match is None:
+        return None
+    parts = match.groupdict()
+    return (
+        f"{received_at:%m/%d-%H:%M:%S}.{received_at.microsecond:06d}  [**] "
+        f"[{parts['gid']}:{parts['sid']}:{parts['rev']}] {parts['message']} [**] "
+        f"[Classification: {parts['classification'] or ''}] [Priority: {parts['priority']}] "
+        f"{{{parts['protocol']}}} {parts['src']} -> {parts['dest']}"
+    )
+
+
+class _UdpProtocol(asyncio.DatagramProtocol):
+
+    def __init__(self, receiver):
+        self.receiver = receiver
+
+    def datagram_received(self, data, addr):
+        # One syslog message per datagram (some relays pack several, newline separated)
+        for message in data.split(b'\n'):
+            if message:
+                self.receiver.handle_message(message, addr[0], droppable=True)
+
+
+class SyslogAlertReceiver:
+    """
+    UDP + TCP syslog listener feeding the batched alert writer.
+
+    Args:
+        host: Address to bind (default SYSLOG_RECEIVER_HOST)
+        udp_port / tcp_port: Ports to bind, 0 = any free port, None = disabled
+        enable_ml / enable_email / enable_websocket: As ingest_snort_logs
+        pipeline: IngestionPipeline to hand batches to (default: write on the executor thread)
+        batch_policy: AdaptiveBatchPolicy (default: the pipeline's, else a new one)
+        dedup_cache: RecentEventCache (default: process-wide cache from settings)
+        max_pending: Records waiting for the writer before TCP pauses / UDP drops
+    """
+
+    def __init__(self, host=None, udp_port=None, tcp_port=None, enable_ml=True, enable_email=True, enable_websocket=True,
+                 pipeline=None, batch_policy=None, dedup_cache=None, max_pending=None):
+        self.host = host if host is not None else getattr(settings, 'SYSLOG_RECEIVER_HOST', '0.0.0.0')
+        self.udp_port = udp_port
+        self.tcp_port = tcp_port
+        self.pipeline = pipeline
+        self.batch_policy = batch_policy or getattr(pipeline, 'batch_policy', None) or AdaptiveBatchPolicy()
+        self.dedup_cache = dedup_cache if dedup_cache is not None else get_event_cache()
+        if max_pending is None:
+            max_pending = getattr(settings, 'SYSLOG_RECEIVER_MAX_PENDING', 20000)
+        self.max_pending = max(1, int(max_pending))
+        self.options = {
+            'enable_ml': enable_ml,
+            'enable_email': enable_email,
+            'enable_websocket': enable_websocket,
+            'batch_policy': self.batch_policy,
+        }
+
+        messages, _classifications = get_signature_lookups()
+        self.json_parser = SnortJsonParser(messages)
+        self.timestamp_cache = SnortTimestampCache()
+        self.stats = {'received': 0, 'parsed': 0, 'failed': 0, 'ignored': 0, 'dropped': 0,
+                      'skipped_duplicates': 0, 'inserted': 0}
+
+        self._batch = []
+        self._maybe_records = []
+        self._pending = 0  # Records handed to the writer and not stored yet
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='syslog-writer')
+        self._writes = set()
+        self._writable = None  # asyncio.Event, cleared while over max_pending
+        self._udp_transport = None
+        self._tcp_server = None
+        self._flush_task = None
+
+    # ---- parsing ----
+
+    def parse_message(self, message, peer):
+        """Syslog message bytes -> (record, error_msg) like _parse_fast_record."""
+        payload = extract_alert_payload(message)
+        if payload is None:
+            return None, None
+
+        # Hashes are keyed by sensor address instead of file:offset
+        source = f'syslog/{peer}'
+        if payload.startswith(b'{'):
+            return self.json_parser(source, 0, payload, self.timestamp_cache)
+        if payload.startswith(b'['):
+            line = syslog_alert_to_fast_line(str(payload, 'utf-8', 'ignore'), timezone.localtime())
+            if line is None:
+                return None, None
+            payload = line.encode('utf-8')
+        return _parse_fast_record(source, 0, payload, self.timestamp_cache)
+
+    def handle_message(self, message, peer, droppable=False):
+        self.stats['received'] += 1
+        if droppable and self._pending + len(self._batch) >= self.max_pending:
+            self.stats['dropped'] += 1
+            return
+
+        record, error_msg = self.parse_message(message[:MAX_SYSLOG_LINE_BYTES], peer)
+        if error_msg:
+            self.stats['failed'] += 1
+            logger.warning(f'Invalid alert data from syslog {peer}: {error_msg}')
+            return
+        if record is None:
+            self.stats['ignored'] += 1
+            return
+        self.stats['parsed'] += 1
+
+        dedup_cache = self.dedup_cache
+        if dedup_cache is not None:
+            verdict = dedup_cache.check(record.event_digest)
+            if verdict == dedup_cache.SEEN:
+                self.stats['skipped_duplicates'] += 1
+                return
+            if verdict == dedup_cache.MAYBE:
+                self._maybe_records.append(record)
+
+        self._batch.append(record)
+        self.batch_policy.record_added()
+        reason = self.batch_policy.flush_reason(len(self._batch))
+        if reason:
+            self._flush(reason)
+
+    # ---- batched writer ----
+
+    def _write(self, records, maybe_records):
+        # Runs on the writer thread (it owns its DB connection)
+        try:
+            return _store_record_batch(records, maybe_records, self.dedup_cache, pipeline=self.pipeline, **self.options)
+        finally:
+            close_old_connections()
+
+    def _flush(self, reason):
+        if not self._batch:
+            return None
+        records, maybe_records = self._batch, self._maybe_records
+        self._batch, self._maybe_records = [], []
+        self.batch_policy.record_flush(reason, len(records))
+
+        self._pending += len(records)
+        if self._pending >= self.max_pending and self._writable is not None:
+            self._writable.clear()
+
+        future = asyncio.get_running_loop().run_in_executor(self._writer, self._write, records, maybe_records)
+        self._writes.add(future)
+        future.add_done_callback(lambda done: self._write_done(done, len(records)))
+        return future
+
+    def _write_done(self, future, count):
+        self._writes.discard(future)
+        self._pending -= count
+        if self._pending < self.max_pending and self._writable is not None:
+            self._writable.set()
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            logger.error(f'[Syslog] Failed to store a batch of {count} alerts: {future.exception()}')
+            return
+        self.stats['inserted'] += future.result()
+
+    async def _deadline_loop(self):
+        # Flush partial batches on the latency deadline even when no more messages arrive
+        interval = max(0.005, self.batch_policy.max_delay / 2)
+        while True:
+            await asyncio.sleep(interval)
+            if self._batch and self.batch_policy.flush_reason(len(self._batch)):
+                self._flush('deadline')
+
+    async def flush(self):
+        """Write the current partial batch and wait for every write in flight."""
+        self._flush('end')
+        if self._writes:
+            await asyncio.gather(*list(self._writes), return_exceptions=True)
+
+    # ---- listeners ----
+
+    async def _handle_tcp(self, reader, writer):
+        peer = (writer.get_extra_info('peername') or ('unknown',))[0]
+        try:
+            while True:
+                # Backpressure: stop reading this sensor while the writer is behind
+                await self._writable.wait()
+                try:
+                    line = await reader.readuntil(b'\n')
+                except asyncio.IncompleteReadError as e:
+                    if e.partial.strip():
+                        self.handle_message(e.partial, peer)
+                    break
+                except asyncio.LimitOverrunError:
+                    # Oversized line: drop it and resynchronise on the next newline
+                    await reader.read(MAX_SYSLOG_LINE_BYTES)
+                    self.stats['failed'] += 1
+                    continue
+                self.handle_message(line, peer)
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self):
+        """Bind the listeners; udp_port / tcp_port hold the bound ports afterwards."""
+        loop = asyncio.get_running_loop()
+        self._writable = asyncio.Event()
+        self._writable.set()
+
+        if self.udp_port is not None:
+            self._udp_transport, _protocol = await loop.create_datagram_endpoint(
+                lambda: _UdpProtocol(self), local_addr=(self.host, self.udp_port)
+            )
+            self.udp_port = self._udp_transport.get_extra_info('sockname')[1]
+        if self.tcp_port is not None:
+            self._tcp_server = await asyncio.start_server(
+                self._handle_tcp, self.host, self.tcp_port, limit=MAX_SYSLOG_LINE_BYTES
+            )
+            self.tcp_port = self._tcp_server.sockets[0].getsockname()[1]
+        self._flush_task = asyncio.create_task(self._deadline_loop())
+
+    async def close(self):
+        """Stop listening, store everything received so far and release the writer thread."""
+        if self._udp_transport is not None:
+            self._udp_transport.close()
+        if self._tcp_server is not None:
+            self._tcp_server.close()
+            await self._tcp_server.wait_closed()
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+        await self.flush()
+        if self.pipeline is not None:
+            self.stats['inserted'] += await asyncio.get_running_loop().run_in_executor(self._writer, self.pipeline.wait_persisted)
+        # The writer thread's own connection (`connection` resolves per thread)
+        await asyncio.get_running_loop().run_in_executor(self._writer, lambda: connection.close())
+        self._writer.shutdown(wait=True)
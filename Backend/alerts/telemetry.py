@@ -0,0 +1,253 @@
+"""
+Ingestion lag and throughput telemetry.
+
+The ingesting process keeps plain counters per sensor (log root) and per log
+file - updated once per file per cycle and once per stored batch - and
+publishes them every INGEST_TELEMETRY_PUBLISH_SECONDS as one
+IngestionTelemetrySnapshot row per (sensor, node):
+
+- bytes and estimated lines behind (file size minus offset; lines estimated
+  from the average line length read so far)
+- lines/s parsed and rows/s inserted since the previous snapshot
+- dedup-rejected, shed and failed counts
+
+plus one KIND_NODE row with the node's batch insert latency histogram (the
+persist stage is shared by all sensors of a process).
+
+Nodes sharing files through leases each publish their own rows for the same
+sensor; the API (ingestion_telemetry) and dashboard_summary add them up.
+They only read those rows and LogIngestionState.file_size / offset, so the
+web process never talks to the ingester directly. Rows not updated for
+TELEMETRY_RETENTION (dead processes) are deleted by the next publish.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+from bisect import bisect_left
+from collections import namedtuple
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import IngestionTelemetrySnapshot
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (ms) of the batch insert latency buckets; one more bucket collects the rest
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+TELEMETRY_RETENTION = timedelta(days=1)
+
+# Snapshot key of a log root: IngestionTelemetrySnapshot kind and sensor
+TelemetrySensor = namedtuple('TelemetrySensor', 'kind name')
+
+
+def telemetry_sensor(log_dir, sensor=''):
+    # Key of a log root (one ingesting worker per root): a Sensor by name, else SNORT_LOG_DIR by its resolved path
+    if sensor:
+        return TelemetrySensor(IngestionTelemetrySnapshot.KIND_SENSOR, sensor)
+    return TelemetrySensor(IngestionTelemetrySnapshot.KIND_LOG_DIR, str(Path(log_dir).resolve()))
+
+
+class LatencyHistogram:
+    """Counts of observations per LATENCY_BUCKETS_MS bucket (value <= bound), plus count and sum."""
+
+    def __init__(self, bounds_ms=LATENCY_BUCKETS_MS):
+        self.bounds_ms = tuple(bounds_ms)
+        self.counts = [0] * (len(self.bounds_ms) + 1)
+        self.count = 0
+        self.sum_ms = 0.0
+
+    def observe(self, seconds):
+        milliseconds = seconds * 1000.0
+        self.counts[bisect_left(self.bounds_ms, milliseconds)] += 1
+        self.count += 1
+        self.sum_ms += milliseconds
+
+    def as_dict(self):
+        return {
+            'le_ms': [*self.bounds_ms, None],  # None: +Inf
+            'counts': list(self.counts),
+            'count': self.count,
+            'avg_ms': round(self.sum_ms / self.count, 2) if self.count else None,
+        }
+
+
+class _FileStats:
+    __slots__ = ('size', 'offset', 'lines', 'bytes_read', 'duplicates', 'shed', 'failed', 'reported_lines')
+
+    def __init__(self):
+        self.size = 0
+        self.offset = 0
+        self.lines = 0
+        self.bytes_read = 0
+        self.duplicates = 0
+        self.shed = 0
+        self.failed = 0
+        self.reported_lines = 0  # `lines` at the previous snapshot
+
+
+class _SensorStats:
+    __slots__ = ('files', 'rows', 'reported_rows')
+
+    def __init__(self):
+        self.files = {}  # relative file path -> _FileStats
+        self.rows = 0
+        self.reported_rows = 0
+
+
+class IngestionTelemetry:
+    """
+    Process-wide ingestion counters (thread-safe; the persist stage reports
+    batch latency from worker threads).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sensors = {}
+        self.batch_latency = LatencyHistogram()
+        self._reported_at = time.monotonic()
+        self._published_at = None
+
+    def _sensor(self, sensor):
+        stats = self._sensors.get(sensor)
+        if stats is None:
+            stats = self._sensors[sensor] = _SensorStats()
+        return stats
+
+    def record_file(self, sensor, file_path, size, offset, lines=0, bytes_read=0, duplicates=0, shed=0, failed=0):
+        """
+        Progress of one file in one cycle.
+
+        Args:
+            sensor: telemetry_sensor() of the log root
+            file_path: Path relative to the log root (as in LogIngestionState)
+            size: Readable size (uncompressed for .gz archives)
+            offset: Offset reached
+            lines: Lines / records parsed; bytes_read: offset advance
+            duplicates / shed / failed: Events dropped by dedup / load shedding / validation
+        """
+        with self._lock:
+            stats = self._sensor(sensor).files.get(file_path)
+            if stats is None:
+                stats = self._sensor(sensor).files[file_path] = _FileStats()
+            stats.size = size
+            stats.offset = offset
+            stats.lines += lines
+            stats.bytes_read += bytes_read
+            stats.duplicates += duplicates
+            stats.shed += shed
+            stats.failed += failed
+
+    def record_rows(self, sensor, rows):
+        # Rows stored by one ingest cycle of the sensor
+        if rows:
+            with self._lock:
+                self._sensor(sensor).rows += rows
+
+    def record_insert(self, seconds):
+        # Latency of one batch insert (persist step)
+        with self._lock:
+            self.batch_latency.observe(seconds)
+
+    def snapshot(self):
+        """{TelemetrySensor: gauges, rates since the previous snapshot() and counters} (values JSON-able)."""
+        with self._lock:
+            now = time.monotonic()
+            elapsed = max(now - self._reported_at, 1e-6)
+            self._reported_at = now
+            result = {}
+            for sensor, sensor_stats in self._sensors.items():
+                files = {}
+                total_lines = sum(stats.lines for stats in sensor_stats.files.values())
+                total_bytes = sum(stats.bytes_read for stats in sensor_stats.files.values())
+                sensor_bytes_per_line = total_bytes / total_lines if total_lines else None
+                for file_path, stats in sensor_stats.files.items():
+                    bytes_behind = max(0, stats.size - stats.offset)
+                    bytes_per_line = stats.bytes_read / stats.lines if stats.lines else sensor_bytes_per_line
+                    lines_per_second = (stats.lines - stats.reported_lines) / elapsed
+                    stats.reported_lines = stats.lines
+                    if not bytes_behind and not lines_per_second:
+                        continue  # Caught-up, idle file
+                    files[file_path] = {
+                        'size': stats.size,
+                        'offset': stats.offset,
+                        'bytes_behind': bytes_behind,
+                        'lines_behind': round(bytes_behind / bytes_per_line) if bytes_per_line else None,
+                        'lines_per_second': round(lines_per_second, 1),
+                        'lines': stats.lines,
+                        'duplicates': stats.duplicates,
+                        'shed': stats.shed,
+                        'failed': stats.failed,
+                    }
+                rows_per_second = (sensor_stats.rows - sensor_stats.reported_rows) / elapsed
+                sensor_stats.reported_rows = sensor_stats.rows
+                result[sensor] = {
+                    'bytes_behind': sum(entry['bytes_behind'] for entry in files.values()),
+                    'lines_behind': sum(entry['lines_behind'] or 0 for entry in files.values()),
+                    'lines_per_second': round(sum(entry['lines_per_second'] for entry in files.values()), 1),
+                    'rows_per_second': round(rows_per_second, 1),
+                    'lines': total_lines,
+                    'rows': sensor_stats.rows,
+                    'duplicates': sum(stats.duplicates for stats in sensor_stats.files.values()),
+                    'shed': sum(stats.shed for stats in sensor_stats.files.values()),
+                    'failed': sum(stats.failed for stats in sensor_stats.files.values()),
+                    'files': files,
+                }
+            return result
+
+    def node_snapshot(self):
+        """Process-wide data: the batch insert latency histogram."""
+        with self._lock:
+            return {'batch_latency': self.batch_latency.as_dict()}
+
+    def publish(self, force=False):
+        """Write this node's snapshot rows, at most every INGEST_TELEMETRY_PUBLISH_SECONDS (0 = never)."""
+        interval = getattr(settings, 'INGEST_TELEMETRY_PUBLISH_SECONDS', 10)
+        if interval <= 0:
+            return False
+        now = time.monotonic()
+        if not force and self._published_at is not None and now - self._published_at < interval:
+            return False
+        self._published_at = now
+
+        hostname = socket.gethostname()
+        pid = os.getpid()
+        node = f'{hostname}:{pid}'
+        updated_at = timezone.now()
+        rows = [(key.kind, key.name, data) for key, data in self.snapshot().items()]
+        rows.append((IngestionTelemetrySnapshot.KIND_NODE, '', self.node_snapshot()))
+        for kind, sensor, data in rows:
+            IngestionTelemetrySnapshot.objects.update_or_create(
+                kind=kind,
+                sensor=sensor,
+                node=node,
+                defaults={'hostname': hostname, 'pid': pid, 'data': data, 'updated_at': updated_at},
+            )
+        IngestionTelemetrySnapshot.objects.filter(updated_at__lt=updated_at - TELEMETRY_RETENTION).delete()
+        return True
+
+
+_telemetry = IngestionTelemetry()
+
+
+def get_ingestion_telemetry():
+    return _telemetry
+
+
+def publish_ingestion_telemetry(force=False):
+    # Called by the polling loops once per cycle; never lets telemetry break ingestion
+    try:
+        return _telemetry.publish(force=force)
+    except Exception as e:
+        logger.warning(f'[Telemetry] Could not publish ingestion telemetry: {e}')
+        return False
+
+
+def reset_ingestion_telemetry():
+    global _telemetry
+    _telemetry = IngestionTelemetry()
@@ -3,14 +3,90 @@ Tests for live_alerts view — covers every filter parameter:
   threat_level, protocol, sid, src_ip, dest_ip, date_from, date_to, search, limit
 """
 
-from datetime import datetime, timezone as dt_timezone
-from django.test import TestCase
+import asyncio
+import gzip
+import hashlib
+import json
+import pickle
+import smtplib
+import socket
+import struct
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+from unittest import mock, skipUnless
+
+from django.core import mail
+from django.db import DatabaseError, connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
 from django.urls import reverse
 from rest_framework.test import APIClient
 from rest_framework_simplejwt.tokens import RefreshToken
 
 from authentication.models import User, Organization
-from alerts.models import Alert
+from subscription.models import SubscriptionPlan
+from alerts.alert_json import SnortJsonParser, ingest_snort_json_logs
+from alerts.checks import event_hash_dual_write_check
+from alerts.dedup import RecentEventCache, reset_event_cache
+from alerts.flows import FlowAggregator, ingest_snort_packet_logs
+from alerts.leases import FileLeaseManager
+from alerts.models import (
+    Alert,
+    AlertOutbox,
+    IngestionNode,
+    IngestionTelemetrySnapshot,
+    LogFileLease,
+    LogIngestionState,
+    PacketFlow,
+    Sensor,
+    ShedAlertCount,
+    Signature,
+)
+from alerts.outbox import dispatch_outbox
+from alerts import pcap as pcap_module
+from alerts.pcap import CaptureFormatError, PacketCapture, decode_ipv4
+from alerts.pipeline import IngestionPipeline, PipelineStage
+from alerts.records import AlertRecord, build_alerts
+from alerts.services import (
+    AdaptiveBatchPolicy,
+    LogFileRegistry,
+    SnortTimestampCache,
+    _insert_new_alerts,
+    _iter_log_lines,
+    _parse_fast_record,
+    _parse_snort_timestamp,
+    _persist_alert_batch,
+    _process_alert_batch,
+    _write_checkpoints,
+    backfill_snort_logs_parallel,
+    ingest_snort_logs,
+    parse_fast_alert,
+    parse_snort_fast_line,
+    reset_file_registries,
+    validate_alert_data,
+)
+from alerts.sensors import SensorSupervisor, ingest_log_root
+from alerts.shedding import LoadShedder, write_shed_counts
+from alerts.signatures import SignatureCache, reset_signature_cache
+from alerts.syslog_receiver import SyslogAlertReceiver, extract_alert_payload
+from alerts.telemetry import (
+    LatencyHistogram,
+    get_ingestion_telemetry,
+    publish_ingestion_telemetry,
+    reset_ingestion_telemetry,
+    telemetry_sensor,
+)
+from alerts.unified2 import (
+    _synthetic_frame,
+    build_unified2_bytes,
+    ingest_snort_unified2_logs,
+    parse_unified2_records,
+    synthetic_unified2_events,
+    write_synthetic_unified2,
+)
+from alerts.watcher import InotifyLogWatcher, StatLogWatcher, inotify_available
 
 
 def make_alert(**kwargs):
@@ -36,6 +112,12 @@ def make_alert(**kwargs):
         import hashlib, json
         key = json.dumps({k: str(v) for k, v in defaults.items()}, sort_keys=True)
         defaults['event_hash'] = hashlib.sha256(key.encode()).hexdigest()
+    # Message, classification and priority belong to the signature (one revision per message)
+    signature_fields = {name: defaults.pop(name) for name in ('message', 'classification', 'priority')}
+    revisions = Signature.objects.filter(sid=defaults['sid'])
+    defaults['signature'] = revisions.filter(message=signature_fields['message']).first() or Signature.objects.create(
+        sid=defaults['sid'], rev=revisions.count() + 1, **signature_fields,
+    )
     return Alert.objects.create(**defaults)
 
 
@@ -448,3 +530,1738 @@ class LiveAlertsFilterTests(TestCase):
         self.assertEqual(r.status_code, 200)
         timestamps = [r['timestamp'] for r in r.data['results']]
         self.assertEqual(timestamps, sorted(timestamps, reverse=True))
+
+
+class LogWatcherTests(SimpleTestCase):
+    """Event-driven wake-up for poll_snort_logs (inotify + stat fallback)."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.log_dir = Path(self.tmp.name)
+        (self.log_dir / 'alert').write_text('')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _append_later(self, path, text, delay=0.05):
+        def writer():
+            time.sleep(delay)
+            with open(path, 'a') as handle:
+                handle.write(text)
+        thread = threading.Thread(target=writer)
+        thread.start()
+        return thread
+
+    def test_stat_watcher_reports_grown_file(self):
+        watcher = StatLogWatcher(self.log_dir, stat_interval=0.05)
+        thread = self._append_later(self.log_dir / 'alert', 'line\n')
+        changed = watcher.wait(timeout=2)
+        thread.join()
+        self.assertIn(self.log_dir / 'alert', changed)
+
+    def test_stat_watcher_times_out_when_idle(self):
+        watcher = StatLogWatcher(self.log_dir, stat_interval=0.05)
+        self.assertEqual(watcher.wait(timeout=0.2), set())
+
+    def test_ignores_non_log_files(self):
+        watcher = StatLogWatcher(self.log_dir, stat_interval=0.05)
+        thread = self._append_later(self.log_dir / 'notes.txt', 'x')
+        self.assertEqual(watcher.wait(timeout=0.3), set())
+        thread.join()
+
+    @skipUnless(inotify_available(), 'inotify not available')
+    def test_inotify_watcher_wakes_on_write_and_new_sensor_dir(self):
+        with InotifyLogWatcher(self.log_dir) as watcher:
+            thread = self._append_later(self.log_dir / 'alert', 'line\n')
+            started = time.monotonic()
+            changed = watcher.wait(timeout=5)
+            thread.join()
+            self.assertIn(self.log_dir / 'alert', changed)
+            self.assertLess(time.monotonic() - started, 1.0)
+
+            sensor_dir = self.log_dir / 'sensor2'
+            sensor_dir.mkdir()
+            watcher.wait(timeout=1)
+            thread = self._append_later(sensor_dir / 'alert.fast', 'line\n')
+            changed = watcher.wait(timeout=5)
+            thread.join()
+            self.assertIn(sensor_dir / 'alert.fast', changed)
+
+
+FAST_LINE_TEMPLATE = (
+    '04/21-02:48:{sec:02d}.661099  [**] [1:1000008:1] TCP SYN Flood Detected [**] '
+    '[Classification: Attempted Denial of Service] [Priority: 1] {{TCP}} '
+    '192.168.73.130:{port} -> 192.168.73.129:80\n'
+)
+
+
+def fast_line(sec=19, port=39894):
+    return FAST_LINE_TEMPLATE.format(sec=sec, port=port)
+
+
+class SnortIngestionTestMixin:
+    """Temporary SNORT_LOG_DIR with helpers to write FAST alert lines."""
+
+    def setUp(self):
+        super().setUp()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.log_dir = Path(self.tmp.name)
+        self.alert_file = self.log_dir / 'alert'
+        self.registry = LogFileRegistry(self.log_dir)
+        reset_event_cache()  # Digests cached by other tests would be skipped as duplicates
+        reset_signature_cache()  # Signature rows of other tests were rolled back
+
+    def tearDown(self):
+        self.tmp.cleanup()
+        super().tearDown()
+
+    def write_lines(self, *lines, path=None):
+        with open(path or self.alert_file, 'a') as handle:
+            handle.writelines(lines)
+
+    def ingest(self, **kwargs):
+        kwargs.setdefault('registry', self.registry)
+        return ingest_snort_logs(
+            self.log_dir, enable_ml=False, enable_email=False, enable_websocket=False, **kwargs
+        )
+
+
+class LogFileRegistryTests(SnortIngestionTestMixin, TestCase):
+    """Idle cycles skip unchanged files without touching the database."""
+
+    def test_offsets_written_back_and_idle_cycle_is_free(self):
+        self.write_lines(fast_line(1, 1001), fast_line(2, 1002))
+        result = self.ingest()
+        self.assertEqual(result['inserted'], 2)
+
+        state = LogIngestionState.objects.get(file_path='alert')
+        self.assertEqual(state.offset, self.alert_file.stat().st_size)
+
+        with self.assertNumQueries(0):
+            result = self.ingest()
+        self.assertEqual(result['processed_lines'], 0)
+
+    def test_appended_lines_are_picked_up(self):
+        self.write_lines(fast_line(1, 1001))
+        self.ingest()
+        self.write_lines(fast_line(3, 1003))
+        result = self.ingest()
+        self.assertEqual(result['processed_lines'], 1)
+        self.assertEqual(Alert.objects.count(), 2)
+
+    def test_new_file_in_sensor_subdirectory_is_discovered(self):
+        self.write_lines(fast_line(1, 1001))
+        self.ingest()
+        sensor_dir = self.log_dir / 'sensor2'
+        sensor_dir.mkdir()
+        self.write_lines(fast_line(5, 1005), path=sensor_dir / 'alert.fast')
+        result = self.ingest()
+        self.assertEqual(result['inserted'], 1)
+        self.assertTrue(LogIngestionState.objects.filter(file_path='sensor2/alert.fast').exists())
+
+    def test_fresh_registry_trusts_state_already_at_eof(self):
+        self.write_lines(fast_line(1, 1001))
+        self.ingest()
+        self.registry = LogFileRegistry(self.log_dir)
+        # One bulk load of LogIngestionState + the startup heartbeat UPDATE
+        with self.assertNumQueries(2):
+            result = self.ingest()
+        self.assertEqual(result['processed_lines'], 0)
+
+
+class BinaryLineReaderTests(SnortIngestionTestMixin, TestCase):
+    """Chunked binary reader keeps byte-accurate, tell()-compatible offsets."""
+
+    def test_offsets_across_chunk_boundaries_with_multibyte_text(self):
+        content = 'first ünïcödé line\nsecond\n\nthird — dash\npartial'.encode('utf-8')
+        self.alert_file.write_bytes(content)
+        with open(self.alert_file, 'rb') as handle:
+            lines = [(start, end, bytes(line)) for start, end, line in _iter_log_lines(handle, 0, chunk_size=4)]
+
+        expected, start = [], 0
+        for raw in content.split(b'\n')[:-1]:
+            end = start + len(raw) + 1
+            expected.append((start, end, raw + b'\n'))
+            start = end
+        self.assertEqual(lines, expected)
+
+    def test_partial_trailing_line_is_carried_to_next_cycle(self):
+        line = fast_line(7, 1007)
+        self.write_lines(line[:40])
+        result = self.ingest()
+        self.assertEqual(result['processed_lines'], 0)
+        self.assertEqual(LogIngestionState.objects.get(file_path='alert').offset, 0)
+
+        self.write_lines(line[40:])
+        result = self.ingest()
+        self.assertEqual(result['inserted'], 1)
+        self.assertEqual(LogIngestionState.objects.get(file_path='alert').offset, len(line.encode()))
+
+    @mock.patch('alerts.services.PARTIAL_LINE_QUIET_SECONDS', 0)
+    def test_unterminated_last_line_is_read_once_the_file_is_quiet(self):
+        line = fast_line(7, 1007).rstrip('\n')
+        self.write_lines(fast_line(6, 1006), line)
+        result = self.ingest()
+        self.assertEqual((result['processed_lines'], result['inserted']), (1, 1))
+
+        # Unchanged since the last cycle: nobody is going to finish the line
+        result = self.ingest()
+        self.assertEqual((result['processed_lines'], result['inserted']), (1, 1))
+        self.assertEqual(LogIngestionState.objects.get(file_path='alert').offset, self.alert_file.stat().st_size)
+        self.assertTrue(self.registry.is_unchanged('alert', self.alert_file.stat()))
+
+    def test_event_hash_matches_text_reader_format(self):
+        first, second = fast_line(1, 1001), fast_line(2, 1002)
+        self.write_lines(first, second)
+        self.ingest()
+        expected = hashlib.blake2b(f'alert:{len(first)}:{second.strip()}'.encode('utf-8'), digest_size=16).digest()
+        self.assertTrue(Alert.objects.filter(event_digest=expected).exists())
+
+
+class SnortTimestampCacheTests(SimpleTestCase):
+    """Cached timestamp parsing must match the strptime reference exactly."""
+
+    def test_matches_reference_parser(self):
+        cache = SnortTimestampCache()
+        samples = [
+            '04/21-02:48:19.661099', '04/21-02:48:19.661098', '04/21-02:48:19',
+            '04/21-02:48:19.5', '04/21-02:48:19.05', '04/21-02:48:19.000000',
+            '04/21-02:48:19.1234567', '02/30-10:00:00.1', '13/01-00:00:00',
+            '12/31-23:59:59.999999', '01/01-00:00:00.000001',
+        ]
+        for text in samples:
+            with self.subTest(timestamp=text):
+                self.assertEqual(cache.parse(text), _parse_snort_timestamp(text))
+
+    def test_parse_snort_fast_line_modes_agree(self):
+        cache = SnortTimestampCache()
+        for sec in range(3):
+            line = fast_line(sec, 2000 + sec)
+            self.assertEqual(parse_snort_fast_line(line, timestamp_cache=cache), parse_snort_fast_line(line))
+
+
+class AlertRecordTests(SnortIngestionTestMixin, TestCase):
+    """The fused FAST parser yields validated AlertRecords; Alerts are built from them at insert time."""
+
+    def test_fused_parse_needs_no_validation_pass(self):
+        line = fast_line(1, 1001)
+        record = parse_fast_alert(line)
+        is_valid, error_msg, cleaned_data = validate_alert_data(record.cleaned_data())
+        self.assertTrue(is_valid, error_msg)
+        self.assertEqual(cleaned_data, record.cleaned_data())
+        self.assertEqual((record.src_ip, record.src_port, record.sid, record.priority), ('192.168.73.130', 1001, '1000008', 1))
+
+    def test_fused_parse_rejects_and_clamps_like_validation(self):
+        self.assertIsNone(parse_fast_alert(fast_line(1, 1001).replace('192.168.73.130', '192.168.73.300')))
+        record = parse_fast_alert(fast_line(1, 70000).replace('[Priority: 1]', '[Priority: 9]'))
+        self.assertIsNone(record.src_port)  # Out of range port dropped, IP kept
+        self.assertEqual((record.priority, record.threat_level), (3, Alert.THREAT_SAFE))
+
+    def test_record_survives_pickling_and_builds_alert(self):
+        record, _error = _parse_fast_record('alert', 0, fast_line(1, 1001).encode(), SnortTimestampCache())
+        self.assertEqual(pickle.loads(pickle.dumps(record)), record)  # Backfill workers send records back
+
+        alert = record.to_alert('edge-1')
+        self.assertIsNone(alert.pk)
+        self.assertEqual(alert.sensor, 'edge-1')
+        self.assertEqual((alert.raw_line, alert.event_hash, alert.event_digest), (record.raw_line, record.event_hash, record.event_digest))
+        for field, value in record.cleaned_data().items():
+            self.assertEqual(getattr(alert, field), value)
+        self.assertFalse(alert.ml_processed)
+        self.assertEqual(alert.ml_classification, '')
+        alert.save()
+        self.assertEqual(Alert.objects.get().sensor, 'edge-1')
+
+
+class SignatureTests(SnortIngestionTestMixin, TestCase):
+    """Alerts reference one Signature row per rule revision, resolved through the ingestion cache."""
+
+    def test_ingestion_stores_one_signature_per_revision(self):
+        self.write_lines(*(fast_line(i, 3000 + i) for i in range(5)), fast_line(5, 3005).replace('[1:1000008:1]', '[1:1000008:2]'))
+        self.assertEqual(self.ingest()['inserted'], 6)
+
+        self.assertEqual(
+            list(Signature.objects.values_list('gid', 'sid', 'rev', 'message', 'priority')),
+            [(1, '1000008', 1, 'TCP SYN Flood Detected', 1), (1, '1000008', 2, 'TCP SYN Flood Detected', 1)],
+        )
+        alert = Alert.objects.select_related('signature').filter(signature__rev=1).first()
+        self.assertEqual((alert.sid, alert.message, alert.classification), ('1000008', 'TCP SYN Flood Detected', 'Attempted Denial of Service'))
+
+        # Known signatures cost no query
+        records = [_parse_fast_record('alert', i, fast_line(i, 4000 + i).encode(), None)[0] for i in range(3)]
+        with self.assertNumQueries(0):
+            alerts = build_alerts(records, 'edge-1')
+        self.assertEqual({alert.signature_id for alert in alerts}, {Signature.objects.get(rev=1).pk})
+        with self.assertNumQueries(0):
+            self.assertEqual(alerts[0].message, 'TCP SYN Flood Detected')
+
+    def test_placeholder_text_is_filled_in(self):
+        record = parse_fast_alert(fast_line(1, 1001).strip())
+        record.message, record.classification = 'Snort Alert [1:1000008:1]', ''
+        cache = SignatureCache()
+        placeholder = cache.resolve([record])[0]
+
+        record.message, record.classification = 'TCP SYN Flood Detected', 'attempted-dos'
+        self.assertIs(cache.resolve([record])[0], placeholder)
+        signature = Signature.objects.get()
+        self.assertEqual((signature.message, signature.classification), ('TCP SYN Flood Detected', 'attempted-dos'))
+
+        # A later placeholder does not overwrite the real text
+        record.message = 'Snort Alert [1:1000008:1]'
+        SignatureCache().resolve([record])
+        self.assertEqual(Signature.objects.get().message, 'TCP SYN Flood Detected')
+
+    def test_apis_group_revisions_of_a_sid(self):
+        user = User.objects.create_user(
+            email='signatures@threateye.io', password='testpass123', role=User.PLATFORM_OWNER, is_verified=True,
+        )
+        client = APIClient()
+        client.force_authenticate(user)
+        now = datetime.now(dt_timezone.utc)
+        # Rule 1000015 revised once (rev 1 -> rev 2); counts of both revisions belong to the SID
+        for i in range(2):
+            make_alert(timestamp=now, sid='1000015', message='Old C2 rule text', classification='misc-activity', src_port=i)
+        make_alert(timestamp=now, sid='1000015', message='Beacon to known C2', classification='trojan-activity')
+        for i in range(2):
+            make_alert(timestamp=now, sid='1000020', message='Port scan detected', classification='network-scan', src_port=i)
+
+        top = client.get(reverse('top_attacks')).data['results']
+        self.assertEqual([(row['sid'], row['count']) for row in top], [('1000015', 3), ('1000020', 2)])
+        self.assertEqual(top[0]['attack_name'], 'Possible Malware C2 Communication')  # SID_ATTACK_MAP wins
+        self.assertEqual(top[1]['attack_name'], 'Port scan detected')
+
+        options = client.get(reverse('filter_options')).data
+        self.assertEqual(
+            options['sids'],
+            [{'value': '1000015', 'label': '1000015 — Beacon to known C2'}, {'value': '1000020', 'label': '1000020 — Port scan detected'}],
+        )
+        self.assertEqual(client.get(reverse('dashboard_summary')).data['topAttackType'], 'trojan-activity')
+
+        results = client.get(reverse('live_alerts'), {'search': 'port scan'}).data['results']
+        self.assertEqual([(row['sid'], row['classification']) for row in results], [('1000020', 'network-scan')] * 2)
+
+
+class ParallelBackfillTests(SnortIngestionTestMixin, TestCase):
+    """Process-pool backfill must match the single-process ingester exactly."""
+
+    def test_matches_sequential_ingestion(self):
+        lines = [fast_line(i % 60, 1000 + i) for i in range(300)]
+        lines.insert(50, 'garbage line — not an alert\n')
+        self.write_lines(*lines)
+        self.write_lines(fast_line(59, 9999)[:30])  # unfinished last line
+
+        result = backfill_snort_logs_parallel(
+            self.log_dir, workers=2, enable_ml=False, range_bytes=777, registry=self.registry
+        )
+        parallel_hashes = [bytes(d) for d in Alert.objects.order_by('id').values_list('event_digest', flat=True)]
+        parallel_offset = LogIngestionState.objects.get(file_path='alert').offset
+
+        Alert.objects.all().delete()
+        LogIngestionState.objects.all().delete()
+        reset_event_cache()
+        sequential = self.ingest(registry=LogFileRegistry(self.log_dir))
+        sequential_hashes = [bytes(d) for d in Alert.objects.order_by('id').values_list('event_digest', flat=True)]
+
+        self.assertEqual(result['inserted'], 300)
+        self.assertEqual(result['processed_lines'], sequential['processed_lines'])
+        self.assertEqual(parallel_hashes, sequential_hashes)
+        self.assertEqual(parallel_offset, LogIngestionState.objects.get(file_path='alert').offset)
+        self.assertEqual(parallel_offset, sum(len(line.encode()) for line in lines))
+
+
+class EventDigestTests(SnortIngestionTestMixin, TestCase):
+    """16-byte BLAKE2b event_digest is the dedup key; the legacy SHA-256 event_hash is optional."""
+
+    @override_settings(ALERT_EVENT_HASH_DUAL_WRITE=True)
+    def test_dual_write_keeps_legacy_sha256(self):
+        line = fast_line(1, 1001)
+        self.write_lines(line)
+        self.ingest()
+        alert = Alert.objects.get()
+        source = f'alert:0:{line.strip()}'.encode('utf-8')
+        self.assertEqual(alert.event_hash, hashlib.sha256(source).hexdigest())
+        self.assertEqual(bytes(alert.event_digest), hashlib.blake2b(source, digest_size=16).digest())
+
+    @override_settings(ALERT_EVENT_HASH_DUAL_WRITE=False)
+    def test_digest_only_mode_writes_no_event_hash(self):
+        self.write_lines(fast_line(1, 1001))
+        with mock.patch('alerts.services.hashlib.sha256') as sha256:
+            self.ingest()
+        sha256.assert_not_called()
+        alert = Alert.objects.get()
+        self.assertEqual(alert.event_hash, '')
+        self.assertIsNotNone(alert.event_digest)
+
+    @override_settings(ALERT_EVENT_HASH_DUAL_WRITE=True)
+    def test_pre_upgrade_rows_are_matched_by_their_legacy_key(self):
+        self.write_lines(fast_line(1, 1001), fast_line(2, 1002))
+        self.ingest()
+        # What migration 0015 leaves on a pre-upgrade row: the SHA-256 prefix as its digest
+        for alert in Alert.objects.all():
+            alert.event_digest = bytes.fromhex(alert.event_hash)[:16]
+            alert.save(update_fields=['event_digest'])
+
+        reset_event_cache()
+        LogIngestionState.objects.update(offset=0)
+        result = self.ingest(registry=LogFileRegistry(self.log_dir))
+        self.assertEqual((result['processed_lines'], result['inserted']), (2, 0))
+        self.assertEqual(Alert.objects.count(), 2)
+
+    def test_dual_write_raises_a_system_check_warning(self):
+        with override_settings(ALERT_EVENT_HASH_DUAL_WRITE=True):
+            self.assertEqual([m.id for m in event_hash_dual_write_check(None)], ['alerts.W001'])
+        with override_settings(ALERT_EVENT_HASH_DUAL_WRITE=False):
+            self.assertEqual(event_hash_dual_write_check(None), [])
+
+    def test_duplicates_are_found_by_digest_alone(self):
+        self.write_lines(fast_line(1, 1001))
+        self.ingest()
+        # A legacy event_hash no longer identifies a row; only the digest is unique
+        Alert.objects.update(event_hash='')
+        record, _error = _parse_fast_record('alert', 0, fast_line(1, 1001).encode(), None)
+        self.assertEqual(_insert_new_alerts([record.to_alert()]), [])
+        self.assertEqual(Alert.objects.count(), 1)
+
+    def test_reingesting_after_offset_reset_stores_no_duplicates(self):
+        self.write_lines(fast_line(1, 1001), fast_line(2, 1002))
+        self.assertEqual(self.ingest()['inserted'], 2)
+        LogIngestionState.objects.update(offset=0)
+        result = self.ingest(registry=LogFileRegistry(self.log_dir))
+        self.assertEqual(result['processed_lines'], 2)
+        self.assertEqual(result['inserted'], 0)
+        self.assertEqual(Alert.objects.count(), 2)
+
+
+class InsertNewAlertsTests(SnortIngestionTestMixin, TestCase):
+    """_insert_new_alerts returns exactly the new rows, with IDs, without a re-fetch."""
+
+    def build(self, *ports):
+        alerts = []
+        for port in ports:
+            line = fast_line(1, port)
+            record, _error = _parse_fast_record('alert', port, line.encode(), None)
+            alerts.append(record.to_alert())
+        return alerts
+
+    @override_settings(ALERT_EVENT_HASH_DUAL_WRITE=False)  # The transition adds one legacy key lookup
+    def test_all_new_rows_inserted_in_one_query(self):
+        alerts = self.build(1001, 1002, 1003)
+        with self.assertNumQueries(3):  # SAVEPOINT, INSERT ... RETURNING, RELEASE
+            inserted = _insert_new_alerts(alerts)
+        self.assertEqual(len(inserted), 3)
+        self.assertEqual(
+            sorted(a.pk for a in inserted),
+            sorted(Alert.objects.values_list('id', flat=True)),
+        )
+
+    def test_existing_rows_are_not_reported_as_new(self):
+        _insert_new_alerts(self.build(1001, 1002))
+        inserted = _insert_new_alerts(self.build(1001, 1002, 1003, 1003))
+        self.assertEqual([a.src_port for a in inserted], [1003])
+        self.assertEqual(inserted[0].pk, Alert.objects.get(src_port=1003).pk)
+        self.assertEqual(Alert.objects.count(), 3)
+
+
+class RecentEventCacheTests(SnortIngestionTestMixin, TestCase):
+    """Recently stored digests are skipped in memory; Bloom positives are confirmed in the DB."""
+
+    def reingest(self, cache):
+        LogIngestionState.objects.update(offset=0)
+        return self.ingest(registry=LogFileRegistry(self.log_dir), dedup_cache=cache)
+
+    def test_lru_evicts_least_recently_used(self):
+        cache = RecentEventCache(max_entries=2)
+        cache.add_many([b'a' * 16, b'b' * 16])
+        self.assertEqual(cache.check(b'a' * 16), cache.SEEN)
+        cache.add_many([b'c' * 16])
+        self.assertEqual(cache.check(b'b' * 16), cache.NEW)
+        self.assertEqual(cache.check(b'a' * 16), cache.SEEN)
+        self.assertEqual(cache.stats()['hits'], 2)
+
+    def test_reingest_skips_recent_events_without_insert(self):
+        cache = RecentEventCache(max_entries=100)
+        self.write_lines(*(fast_line(i, 1000 + i) for i in range(5)))
+        self.assertEqual(self.ingest(dedup_cache=cache)['inserted'], 5)
+
+        LogIngestionState.objects.update(offset=0)
+        registry = LogFileRegistry(self.log_dir)
+        with self.assertNumQueries(2):  # Registry state load + offset flush, nothing on alerts
+            result = self.ingest(registry=registry, dedup_cache=cache)
+        self.assertEqual(result['skipped_duplicates'], 5)
+        self.assertEqual(result['inserted'], 0)
+        self.assertEqual(cache.stats()['hits'], 5)
+
+    def test_bloom_positives_are_confirmed_with_one_query(self):
+        cache = RecentEventCache(max_entries=1, bloom_capacity=1000)
+        self.write_lines(*(fast_line(i, 1000 + i) for i in range(4)))
+        self.ingest(dedup_cache=cache)
+
+        result = self.reingest(cache)
+        stats = cache.stats()
+        self.assertEqual(result['inserted'], 0)
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['bloom_hits'], 3)
+        self.assertEqual(stats['bloom_false_positives'], 0)
+        self.assertEqual(Alert.objects.count(), 4)
+
+    def test_bloom_false_positive_is_counted_and_inserted(self):
+        cache = RecentEventCache(max_entries=10, bloom_capacity=1000)
+        line = fast_line(1, 1001)
+        record, _error = _parse_fast_record('alert', 0, line.encode(), None)
+        cache.bloom.add(record.event_digest)  # Pretend the filter collides on a never-stored event
+
+        self.write_lines(line)
+        self.assertEqual(self.ingest(dedup_cache=cache)['inserted'], 1)
+        self.assertEqual(cache.stats()['bloom_false_positives'], 1)
+
+    def test_seeded_from_newest_stored_digests(self):
+        self.write_lines(*(fast_line(i, 1000 + i) for i in range(3)))
+        self.ingest(dedup_cache=RecentEventCache(max_entries=10))
+
+        cache = RecentEventCache(max_entries=2)
+        self.assertEqual(cache.seed_from_database(limit=10), 3)
+        newest = bytes(Alert.objects.latest('id').event_digest)
+        oldest = bytes(Alert.objects.earliest('id').event_digest)
+        self.assertEqual(cache.check(newest), cache.SEEN)
+        self.assertEqual(cache.check(oldest), cache.NEW)
+
+
+class PipelineStageTests(SimpleTestCase):
+    """Bounded stage queues push back on the producer instead of growing."""
+
+    def test_full_queue_blocks_producer_until_worker_catches_up(self):
+        release = threading.Event()
+        handled = []
+
+        def handler(batch):
+            release.wait(5)
+            handled.append(batch)
+
+        stage = PipelineStage('slow', handler, workers=1, queue_size=1)
+        stage.start()
+        stage.put([1])  # Taken by the worker, which then blocks
+        stage.put([2])  # Fills the queue
+
+        producer = threading.Thread(target=stage.put, args=([3],))
+        producer.start()
+        producer.join(0.2)
+        self.assertTrue(producer.is_alive())  # Backpressure: third put waits
+
+        release.set()
+        producer.join(5)
+        stage.join()
+        stage.stop()
+        self.assertEqual(handled, [[1], [2], [3]])
+        stats = stage.stats()
+        self.assertEqual(stats['batches'], 3)
+        self.assertEqual(stats['max_depth'], 1)
+        self.assertGreater(stats['blocked_seconds'], 0.1)
+
+    def test_failing_batch_is_counted_and_stage_keeps_running(self):
+        downstream = []
+        stage = PipelineStage('flaky', lambda batch: 1 / batch[0] and batch, workers=2, queue_size=2)
+        stage.downstream = mock.Mock(put=downstream.append)
+        stage.start()
+        for batch in ([1], [0], [2]):
+            stage.put(batch)
+        stage.join()
+        stage.stop()
+        self.assertEqual(stage.stats()['errors'], 1)
+        self.assertEqual(sorted(downstream), [[1], [2]])
+
+
+class IngestionPipelineTests(SnortIngestionTestMixin, TransactionTestCase):
+    """Alerts are stored while a slow notify stage is still busy."""
+
+    @override_settings(ALERT_OUTBOX_ENABLED=False)
+    def test_slow_notifications_do_not_stall_ingestion(self):
+        release = threading.Event()
+        notified = []
+
+        def slow_notify(saved, **kwargs):
+            release.wait(5)
+            notified.extend(alert.pk for alert in saved)
+
+        self.write_lines(*(fast_line(i % 60, 1000 + i) for i in range(12)))
+        with mock.patch('alerts.services._notify_alert_batch', slow_notify), \
+                mock.patch('alerts.services.BATCH_SIZE', 5):
+            pipeline = IngestionPipeline(enable_ml=False, enable_email=False, enable_websocket=True, queue_size=2)
+            try:
+                result = self.ingest(pipeline=pipeline)
+                # Everything is stored and checkpointed before any notification finished
+                self.assertEqual(result['inserted'], 12)
+                self.assertEqual(Alert.objects.count(), 12)
+                self.assertEqual(LogIngestionState.objects.get(file_path='alert').offset, self.alert_file.stat().st_size)
+                self.assertEqual(notified, [])
+            finally:
+                release.set()
+                pipeline.close()
+
+        self.assertEqual(sorted(notified), sorted(Alert.objects.values_list('id', flat=True)))
+        stats = pipeline.stats()
+        self.assertEqual(list(stats), ['persist', 'notify'])
+        self.assertEqual(stats['persist']['batches'], 3)
+        self.assertEqual(stats['notify']['errors'], 0)
+
+    def test_persisted_digests_feed_the_readers_dedup_cache(self):
+        self.write_lines(*(fast_line(i, 1000 + i) for i in range(4)))
+        pipeline = IngestionPipeline(enable_ml=False, enable_email=False, enable_websocket=False)
+        try:
+            self.assertEqual(self.ingest(pipeline=pipeline)['inserted'], 4)
+
+            # Offsets reset: the re-read is answered by the cache the persist stage filled
+            LogIngestionState.objects.update(offset=0)
+            with mock.patch('alerts.services._insert_new_alerts') as insert:
+                result = self.ingest(pipeline=pipeline, registry=LogFileRegistry(self.log_dir))
+            insert.assert_not_called()
+        finally:
+            pipeline.close()
+        self.assertEqual((result['skipped_duplicates'], result['inserted']), (4, 0))
+
+    def test_failed_persist_keeps_offsets_at_last_committed_batch(self):
+        lines = [fast_line(i, 1000 + i) for i in range(7)]
+        self.write_lines(*lines)
+        calls = []
+        real_insert = _insert_new_alerts
+
+        def fail_second_batch(alerts):
+            calls.append(len(alerts))
+            if len(calls) == 2:
+                raise DatabaseError('deadlock')
+            return real_insert(alerts)
+
+        policy = AdaptiveBatchPolicy(initial_size=3, min_size=3, max_size=3, max_delay=60)
+        pipeline = IngestionPipeline(enable_ml=False, enable_email=False, enable_websocket=False, batch_policy=policy)
+        try:
+            with mock.patch('alerts.services._insert_new_alerts', fail_second_batch):
+                result = self.ingest(pipeline=pipeline)
+            self.assertEqual(result['inserted'], 3)
+            self.assertEqual(Alert.objects.count(), 3)
+            state = LogIngestionState.objects.get(file_path='alert')
+            self.assertEqual(state.offset, sum(len(line.encode()) for line in lines[:3]))
+
+            # Next cycle (same registry) reads the unstored lines again
+            result = self.ingest(pipeline=pipeline)
+            self.assertEqual((result['processed_lines'], result['inserted']), (4, 4))
+        finally:
+            pipeline.close()
+        self.assertEqual(Alert.objects.count(), 7)
+        self.assertEqual(LogIngestionState.objects.get(file_path='alert').offset, self.alert_file.stat().st_size)
+
+
+class AlertOutboxTests(SnortIngestionTestMixin, TestCase):
+    """Notifications are queued with the insert and delivered by the dispatcher."""
+
+    def build(self, *ports, threat_level=Alert.THREAT_HIGH):
+        alerts = []
+        for port in ports:
+            record, _error = _parse_fast_record('alert', port, fast_line(1, port).encode(), None)
+            alert = record.to_alert()
+            alert.threat_level = threat_level
+            alerts.append(alert)
+        return alerts
+
+    def test_entries_written_with_alerts(self):
+        alerts = self.build(1001, 1002) + self.build(1003, threat_level=Alert.THREAT_SAFE)
+        with mock.patch('alerts.services._notify_alert_batch') as notify:
+            inserted = _process_alert_batch(alerts, enable_ml=False)
+        notify.assert_not_called()  # Nothing is sent inline
+
+        self.assertEqual(inserted, 3)
+        websocket = AlertOutbox.objects.get(kind=AlertOutbox.KIND_WEBSOCKET)
+        self.assertEqual(websocket.payload['count'], 3)
+        self.assertEqual(websocket.payload['latest']['id'], alerts[-1].pk)
+        emails = AlertOutbox.objects.filter(kind=AlertOutbox.KIND_EMAIL)
+        self.assertEqual(sorted(e.alert_id for e in emails), sorted(a.pk for a in alerts[:2]))
+
+    def test_insert_rolls_back_when_outbox_write_fails(self):
+        with mock.patch('alerts.services.enqueue_alert_notifications', side_effect=RuntimeError('db down')):
+            with self.assertRaises(RuntimeError):
+                _persist_alert_batch(self.build(1001), enable_websocket=True)
+        self.assertFalse(Alert.objects.exists())
+
+    def test_dispatch_coalesces_websocket_entries(self):
+        for port in (1001, 1002, 1003):
+            _persist_alert_batch(self.build(port), enable_websocket=True)
+
+        with mock.patch('alerts.services.post_websocket_payload') as post:
+            result = dispatch_outbox()
+        post.assert_called_once()
+        payload = post.call_args.args[0]
+        self.assertEqual(payload['count'], 3)
+        self.assertEqual(payload['latest']['id'], Alert.objects.get(src_port=1003).pk)
+        self.assertEqual(result['dispatched'], 3)
+        self.assertFalse(AlertOutbox.objects.exists())
+
+    def test_concurrent_dispatchers_deliver_each_entry_once(self):
+        for port in (1001, 1002):
+            _persist_alert_batch(self.build(port), enable_websocket=True)
+        second = []
+
+        def post(payload):
+            # A second node's dispatcher runs while the first is still delivering
+            if not second:
+                second.append(dispatch_outbox())
+
+        with mock.patch('alerts.services.post_websocket_payload', side_effect=post) as posted:
+            first = dispatch_outbox()
+        posted.assert_called_once()
+        self.assertEqual(first['dispatched'], 2)
+        self.assertEqual(second[0]['dispatched'], 0)
+        self.assertFalse(AlertOutbox.objects.exists())
+
+    def test_entries_of_a_dead_dispatcher_are_due_after_the_claim(self):
+        _persist_alert_batch(self.build(1001), enable_websocket=True)
+        with mock.patch('alerts.services.post_websocket_payload', side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                dispatch_outbox()  # Dies between the claim and the delivery
+
+        with mock.patch('alerts.services.post_websocket_payload') as post:
+            self.assertEqual(dispatch_outbox()['dispatched'], 0)  # Still claimed
+            AlertOutbox.objects.update(next_attempt_at=datetime.now(dt_timezone.utc))
+            self.assertEqual(dispatch_outbox()['dispatched'], 1)
+        post.assert_called_once()
+
+    def test_email_entries_of_deleted_alerts_are_dropped(self):
+        _persist_alert_batch(self.build(1001, 1002), enable_email=True)
+        kept = Alert.objects.get(src_port=1002)
+        with connection.cursor() as cursor:
+            # Raw delete like clear_alerts' TRUNCATE: no cascade, and the FK has no DB constraint
+            cursor.execute('DELETE FROM alerts_alert WHERE src_port = 1001')
+
+        with mock.patch('alerts.services.send_alert_notification') as send:
+            result = dispatch_outbox()
+        send.assert_called_once_with(kept, raise_errors=True)
+        self.assertEqual((result['dispatched'], result['retried'], result['failed']), (1, 0, 0))
+        self.assertFalse(AlertOutbox.objects.exists())
+
+    @override_settings(ALERT_OUTBOX_MAX_ATTEMPTS=2)
+    def test_failed_delivery_is_retried_with_backoff(self):
+        _persist_alert_batch(self.build(1001), enable_websocket=True)
+
+        with mock.patch('alerts.services.post_websocket_payload', side_effect=ConnectionError('daphne down')):
+            self.assertEqual(dispatch_outbox()['retried'], 1)
+            self.assertEqual(dispatch_outbox()['retried'], 0)  # Not due yet
+            entry = AlertOutbox.objects.get()
+            self.assertEqual(entry.attempts, 1)
+            self.assertIn('daphne down', entry.last_error)
+
+            AlertOutbox.objects.update(next_attempt_at=entry.created_at)
+            self.assertEqual(dispatch_outbox()['failed'], 1)
+        self.assertTrue(AlertOutbox.objects.get().failed)
+
+    @override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+    @mock.patch.dict('alerts.services._last_email_time_high', clear=True)
+    def test_smtp_failure_keeps_email_entry_for_retry(self):
+        SubscriptionPlan.objects.create(display_name='Basic plan', max_users=5, price=5)
+        org = Organization.objects.create(name='Acme', subscription_tier=Organization.TIER_BASIC)
+        User.objects.create_user(email='soc@acme.test', password='pass12345', organization=org, is_verified=True)
+        _persist_alert_batch(self.build(1001), enable_email=True)
+
+        with mock.patch('django.core.mail.EmailMultiAlternatives.send', side_effect=smtplib.SMTPServerDisconnected('gone')):
+            result = dispatch_outbox()
+        self.assertEqual((result['dispatched'], result['retried']), (0, 1))
+        entry = AlertOutbox.objects.get(kind=AlertOutbox.KIND_EMAIL)
+        self.assertEqual(entry.attempts, 1)
+        self.assertIn('gone', entry.last_error)
+
+        # The failed attempt did not use up the rate-limit slot: the retry is sent
+        AlertOutbox.objects.update(next_attempt_at=entry.created_at)
+        self.assertEqual(dispatch_outbox()['dispatched'], 1)
+        self.assertEqual([message.to for message in mail.outbox], [['soc@acme.test']])
+        self.assertFalse(AlertOutbox.objects.exists())
+
+
+class AdaptiveBatchPolicyTests(SnortIngestionTestMixin, TestCase):
+    """Batches flush on size or deadline; the size target follows insert latency."""
+
+    def test_fast_full_batches_grow_slow_inserts_shrink(self):
+        policy = AdaptiveBatchPolicy(initial_size=100, min_size=10, max_size=120, target_seconds=0.2)
+        policy.record_insert(100, 0.01)
+        self.assertEqual(policy.size, 120)  # x1.25 capped at max_size
+        policy.record_insert(50, 0.01)  # Partial batch says nothing about capacity
+        self.assertEqual(policy.size, 120)
+        policy.record_insert(120, 0.8)  # 4x over target: shrink, at most by half
+        self.assertEqual(policy.size, 60)
+        for _ in range(10):
+            policy.record_insert(60, 10.0)
+        self.assertEqual(policy.size, 10)
+
+    def test_quiet_trickle_flushes_once_at_end(self):
+        self.write_lines(*(fast_line(i, 1000 + i) for i in range(3)))
+        policy = AdaptiveBatchPolicy(initial_size=100)
+        self.ingest(batch_policy=policy)
+        stats = policy.take_cycle_stats()
+        self.assertEqual((stats['batches'], stats['end'], stats['avg_batch']), (1, 1, 3))
+        self.assertEqual(policy.take_cycle_stats()['batches'], 0)  # Counters are per cycle
+
+    def test_deadline_flushes_before_size_target(self):
+        self.write_lines(*(fast_line(i, 1000 + i) for i in range(3)))
+        policy = AdaptiveBatchPolicy(initial_size=100, max_delay=0)
+        result = self.ingest(batch_policy=policy)
+        stats = policy.take_cycle_stats()
+        self.assertEqual(result['inserted'], 3)
+        self.assertEqual((stats['batches'], stats['deadline'], stats['size']), (3, 3, 0))
+
+    def test_size_target_flushes_full_batches(self):
+        self.write_lines(*(fast_line(i, 1000 + i) for i in range(7)))
+        policy = AdaptiveBatchPolicy(initial_size=3, min_size=3, max_size=3, max_delay=60)
+        self.ingest(batch_policy=policy)
+        stats = policy.take_cycle_stats()
+        self.assertEqual((stats['size'], stats['end'], stats['rows']), (2, 1, 7))
+
+
+class BatchCheckpointTests(SnortIngestionTestMixin, TestCase):
+    """LogIngestionState advances in the same transaction as each stored batch."""
+
+    def test_restart_after_crash_resumes_at_last_committed_batch(self):
+        lines = [fast_line(i, 1000 + i) for i in range(7)]
+        self.write_lines(*lines)
+
+        class Crash(BaseException):
+            pass
+
+        calls = []
+        real_insert = _insert_new_alerts
+
+        def crash_on_third_batch(alerts):
+            calls.append(len(alerts))
+            if len(calls) == 3:
+                raise Crash()
+            return real_insert(alerts)
+
+        policy = AdaptiveBatchPolicy(initial_size=3, min_size=3, max_size=3, max_delay=60)
+        with mock.patch('alerts.services._insert_new_alerts', crash_on_third_batch):
+            with self.assertRaises(Crash):
+                self.ingest(batch_policy=policy)
+
+        self.assertEqual(Alert.objects.count(), 6)
+        state = LogIngestionState.objects.get(file_path='alert')
+        self.assertEqual(state.offset, sum(len(line.encode()) for line in lines[:6]))
+
+        # Fresh process: only the uncommitted tail is read again
+        reset_event_cache()
+        result = self.ingest(registry=LogFileRegistry(self.log_dir))
+        self.assertEqual((result['processed_lines'], result['inserted']), (1, 1))
+        self.assertEqual(Alert.objects.count(), 7)
+
+    def test_failed_insert_leaves_lines_for_the_next_cycle(self):
+        self.write_lines(*(fast_line(i, 1000 + i) for i in range(5)))
+        with mock.patch('alerts.services._insert_new_alerts', side_effect=DatabaseError('lock wait timeout')):
+            result = self.ingest()
+        self.assertEqual(result['inserted'], 0)
+        self.assertFalse(Alert.objects.exists())
+        self.assertEqual(LogIngestionState.objects.get(file_path='alert').offset, 0)
+
+        # Same process: the cached offset went back to the committed one
+        result = self.ingest()
+        self.assertEqual((result['processed_lines'], result['inserted']), (5, 5))
+        self.assertEqual(LogIngestionState.objects.get(file_path='alert').offset, self.alert_file.stat().st_size)
+
+    def test_checkpoint_never_moves_backwards_for_same_inode(self):
+        state = LogIngestionState.objects.create(file_path='alert', inode='7', offset=500)
+        _write_checkpoints([(state.pk, '7', 200)])  # Late, out-of-order batch
+        state.refresh_from_db()
+        self.assertEqual(state.offset, 500)
+
+        _write_checkpoints([(state.pk, '8', 200)])  # Rotated file
+        state.refresh_from_db()
+        self.assertEqual((state.inode, state.offset), ('8', 200))
+
+
+class LoadShedderTests(SimpleTestCase):
+    """Token buckets per (src_ip, sid) apply only while ingestion is behind."""
+
+    def event(self, second, src_ip='10.0.0.1', sid='1000008'):
+        return AlertRecord(
+            datetime(2026, 4, 21, 2, 48, second, tzinfo=dt_timezone.utc), src_ip, 1234, '10.0.0.9', 80,
+            'TCP', sid, 'Test', '', 3, Alert.THREAT_SAFE,
+        )
+
+    def test_buckets_limit_each_key_with_hysteresis(self):
+        shedder = LoadShedder(lag_threshold=1000, rate=2, burst=3, window_seconds=60)
+        self.assertFalse(shedder.set_lag(999))
+        self.assertTrue(all(shedder.admit(self.event(0)) for _ in range(10)))
+
+        self.assertTrue(shedder.set_lag(1000))
+        admitted = [shedder.admit(self.event(0)) for _ in range(10)]
+        self.assertEqual(admitted.count(True), 3)  # The burst
+        self.assertTrue(shedder.admit(self.event(0, src_ip='10.0.0.2')))  # Other source: own bucket
+        # One second of alert time later: `rate` new tokens
+        self.assertEqual([shedder.admit(self.event(1)) for _ in range(3)], [True, True, False])
+
+        window = datetime(2026, 4, 21, 2, 48, tzinfo=dt_timezone.utc)
+        self.assertEqual(shedder.take_counts(), {(window, '', '10.0.0.1', '1000008'): 8})
+        self.assertIsNone(shedder.take_counts())
+
+        self.assertTrue(shedder.set_lag(500))  # Still above half the threshold
+        self.assertFalse(shedder.set_lag(499))
+        self.assertEqual(shedder.shed_total, 8)
+
+
+class LoadSheddingIngestionTests(SnortIngestionTestMixin, TestCase):
+    """Shed alerts are counted per key and window, committed with the offsets that skip them."""
+
+    def test_flood_is_shed_and_counted_while_behind(self):
+        self.write_lines(*[fast_line(10, 2000 + i) for i in range(20)], *[fast_line(40, 3000 + i) for i in range(5)])
+        shedder = LoadShedder(lag_threshold=1, rate=1, burst=5)
+
+        result = self.ingest(shedder=shedder)
+
+        # Burst of 5 at :10, bucket refilled (capped at 5) by :40
+        self.assertEqual((result['inserted'], result['shed_events']), (10, 15))
+        count = ShedAlertCount.objects.get()
+        self.assertEqual((count.src_ip, count.sid, count.shed_count), ('192.168.73.130', '1000008', 15))
+        self.assertEqual(count.window_start.second, 0)
+        self.assertEqual(LogIngestionState.objects.get(file_path='alert').offset, self.alert_file.stat().st_size)
+
+        # Later shed events of the same window add to the same row
+        self.write_lines(*[fast_line(10, 4000 + i) for i in range(4)])
+        self.assertEqual(self.ingest(shedder=shedder)['shed_events'], 4)
+        self.assertEqual(ShedAlertCount.objects.get().shed_count, 19)
+
+    def test_counts_are_added_in_the_database_per_sensor(self):
+        window = datetime(2026, 4, 21, 2, 48, tzinfo=dt_timezone.utc)
+        write_shed_counts({(window, '', '10.0.0.1', '1000008'): 3})
+        # The row already exists (another worker created it): no IntegrityError, the count is added
+        with transaction.atomic():
+            write_shed_counts({(window, '', '10.0.0.1', '1000008'): 4, (window, 'edge-1', '10.0.0.1', '1000008'): 2})
+
+        self.assertEqual(
+            sorted(ShedAlertCount.objects.values_list('sensor', 'shed_count')), [('', 7), ('edge-1', 2)],
+        )
+
+    def test_nothing_is_shed_below_the_lag_threshold(self):
+        self.write_lines(*[fast_line(10, 2000 + i) for i in range(20)])
+        shedder = LoadShedder(lag_threshold=self.alert_file.stat().st_size + 1, rate=1, burst=5)
+
+        result = self.ingest(shedder=shedder)
+
+        self.assertEqual((result['inserted'], result['shed_events']), (20, 0))
+        self.assertFalse(ShedAlertCount.objects.exists())
+
+    def test_registry_lag_counts_unread_bytes(self):
+        self.write_lines(fast_line(1, 1001), fast_line(2, 1002))
+        log_files = self.registry.iter_log_files(lambda name: name == 'alert')
+        self.assertEqual(self.registry.lag_bytes(log_files), self.alert_file.stat().st_size)
+
+        self.ingest()
+        self.write_lines(fast_line(3, 1003))
+        log_files = self.registry.iter_log_files(lambda name: name == 'alert')
+        self.assertEqual(self.registry.lag_bytes(log_files), len(fast_line(3, 1003)))
+
+
+class IngestionTelemetryTests(SnortIngestionTestMixin, TestCase):
+    """Per-file lag and throughput are kept in-process and published for the API."""
+
+    def setUp(self):
+        super().setUp()
+        reset_ingestion_telemetry()
+        self.user = User.objects.create_user(
+            email='telemetry@threateye.io', password='testpass123', role=User.PLATFORM_OWNER, is_verified=True,
+        )
+
+    def test_lag_lines_and_dedup_counts_per_file(self):
+        lines = [fast_line(i, 1000 + i) for i in range(5)]
+        self.write_lines(*lines)
+        self.ingest(max_lines=3)
+
+        size = self.alert_file.stat().st_size
+        state = LogIngestionState.objects.get(file_path='alert')
+        self.assertEqual((state.file_size, size - state.offset), (size, sum(len(line) for line in lines[3:])))
+
+        sensor = telemetry_sensor(self.log_dir)
+        entry = get_ingestion_telemetry().snapshot()[sensor]
+        self.assertEqual((entry['lines'], entry['rows'], entry['lines_behind']), (3, 3, 2))
+        self.assertEqual(entry['files']['alert']['bytes_behind'], size - state.offset)
+
+        # Rest of the file, then a re-read after an offset reset: rejected by the dedup cache
+        self.ingest()
+        LogIngestionState.objects.update(offset=0)
+        self.ingest(registry=LogFileRegistry(self.log_dir))
+        entry = get_ingestion_telemetry().snapshot()[sensor]
+        self.assertEqual((entry['lines'], entry['rows'], entry['duplicates'], entry['bytes_behind']), (10, 5, 5, 0))
+        self.assertEqual(get_ingestion_telemetry().node_snapshot()['batch_latency']['count'], 2)
+
+    def test_latency_histogram_buckets(self):
+        histogram = LatencyHistogram(bounds_ms=(5, 10))
+        for seconds in (0.004, 0.005, 0.006, 10):
+            histogram.observe(seconds)
+        self.assertEqual(histogram.as_dict()['counts'], [2, 1, 1])
+        self.assertEqual(histogram.as_dict()['le_ms'], [5, 10, None])
+
+    def test_published_snapshot_is_served_by_api_and_dashboard(self):
+        self.write_lines(*[fast_line(i, 1000 + i) for i in range(5)])
+        self.ingest(max_lines=3)
+        self.assertTrue(publish_ingestion_telemetry(force=True))
+
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        self.assertEqual(APIClient().get(reverse('ingestion_telemetry')).status_code, 401)
+
+        data = client.get(reverse('ingestion_telemetry')).data
+        self.assertEqual(
+            [(sensor['kind'], sensor['sensor']) for sensor in data['sensors']], [tuple(telemetry_sensor(self.log_dir))],
+        )
+        self.assertFalse(data['sensors'][0]['stale'])
+        self.assertEqual([(row['file_path'], row['lines_behind']) for row in data['files']], [('alert', 2)])
+        self.assertEqual([node['batch_latency']['count'] for node in data['nodes']], [1])
+
+        summary = client.get(reverse('dashboard_summary')).data['ingestion']
+        self.assertEqual(summary['bytesBehind'], data['files'][0]['bytes_behind'])
+        self.assertEqual(summary['linesBehind'], 2)
+
+    def test_nodes_sharing_a_sensor_are_added_up(self):
+        now = datetime.now(dt_timezone.utc)
+        for node, file_path, rows in (('ingest-a:10', 'alert', 3), ('ingest-b:20', 'alert.1', 4)):
+            IngestionTelemetrySnapshot.objects.create(
+                kind=IngestionTelemetrySnapshot.KIND_SENSOR, sensor='edge-1', node=node, updated_at=now,
+                data={
+                    'rows': rows, 'rows_per_second': 1.5, 'lines': rows, 'lines_per_second': 2.0,
+                    'files': {file_path: {'bytes_behind': 100, 'lines_behind': 2, 'lines_per_second': 2.0}},
+                },
+            )
+        LogIngestionState.objects.create(sensor='edge-1', file_path='alert', file_size=100, offset=0)
+
+        client = APIClient()
+        client.force_authenticate(self.user)
+        data = client.get(reverse('ingestion_telemetry')).data
+        sensor, = data['sensors']
+        self.assertEqual((sensor['kind'], sensor['sensor']), ('sensor', 'edge-1'))
+        self.assertEqual(sorted(sensor['nodes']), ['ingest-a:10', 'ingest-b:20'])
+        self.assertEqual((sensor['rows'], sensor['rows_per_second'], sensor['bytes_behind']), (7, 3.0, 200))
+        self.assertEqual([(row['sensor'], row['lines_behind']) for row in data['files']], [('edge-1', 2)])
+        self.assertEqual(client.get(reverse('dashboard_summary')).data['ingestion']['rowsPerSecond'], 3.0)
+
+
+class MultiSensorIngestionTests(SnortIngestionTestMixin, TransactionTestCase):
+    """Sensor log roots are ingested side by side with per-sensor offsets and alerts."""
+
+    def setUp(self):
+        super().setUp()
+        reset_file_registries()
+        self.sensor_tmp = tempfile.TemporaryDirectory()
+        self.sensor_dir = Path(self.sensor_tmp.name)
+
+    def tearDown(self):
+        reset_file_registries()
+        self.sensor_tmp.cleanup()
+        super().tearDown()
+
+    def ingest_root(self, log_dir, sensor='', **kwargs):
+        return ingest_log_root(log_dir, sensor=sensor, enable_ml=False, enable_email=False, enable_websocket=False, **kwargs)
+
+    def test_same_file_name_is_stored_per_sensor(self):
+        self.write_lines(fast_line())
+        self.write_lines(fast_line(), path=self.sensor_dir / 'alert')
+
+        self.assertEqual(self.ingest_root(self.log_dir)['text']['inserted'], 1)
+        self.assertEqual(self.ingest_root(self.sensor_dir, 'edge-1')['text']['inserted'], 1)
+
+        self.assertEqual(sorted(Alert.objects.values_list('sensor', flat=True)), ['', 'edge-1'])
+        self.assertEqual(
+            sorted(LogIngestionState.objects.values_list('sensor', 'file_path')), [('', 'alert'), ('edge-1', 'alert')],
+        )
+        # SNORT_LOG_DIR keeps its event hashes
+        record, _ = _parse_fast_record('alert', 0, fast_line().encode(), SnortTimestampCache())
+        self.assertEqual(bytes(Alert.objects.get(sensor='').event_digest), record.event_digest)
+
+        # Each sensor resumes from its own offset
+        self.write_lines(fast_line(20), path=self.sensor_dir / 'alert')
+        reset_file_registries()
+        self.assertEqual(self.ingest_root(self.log_dir)['text']['inserted'], 0)
+        self.assertEqual(self.ingest_root(self.sensor_dir, 'edge-1')['text']['inserted'], 1)
+
+    def test_pipeline_waits_per_sensor(self):
+        self.write_lines(fast_line())
+        self.write_lines(fast_line(), fast_line(20), path=self.sensor_dir / 'alert')
+        pipeline = IngestionPipeline(enable_ml=False, enable_email=False, enable_websocket=False)
+        try:
+            self.assertEqual(self.ingest_root(self.sensor_dir, 'edge-1', pipeline=pipeline)['text']['inserted'], 2)
+            self.assertEqual(self.ingest_root(self.log_dir, pipeline=pipeline)['text']['inserted'], 1)
+            self.assertEqual(pipeline.wait_persisted(), 0)
+        finally:
+            pipeline.close()
+
+    def test_supervisor_starts_and_stops_workers(self):
+        self.write_lines(fast_line(), path=self.sensor_dir / 'alert')
+        Sensor.objects.create(name='edge-1', log_dir=str(self.sensor_dir))
+        Sensor.objects.create(name='main', log_dir=str(self.log_dir))  # Already read by the command itself
+        nested_dir = self.log_dir / 'edge-2'  # Scanned recursively as part of SNORT_LOG_DIR
+        nested_dir.mkdir()
+        Sensor.objects.create(name='edge-2', log_dir=str(nested_dir))
+
+        supervisor = SensorSupervisor(watch=False, interval=1, enable_ml=False, enable_email=False, enable_websocket=False)
+        try:
+            with override_settings(SNORT_LOG_DIR=str(self.log_dir)):
+                self.assertEqual(supervisor.reconcile(), (['edge-1'], []))
+                self.assertEqual(supervisor.reconcile(), ([], []))
+
+                deadline = time.monotonic() + 5
+                while not Alert.objects.filter(sensor='edge-1').exists() and time.monotonic() < deadline:
+                    time.sleep(0.05)
+                self.assertEqual(Alert.objects.filter(sensor='edge-1').count(), 1)
+
+                worker = supervisor.workers['edge-1']
+                Sensor.objects.filter(name='edge-1').update(enabled=False)
+                self.assertEqual(supervisor.reconcile(), ([], ['edge-1']))
+                self.assertFalse(worker.is_alive())
+                self.assertEqual(supervisor.workers, {})
+        finally:
+            supervisor.stop_all()
+
+
+class FileLeaseTests(SnortIngestionTestMixin, TestCase):
+    """Ingesters split the log files through leases and take over from dead nodes."""
+
+    def node(self, owner):
+        manager = FileLeaseManager(owner=owner, lease_seconds=30, refresh_seconds=0)
+        manager.heartbeat()
+        return manager
+
+    def expire(self, owner):
+        # The node stopped renewing (crashed) more than a lease period ago
+        past = datetime.now(dt_timezone.utc) - timedelta(minutes=5)
+        IngestionNode.objects.filter(owner=owner).update(expires_at=past)
+        LogFileLease.objects.filter(owner=owner).update(expires_at=past)
+
+    def test_nodes_split_files_and_take_over_after_expiry(self):
+        paths = [f'alert.{index}' for index in range(20)]
+        node_a, node_b = self.node('node-a'), self.node('node-b')
+        owned_a, acquired_a = node_a.claim('', paths)
+        owned_b, _ = node_b.claim('', paths)
+
+        self.assertEqual(owned_a, acquired_a)
+        self.assertTrue(owned_a and owned_b)
+        self.assertFalse(owned_a & owned_b)
+        self.assertEqual(owned_a | owned_b, set(paths))
+
+        self.expire('node-b')
+        owned_a, acquired_a = node_a.claim('', paths)
+        self.assertEqual(owned_a, set(paths))
+        self.assertEqual(acquired_a, owned_b)
+
+    def test_joining_node_gets_its_share_handed_over(self):
+        paths = [f'alert.{index}' for index in range(20)]
+        node_a = self.node('node-a')
+        self.assertEqual(node_a.claim('', paths)[0], set(paths))
+
+        node_b = self.node('node-b')
+        self.assertEqual(node_b.claim('', paths)[0], set())  # Still leased by a live node
+        owned_a, _ = node_a.claim('', paths)  # Hands b's share over
+        owned_b, _ = node_b.claim('', paths)
+        self.assertTrue(owned_b)
+        self.assertEqual((owned_a & owned_b, owned_a | owned_b), (set(), set(paths)))
+
+    def test_registries_read_only_leased_files(self):
+        for index in range(6):
+            self.write_lines(fast_line(index), path=self.log_dir / f'alert.{index}')
+        node_a, node_b = self.node('node-a'), self.node('node-b')
+        registry_a = LogFileRegistry(self.log_dir, leases=node_a)
+        registry_b = LogFileRegistry(self.log_dir, leases=node_b)
+
+        result_b = self.ingest(registry=registry_b)
+        result_a = self.ingest(registry=registry_a)
+        self.assertTrue(result_a['inserted'] and result_b['inserted'])
+        self.assertEqual(result_a['processed_lines'] + result_b['processed_lines'], 6)
+        self.assertEqual(Alert.objects.count(), 6)
+
+        # Clean shutdown: b takes a's files over from a's stored offsets
+        node_a.close()
+        self.assertEqual(IngestionNode.objects.filter(owner='node-a').count(), 0)
+        result_b = self.ingest(registry=registry_b)
+        self.assertEqual((result_b['processed_lines'], result_b['inserted']), (0, 0))
+        self.assertEqual(set(LogFileLease.objects.values_list('owner', flat=True)), {'node-b'})
+
+
+class GzipArchiveIngestionTests(SnortIngestionTestMixin, TestCase):
+    """logrotate .gz archives are streamed with uncompressed offsets."""
+
+    def write_archive(self, name, lines):
+        path = self.log_dir / name
+        with gzip.open(path, 'wt') as handle:
+            handle.writelines(lines)
+        return path
+
+    def test_archive_ingested_and_skipped_after_restart(self):
+        lines = [fast_line(i, 2000 + i) for i in range(5)]
+        self.write_archive('alert.1.gz', lines)
+
+        result = self.ingest()
+        self.assertEqual((result['processed_lines'], result['inserted']), (5, 5))
+        state = LogIngestionState.objects.get(file_path='alert.1.gz')
+        self.assertEqual(state.offset, sum(len(line.encode()) for line in lines))
+
+        # New process: the gzip trailer says the archive was read to the end - not reopened
+        with mock.patch('alerts.services.gzip.open') as gzip_open:
+            result = self.ingest(registry=LogFileRegistry(self.log_dir))
+        gzip_open.assert_not_called()
+        self.assertEqual(result['processed_lines'], 0)
+
+    def test_last_line_without_newline_is_ingested(self):
+        lines = [fast_line(i, 2000 + i) for i in range(3)]
+        lines[-1] = lines[-1].rstrip('\n')
+        self.write_archive('alert.3.gz', lines)
+
+        result = self.ingest()
+        self.assertEqual((result['processed_lines'], result['inserted']), (3, 3))
+        self.assertTrue(self.registry.is_unchanged('alert.3.gz', (self.log_dir / 'alert.3.gz').stat()))
+
+    def test_truncated_archive_is_resumed_when_complete(self):
+        lines = [fast_line(i % 60, 2000 + i) for i in range(400)]
+        path = self.write_archive('alert.2.gz', lines)
+        complete_bytes = path.read_bytes()
+        path.write_bytes(complete_bytes[:len(complete_bytes) // 2])  # logrotate mid-compression
+
+        first = self.ingest()
+        self.assertLess(first['processed_lines'], 400)
+
+        path.write_bytes(complete_bytes)
+        second = self.ingest()
+        self.assertEqual(first['processed_lines'] + second['processed_lines'], 400)
+        self.assertEqual(Alert.objects.count(), 400)
+        self.assertTrue(self.registry.is_unchanged('alert.2.gz', path.stat()))
+
+    def test_parallel_backfill_matches_sequential_for_archives(self):
+        self.write_archive('alert.1.gz', [fast_line(i, 3000 + i) for i in range(20)])
+        self.write_archive('alert.2.gz', [fast_line(i, 4000 + i) for i in range(30)])
+        self.write_lines(*(fast_line(i, 5000 + i) for i in range(10)))
+
+        backfill_snort_logs_parallel(self.log_dir, workers=2, enable_ml=False, registry=self.registry)
+        parallel = {bytes(d) for d in Alert.objects.values_list('event_digest', flat=True)}
+        offsets = dict(LogIngestionState.objects.values_list('file_path', 'offset'))
+
+        Alert.objects.all().delete()
+        LogIngestionState.objects.all().delete()
+        reset_event_cache()
+        self.ingest(registry=LogFileRegistry(self.log_dir))
+
+        self.assertEqual(len(parallel), 60)
+        self.assertEqual(parallel, {bytes(d) for d in Alert.objects.values_list('event_digest', flat=True)})
+        self.assertEqual(offsets, dict(LogIngestionState.objects.values_list('file_path', 'offset')))
+
+
+class Unified2IngestionTests(SnortIngestionTestMixin, TestCase):
+    """unified2 binary events decode to the same alert structure as FAST lines."""
+
+    def ingest_u2(self, **kwargs):
+        kwargs.setdefault('registry', self.registry)
+        return ingest_snort_unified2_logs(
+            self.log_dir, enable_ml=False, enable_email=False, enable_websocket=False, **kwargs
+        )
+
+    def test_decoded_event_matches_fast_parser(self):
+        events = synthetic_unified2_events(30)
+        for version in (1, 2):
+            records, errors = parse_unified2_records(build_unified2_bytes(events, version=version))
+            self.assertEqual(errors, [])
+            self.assertEqual(len(records), 30)
+            for record, event in zip(records, events):
+                cleaned, raw_line = record.cleaned_data(), record.raw_line
+                self.assertEqual(cleaned['src_ip'], event['src_ip'])
+                self.assertEqual(cleaned['sid'], str(event['sid']))
+                self.assertEqual(cleaned['threat_level'], Alert.THREAT_LEVEL_CHOICES[3 - event['priority']][0])
+                # raw_line is FAST text: the text parser reads the same fields back (year aside)
+                reparsed = parse_snort_fast_line(raw_line)
+                for field in ('src_ip', 'src_port', 'dest_ip', 'dest_port', 'protocol', 'sid', 'priority', 'message'):
+                    self.assertEqual(reparsed[field], cleaned[field])
+
+    def test_signature_maps_supply_message_and_classification(self):
+        sid_map = self.log_dir / 'sid-msg.map'
+        sid_map.write_text('1 || 1000001 || 1 || attempted-dos || 0 || TCP SYN Flood Detected || url,example.com\n')
+        class_config = self.log_dir / 'classification.config'
+        class_config.write_text('config classification: attempted-dos,Attempted Denial of Service,2\n')
+        event = dict(synthetic_unified2_events(1)[0], classification_id=1)
+
+        with override_settings(SNORT_SID_MSG_MAP=str(sid_map), SNORT_CLASSIFICATION_CONFIG=str(class_config)):
+            write_synthetic_unified2(self.log_dir / 'snort.u2.1713657600', [event])
+            self.ingest_u2()
+
+        alert = Alert.objects.get()
+        self.assertEqual(alert.message, 'TCP SYN Flood Detected')
+        self.assertEqual(alert.classification, 'Attempted Denial of Service')
+
+    def test_offsets_resume_on_record_boundaries(self):
+        path = self.log_dir / 'snort.u2.1713657600'
+        events = synthetic_unified2_events(10)
+        data = build_unified2_bytes(events)
+        complete = len(build_unified2_bytes(events[:6]))
+        path.write_bytes(data[:complete + 11])  # Snort is mid-way through the 7th event
+
+        result = self.ingest_u2()
+        self.assertEqual((result['processed_records'], result['inserted']), (6, 6))
+        self.assertEqual(LogIngestionState.objects.get(file_path=path.name).offset, complete)
+
+        path.write_bytes(data)
+        result = self.ingest_u2()
+        self.assertEqual((result['processed_records'], result['inserted']), (4, 4))
+        self.assertEqual(Alert.objects.count(), 10)
+
+        # Re-read from scratch after a reset: everything is a duplicate
+        LogIngestionState.objects.update(offset=0)
+        result = self.ingest_u2(registry=LogFileRegistry(self.log_dir))
+        self.assertEqual(result['inserted'], 0)
+        self.assertEqual(Alert.objects.count(), 10)
+
+    def test_corrupt_record_keeps_earlier_events(self):
+        path = self.log_dir / 'unified2.log.1713657600'
+        good = build_unified2_bytes(synthetic_unified2_events(3))
+        path.write_bytes(good + b'\x00\x00\x00\x07\xff\xff\xff\xff' + bytes(64))
+
+        result = self.ingest_u2()
+        self.assertEqual(result['inserted'], 3)
+        self.assertEqual(LogIngestionState.objects.get(file_path=path.name).offset, len(good))
+        # Not re-read until the file changes
+        self.assertEqual(self.ingest_u2()['processed_records'], 0)
+
+
+def json_line(index, rule_sid=1000001, **fields):
+    """Helper: one Snort 3 alert_json line (default field set + msg/class/priority)."""
+    event = {
+        'timestamp': f'04/18-12:00:{index % 60:02d}.{index:06d}',
+        'pkt_num': index,
+        'proto': 'TCP',
+        'pkt_gen': 'raw',
+        'pkt_len': 60,
+        'dir': 'C2S',
+        'src_ap': f'10.0.0.{index % 250 + 1}:{1024 + index}',
+        'dst_ap': '192.168.1.1:80',
+        'rule': f'1:{rule_sid}:1',
+        'action': 'allow',
+        'msg': 'TCP SYN Flood Detected',
+        'class': 'Attempted Denial of Service',
+        'priority': 1,
+    }
+    event.update(fields)
+    return json.dumps(event) + '\n'
+
+
+class SnortJsonIngestionTests(SnortIngestionTestMixin, TestCase):
+    """Snort 3 alert_json lines go through the same batching and dedup as FAST."""
+
+    def ingest_json(self, **kwargs):
+        kwargs.setdefault('registry', self.registry)
+        return ingest_snort_json_logs(
+            self.log_dir, enable_ml=False, enable_email=False, enable_websocket=False, **kwargs
+        )
+
+    def test_json_and_fast_files_are_read_by_their_own_source(self):
+        json_file = self.log_dir / 'alert_json.txt'
+        self.write_lines(*(json_line(i) for i in range(5)), path=json_file)
+        self.write_lines(fast_line(1, 1001))
+
+        self.assertEqual(self.ingest_json()['inserted'], 5)
+        self.assertEqual(self.ingest()['inserted'], 1)
+
+        alert = Alert.objects.filter(raw_line__startswith='{').order_by('id').first()
+        self.assertEqual((alert.src_ip, alert.src_port, alert.dest_port), ('10.0.0.1', 1024, 80))
+        self.assertEqual((alert.sid, alert.protocol, alert.threat_level), ('1000001', 'TCP', Alert.THREAT_HIGH))
+        self.assertEqual(alert.classification, 'Attempted Denial of Service')
+        self.assertEqual(LogIngestionState.objects.get(file_path='alert_json.txt').offset, json_file.stat().st_size)
+
+        # Re-read after an offset reset: the dedup cache drops every line
+        LogIngestionState.objects.update(offset=0)
+        result = self.ingest_json(registry=LogFileRegistry(self.log_dir))
+        self.assertEqual((result['inserted'], result['skipped_duplicates']), (0, 5))
+
+    def test_explicit_fields_and_sid_map_fallback(self):
+        sid_map = self.log_dir / 'sid-msg.map'
+        sid_map.write_text('1000002 || ET SCAN Nmap Scripting Engine\n')
+        line = json_line(
+            3, msg=None, rule=None, gid=1, sid=1000002, rev=2,
+            src_ap=None, src_addr='10.9.9.9', src_port=4444, seconds=1713441600, timestamp='24/04/18-12:00:00.25',
+        )
+        self.write_lines(line, 'not json\n', '{"truncated": \n', path=self.log_dir / 'alert_json.txt')
+
+        with override_settings(SNORT_SID_MSG_MAP=str(sid_map)):
+            result = self.ingest_json()
+
+        self.assertEqual((result['inserted'], result['failed_lines']), (1, 0))
+        alert = Alert.objects.get()
+        self.assertEqual(alert.message, 'ET SCAN Nmap Scripting Engine')
+        self.assertEqual((alert.src_ip, alert.src_port), ('10.9.9.9', 4444))
+        self.assertEqual(alert.timestamp, datetime(2024, 4, 18, 12, 0, 0, 250000, tzinfo=dt_timezone.utc))
+
+    def test_stdlib_fallback_matches_fast_decoder(self):
+        lines = [json_line(i, rule_sid=1000001 + i % 3, priority=1 + i % 3).encode() for i in range(20)]
+        cache = SnortTimestampCache()
+        default = [SnortJsonParser()('alert_json.txt', i, line, cache) for i, line in enumerate(lines)]
+        stdlib = [SnortJsonParser(loads=json.loads)('alert_json.txt', i, line, cache) for i, line in enumerate(lines)]
+        self.assertEqual(default, stdlib)
+        self.assertTrue(all(record is not None for record, _error in default))
+
+
+@override_settings(ALERT_OUTBOX_ENABLED=False)
+class SyslogReceiverTests(TransactionTestCase):
+    """A local socket stands in for a remote sensor pushing alerts over syslog."""
+
+    def setUp(self):
+        reset_event_cache()
+        reset_signature_cache()
+
+    def run_receiver(self, scenario, **kwargs):
+        # Built outside the event loop: seeding the dedup cache queries the database
+        receiver = SyslogAlertReceiver(
+            host='127.0.0.1', udp_port=0, tcp_port=0,
+            enable_ml=False, enable_email=False, enable_websocket=False, **kwargs
+        )
+
+        async def main():
+            await receiver.start()
+            try:
+                await scenario(receiver)
+            finally:
+                await receiver.close()
+
+        asyncio.run(main())
+        return receiver
+
+    def test_udp_and_tcp_messages_are_stored_in_batches(self):
+        async def scenario(receiver):
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as udp:
+                for i in range(3):
+                    message = f'<33>Apr 18 12:00:00 sensor1 snort[42]: {fast_line(i, 6000 + i).strip()}'
+                    udp.sendto(message.encode(), ('127.0.0.1', receiver.udp_port))
+            _reader, writer = await asyncio.open_connection('127.0.0.1', receiver.tcp_port)
+            writer.write(''.join(fast_line(i, 7000 + i) for i in range(5)).encode())
+            writer.write(b'<33>1 2026-04-18T12:00:00Z sensor2 snort 42 - - ' + json_line(9).encode())
+            writer.write(b'<33>snort[42]: [1:2000001:3] ET SCAN Suspicious inbound [Classification: Attempted Information Leak] [Priority: 2]: {TCP} 10.1.1.1:5555 -> 192.168.1.1:22\n')
+            writer.write(b'<33>snort[42]: Snort started\n')
+            await writer.drain()
+            writer.close()
+            await writer.wait_closed()
+            # Let the loop read everything before close() flushes
+            for _ in range(100):
+                if receiver.stats['received'] >= 11:
+                    break
+                await asyncio.sleep(0.01)
+
+        receiver = self.run_receiver(scenario, batch_policy=AdaptiveBatchPolicy(initial_size=4, min_size=1))
+
+        self.assertEqual(receiver.stats['received'], 11)
+        self.assertEqual(receiver.stats['ignored'], 1)
+        self.assertEqual(receiver.stats['inserted'], 10)
+        self.assertEqual(Alert.objects.count(), 10)
+        syslog_alert = Alert.objects.get(sid='2000001')
+        self.assertEqual((syslog_alert.threat_level, syslog_alert.dest_port), (Alert.THREAT_MEDIUM, 22))
+        self.assertEqual(syslog_alert.classification, 'Attempted Information Leak')
+
+    def test_duplicate_messages_skipped_and_udp_dropped_when_writer_is_behind(self):
+        line = fast_line(1, 8001).encode()
+
+        async def scenario(receiver):
+            receiver.handle_message(line, '10.0.0.9')
+            await receiver.flush()
+            receiver.handle_message(line, '10.0.0.9')  # Retransmit: dedup cache hit
+            receiver._pending = receiver.max_pending  # Writer backlog
+            receiver.handle_message(fast_line(2, 8002).encode(), '10.0.0.9', droppable=True)
+            receiver._pending = 0
+
+        receiver = self.run_receiver(scenario)
+        self.assertEqual(Alert.objects.count(), 1)
+        self.assertEqual((receiver.stats['skipped_duplicates'], receiver.stats['dropped']), (1, 1))
+
+    def test_payload_extraction(self):
+        fast = fast_line(1, 9001).strip().encode()
+        self.assertEqual(extract_alert_payload(b'<13>Apr 18 12:00:00 host snort: ' + fast + b'\r\n'), fast)
+        self.assertEqual(extract_alert_payload(fast), fast)
+        self.assertIsNone(extract_alert_payload(b'<13>Apr 18 12:00:00 host sshd[1]: session opened'))
+
+
+def write_pcap(path, events, append=False, endian='<', nanosecond=False):
+    """Helper: PCAP file with one Ethernet/IPv4 frame per event dict (see _synthetic_frame)."""
+    with open(path, 'ab' if append else 'wb') as handle:
+        if not append:
+            magic = 0xa1b23c4d if nanosecond else 0xa1b2c3d4
+            handle.write(struct.pack(f'{endian}IHHiIII', magic, 2, 4, 0, 0, 65535, 1))
+        for event in events:
+            frame = _synthetic_frame(event)
+            fraction = event['microseconds'] * 1000 + event.get('nanoseconds', 0) if nanosecond else event['microseconds']
+            handle.write(struct.pack(f'{endian}IIII', event['seconds'], fraction, len(frame), len(frame)) + frame)
+
+
+def pcapng_block(block_type, body, endian='<'):
+    padded = body + bytes(-len(body) % 4)
+    return struct.pack(f'{endian}II', block_type, len(padded) + 12) + padded + struct.pack(f'{endian}I', len(padded) + 12)
+
+
+def write_pcapng(path, packets, interfaces=((1, None),), endian='<'):
+    """
+    Helper: PCAPNG section with the given (linktype, if_tsresol) interfaces and
+    one Enhanced Packet block per (interface_id, timestamp in interface units, frame).
+    """
+    data = pcapng_block(0x0A0D0D0A, struct.pack(f'{endian}IHHq', 0x1A2B3C4D, 1, 0, -1), endian)
+    for linktype, tsresol in interfaces:
+        options = b''
+        if tsresol is not None:
+            options = struct.pack(f'{endian}HHB3x', 9, 1, tsresol) + struct.pack(f'{endian}HH', 0, 0)
+        data += pcapng_block(1, struct.pack(f'{endian}HHI', linktype, 0, 65535) + options, endian)
+    # A block type the reader does not know is skipped by length
+    data += pcapng_block(0x00000BAD, b'custom', endian)
+    for interface_id, timestamp, frame in packets:
+        header = struct.pack(f'{endian}5I', interface_id, timestamp >> 32, timestamp & 0xFFFFFFFF, len(frame), len(frame))
+        data += pcapng_block(6, header + frame, endian)
+    Path(path).write_bytes(data)
+
+
+def flow_packets(count, src_ip='192.168.1.10', src_port=40000, dest_ip='10.0.0.1', dest_port=443, start=1713657600.0, step=0.1):
+    """Helper: `count` packet events of one 5-tuple, `step` seconds apart (for write_pcap)."""
+    return [
+        {
+            'seconds': int(start + i * step), 'microseconds': int(round((start + i * step) % 1 * 1000000)),
+            'src_ip': src_ip, 'src_port': src_port, 'dest_ip': dest_ip, 'dest_port': dest_port, 'protocol': 6,
+        }
+        for i in range(count)
+    ]
+
+
+class FlowAggregatorTests(SimpleTestCase):
+    """5-tuple flows end on the idle and active timeouts and when the table is full."""
+
+    KEY = ('192.168.1.10', 40000, '10.0.0.1', 443, 6)
+
+    def test_idle_and_active_timeouts_split_flows(self):
+        aggregator = FlowAggregator(idle_timeout=10, active_timeout=30)
+        for timestamp in (0, 5, 14, 40):  # 14: within idle; 40: idle gap of 26s
+            aggregator.add(self.KEY, 1000 + timestamp, 100, 'snort.log.1', timestamp)
+        for timestamp in range(41, 75, 5):  # Continuous traffic, cut at 30s after 1040
+            aggregator.add(self.KEY, 1000 + timestamp, 100, 'snort.log.1', timestamp)
+
+        flows = aggregator.pending()
+        self.assertEqual([(f.first_seen - 1000, f.last_seen - 1000, f.packets) for f in flows],
+                         [(0, 14, 3), (40, 66, 7), (71, 71, 1)])
+        self.assertEqual(flows[0].bytes, 300)
+        self.assertEqual(len(aggregator.active), 1)
+
+    def test_sweep_and_eviction_end_quiet_flows(self):
+        aggregator = FlowAggregator(idle_timeout=10, active_timeout=60, max_flows=10)
+        for port in range(10):
+            aggregator.add(self.KEY[:1] + (port,) + self.KEY[2:], 1000 + port * 0.1, 60, 'snort.log.1', port)
+        # Table full: the least recently seen flow is ended to make room
+        aggregator.add(self.KEY, 1001, 60, 'snort.log.1', 99)
+        self.assertEqual([flow.key[1] for flow in aggregator.closed], [0])
+
+        # Capture clock moves past the idle timeout: every quiet flow ends
+        aggregator.add(self.KEY, 1020, 60, 'snort.log.1', 100)
+        self.assertEqual(len(aggregator.closed), 11)
+        self.assertEqual(list(aggregator.active), [self.KEY])
+
+
+@override_settings(PACKET_FLOW_IDLE_TIMEOUT=60, PACKET_FLOW_ACTIVE_TIMEOUT=300)
+class PacketFlowIngestionTests(SnortIngestionTestMixin, TestCase):
+    """snort.log packets are stored as PacketFlow rows, not one Alert per packet."""
+
+    def setUp(self):
+        super().setUp()
+        self.aggregator = FlowAggregator()
+
+    def ingest_packets(self, **kwargs):
+        kwargs.setdefault('registry', self.registry)
+        kwargs.setdefault('aggregator', self.aggregator)
+        return ingest_snort_packet_logs(self.log_dir, **kwargs)
+
+    def test_packets_are_aggregated_into_flows(self):
+        path = self.log_dir / 'snort.log.1713657600'
+        web = flow_packets(30)
+        dns = flow_packets(5, src_port=53000, dest_port=53, start=1713657601.05)
+        write_pcap(path, sorted(web + dns, key=lambda event: (event['seconds'], event['microseconds'])))
+
+        result = self.ingest_packets()
+
+        self.assertEqual((result['processed_packets'], result['inserted'], result['failed_packets']), (35, 2, 0))
+        self.assertEqual(Alert.objects.count(), 0)
+        flow = PacketFlow.objects.get(dest_port=443)
+        frame_length = len(_synthetic_frame(web[0]))
+        self.assertEqual((flow.packet_count, flow.byte_count, flow.protocol), (30, 30 * frame_length, 'TCP'))
+        self.assertEqual(flow.first_seen.timestamp(), 1713657600.0)
+        self.assertAlmostEqual(flow.last_seen.timestamp(), 1713657602.9, places=5)
+        self.assertEqual(PacketFlow.objects.get(dest_port=53).packet_count, 5)
+        self.assertEqual(LogIngestionState.objects.get(file_path=path.name).offset, path.stat().st_size)
+
+    def test_open_flow_is_updated_across_cycles_and_reread_is_idempotent(self):
+        path = self.log_dir / 'snort.log.1713657600'
+        # Live traffic: timestamps close to now, so the wall-clock sweep keeps the flow open
+        events = flow_packets(30, start=time.time() - 5)
+        write_pcap(path, events[:20])
+        self.assertEqual(self.ingest_packets()['inserted'], 1)
+
+        write_pcap(path, events[20:], append=True)
+        result = self.ingest_packets()
+        self.assertEqual((result['inserted'], result['updated'], result['active_flows']), (0, 1, 1))
+        self.assertEqual(PacketFlow.objects.get().packet_count, 30)
+
+        # Offsets reset, process restarted: the same flow row is rewritten, not duplicated
+        LogIngestionState.objects.update(offset=0)
+        result = self.ingest_packets(registry=LogFileRegistry(self.log_dir), aggregator=FlowAggregator())
+        self.assertEqual((result['inserted'], result['updated']), (0, 1))
+        self.assertEqual(PacketFlow.objects.get().packet_count, 30)
+
+    def test_pcapng_capture_is_aggregated(self):
+        path = self.log_dir / 'snort.log.1713657600'
+        events = flow_packets(12)
+        write_pcapng(path, [
+            (0, event['seconds'] * 1000000 + event['microseconds'], _synthetic_frame(event)) for event in events
+        ])
+
+        result = self.ingest_packets()
+
+        self.assertEqual((result['processed_packets'], result['inserted']), (12, 1))
+        self.assertEqual(PacketFlow.objects.get().packet_count, 12)
+        self.assertEqual(LogIngestionState.objects.get(file_path=path.name).offset, path.stat().st_size)
+
+
+class PacketFlowApiTests(TestCase):
+    """Live traffic and traffic analytics read PacketFlow rows."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='flows@threateye.io', password='testpass123', role=User.PLATFORM_OWNER, is_verified=True,
+        )
+        now = datetime.now(dt_timezone.utc)
+        for index, (protocol, dest_port, packets) in enumerate([('TCP', 443, 100), ('UDP', 53, 10), ('TCP', 22, 5)]):
+            PacketFlow.objects.create(
+                src_ip=f'192.168.1.{index + 1}', src_port=40000 + index, dest_ip='10.0.0.1', dest_port=dest_port,
+                protocol=protocol, first_seen=now - timedelta(minutes=10 - index), last_seen=now - timedelta(minutes=5 - index),
+                packet_count=packets, byte_count=packets * 100, flow_hash=f'flow-{index}',
+            )
+
+    def setUp(self):
+        self.client = APIClient()
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {str(refresh.access_token)}')
+
+    def test_live_flows_filters_and_orders_by_last_seen(self):
+        response = self.client.get(reverse('live_flows'))
+        self.assertEqual([row['dest_port'] for row in response.data['results']], [22, 53, 443])
+
+        response = self.client.get(reverse('live_flows'), {'protocol': 'tcp', 'port': '443'})
+        self.assertEqual(response.data['total_available'], 1)
+        self.assertEqual(response.data['results'][0]['packet_count'], 100)
+
+    def test_traffic_statistics_and_dashboard_use_flows(self):
+        response = self.client.get(reverse('traffic_statistics'))
+        self.assertEqual((response.data['flows'], response.data['packets'], response.data['bytes']), (3, 115, 11500))
+        self.assertEqual([row['protocol'] for row in response.data['protocols']], ['TCP', 'UDP'])
+        self.assertEqual(response.data['top_talkers'][0]['src_ip'], '192.168.1.1')
+
+        summary = self.client.get(reverse('dashboard_summary')).data
+        self.assertEqual(summary['traffic24h'], {'flows': 3, 'packets': 115, 'bytes': 11500})
+        self.assertEqual(summary['totalAlerts24h'], 0)
+
+
+class PacketCaptureTests(SimpleTestCase):
+    """mmap PCAP / PCAPNG reader and in-place frame decoding."""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = Path(tmp.name)
+        self.events = synthetic_unified2_events(5)
+
+    def read(self, path, offset=None):
+        with PacketCapture(path) as capture:
+            return [
+                (packet[:4], decode_ipv4(capture.view, packet[4], packet[5], packet[6]))
+                for packet in capture.packets(offset)
+            ]
+
+    def expected(self, event):
+        return (event['src_ip'], event['src_port'], event['dest_ip'], event['dest_port'], event['protocol'])
+
+    def test_nanosecond_big_endian_pcap(self):
+        path = self.dir / 'snort.log.1'
+        for event in self.events:
+            event['nanoseconds'] = 789
+        write_pcap(path, self.events, endian='>', nanosecond=True)
+
+        packets = self.read(path)
+        self.assertEqual([decoded for _header, decoded in packets], [self.expected(e) for e in self.events])
+        first = packets[0][0]
+        self.assertEqual(first[1:], (self.events[0]['seconds'], self.events[0]['microseconds'],
+                                     self.events[0]['microseconds'] * 1000 + 789))
+
+    def test_partial_trailing_record_is_left_for_the_next_cycle(self):
+        path = self.dir / 'snort.log.1'
+        write_pcap(path, self.events[:3])
+        complete_size = path.stat().st_size
+        frame = _synthetic_frame(self.events[3])
+        with open(path, 'ab') as handle:
+            handle.write(struct.pack('<IIII', 1, 0, len(frame), len(frame)) + frame[:10])
+
+        packets = self.read(path)
+        self.assertEqual(len(packets), 3)
+        self.assertEqual(packets[-1][0][0], complete_size)
+        self.assertEqual(self.read(path, complete_size), [])
+
+    def test_pcapng_interfaces_resolution_and_resume(self):
+        path = self.dir / 'snort.log.1'
+        raw_ip = _synthetic_frame(self.events[1])[14:]
+        write_pcapng(path, [
+            (0, 1713657600 * 1000000 + 250000, _synthetic_frame(self.events[0])),
+            (1, 1713657601 * 10 ** 9 + 123456789, raw_ip),
+            (0, 1713657602 * 1000000, _synthetic_frame(self.events[2])),
+        ], interfaces=((1, None), (101, 9)))
+
+        packets = self.read(path)
+        self.assertEqual([decoded for _header, decoded in packets], [self.expected(e) for e in self.events[:3]])
+        self.assertEqual([header[1:3] for header, _decoded in packets],
+                         [(1713657600, 250000), (1713657601, 123456), (1713657602, 0)])
+
+        # Resuming mid-file needs the interfaces declared before the offset: from the cached walk or a rescan
+        resume_at = packets[0][0][0]
+        self.assertEqual(self.read(path, resume_at), packets[1:])
+        pcap_module._section_states.clear()
+        self.assertEqual(self.read(path, resume_at), packets[1:])
+
+    def test_link_types_and_fragments(self):
+        frame = _synthetic_frame(self.events[0])
+        ip_packet = frame[14:]
+        vlan = frame[:12] + b'\x81\x00\x00\x05' + frame[12:]
+        cooked = bytes(14) + b'\x08\x00' + ip_packet
+        fragment = bytearray(frame)
+        fragment[20:22] = b'\x00\x10'  # Fragment offset 16: no transport header
+        expected = self.expected(self.events[0])
+
+        self.assertEqual(decode_ipv4(vlan, 1, 0, len(vlan)), expected)
+        self.assertEqual(decode_ipv4(cooked, 113, 0, len(cooked)), expected)
+        self.assertEqual(decode_ipv4(ip_packet, 101, 0, len(ip_packet)), expected)
+        self.assertEqual(decode_ipv4(bytes(fragment), 1, 0, len(fragment)), expected[:1] + (None,) + expected[2:3] + (None, 6))
+        self.assertIsNone(decode_ipv4(frame[:30], 1, 0, 30))
+        self.assertIsNone(decode_ipv4(frame, 1, 0, 30))
+
+    def test_empty_and_unknown_files_are_rejected(self):
+        empty = self.dir / 'snort.log.1'
+        empty.touch()
+        text = self.dir / 'snort.log.2'
+        text.write_text('not a capture at all\n')
+        for path in (empty, text):
+            with self.assertRaises(CaptureFormatError):
+                PacketCapture(path)
+
+
+class ThreatAnalyzerBatchTests(SimpleTestCase):
+    """analyze_alerts (one predict_proba per batch) agrees with analyze_alert."""
+
+    def test_vectorized_results_match_per_alert_analysis(self):
+        import numpy as np
+        from sklearn.ensemble import RandomForestClassifier
+        from ml_features.feature_extractor_simple import SimplifiedFeatureExtractor
+        from ml_features.threat_analyzer import ThreatAnalyzer
+
+        rng = np.random.RandomState(0)
+        model = RandomForestClassifier(n_estimators=5, random_state=0)
+        model.fit(rng.rand(200, 12), rng.randint(0, 2, 200))
+        analyzer = ThreatAnalyzer.__new__(ThreatAnalyzer)
+        analyzer.feature_extractor = SimplifiedFeatureExtractor()
+        analyzer.model = model
+        analyzer.model_loaded = True
+
+        alerts = [
+            Alert(id=i, dest_port=20 + i, src_port=1000 * i, protocol=['TCP', 'UDP'][i % 2], sid=str(1000000 + i),
+                  signature=Signature(sid=str(1000000 + i), message='TCP SYN ACK' if i % 4 else 'ping'),
+                  src_ip=f'192.168.0.{i}', dest_ip='8.8.8.8',
+                  threat_level=[Alert.THREAT_SAFE, Alert.THREAT_MEDIUM, Alert.THREAT_HIGH][i % 3])
+            for i in range(1, 30)
+        ]
+        self.assertEqual(analyzer.analyze_alerts(alerts), [analyzer.analyze_alert(alert) for alert in alerts])
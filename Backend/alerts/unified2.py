@@ -0,0 +1,584 @@
+"""
+Snort unified2 binary alert reader.
+
+FAST text output is the slowest format Snort can write, and matching every
+line against FAST_ALERT_PATTERN is the ingestion bottleneck. unified2 is a
+sequence of type-length-value records (big-endian):
+
+    [type:u32][length:u32][body: length bytes]
+
+Event bodies have fixed layouts, so they are decoded with precompiled
+struct.Struct objects straight into the dict parse_snort_fast_line returns.
+Packet records (the triggering frame) follow their event and are skipped;
+unknown record types (extra data, Snort 3 additions) are skipped by length.
+
+unified2 carries numeric ids only: messages come from sid-msg.map and
+classification names from classification.config when SNORT_SID_MSG_MAP /
+SNORT_CLASSIFICATION_CONFIG point at them, otherwise placeholders are used.
+
+Files are snort.u2.<epoch> (Snort 2) or unified2.log.<epoch> (Snort 3);
+LogIngestionState offsets always sit on a record boundary.
+"""
+import io
+import ipaddress
+import logging
+import os
+import random
+import struct
+from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+
+from .dedup import get_event_cache
+from .pipeline import PersistError
+from .records import AlertRecord
+from .shedding import get_load_shedder
+from .telemetry import get_ingestion_telemetry, telemetry_sensor
+from .services import (
+    AdaptiveBatchPolicy,
+    _get_alert_log_state,
+    _get_protocol_name,
+    _store_record_batch,
+    compute_event_hashes,
+    get_file_registry,
+    map_priority_to_threat_level,
+    validate_alert_data,
+)
+
+logger = logging.getLogger(__name__)
+
+# ===== RECORD LAYOUTS =====
+
+UNIFIED2_PACKET = 2
+UNIFIED2_IDS_EVENT = 7
+UNIFIED2_IDS_EVENT_IPV6 = 72
+UNIFIED2_IDS_EVENT_V2 = 104
+UNIFIED2_IDS_EVENT_IPV6_V2 = 105
+UNIFIED2_EXTRA_DATA = 110
+
+RECORD_HEADER = struct.Struct('!II')  # type, length
+
+# sensor_id, event_id, event_second, event_microsecond, signature_id, generator_id,
+# signature_revision, classification_id, priority_id, ip_source, ip_destination,
+# sport_itype, dport_icode, protocol, impact_flag, impact, blocked
+IDS_EVENT = struct.Struct('!9I4s4sHHBBBB')
+IDS_EVENT_IPV6 = struct.Struct('!9I16s16sHHBBBB')
+# Version 2 events append mpls_label, vlan_id and padding
+IDS_EVENT_V2 = struct.Struct('!9I4s4sHHBBBBIHH')
+IDS_EVENT_IPV6_V2 = struct.Struct('!9I16s16sHHBBBBIHH')
+
+# sensor_id, event_id, event_second, packet_second, packet_microsecond, linktype, packet_length
+PACKET_HEADER = struct.Struct('!7I')
+
+EVENT_LAYOUTS = {
+    UNIFIED2_IDS_EVENT: IDS_EVENT,
+    UNIFIED2_IDS_EVENT_IPV6: IDS_EVENT_IPV6,
+    UNIFIED2_IDS_EVENT_V2: IDS_EVENT_V2,
+    UNIFIED2_IDS_EVENT_IPV6_V2: IDS_EVENT_IPV6_V2,
+}
+
+MAX_RECORD_LENGTH = 16 * 1024 * 1024  # Larger lengths mean a corrupt file, not a record
+UNIFIED2_READ_CHUNK_SIZE = 1024 * 1024
+
+_PORTLESS_PROTOCOLS = {'ICMP'}  # FAST prints ICMP endpoints without ports; so does raw_line
+
+
+class Unified2FormatError(Exception):
+    """The file is not unified2 or is corrupt at the given offset."""
+
+
+def _is_unified2_log_name(name):
+    # snort.u2.<epoch> (Snort 2) / unified2.log.<epoch> (Snort 3)
+    return not name.startswith('.') and ('.u2' in name or name.startswith('unified2'))
+
+
+# ===== RECORD READER =====
+
+def iter_unified2_records(handle, offset, chunk_size=UNIFIED2_READ_CHUNK_SIZE):
+    """
+    Yield (record_start, record_end, record_type, body) for each complete record.
+
+    Reads large chunks and slices records out with unpack_from (no per-record
+    read() call). Stops before a record that is still being written, so
+    record_end of the last yielded record is a safe resume offset.
+
+    Raises Unified2FormatError on an impossible record length.
+    """
+    handle.seek(offset)
+    buffer = b''
+    position = 0         # Parse position inside buffer
+    buffer_start = offset  # File offset of buffer[0]
+    header_size = RECORD_HEADER.size
+    unpack_header = RECORD_HEADER.unpack_from
+
+    while True:
+        chunk = handle.read(chunk_size)
+        if not chunk:
+            return
+        if position:
+            buffer_start += position
+            buffer = buffer[position:] + chunk
+            position = 0
+        else:
+            buffer += chunk
+        view = memoryview(buffer)
+        available = len(buffer)
+
+        while available - position >= header_size:
+            record_type, length = unpack_header(buffer, position)
+            if length > MAX_RECORD_LENGTH:
+                raise Unified2FormatError(f'record length {length} at offset {buffer_start + position}')
+            body_start = position + header_size
+            body_end = body_start + length
+            if body_end > available:
+                break
+            yield buffer_start + position, buffer_start + body_end, record_type, view[body_start:body_end]
+            position = body_end
+
+
+# ===== SIGNATURE / CLASSIFICATION LOOKUP =====
+
+@lru_cache(maxsize=4)
+def _load_sid_msg_map(path, _mtime_ns):
+    # sid-msg.map v1 "sid || msg || refs..." and v2 "gid || sid || rev || class || prio || msg || refs..."
+    messages = {}
+    with open(path, encoding='utf-8', errors='ignore') as handle:
+        for line in handle:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            fields = [field.strip() for field in line.split('||')]
+            try:
+                if len(fields) >= 6 and fields[2].isdigit():
+                    messages[(int(fields[0]), int(fields[1]))] = fields[5]
+                elif len(fields) >= 2:
+                    messages[(1, int(fields[0]))] = fields[1]
+            except ValueError:
+                continue
+    return messages
+
+
+@lru_cache(maxsize=4)
+def _load_classification_config(path, _mtime_ns):
+    # "config classification: shortname,description,priority" - ids are 1-based in file order
+    classifications = {}
+    with open(path, encoding='utf-8', errors='ignore') as handle:
+        for line in handle:
+            line = line.strip()
+            if not line.startswith('config classification:'):
+                continue
+            fields = line.split(':', 1)[1].split(',')
+            if len(fields) >= 2:
+                classifications[len(classifications) + 1] = fields[1].strip()
+    return classifications
+
+
+def _load_lookup(loader, path):
+    # Reloaded when the file changes; missing/unset file -> empty lookup
+    if not path:
+        return {}
+    try:
+        return loader(str(path), os.stat(path).st_mtime_ns)
+    except OSError as e:
+        logger.warning(f'[unified2] Cannot read {path}: {e}')
+        return {}
+
+
+def get_signature_lookups():
+    """Returns ({(gid, sid): message}, {classification_id: name}) from settings."""
+    return (
+        _load_lookup(_load_sid_msg_map, getattr(settings, 'SNORT_SID_MSG_MAP', '')),
+        _load_lookup(_load_classification_config, getattr(settings, 'SNORT_CLASSIFICATION_CONFIG', '')),
+    )
+
+
+# ===== EVENT DECODING =====
+
+_IPV4_LAYOUTS = {UNIFIED2_IDS_EVENT, UNIFIED2_IDS_EVENT_V2}
+
+
+def _format_ip(raw):
+    if len(raw) == 4:
+        return f'{raw[0]}.{raw[1]}.{raw[2]}.{raw[3]}'
+    return str(ipaddress.IPv6Address(bytes(raw)))
+
+
+class Unified2Decoder:
+    """
+    Decodes IDS event bodies into the parse_snort_fast_line dict.
+
+    Like SnortTimestampCache, per-second work (timezone conversion and the
+    FAST timestamp prefix of raw_line) is done once per distinct second.
+
+    Args:
+        messages: {(gid, sid): message} from sid-msg.map (default: placeholders)
+        classifications: {classification_id: name} from classification.config
+    """
+
+    MAX_CACHED_SECONDS = 4096
+
+    def __init__(self, messages=None, classifications=None):
+        self.messages = messages or {}
+        self.classifications = classifications or {}
+        self.tz = timezone.get_current_timezone()
+        self._seconds = {}  # event_second -> (aware datetime, 'MM/DD-HH:MM:SS')
+
+    def _second(self, event_second):
+        cached = self._seconds.get(event_second)
+        if cached is None:
+            if len(self._seconds) >= self.MAX_CACHED_SECONDS:
+                self._seconds.clear()
+            moment = datetime.fromtimestamp(event_second, self.tz)
+            cached = self._seconds[event_second] = (moment, moment.strftime('%m/%d-%H:%M:%S'))
+        return cached
+
+    def decode(self, record_type, body):
+        """
+        Returns (parsed, raw_line, (sensor_id, event_id)), or (None, None, None)
+        when the body is too short for its layout.
+        """
+        layout = EVENT_LAYOUTS[record_type]
+        if len(body) < layout.size:
+            return None, None, None
+        (sensor_id, event_id, event_second, event_microsecond, sid, gid, rev,
+         classification_id, priority, src_raw, dest_raw, sport, dport, protocol_number) = layout.unpack_from(body)[:14]
+
+        # Same clamping as the FAST parser
+        if priority < 1 or priority > 3:
+            priority = 3
+        if event_microsecond >= 1000000:
+            event_microsecond = 0
+        moment, prefix = self._second(event_second)
+        protocol = _get_protocol_name(protocol_number)
+        src_ip = _format_ip(src_raw)
+        dest_ip = _format_ip(dest_raw)
+        message = self.messages.get((gid, sid)) or f'Snort Alert [{gid}:{sid}:{rev}]'
+        classification = self.classifications.get(classification_id, '')
+
+        if protocol in _PORTLESS_PROTOCOLS:
+            sport = dport = None
+            endpoints = f'{src_ip} -> {dest_ip}'
+        else:
+            endpoints = f'{src_ip}:{sport} -> {dest_ip}:{dport}'
+
+        parsed = {
+            'timestamp': moment.replace(microsecond=event_microsecond),
+            'src_ip': src_ip,
+            'src_port': sport,
+            'dest_ip': dest_ip,
+            'dest_port': dport,
+            'protocol': protocol,
+            'sid': str(sid),
+            'message': message[:512],
+            'classification': classification[:255],
+            'priority': priority,
+            'threat_level': map_priority_to_threat_level(priority),
+            'gid': gid,
+            'rev': rev,
+        }
+        # FAST-equivalent text for raw_line, so unified2 alerts look like the text-ingested ones
+        raw_line = (
+            f'{prefix}.{event_microsecond:06d}  [**] [{gid}:{sid}:{rev}] {parsed["message"]} [**] '
+            f'[Classification: {parsed["classification"]}] [Priority: {priority}] {{{protocol}}} {endpoints}'
+        )
+        return parsed, raw_line, (sensor_id, event_id)
+
+
+def _parse_unified2_record(file_path, record_start, record_type, body, decoder):
+    """
+    Decode, validate and hash one event record.
+
+    Returns (record, error_msg) like _parse_fast_record (record is an AlertRecord).
+    """
+    parsed, raw_line, ids = decoder.decode(record_type, body)
+    if parsed is None:
+        return None, f'truncated event record (type {record_type})'
+
+    # IPv4 layouts are valid by construction (4-byte addresses, u16 ports, clamped
+    # priority); IPv6 events go through the same validation as FAST lines (IPv4 only)
+    if record_type not in _IPV4_LAYOUTS:
+        is_valid, error_msg, parsed = validate_alert_data(parsed)
+        if not is_valid:
+            return None, error_msg
+
+    # sensor/event ids identify the event; the offset disambiguates sensor restarts
+    event_hash, event_digest = compute_event_hashes(f'u2:{file_path}:{record_start}:{ids[0]}:{ids[1]}')
+    return AlertRecord.from_cleaned(parsed, raw_line, event_hash, event_digest), None
+
+
+def parse_unified2_records(data, file_path='unified2', messages=None, classifications=None):
+    """Parse an in-memory unified2 buffer; returns (records, errors). Used by tests and benchmarks."""
+    decoder = Unified2Decoder(messages, classifications)
+    records, errors = [], []
+    for record_start, _record_end, record_type, body in iter_unified2_records(io.BytesIO(data), 0):
+        if record_type not in EVENT_LAYOUTS:
+            continue
+        record, error_msg = _parse_unified2_record(file_path, record_start, record_type, body, decoder)
+        if record is not None:
+            records.append(record)
+        elif error_msg:
+            errors.append(error_msg)
+    return records, errors
+
+
+# ===== INGESTION =====
+
+def ingest_snort_unified2_logs(log_dir, max_records=None, enable_ml=True, enable_email=True, enable_websocket=True, registry=None, dedup_cache=None, pipeline=None, batch_policy=None, shedder=None):
+    """
+    Ingest unified2 binary alert files with the same batching, dedup and
+    checkpointing as ingest_snort_logs.
+
+    Args:
+        log_dir: Path to Snort log directory
+        max_records: Max event records to process (None = all)
+        enable_ml: Run ML enrichment on alerts (default True)
+        enable_email: Send email notifications (default True)
+        enable_websocket: Broadcast WebSocket updates (default True)
+        registry: LogFileRegistry to use (default: process-wide registry for log_dir)
+        dedup_cache: RecentEventCache to use (default: process-wide cache from settings)
+        pipeline: IngestionPipeline to persist/enrich/notify on worker threads
+        batch_policy: AdaptiveBatchPolicy deciding batch flushes (default: the pipeline's, else a new one)
+        shedder: LoadShedder used while ingestion is behind (default: from settings, None when disabled)
+    """
+    log_dir_path = Path(log_dir)
+    if not log_dir_path.exists() or not log_dir_path.is_dir():
+        return {'inserted': 0, 'processed_records': 0, 'failed_records': 0, 'skipped_duplicates': 0, 'shed_events': 0}
+
+    if registry is None:
+        registry = get_file_registry(log_dir_path)
+    log_files = registry.iter_log_files(_is_unified2_log_name)
+    if dedup_cache is None:
+        dedup_cache = get_event_cache()
+    if batch_policy is None:
+        batch_policy = getattr(pipeline, 'batch_policy', None) or AdaptiveBatchPolicy()
+    if shedder is None:
+        shedder = get_load_shedder(log_dir_path, _is_unified2_log_name, registry.sensor)
+    lag_bytes = registry.lag_bytes(log_files) if shedder is not None else 0
+    telemetry = get_ingestion_telemetry()
+    sensor = telemetry_sensor(log_dir_path, registry.sensor)
+
+    inserted = 0
+    processed_records = 0
+    failed_records = 0
+    skipped_duplicates = 0
+    shed_events = 0
+    batch = []
+    maybe_records = []
+    checkpoints = {}  # file_path -> (state pk, inode, offset) reached by the records in `batch`
+    read_files = []  # Files read this cycle (their cached offsets run ahead of the stored alerts)
+    decoder = Unified2Decoder(*get_signature_lookups()) if log_files else None
+    options = {
+        'enable_ml': enable_ml,
+        'enable_email': enable_email,
+        'enable_websocket': enable_websocket,
+        'pipeline': pipeline,
+        'batch_policy': batch_policy,
+        'sensor': registry.sensor,
+    }
+
+    failure = None
+    try:
+        for log_file, file_path, stat_result in log_files:
+            if max_records is not None and processed_records >= max_records:
+                break
+
+            # Nothing new since the last cycle - no open(), no DB query
+            if registry.is_unchanged(file_path, stat_result):
+                continue
+
+            try:
+                read_files.append(file_path)
+                state = registry.ensure_row(_get_alert_log_state(registry, file_path, stat_result))
+                start_offset = state.offset
+                counts_before = (processed_records, skipped_duplicates, shed_events, failed_records)
+                event_source = registry.event_source(file_path)
+                if shedder is not None:
+                    shedder.set_lag(lag_bytes)
+
+                with log_file.open('rb') as handle:
+                    try:
+                        for record_start, record_end, record_type, body in iter_unified2_records(handle, state.offset):
+                            if max_records is not None and processed_records >= max_records:
+                                break
+
+                            state.offset = record_end
+                            if record_type not in EVENT_LAYOUTS:
+                                continue  # Packet / extra data records
+
+                            processed_records += 1
+                            record, error_msg = _parse_unified2_record(
+                                event_source, record_start, record_type, body, decoder
+                            )
+                            if error_msg:
+                                failed_records += 1
+                                logger.warning(f'Invalid unified2 event from {file_path}: {error_msg}')
+                                continue
+
+                            if dedup_cache is not None:
+                                verdict = dedup_cache.check(record.event_digest)
+                                if verdict == dedup_cache.SEEN:
+                                    skipped_duplicates += 1
+                                    continue
+                                if verdict == dedup_cache.MAYBE:
+                                    maybe_records.append(record)
+
+                            if shedder is not None and not shedder.admit(record):
+                                shed_events += 1
+                                continue
+
+                            batch.append(record)
+                            batch_policy.record_added()
+
+                            reason = batch_policy.flush_reason(len(batch))
+                            if reason:
+                                batch_policy.record_flush(reason, len(batch))
+                                checkpoints[file_path] = (state.pk, state.inode, state.offset)
+                                inserted += _store_record_batch(
+                                    batch, maybe_records, dedup_cache, checkpoint=list(checkpoints.values()),
+                                    shed_counts=shedder and shedder.take_counts(), **options
+                                )
+                                batch = []
+                                maybe_records = []
+                                checkpoints = {}
+                                if shedder is not None:
+                                    shedder.set_lag(lag_bytes - (state.offset - start_offset))
+                    except Unified2FormatError as e:
+                        # Keep everything before the corrupt record; retried when the file changes
+                        logger.warning(f'Corrupt unified2 file {file_path}: {e}')
+                        checkpoints[file_path] = (state.pk, state.inode, state.offset)
+                        registry.mark_ingested(file_path, state, stat_result, complete=True)
+                        lag_bytes -= stat_result.st_size - start_offset
+                        continue
+
+                registry.mark_ingested(file_path, state, stat_result)
+                checkpoints[file_path] = (state.pk, state.inode, state.offset)
+                lag_bytes -= state.offset - start_offset
+                telemetry.record_file(
+                    sensor, file_path, state.file_size, state.offset,
+                    processed_records - counts_before[0], state.offset - start_offset,
+                    skipped_duplicates - counts_before[1], shed_events - counts_before[2], failed_records - counts_before[3],
+                )
+            except PersistError:
+                raise
+            except Exception:
+                logger.exception('Error while ingesting unified2 file %s', log_file)
+                continue
+
+        shed_counts = shedder and shedder.take_counts()
+        if batch or shed_counts:
+            if batch:
+                batch_policy.record_flush('end', len(batch))
+            inserted += _store_record_batch(
+                batch, maybe_records, dedup_cache, checkpoint=list(checkpoints.values()), shed_counts=shed_counts, **options
+            )
+    except PersistError as e:
+        failure = e
+
+    # Offsets must never get ahead of the stored alerts
+    if pipeline is not None:
+        try:
+            inserted += pipeline.wait_persisted(registry.sensor)
+        except PersistError as e:
+            inserted += e.inserted
+            failure = failure or e
+    if failure is not None:
+        # The cached offsets are ahead of the stored alerts: go back to the committed checkpoints
+        logger.error(f'Storing unified2 alerts failed, {len(read_files)} file(s) are re-read from their last checkpoint: {failure}')
+        registry.forget(read_files)
+    telemetry.record_rows(sensor, inserted)
+
+    try:
+        registry.flush()
+    except Exception:
+        logger.exception('Failed to save unified2 ingestion state')
+
+    return {
+        'inserted': inserted,
+        'processed_records': processed_records,
+        'failed_records': failed_records,
+        'skipped_duplicates': skipped_duplicates,
+        'shed_events': shed_events,
+    }
+
+
+# ===== SYNTHETIC UNIFIED2 GENERATOR =====
+# No sensor runs in CI: build byte-exact unified2 files for tests and benchmarks.
+
+def _encode_record(record_type, body):
+    return RECORD_HEADER.pack(record_type, len(body)) + body
+
+
+def _synthetic_frame(event):
+    # Ethernet + IPv4 + TCP/UDP header for the packet record that follows an event
+    protocol = event.get('protocol', 6)
+    src = ipaddress.IPv4Address(event['src_ip']).packed
+    dest = ipaddress.IPv4Address(event['dest_ip']).packed
+    transport = struct.pack('!HH', event.get('src_port', 0), event.get('dest_port', 0)) + bytes(16 if protocol == 6 else 4)
+    ip_header = struct.pack('!BBHHHBBH4s4s', 0x45, 0, 20 + len(transport), 0, 0, 64, protocol, 0, src, dest)
+    return bytes(12) + b'\x08\x00' + ip_header + transport
+
+
+def encode_unified2_event(event, version=2, with_packet=True):
+    """
+    Encode one IPv4 event (dict) as unified2 bytes.
+
+    event keys: event_id, seconds, microseconds, sid, gid, rev, classification_id,
+    priority, src_ip, dest_ip, src_port, dest_port, protocol (IP number), sensor_id
+    """
+    values = (
+        event.get('sensor_id', 0), event['event_id'], event['seconds'], event.get('microseconds', 0),
+        event['sid'], event.get('gid', 1), event.get('rev', 1), event.get('classification_id', 0),
+        event.get('priority', 3),
+        ipaddress.IPv4Address(event['src_ip']).packed, ipaddress.IPv4Address(event['dest_ip']).packed,
+        event.get('src_port', 0), event.get('dest_port', 0), event.get('protocol', 6), 0, 0, 0,
+    )
+    if version == 2:
+        data = _encode_record(UNIFIED2_IDS_EVENT_V2, IDS_EVENT_V2.pack(*values, 0, 0, 0))
+    else:
+        data = _encode_record(UNIFIED2_IDS_EVENT, IDS_EVENT.pack(*values))
+    if with_packet:
+        frame = _synthetic_frame(event)
+        header = PACKET_HEADER.pack(
+            event.get('sensor_id', 0), event['event_id'], event['seconds'],
+            event['seconds'], event.get('microseconds', 0), 1, len(frame),
+        )
+        data += _encode_record(UNIFIED2_PACKET, header + frame)
+    return data
+
+
+def synthetic_unified2_events(count, start_seconds=1713657600, events_per_second=500, seed=42):
+    # Same traffic shape as benchmark_ingestion.build_fast_lines: floods sharing a second
+    rng = random.Random(seed)
+    return [
+        {
+            'event_id': i + 1,
+            'seconds': start_seconds + i // events_per_second,
+            'microseconds': rng.randrange(1000000),
+            'sid': 1000001 + i % 20,
+            'gid': 1,
+            'rev': 1,
+            'classification_id': 1 + i % 3,
+            'priority': 1 + i % 3,
+            'src_ip': f'192.168.{i % 256}.{(i // 256) % 256}',
+            'dest_ip': f'10.0.0.{i % 250 + 1}',
+            'src_port': 1024 + i % 60000,
+            'dest_port': 80,
+            'protocol': 6,
+        }
+        for i in range(count)
+    ]
+
+
+def build_unified2_bytes(events, version=2, with_packets=True):
+    return b''.join(encode_unified2_event(event, version=version, with_packet=with_packets) for event in events)
+
+
+def write_synthetic_unified2(path, events, version=2, with_packets=True, append=False):
+    """Write (or append) events to a unified2 file; returns the number of bytes written."""
+    data = build_unified2_bytes(events, version=version, with_packets=with_packets)
+    with open(path, 'ab' if append else 'wb') as handle:
+        handle.write(data)
+    return len(data)
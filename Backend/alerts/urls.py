@@ -1,13 +1,15 @@
 from django.urls import path
 
-from .views import live_alerts, filter_options, send_alert_email, ws_broadcast_alert, export_alerts_pdf
-from .analytics import threat_level_distribution, top_attacks, alerts_timeline, protocol_statistics, top_suspicious_ips, dashboard_summary
+from .views import live_alerts, live_flows, filter_options, send_alert_email, ws_broadcast_alert, export_alerts_pdf
+from .analytics import threat_level_distribution, top_attacks, alerts_timeline, protocol_statistics, top_suspicious_ips, traffic_statistics, ingestion_telemetry, dashboard_summary
 
 # ===== ALERTS API ENDPOINTS =====
 # Real-time security alerts from Snort IDS and analytics endpoints
 urlpatterns = [
     # GET: limit (1-10000) + offset (0-based) → latest security alerts for real-time feed
     path('live/', live_alerts, name='live_alerts'),
+    # GET: limit + offset, ip/port/protocol/date filters → most recently active packet flows
+    path('flows/', live_flows, name='live_flows'),
     # GET: → distinct SIDs, src_ips, dest_ips for filter dropdowns
     path('filter-options/', filter_options, name='filter_options'),
     # GET: → count alerts grouped by threat level (safe/medium/high) for pie chart
@@ -20,6 +22,10 @@ urlpatterns = [
     path('protocol-statistics/', protocol_statistics, name='protocol_statistics'),
     # GET: → top 5 most suspicious source IPs by alert frequency for IP tracking
     path('top-suspicious-ips/', top_suspicious_ips, name='top_suspicious_ips'),
+    # GET: → captured traffic (flows/packets/bytes) of the last 24h by protocol and top talkers
+    path('traffic-statistics/', traffic_statistics, name='traffic_statistics'),
+    # GET: → ingestion lag (bytes/lines behind) and throughput per sensor and log file
+    path('ingestion-telemetry/', ingestion_telemetry, name='ingestion_telemetry'),
     # GET: → dashboard summary with key metrics (total alerts, severity, top attacks, IPs, system status)
     path('dashboard-summary/', dashboard_summary, name='dashboard_summary'),
     # POST: → manually send email notification for an alert (for testing)
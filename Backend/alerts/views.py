@@ -15,8 +15,9 @@ from django.utils import timezone as dj_timezone
 from django.http import HttpResponse, StreamingHttpResponse
 from datetime import datetime, timedelta
 
-from .models import Alert
+from .models import Alert, PacketFlow, Signature
 from .services import map_priority_to_threat_level
+from .signatures import latest_signatures
 
 logger = logging.getLogger(__name__)
 
@@ -54,8 +55,8 @@ def live_alerts(request):
     except ValueError:
         offset = 0
 
-    # Start with all alerts
-    queryset = Alert.objects.all()
+    # Start with all alerts (signature text joined in for the response)
+    queryset = Alert.objects.select_related('signature')
     
     # Log incoming filter parameters for debugging
     filter_params = {k: v for k, v in request.query_params.items() if k != 'limit'}
@@ -77,6 +78,13 @@ def live_alerts(request):
         if sid_list:
             queryset = queryset.filter(sid__in=sid_list)
     
+    # Filter by sensor name (can be multiple: "edge-1,edge-2")
+    sensors = request.query_params.get('sensor', '')
+    if sensors:
+        sensor_list = [s.strip() for s in sensors.split(',') if s.strip()]
+        if sensor_list:
+            queryset = queryset.filter(sensor__in=sensor_list)
+    
     # Filter by source IP (attacker IP) — supports partial match
     src_ip = request.query_params.get('src_ip', '')
     if src_ip:
@@ -144,8 +152,7 @@ def live_alerts(request):
     if search_query:
         search_query = search_query.strip()
         queryset = queryset.filter(
-            Q(message__icontains=search_query) |
-            Q(classification__icontains=search_query) |
+            Q(signature__in=_signatures_matching(search_query)) |
             Q(sid__icontains=search_query) |
             Q(src_ip__icontains=search_query) |
             Q(dest_ip__icontains=search_query)
@@ -177,6 +184,7 @@ def live_alerts(request):
                 'dest_port': alert.dest_port,
                 'protocol': alert.protocol,
                 'sid': alert.sid,
+                'sensor': alert.sensor,
                 'message': alert.message,
                 'classification': alert.classification,
                 'priority': alert.priority,
@@ -187,6 +195,112 @@ def live_alerts(request):
     })
 
 
+def _signatures_matching(text):
+    # Signatures whose message or classification contains text: the LIKE scans the small
+    # signature table, alerts are then matched by signature_id
+    return Signature.objects.filter(Q(message__icontains=text) | Q(classification__icontains=text)).values('id')
+
+
+def _parse_filter_datetime(value, end_of_day=False):
+    # ISO date/datetime query parameter -> aware datetime, or None if invalid
+    normalized = value.strip().replace('Z', '+00:00')
+    if len(normalized) == 16:  # "YYYY-MM-DDTHH:MM" from datetime-local inputs
+        normalized += ':00'
+    try:
+        parsed = datetime.fromisoformat(normalized)
+    except ValueError:
+        return None
+    if end_of_day and len(value.strip()) == 10:
+        parsed = parsed.replace(hour=23, minute=59, second=59)
+    if parsed.tzinfo is None:
+        parsed = dj_timezone.make_aware(parsed, dj_timezone.get_current_timezone())
+    return parsed
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def live_flows(request):
+    """
+    Get the most recently active packet flows (snort.log packets aggregated by 5-tuple).
+
+    Query Parameters:
+    - limit: number of results (1-10000, default 100)
+    - offset: pagination offset (0-based)
+    - src_ip / dest_ip: IP address (supports partial match)
+    - port: source or destination port
+    - protocol: comma-separated protocols (TCP,UDP,ICMP)
+    - date_from / date_to: flows active within the range (ISO format)
+
+    Returns: flows ordered by last packet time (newest first)
+    """
+    try:
+        limit = max(1, min(10000, int(request.query_params.get('limit', '100'))))
+    except ValueError:
+        limit = 100
+    try:
+        offset = max(0, int(request.query_params.get('offset', '0')))
+    except ValueError:
+        offset = 0
+
+    queryset = PacketFlow.objects.all()
+
+    src_ip = request.query_params.get('src_ip', '').strip()
+    if src_ip:
+        queryset = queryset.filter(src_ip__icontains=src_ip)
+
+    dest_ip = request.query_params.get('dest_ip', '').strip()
+    if dest_ip:
+        queryset = queryset.filter(dest_ip__icontains=dest_ip)
+
+    port = request.query_params.get('port', '').strip()
+    if port.isdigit():
+        queryset = queryset.filter(Q(src_port=int(port)) | Q(dest_port=int(port)))
+
+    # Protocols are stored upper-case by the flow aggregator
+    protocols = request.query_params.get('protocol', '')
+    if protocols:
+        protocol_list = [p.strip().upper() for p in protocols.split(',') if p.strip()]
+        if protocol_list:
+            queryset = queryset.filter(protocol__in=protocol_list)
+
+    # A flow is in the range if it was active at any time within it
+    date_from = request.query_params.get('date_from', '')
+    if date_from:
+        from_dt = _parse_filter_datetime(date_from)
+        if from_dt is not None:
+            queryset = queryset.filter(last_seen__gte=from_dt)
+    date_to = request.query_params.get('date_to', '')
+    if date_to:
+        to_dt = _parse_filter_datetime(date_to, end_of_day=True)
+        if to_dt is not None:
+            queryset = queryset.filter(first_seen__lte=to_dt)
+
+    total_available = queryset.count()
+    flows = list(queryset.order_by('-last_seen', '-id')[offset:offset + limit])
+
+    return Response({
+        'count': len(flows),
+        'total_available': total_available,
+        'offset': offset,
+        'limit': limit,
+        'results': [
+            {
+                'id': flow.id,
+                'first_seen': flow.first_seen.isoformat(),
+                'last_seen': flow.last_seen.isoformat(),
+                'src_ip': flow.src_ip,
+                'src_port': flow.src_port,
+                'dest_ip': flow.dest_ip,
+                'dest_port': flow.dest_port,
+                'protocol': flow.protocol,
+                'packet_count': flow.packet_count,
+                'byte_count': flow.byte_count,
+            }
+            for flow in flows
+        ],
+    })
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def filter_options(request):
@@ -211,22 +325,18 @@ def filter_options(request):
     cutoff = dj_timezone.now() - timedelta(days=7)
     recent_alerts = Alert.objects.filter(timestamp__gte=cutoff)
     
-    # Distinct SIDs with their most common message for labelling
-    sid_rows = (
-        recent_alerts.values('sid', 'message')
-        .annotate(msg_count=Count('id'))
-        .order_by('sid', '-msg_count')[:100]  # Limit to top 100 SIDs
-    )
-    # Pick the most frequent message per SID
-    sid_labels = {}
-    for row in sid_rows:
-        sid = row['sid']
-        if sid not in sid_labels:
-            sid_labels[sid] = row['message']
+    # Top 100 SIDs by alert count (all revisions of a rule together), labelled with the newest revision
+    top_sids = [
+        row['sid'] for row in
+        recent_alerts.values('sid')
+        .annotate(alert_count=Count('id'))
+        .order_by('-alert_count')[:100]
+    ]
+    signatures = latest_signatures(top_sids)
     
     sids = [
-        {'value': sid, 'label': f"{sid} — {msg[:80]}"}
-        for sid, msg in sorted(sid_labels.items())
+        {'value': sid, 'label': f"{sid} — {signatures[sid].message[:80] if sid in signatures else ''}"}
+        for sid in sorted(top_sids)
     ]
     
     # Top 100 source IPs by frequency (sorted by frequency, then alphabetically)
@@ -272,7 +382,7 @@ def send_alert_email(request):
         return Response({'error': 'alert_id is required'}, status=400)
     
     try:
-        alert = Alert.objects.get(id=alert_id)
+        alert = Alert.objects.select_related('signature').get(id=alert_id)
     except Alert.DoesNotExist:
         return Response({'error': f'Alert with id {alert_id} not found'}, status=404)
     
@@ -372,8 +482,8 @@ def get_filtered_alerts(request, max_limit=None):
     if max_limit is not None:
         limit = max_limit if limit is None else min(limit, max_limit)
 
-    # Apply filters to queryset
-    alerts_qs = Alert.objects.all().order_by('-timestamp')
+    # Apply filters to queryset (signature text joined in for the export rows)
+    alerts_qs = Alert.objects.select_related('signature').order_by('-timestamp')
 
     # Threat level filter
     threat_levels = request.query_params.get('threat_level', '')
@@ -430,10 +540,8 @@ def get_filtered_alerts(request, max_limit=None):
     # Search filter (in message, classification, sid)
     search = request.query_params.get('search', '').strip()
     if search:
-        search_lower = search.lower()
         alerts_qs = alerts_qs.filter(
-            Q(message__icontains=search) |
-            Q(classification__icontains=search) |
+            Q(signature__in=_signatures_matching(search)) |
             Q(sid__icontains=search)
         )
 
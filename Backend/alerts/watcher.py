@@ -0,0 +1,285 @@
+"""
+Event-driven change detection for the Snort log directory.
+
+poll_snort_logs used to sleep a fixed interval between ingestion cycles, so
+every alert waited up to SNORT_POLL_INTERVAL_SECONDS before it was stored.
+The watchers below block until an alert/packet log grows or a new one appears:
+
+- InotifyLogWatcher: Linux inotify via ctypes (no extra dependency). The
+  process sleeps in poll() while the sensor is idle and wakes within
+  milliseconds of a write.
+- StatLogWatcher: portable fallback that compares (inode, size, mtime) of the
+  log files on a short interval.
+
+Use create_log_watcher() to get the best watcher for the current platform.
+"""
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+import sys
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+def is_ingestible_log_name(name):
+    # Only alert files ("*alert*"), unified2 files ("snort.u2*", "unified2*")
+    # and PCAP packet logs ("snort.log*") matter
+    if not name or name.startswith('.'):
+        return False
+    return 'alert' in name or name.startswith(('snort.log', 'snort.u2', 'unified2'))
+
+
+# ===== INOTIFY (LINUX) =====
+
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE_SELF = 0x00000400
+_IN_MOVE_SELF = 0x00000800
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ISDIR = 0x40000000
+
+_WATCH_MASK = _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE_SELF | _IN_MOVE_SELF
+
+# struct inotify_event { int wd; uint32_t mask; uint32_t cookie; uint32_t len; char name[]; }
+_INOTIFY_EVENT = struct.Struct('iIII')
+
+_libc = None
+
+
+def _load_libc():
+    # Resolve inotify_* from libc once, returns None when unavailable
+    global _libc
+    if _libc is None:
+        _libc = False
+        if sys.platform.startswith('linux'):
+            try:
+                libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+                libc.inotify_init1.argtypes = [ctypes.c_int]
+                libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+                libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+                _libc = libc
+            except (OSError, AttributeError):
+                _libc = False
+    return _libc or None
+
+
+def inotify_available():
+    return _load_libc() is not None
+
+
+class InotifyLogWatcher:
+    """
+    Block until a Snort log file under log_dir is written, created or moved in.
+
+    wait() returns the set of changed paths (empty on timeout). A kernel queue
+    overflow is reported as {log_dir} so the caller falls back to a full scan.
+    """
+
+    def __init__(self, log_dir, settle_seconds=0.005):
+        libc = _load_libc()
+        if libc is None:
+            raise OSError('inotify is not available on this platform')
+
+        self.log_dir = Path(log_dir)
+        self.settle_seconds = settle_seconds
+        self._libc = libc
+        self._fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+        self._watches = {}  # wd -> directory Path
+        self._poller = select.poll()
+        self._poller.register(self._fd, select.POLLIN)
+        self._add_tree(self.log_dir)
+
+    def _add_watch(self, directory):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(str(directory)), _WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err != errno.ENOENT:
+                logger.warning(f'[Watcher] Cannot watch {directory}: {os.strerror(err)}')
+            return
+        self._watches[wd] = Path(directory)
+
+    def _add_tree(self, root):
+        # inotify is not recursive - watch every sub-directory (sensor folders)
+        if not Path(root).is_dir():
+            return
+        self._add_watch(root)
+        for dirpath, dirnames, _filenames in os.walk(root):
+            dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+            for dirname in dirnames:
+                self._add_watch(Path(dirpath) / dirname)
+
+    def _read_events(self, changed):
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                return
+            if not data:
+                return
+
+            offset = 0
+            size = len(data)
+            while offset + _INOTIFY_EVENT.size <= size:
+                wd, mask, _cookie, name_len = _INOTIFY_EVENT.unpack_from(data, offset)
+                offset += _INOTIFY_EVENT.size
+                name = data[offset:offset + name_len].split(b'\0', 1)[0].decode('utf-8', 'replace')
+                offset += name_len
+
+                if mask & _IN_Q_OVERFLOW:
+                    # Events were dropped: let the caller rescan everything
+                    changed.add(self.log_dir)
+                    continue
+
+                directory = self._watches.get(wd)
+                if directory is None:
+                    continue
+
+                if mask & _IN_IGNORED:
+                    self._watches.pop(wd, None)
+                    continue
+
+                if mask & (_IN_DELETE_SELF | _IN_MOVE_SELF):
+                    continue
+
+                path = directory / name if name else directory
+                if mask & _IN_ISDIR:
+                    if mask & (_IN_CREATE | _IN_MOVED_TO):
+                        # New sensor folder - watch it and pick up files already inside
+                        self._add_tree(path)
+                        changed.add(path)
+                    continue
+
+                if is_ingestible_log_name(name):
+                    changed.add(path)
+
+    def wait(self, timeout=None):
+        """
+        Sleep until a log file changes or timeout (seconds) elapses.
+
+        Returns: set of changed Paths (empty set on timeout)
+        """
+        changed = set()
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        if not self._watches:
+            # Log directory missing (sensor share not mounted yet) - retry later
+            self._add_tree(self.log_dir)
+            if not self._watches:
+                time.sleep(1.0 if timeout is None else min(timeout, 1.0))
+                return changed
+
+        while not changed:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            ready = self._poller.poll(None if remaining is None else int(remaining * 1000))
+            if ready:
+                self._read_events(changed)
+                # Coalesce the burst of writes that usually follows the first one
+                while self._poller.poll(int(self.settle_seconds * 1000)):
+                    self._read_events(changed)
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+
+        return changed
+
+    def close(self):
+        if self._fd is not None and self._fd >= 0:
+            try:
+                self._poller.unregister(self._fd)
+            except (KeyError, ValueError):
+                pass
+            os.close(self._fd)
+        self._fd = None
+        self._watches.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# ===== STAT-BASED FALLBACK =====
+
+class StatLogWatcher:
+    """
+    Portable fallback: re-stat the log files every stat_interval seconds and
+    report the ones whose (inode, size, mtime) changed or that are new.
+    """
+
+    def __init__(self, log_dir, stat_interval=0.5):
+        self.log_dir = Path(log_dir)
+        self.stat_interval = max(0.05, float(stat_interval))
+        self._snapshot = self._take_snapshot()
+
+    def _take_snapshot(self):
+        snapshot = {}
+        if not self.log_dir.is_dir():
+            return snapshot
+        for dirpath, dirnames, filenames in os.walk(self.log_dir):
+            dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+            for filename in filenames:
+                if not is_ingestible_log_name(filename):
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                snapshot[path] = (st.st_ino, st.st_size, st.st_mtime_ns)
+        return snapshot
+
+    def wait(self, timeout=None):
+        """
+        Sleep until a log file changes or timeout (seconds) elapses.
+
+        Returns: set of changed Paths (empty set on timeout)
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            sleep_for = self.stat_interval
+            if deadline is not None:
+                sleep_for = min(sleep_for, max(0.0, deadline - time.monotonic()))
+            time.sleep(sleep_for)
+
+            snapshot = self._take_snapshot()
+            changed = {
+                Path(path) for path, signature in snapshot.items()
+                if self._snapshot.get(path) != signature
+            }
+            self._snapshot = snapshot
+            if changed:
+                return changed
+            if deadline is not None and time.monotonic() >= deadline:
+                return set()
+
+    def close(self):
+        self._snapshot = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def create_log_watcher(log_dir, stat_interval=0.5):
+    # Prefer inotify on Linux, fall back to stat polling elsewhere (or on error)
+    if inotify_available():
+        try:
+            return InotifyLogWatcher(log_dir)
+        except OSError as e:
+            logger.warning(f'[Watcher] inotify unavailable ({e}), falling back to stat polling')
+    return StatLogWatcher(log_dir, stat_interval=stat_interval)
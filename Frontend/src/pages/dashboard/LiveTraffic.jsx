@@ -1,5 +1,5 @@
 import { useEffect, useMemo, useRef, useState } from 'react';
-import { getLiveAlerts, getFilterOptions, exportAlertsPDF } from '../../services/api';
+import { getLiveAlerts, getLiveFlows, getFilterOptions, exportAlertsPDF } from '../../services/api';
 import Pagination from '../../components/common/Pagination';
 
 const MAX_ROWS_PER_PAGE = 50;
@@ -7,6 +7,7 @@ const MAX_ITEMS_PER_PAGE = 500;
 
 const BASE_URL = (import.meta.env.VITE_API_URL || 'http://localhost:8000').replace(/\/$/, '');
 const FILTER_OPTIONS_POLL_INTERVAL = 15000; // Refresh dropdown options every 15 seconds
+const FLOWS_POLL_INTERVAL = 5000; // Packet flows have no WebSocket feed, so poll them
 
 const THREAT_STYLES = {
   safe: 'bg-green-500/20 text-green-300 border border-green-400/30',
@@ -43,6 +44,18 @@ function formatPort(port) {
   return String(port);
 }
 
+function formatBytes(bytes) {
+  if (!Number.isFinite(bytes)) return '-';
+  const units = ['B', 'KB', 'MB', 'GB', 'TB'];
+  let value = bytes;
+  let unit = 0;
+  while (value >= 1024 && unit < units.length - 1) {
+    value /= 1024;
+    unit += 1;
+  }
+  return `${unit === 0 ? value : value.toFixed(1)} ${units[unit]}`;
+}
+
 /**
  * Checks if an incoming WebSocket alert matches the currently active filters.
  */
@@ -69,8 +82,9 @@ function alertMatchesFilters(alert, filters) {
 }
 
 /**
- * LiveTraffic - Displays real-time alert table.
+ * LiveTraffic - Displays real-time alert table and captured packet flows.
  * Receives latestWsAlert from Dashboard (single WebSocket connection).
+ * Packet flows are polled from the flows endpoint.
  */
 export default function LiveTraffic({ token, latestWsAlert, wsConnectionStatus, wsClearSignal }) {
   const [alerts, setAlerts] = useState([]);
@@ -94,6 +108,12 @@ export default function LiveTraffic({ token, latestWsAlert, wsConnectionStatus,
   const [exportLoading, setExportLoading] = useState(false);
   const [exportDateFrom, setExportDateFrom] = useState('');
   const [exportDateTo, setExportDateTo] = useState('');
+  const [flows, setFlows] = useState([]);
+  const [flowsTotal, setFlowsTotal] = useState(0);
+  const [flowsLoading, setFlowsLoading] = useState(true);
+  const [flowsError, setFlowsError] = useState('');
+  const [flowsPage, setFlowsPage] = useState(1);
+  const [flowsPerPage, setFlowsPerPage] = useState(MAX_ROWS_PER_PAGE);
   const seenAlertIdsRef = useRef(new Set());
   const filterModalRef = useRef(null);
   const exportMenuRef = useRef(null);
@@ -156,6 +176,17 @@ export default function LiveTraffic({ token, latestWsAlert, wsConnectionStatus,
 
   const hasActiveFilters = Object.keys(activeFilters).length > 0;
 
+  // Flows carry no alert fields (threat level, SID, message): only the traffic filters apply
+  const flowFilters = useMemo(() => {
+    const filters = {};
+    if (activeFilters.protocol) filters.protocol = activeFilters.protocol;
+    if (activeFilters.src_ip) filters.src_ip = activeFilters.src_ip;
+    if (activeFilters.dest_ip) filters.dest_ip = activeFilters.dest_ip;
+    if (activeFilters.date_from) filters.date_from = activeFilters.date_from;
+    if (activeFilters.date_to) filters.date_to = activeFilters.date_to;
+    return filters;
+  }, [activeFilters]);
+
   // ===== WEBSOCKET: Receive alerts from Dashboard's central WebSocket =====
   // React to latestWsAlert prop changes (pushed from Dashboard.jsx)
   useEffect(() => {
@@ -237,6 +268,56 @@ export default function LiveTraffic({ token, latestWsAlert, wsConnectionStatus,
     // eslint-disable-next-line react-hooks/exhaustive-deps
   }, [token, activeFilters, forceRefresh, currentPage, itemsPerPage]);
 
+  // ===== HTTP POLL: Packet flows (snort.log packets aggregated by 5-tuple) =====
+  useEffect(() => {
+    if (!token) return;
+    let active = true;
+    let controller = null;
+
+    setFlowsLoading(true);
+
+    const fetchFlows = async () => {
+      // A slow poll is dropped by the next one rather than overlapping it
+      controller?.abort();
+      const request = new AbortController();
+      controller = request;
+      const timeoutId = setTimeout(() => request.abort(), 8000);
+      try {
+        const offset = Math.max(0, (flowsPage - 1) * flowsPerPage);
+        const flowsPayload = await getLiveFlows(token, flowsPerPage, request.signal, flowFilters, offset);
+
+        if (!active) return;
+
+        const results = flowsPayload.results || [];
+        setFlows(results);
+        setFlowsTotal(
+          Number.isFinite(flowsPayload.total_available) ? flowsPayload.total_available : results.length
+        );
+        setFlowsError('');
+        setLastSyncedAt(new Date());
+      } catch (err) {
+        if (!active || controller !== request) return;
+        if (err?.name === 'AbortError') {
+          setFlowsError('Request timed out.');
+        } else {
+          setFlowsError(err.message || 'Failed to fetch packet flows');
+        }
+      } finally {
+        clearTimeout(timeoutId);
+        if (active) setFlowsLoading(false);
+      }
+    };
+
+    fetchFlows();
+    const interval = setInterval(fetchFlows, FLOWS_POLL_INTERVAL);
+
+    return () => {
+      active = false;
+      clearInterval(interval);
+      controller?.abort();
+    };
+  }, [token, flowFilters, forceRefresh, flowsPage, flowsPerPage]);
+
   // Close filter modal when clicking outside
   useEffect(() => {
     const handleClickOutside = (event) => {
@@ -280,6 +361,7 @@ export default function LiveTraffic({ token, latestWsAlert, wsConnectionStatus,
     setDateToFilter('');
     setSearchFilter('');
     setCurrentPage(1);
+    setFlowsPage(1);
     setForceRefresh(prev => prev + 1);
   };
 
@@ -309,6 +391,14 @@ export default function LiveTraffic({ token, latestWsAlert, wsConnectionStatus,
     }
   }, [currentPage, totalPages]);
 
+  const flowsTotalPages = Math.max(1, Math.ceil(flowsTotal / flowsPerPage));
+
+  useEffect(() => {
+    if (flowsPage > flowsTotalPages) {
+      setFlowsPage(flowsTotalPages);
+    }
+  }, [flowsPage, flowsTotalPages]);
+
   const paginatedAlerts = useMemo(() => alerts, [alerts]);
 
   return (
@@ -322,6 +412,9 @@ export default function LiveTraffic({ token, latestWsAlert, wsConnectionStatus,
               <p className="text-sm text-gray-300">
                 <span className="font-semibold text-blue-400">{totalAvailable}</span> alerts detected
               </p>
+              <p className="text-sm text-gray-300">
+                <span className="font-semibold text-blue-400">{flowsTotal}</span> packet flows
+              </p>
               {hasActiveFilters && (
                 <p className="text-sm text-yellow-300">(Filtered)</p>
               )}
@@ -507,6 +600,7 @@ export default function LiveTraffic({ token, latestWsAlert, wsConnectionStatus,
                       onClick={() => {
                         setShowFilterModal(false);
                         setCurrentPage(1);
+                        setFlowsPage(1);
                         setForceRefresh(prev => prev + 1);
                       }}
                       className="flex-1 px-3 py-2 bg-green-600 hover:bg-green-700 text-white text-sm font-semibold rounded transition"
@@ -673,6 +767,77 @@ export default function LiveTraffic({ token, latestWsAlert, wsConnectionStatus,
           />
         )}
       </div>
+
+      {/* Packet Flows Table */}
+      <div className="bg-[#0d1117] border border-[#30363d] rounded-xl overflow-hidden">
+        <div className="px-4 py-3 border-b border-[#30363d]">
+          <h3 className="text-white text-sm font-bold">Packet Flows</h3>
+          <p className="text-xs text-gray-500 mt-1">Captured packets grouped by source, destination and protocol</p>
+        </div>
+        {flowsError && (
+          <div className="px-4 py-3 bg-red-500/10 border-b border-red-500/20 text-sm text-red-300">
+            {flowsError}
+          </div>
+        )}
+        {flowsLoading ? (
+          <div className="p-8 text-center text-gray-400">Loading packet flows...</div>
+        ) : (
+          <div className="overflow-x-hidden">
+            <table className="w-full table-fixed text-xs">
+              <thead className="bg-[#161b22] text-gray-300 uppercase text-xs tracking-wider">
+                <tr>
+                  <th className="text-left px-3 py-3 w-[16%]">First Seen</th>
+                  <th className="text-left px-3 py-3 w-[16%]">Last Seen</th>
+                  <th className="text-left px-3 py-3 w-[19%]">Source</th>
+                  <th className="text-left px-3 py-3 w-[19%]">Destination</th>
+                  <th className="text-left px-3 py-3 w-[9%]">Protocol</th>
+                  <th className="text-left px-3 py-3 w-[10%]">Packets</th>
+                  <th className="text-left px-3 py-3 w-[11%]">Bytes</th>
+                </tr>
+              </thead>
+              <tbody>
+                {flows.length === 0 && (
+                  <tr>
+                    <td colSpan={7} className="px-4 py-8 text-center text-gray-400">
+                      No packet flows found{Object.keys(flowFilters).length > 0 ? ' matching your filters' : ' captured yet'}.
+                    </td>
+                  </tr>
+                )}
+                {flows.map((flow) => (
+                  <tr key={flow.id} className="border-t border-[#222a35] hover:bg-[#111827]">
+                    <td className="px-3 py-3 align-top">{formatTimestamp(flow.first_seen)}</td>
+                    <td className="px-3 py-3 align-top">{formatTimestamp(flow.last_seen)}</td>
+                    <td className="px-3 py-3 align-top">
+                      <div className="leading-tight break-all">{flow.src_ip}</div>
+                      <div className="text-[11px] text-gray-500">Port: {formatPort(flow.src_port)}</div>
+                    </td>
+                    <td className="px-3 py-3 align-top">
+                      <div className="leading-tight break-all">{flow.dest_ip}</div>
+                      <div className="text-[11px] text-gray-500">Port: {formatPort(flow.dest_port)}</div>
+                    </td>
+                    <td className="px-3 py-3 align-top">{flow.protocol}</td>
+                    <td className="px-3 py-3 align-top">{flow.packet_count}</td>
+                    <td className="px-3 py-3 align-top">{formatBytes(flow.byte_count)}</td>
+                  </tr>
+                ))}
+              </tbody>
+            </table>
+          </div>
+        )}
+        {!flowsLoading && flowsTotal > 0 && (
+          <Pagination
+            totalItems={flowsTotal}
+            itemsPerPage={flowsPerPage}
+            currentPage={flowsPage}
+            onPageChange={setFlowsPage}
+            onItemsPerPageChange={(value) => {
+              setFlowsPerPage(Math.min(MAX_ITEMS_PER_PAGE, value));
+              setFlowsPage(1);
+            }}
+            itemsPerPageOptions={[10, 25, 50, 100, 200, 500]}
+          />
+        )}
+      </div>
     </div>
   );
 }
@@ -163,6 +163,31 @@ export const getLiveAlerts = async (token, limit = 100, signal, filters = {}, of
   return response.json();
 };
 
+// Get most recently active packet flows (captured packets aggregated by 5-tuple)
+export const getLiveFlows = async (token, limit = 100, signal, filters = {}, offset = 0) => {
+  const params = new URLSearchParams({ limit, offset });
+
+  if (filters.protocol) params.append('protocol', filters.protocol);
+  if (filters.src_ip) params.append('src_ip', filters.src_ip);
+  if (filters.dest_ip) params.append('dest_ip', filters.dest_ip);
+  if (filters.port) params.append('port', filters.port);
+  if (filters.date_from) params.append('date_from', filters.date_from);
+  if (filters.date_to) params.append('date_to', filters.date_to);
+
+  const response = await fetch(`${BASE_URL}/api/alerts/flows/?${params.toString()}`, {
+    signal,
+    headers: {
+      'Authorization': `Bearer ${token}`,
+    },
+  });
+
+  if (!response.ok) {
+    throw new Error('Failed to fetch packet flows');
+  }
+
+  return response.json();
+};
+
 // Get count of alerts by threat level (safe, medium, high) for chart
 export const getThreatLevelDistribution = async (token, signal) => {
   const response = await fetch(`${API_URL}/threat-level-distribution/`, {